@@ -192,20 +192,43 @@ python a02_make_qa_para.py \
     python a02_make_qa_para.py --dataset wikipedia_ja --model gemini-2.0-flash  --analyze-coverage --max-docs 10
     python a02_make_qa_para.py --dataset japanese_text --model gemini-2.0-flash  --analyze-coverage --max-docs 10
     python a02_make_qa_para.py --dataset livedoor --model gemini-2.0-flash --analyze-coverage --max-docs 100
+
+    # カバレージ分析のEmbeddingをキャッシュ（同一データの再実行ではEmbedding API呼び出し0回）
+    python a02_make_qa_para.py --dataset livedoor --analyze-coverage --embedding-cache qa_output/.embedding_cache.sqlite
+
+    # Celery/Redisなしで8バッチ同時実行（出力順は逐次実行と同じ）
+    python a02_make_qa_para.py --dataset livedoor --concurrency 8 --max-docs 100
+
+    # LLM応答をキャッシュ（同じチャンクの再実行ではQ/A生成APIを呼ばない）
+    python a02_make_qa_para.py --dataset livedoor --llm-cache qa_cache/llm_cache.sqlite
+
+    # チャンク複雑度でモデルを振り分け（low→gemini-2.0-flash-lite, high→gemini-2.5-flash、ルート別のレイテンシ・費用を表示）
+    python a02_make_qa_para.py --dataset livedoor --concurrency 8 --route-models
+
+    # 定型文・ナビゲーションなど低情報チャンクはLLMに送らない（スキップ数と削減したAPI呼び出し数を表示）
+    python a02_make_qa_para.py --dataset livedoor --prefilter-threshold 0.3
 """
 
 import os
 import sys
 import json
+import math
 import time
 import argparse
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
 import pandas as pd
 import numpy as np
 from pathlib import Path
 from typing import List, Dict, Optional
 from datetime import datetime
 import tiktoken
-from helper_llm import create_llm_client, LLMClient
+from helper_llm import create_llm_client, get_token_counter, build_structured_prompt, LLMClient
+from helper_llm_cache import CachedLLMClient, LLMCacheStore
+from helper_llm_batch import BatchJobClient, GeminiBatchBackend
+from helper_model_router import ModelRouter, ModelRoute, parse_route_concurrency, FAST_ROUTE, DEFAULT_ROUTER_FAST_MODEL, DEFAULT_ROUTER_STRONG_MODEL
+from helper_prompt_packer import TokenBudgetPacker, DEFAULT_PROMPT_OUTPUT_TOKEN_BUDGET, DEFAULT_TOKENS_PER_QA_PAIR
+from helper_usage import InMemoryUsageSink, format_usage_report, get_usage_meter
 from dotenv import load_dotenv
 import logging
 import re
@@ -214,11 +237,12 @@ from collections import Counter
 # ===================================================================
 # 共通モジュールからインポート
 # ===================================================================
-from models import QAPairsResponse
+from models import QAPair, QAPairsResponse
 from config import (
     DATASET_CONFIGS,
     QAGenerationConfig,
 )
+from regex_mecab import get_mecab_tagger, is_mecab_available
 
 # 環境変数読み込み
 load_dotenv()
@@ -307,14 +331,7 @@ class KeywordExtractor:
 
     def _check_mecab_availability(self) -> bool:
         """MeCabの利用可能性をチェック"""
-        try:
-            import MeCab
-            # 実際にインスタンス化して動作確認
-            tagger = MeCab.Tagger()
-            tagger.parse("テスト")
-            return True
-        except (ImportError, RuntimeError):
-            return False
+        return is_mecab_available()
 
     def extract(self, text: str, top_n: int = 5) -> List[str]:
         """
@@ -340,10 +357,7 @@ class KeywordExtractor:
 
     def _extract_with_mecab(self, text: str, top_n: int) -> List[str]:
         """MeCabを使用した複合名詞抽出"""
-        import MeCab
-
-        tagger = MeCab.Tagger()
-        node = tagger.parseToNode(text)
+        node = get_mecab_tagger().parseToNode(text)
 
         # 複合名詞の抽出
         compound_buffer = []
@@ -487,11 +501,31 @@ def extract_key_concepts(chunk_text: str, lang: str = "ja", top_n: int = 5) -> L
 # セマンティックチャンク作成関数
 # ==========================================
 
+# チャンク分割器（ネットワーク不要。文書間で使い回し、ワーカープロセスではプロセスごとに1つ）
+_chunker = None
+
+
+def _get_chunker():
+    """このプロセスの SemanticChunker を返す（初回のみ生成）"""
+    global _chunker
+    if _chunker is None:
+        from helper_rag_qa import SemanticChunker
+        _chunker = SemanticChunker(token_count_model="gemini-embedding-001")
+    return _chunker
+
+
+def _init_chunk_worker() -> None:
+    """チャンク作成ワーカープロセスの初期化（トークナイザー・MeCab・SemanticChunker を先に用意）"""
+    tiktoken.get_encoding("cl100k_base")
+    is_mecab_available()
+    _get_chunker()
+
+
 def create_semantic_chunks(text: str, lang: str = "ja", max_tokens: int = 200, chunk_id_prefix: str = "chunk") -> List[Dict]:
     """
     セマンティック分割によるチャンク作成（段落優先）
 
-    helper_rag_qa.pyのSemanticCoverage.create_semantic_chunks()を使用し、
+    helper_rag_qa.pyのSemanticChunker.create_semantic_chunks()を使用し、
     段落境界を最優先したセマンティック分割を実行。
     文脈を保持しながら適切なサイズでチャンクを作成。
 
@@ -504,10 +538,8 @@ def create_semantic_chunks(text: str, lang: str = "ja", max_tokens: int = 200, c
     Returns:
         チャンクのリスト
     """
-    # SemanticCoverageを使用してセマンティック分割を実行
-    from helper_rag_qa import SemanticCoverage
-
-    semantic_analyzer = SemanticCoverage(embedding_model="gemini-embedding-001")
+    # SemanticChunkerを使用してセマンティック分割を実行（プロセス内で1つを使い回す）
+    semantic_analyzer = _get_chunker()
 
     # 段落優先のセマンティック分割を実行
     # prefer_paragraphs=True: 段落境界を最優先
@@ -522,7 +554,7 @@ def create_semantic_chunks(text: str, lang: str = "ja", max_tokens: int = 200, c
         verbose=False
     )
 
-    # SemanticCoverageの出力形式をa02の形式に変換
+    # SemanticChunkerの出力形式をa02の形式に変換
     chunks = []
     tokenizer = tiktoken.get_encoding("cl100k_base")
 
@@ -756,13 +788,41 @@ def load_preprocessed_data(dataset_type: str) -> pd.DataFrame:
     return df
 
 
-def create_document_chunks(df: pd.DataFrame, dataset_type: str, max_docs: Optional[int] = None, config: Optional[Dict] = None) -> List[Dict]:
+def _chunk_document(doc: tuple, dataset_type: str, lang: str, chunk_size: int) -> List[Dict]:
+    """1文書をチャンク分割してメタデータを付ける（失敗時は空リスト）
+    Args:
+        doc: (文書インデックス, 文書ID, 本文)
+    """
+    idx, doc_id, text = doc
+    try:
+        chunks = create_semantic_chunks(
+            text=text,
+            lang=lang,
+            max_tokens=chunk_size,
+            chunk_id_prefix=f"{doc_id}_chunk"
+        )
+    except Exception as e:
+        logger.warning(f"チャンク作成エラー (doc {idx}): {e}")
+        return []
+
+    # 各チャンクにメタデータを追加
+    for i, chunk in enumerate(chunks):
+        chunk['doc_id'] = doc_id
+        chunk['doc_idx'] = idx
+        chunk['chunk_idx'] = i
+        chunk['dataset_type'] = dataset_type
+    return chunks
+
+
+def create_document_chunks(df: pd.DataFrame, dataset_type: str, max_docs: Optional[int] = None,
+                           config: Optional[Dict] = None, chunk_workers: int = 1) -> List[Dict]:
     """DataFrameから文書チャンクを作成（セマンティック分割）
     Args:
         df: データフレーム
         dataset_type: データセットタイプ
         max_docs: 処理する最大文書数
         config: データセット設定（指定がない場合はDATASET_CONFIGSから取得）
+        chunk_workers: チャンク分割のワーカープロセス数（1=逐次。結果は常に文書順）
     Returns:
         チャンクのリスト
     """
@@ -776,49 +836,44 @@ def create_document_chunks(df: pd.DataFrame, dataset_type: str, max_docs: Option
     chunk_size = config["chunk_size"]
     lang = config["lang"]
 
-    all_chunks = []
-
     # 処理する文書数を制限
     docs_to_process = df.head(max_docs) if max_docs else df
 
-    logger.info(f"チャンク作成開始: {len(docs_to_process)}件の文書（セマンティック分割）")
-
-    total_docs = len(docs_to_process)
-    for i, (idx, row) in enumerate(docs_to_process.iterrows()):
-        # 進捗ログ（10件ごと）
-        if (i + 1) % 10 == 0 or (i + 1) == total_docs:
-            logger.info(f"  チャンク作成進捗: {i + 1}/{total_docs} 文書完了")
-
-        # row[text_col]はSeriesやオブジェクトの可能性があるため、明示的にstrに変換
-        text = str(row[text_col]) if pd.notna(row[text_col]) else ""
-
+    # 本文・文書IDを先に取り出す（ワーカーには DataFrame ではなくタプルを渡す）
+    has_title = bool(title_col) and title_col in docs_to_process.columns
+    titles = docs_to_process[title_col] if has_title else [None] * len(docs_to_process)
+    docs = []
+    for idx, raw_text, title in zip(docs_to_process.index, docs_to_process[text_col], titles):
+        # 本文はオブジェクトの可能性があるため、明示的にstrに変換
+        text = str(raw_text) if pd.notna(raw_text) else ""
         # タイトルがある場合は含める
-        if title_col and title_col in row and pd.notna(row[title_col]):
-            doc_id = f"{dataset_type}_{idx}_{str(row[title_col])[:30]}"
+        if has_title and pd.notna(title):
+            doc_id = f"{dataset_type}_{idx}_{str(title)[:30]}"
         else:
             doc_id = f"{dataset_type}_{idx}"
+        docs.append((idx, doc_id, text))
 
-        # セマンティック分割によるチャンク作成を使用
-        try:
-            chunk_id_prefix = f"{doc_id}_chunk"
-            chunks = create_semantic_chunks(
-                text=text,
-                lang=lang,
-                max_tokens=chunk_size,
-                chunk_id_prefix=chunk_id_prefix
-            )
-
-            # 各チャンクにメタデータを追加
-            for i, chunk in enumerate(chunks):
-                chunk['doc_id'] = doc_id
-                chunk['doc_idx'] = idx
-                chunk['chunk_idx'] = i
-                chunk['dataset_type'] = dataset_type
-                all_chunks.append(chunk)
+    total_docs = len(docs)
+    workers = max(1, min(chunk_workers, total_docs))
+    logger.info(f"チャンク作成開始: {total_docs}件の文書（セマンティック分割、{workers}プロセス）")
 
-        except Exception as e:
-            logger.warning(f"チャンク作成エラー (doc {idx}): {e}")
-            continue
+    chunk_document = partial(_chunk_document, dataset_type=dataset_type, lang=lang, chunk_size=chunk_size)
+    all_chunks = []
+    # 進捗ログの間隔（逐次は10件ごと、並列は約1%ごと）
+    step = 10 if workers == 1 else max(10, total_docs // 100)
+
+    def collect(results) -> None:
+        for i, chunks in enumerate(results):
+            all_chunks.extend(chunks)
+            if (i + 1) % step == 0 or (i + 1) == total_docs:
+                logger.info(f"  チャンク作成進捗: {i + 1}/{total_docs} 文書完了")
+
+    if workers > 1:
+        # 文書を連続した塊でワーカーに配り、executor.map で文書順に結果を連結
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_chunk_worker) as executor:
+            collect(executor.map(chunk_document, docs, chunksize=max(1, total_docs // (workers * 8))))
+    else:
+        collect(map(chunk_document, docs))
 
     logger.info(f"チャンク作成完了: {len(all_chunks)}個のチャンク（セマンティック分割）")
     return all_chunks
@@ -896,8 +951,8 @@ def determine_qa_count(chunk: Dict, config: Dict) -> int:
         Q/Aペア数
     """
     base_count = config["qa_per_chunk"]
-    client_for_token_count = create_llm_client(provider="gemini", default_model=model) # modelはLLM生成モデル
-    token_count = client_for_token_count.count_tokens(chunk['text'], model=model)
+    # チャンクごとに呼ぶため、デフォルトはネットワーク不要のローカル計算（LLM_TOKEN_COUNT_MODE=api でGemini API）
+    token_count = get_token_counter(provider="gemini").count_tokens(chunk['text'])
 
     # チャンク位置を考慮（文書後半の補正）
     chunk_position = chunk.get('chunk_idx', 0)
@@ -921,164 +976,231 @@ def determine_qa_count(chunk: Dict, config: Dict) -> int:
     return min(qa_count, 8)  # 上限を8に設定
 
 
-def generate_qa_pairs_for_batch(
-    chunks: List[Dict],
-    config: Dict,
-    model: str = "gemini-2.0-flash",
-    client: Optional[LLMClient] = None
-) -> List[Dict]:
-    """複数チャンクから一度にQ/Aペアを生成（バッチ処理対応）
-    Args:
-        chunks: チャンクデータのリスト（1-5個）
-        config: データセット設定
-        model: 使用するモデル（デフォルト: gemini-2.0-flash）
-        client: LLMクライアント（GeminiClient）
-    Returns:
-        生成されたQ/Aペアのリスト
-    """
-    if client is None:
-        client = create_llm_client(provider="gemini")
-
-    if len(chunks) == 0:
-        return []
-
-    # 単一チャンクの場合は従来の処理
-    if len(chunks) == 1:
-        return generate_qa_pairs_for_chunk(chunks[0], config, model, client)
-
-    lang = config["lang"]
-    all_qa_pairs = []
-
-    # 言語別のプロンプト設定
-    if lang == "ja":
-        system_prompt = """あなたは教育コンテンツ作成の専門家です。
-複数の日本語テキストから、学習効果の高いQ&Aペアを生成してください。
+# 言語別のシステムプロンプト（単一チャンク / 複数チャンク）
+_QA_SYSTEM_PROMPTS = {
+    "ja": """あなたは教育コンテンツ作成の専門家です。
+{source}から、学習効果の高いQ&Aペアを生成してください。
 
 生成ルール:
 1. 質問は明確で具体的に
 2. 回答は簡潔で正確に（1-2文程度）
 3. テキストの内容に忠実に
-4. 多様な観点から質問を作成"""
-
-        # 複数チャンクを結合してプロンプト構築
-        combined_text = ""
-        chunks_data = {}
-        total_pairs = 0
-
-        for i, chunk in enumerate(chunks, 1):
-            num_pairs = determine_qa_count(chunk, config)
-            total_pairs += num_pairs
-            chunk_text = chunk['text']
+4. 多様な観点から質問を作成""",
+    "en": """You are an expert in educational content creation.
+Generate high-quality Q&A pairs from {source}.
 
-            # 長すぎる場合は短縮
-            if len(chunk_text) > 1000:
-                chunk_text = chunk_text[:1000] + "..."
-
-            combined_text += f"\n\n【テキスト{i}】\n{chunk_text}"
-            chunks_data[f"chunk_{i}"] = {"num_pairs": num_pairs, "chunk": chunk}
+Generation rules:
+1. Questions should be clear and specific
+2. Answers should be concise and accurate (1-2 sentences)
+3. Stay faithful to the text content
+4. Create questions from diverse perspectives""",
+}
 
-        user_prompt = f"""以下の{len(chunks)}個のテキストから、合計{total_pairs}個のQ&Aペアを生成してください。
-{combined_text}
+_QA_SYSTEM_SOURCES = {
+    "ja": {"single": "与えられた日本語テキスト", "batch": "複数の日本語テキスト"},
+    "en": {"single": "the given English text", "batch": "multiple English texts"},
+}
 
-質問タイプ:
-- fact: 事実確認型（〜は何ですか？）
+_QA_QUESTION_TYPES = {
+    "ja": """- fact: 事実確認型（〜は何ですか？）
 - reason: 理由説明型（なぜ〜ですか？）
 - comparison: 比較型（〜と〜の違いは？）
-- application: 応用型（〜はどのように活用されますか？）
+- application: 応用型（〜はどのように活用されますか？）""",
+    "en": """- fact: Factual questions (What is...?)
+- reason: Explanatory questions (Why...?)
+- comparison: Comparative questions (What's the difference...?)
+- application: Application questions (How is... used?)""",
+}
 
-JSON形式で出力:
-{{
+_QA_OUTPUT_FORMATS = {
+    "ja": """JSON形式で出力:
+{
   "qa_pairs": [
-    {{
+    {
       "question": "質問文",
       "answer": "回答文",
       "question_type": "fact/reason/comparison/application"
-    }}
+    }
+  ]
+}""",
+    "en": """Output in JSON format:
+{
+  "qa_pairs": [
+    {
+      "question": "question text",
+      "answer": "answer text",
+      "question_type": "fact/reason/comparison/application"
+    }
   ]
-}}"""
+}""",
+}
 
-    else:
-        system_prompt = """You are an expert in educational content creation.
-Generate high-quality Q&A pairs from multiple English texts.
 
-Generation rules:
-1. Questions should be clear and specific
-2. Answers should be concise and accurate (1-2 sentences)
-3. Stay faithful to the text content
-4. Create questions from diverse perspectives"""
+def _qa_prompt_lang(config: Dict) -> str:
+    return "ja" if config["lang"] == "ja" else "en"
+
+
+def build_batch_qa_prompt(chunks: List[Dict], config: Dict, truncate: bool = True) -> tuple:
+    """複数チャンク用のQ/A生成プロンプトを構築
+    Args:
+        chunks: チャンクデータのリスト
+        config: データセット設定
+        truncate: 各チャンクを1000文字で短縮するか（トークン予算でパッキングした場合はFalse）
+    Returns:
+        (プロンプト, チャンクごとの期待Q/A数のリスト)
+    """
+    lang = _qa_prompt_lang(config)
+    label = "テキスト" if lang == "ja" else "Text "
+
+    combined_text = ""
+    expected_counts = []
+    for i, chunk in enumerate(chunks, 1):
+        num_pairs = determine_qa_count(chunk, config)
+        expected_counts.append(num_pairs)
+        chunk_text = chunk['text']
 
-        # 複数チャンクを結合してプロンプト構築
-        combined_text = ""
-        chunks_data = {}
-        total_pairs = 0
+        # 長すぎる場合は短縮
+        if truncate and len(chunk_text) > 1000:
+            chunk_text = chunk_text[:1000] + "..."
 
-        for i, chunk in enumerate(chunks, 1):
-            num_pairs = determine_qa_count(chunk, config)
-            total_pairs += num_pairs
-            chunk_text = chunk['text']
+        combined_text += f"\n\n【{label}{i}】\n{chunk_text}"
 
-            # 長すぎる場合は短縮
-            if len(chunk_text) > 1000:
-                chunk_text = chunk_text[:1000] + "..."
+    total_pairs = sum(expected_counts)
+    if lang == "ja":
+        user_prompt = f"""以下の{len(chunks)}個のテキストから、合計{total_pairs}個のQ&Aペアを生成してください。
+{combined_text}
 
-            combined_text += f"\n\n【Text {i}】\n{chunk_text}"
-            chunks_data[f"chunk_{i}"] = {"num_pairs": num_pairs, "chunk": chunk}
+質問タイプ:
+{_QA_QUESTION_TYPES[lang]}
 
+{_QA_OUTPUT_FORMATS[lang]}"""
+    else:
         user_prompt = f"""Generate {total_pairs} Q&A pairs from the following {len(chunks)} texts.
 {combined_text}
 
 Question types:
-- fact: Factual questions (What is...?)
-- reason: Explanatory questions (Why...?)
-- comparison: Comparative questions (What's the difference...?)
-- application: Application questions (How is... used?)
+{_QA_QUESTION_TYPES[lang]}
 
-Output in JSON format:
-{{
-  "qa_pairs": [
-    {{
-      "question": "question text",
-      "answer": "answer text",
-      "question_type": "fact/reason/comparison/application"
-    }}
-  ]
-}}"""
+{_QA_OUTPUT_FORMATS[lang]}"""
 
-    try:
-        # Gemini API を使用（構造化出力）
-        # システムプロンプトとユーザープロンプトを統合
-        combined_input = f"{system_prompt}\n\n{user_prompt}"
+    system_prompt = _QA_SYSTEM_PROMPTS[lang].format(source=_QA_SYSTEM_SOURCES[lang]["batch"])
+    return f"{system_prompt}\n\n{user_prompt}", expected_counts
+
+
+def build_chunk_qa_prompt(chunk: Dict, config: Dict, truncate: bool = True) -> tuple:
+    """単一チャンク用のQ/A生成プロンプトを構築
+    Args:
+        chunk: チャンクデータ
+        config: データセット設定
+        truncate: チャンクを2000文字で短縮するか（トークン予算でパッキングした場合はFalse）
+    Returns:
+        (プロンプト, 期待Q/A数)
+    """
+    lang = _qa_prompt_lang(config)
+    num_pairs = determine_qa_count(chunk, config)
+
+    # チャンクが長すぎる場合は短縮（日本語テキストは長い傾向があるため）
+    max_chunk_length = 2000  # 文字数制限
+    chunk_text = chunk['text']
+    if truncate and len(chunk_text) > max_chunk_length:
+        chunk_text = chunk_text[:max_chunk_length] + "..."
+        logger.debug(f"チャンクを{max_chunk_length}文字に短縮")
+
+    if lang == "ja":
+        user_prompt = f"""以下のテキストから{num_pairs}個のQ&Aペアを生成してください。
+
+質問タイプ:
+
+{_QA_QUESTION_TYPES[lang]}
+
+テキスト:
+{chunk_text}
+
+{_QA_OUTPUT_FORMATS[lang]}"""
+    else:
+        user_prompt = f"""Generate {num_pairs} Q&A pairs from the following text.
+
+Question types:
+
+{_QA_QUESTION_TYPES[lang]}
+
+Text:
+{chunk_text}
+
+{_QA_OUTPUT_FORMATS[lang]}"""
+
+    system_prompt = _QA_SYSTEM_PROMPTS[lang].format(source=_QA_SYSTEM_SOURCES[lang]["single"])
+    return f"{system_prompt}\n\n{user_prompt}", num_pairs
+
+
+def _qa_record(qa_data, chunk: Dict) -> Dict:
+    """構造化出力の1ペアをチャンク情報付きのQ/A辞書に変換"""
+    return {
+        "question": qa_data.question,
+        "answer": qa_data.answer,
+        "question_type": qa_data.question_type,
+        "source_chunk_id": chunk.get('id', ''),
+        "doc_id": chunk.get('doc_id', ''),
+        "dataset_type": chunk.get('dataset_type', ''),
+        "chunk_idx": chunk.get('chunk_idx', 0)
+    }
+
+
+def _distribute_qa_pairs(chunks: List[Dict], expected_counts: List[int], parsed_data: QAPairsResponse) -> List[Dict]:
+    """複数チャンク分の生成結果を、各チャンクの期待数ずつ先頭から割り当てる"""
+    qa_pairs = []
+    qa_index = 0
+    for chunk, expected_pairs in zip(chunks, expected_counts):
+        for _ in range(expected_pairs):
+            if qa_index < len(parsed_data.qa_pairs):
+                qa_pairs.append(_qa_record(parsed_data.qa_pairs[qa_index], chunk))
+                qa_index += 1
+    return qa_pairs
+
+
+def generate_qa_pairs_for_batch(
+    chunks: List[Dict],
+    config: Dict,
+    model: str = "gemini-2.0-flash",
+    client: Optional[LLMClient] = None,
+    truncate: bool = True,
+    max_output_tokens: int = 4000
+) -> List[Dict]:
+    """複数チャンクから一度にQ/Aペアを生成（バッチ処理対応）
+    Args:
+        chunks: チャンクデータのリスト（1-5個、トークン予算でパッキングした場合は任意個）
+        config: データセット設定
+        model: 使用するモデル（デフォルト: gemini-2.0-flash）
+        client: LLMクライアント（GeminiClient）
+        truncate: 各チャンクを短縮するか
+        max_output_tokens: 出力トークン上限
+    Returns:
+        生成されたQ/Aペアのリスト
+    """
+    if client is None:
+        client = create_llm_client(provider="gemini")
+
+    if len(chunks) == 0:
+        return []
 
+    # 単一チャンクの場合は従来の処理
+    if len(chunks) == 1:
+        return generate_qa_pairs_for_chunk(chunks[0], config, model, client, truncate=truncate)
+
+    all_qa_pairs = []
+    combined_input, expected_counts = build_batch_qa_prompt(chunks, config, truncate=truncate)
+
+    try:
         # GeminiClientの構造化出力メソッドを使用
         parsed_data = client.generate_structured(
             prompt=combined_input,
             response_schema=QAPairsResponse,
             model=model,
-            max_output_tokens=4000  # バッチ処理のため増加（3チャンク対応）
+            max_output_tokens=max_output_tokens  # バッチ処理のため増加（3チャンク対応）
         )
 
-        # 生成されたQ/Aペアを各チャンクに分配
-        # 各チャンクに期待される数だけQ/Aを割り当て
-        qa_index = 0
-        for i, chunk in enumerate(chunks, 1):
-            chunk_key = f"chunk_{i}"
-            expected_pairs = chunks_data[chunk_key]["num_pairs"]
-
-            # このチャンクに割り当てるQ/Aペアを取得
-            for _ in range(expected_pairs):
-                if qa_index < len(parsed_data.qa_pairs):
-                    qa_data = parsed_data.qa_pairs[qa_index]
-                    qa = {
-                        "question": qa_data.question,
-                        "answer": qa_data.answer,
-                        "question_type": qa_data.question_type,
-                        "source_chunk_id": chunk.get('id', ''),
-                        "doc_id": chunk.get('doc_id', ''),
-                        "dataset_type": chunk.get('dataset_type', ''),
-                        "chunk_idx": chunk.get('chunk_idx', 0)
-                    }
-                    all_qa_pairs.append(qa)
-                    qa_index += 1
+        # 生成されたQ/Aペアを各チャンクに期待される数だけ分配
+        all_qa_pairs = _distribute_qa_pairs(chunks, expected_counts, parsed_data)
 
         # 空レスポンスチェック
         if len(all_qa_pairs) == 0:
@@ -1095,7 +1217,7 @@ Output in JSON format:
         logger.info("フォールバック: チャンクを個別処理します")
         for chunk in chunks:
             try:
-                qa_pairs = generate_qa_pairs_for_chunk(chunk, config, model, client)
+                qa_pairs = generate_qa_pairs_for_chunk(chunk, config, model, client, truncate=truncate)
                 all_qa_pairs.extend(qa_pairs)
             except Exception as chunk_error:
                 logger.error(f"チャンク個別処理エラー: {chunk_error}")
@@ -1106,7 +1228,9 @@ def generate_qa_pairs_for_chunk(
     chunk: Dict,
     config: Dict,
     model: str = "gemini-2.0-flash",
-    client: Optional[LLMClient] = None
+    client: Optional[LLMClient] = None,
+    truncate: bool = True,
+    max_output_tokens: int = 1000
 ) -> List[Dict]:
     """単一チャンクからQ/Aペアを生成
     Args:
@@ -1114,159 +1238,27 @@ def generate_qa_pairs_for_chunk(
         config: データセット設定
         model: 使用するモデル（デフォルト: gemini-2.0-flash）
         client: LLMクライアント（GeminiClient）
+        truncate: チャンクを短縮するか
+        max_output_tokens: 出力トークン上限
     Returns:
         生成されたQ/Aペアのリスト
     """
     if client is None:
         client = create_llm_client(provider="gemini")
 
-    num_pairs = determine_qa_count(chunk, config)
-    lang = config["lang"]
-
-    # 言語別のプロンプト設定
-    if lang == "ja":
-        system_prompt = """あなたは教育コンテンツ作成の専門家です。
-与えられた日本語テキストから、学習効果の高いQ&Aペアを生成してください。
-
-生成ルール:
-1. 質問は明確で具体的に
-2. 回答は簡潔で正確に（1-2文程度）
-3. テキストの内容に忠実に
-4. 多様な観点から質問を作成"""
-
-        question_types_desc = """
-- fact: 事実確認型（〜は何ですか？）
-- reason: 理由説明型（なぜ〜ですか？）
-- comparison: 比較型（〜と〜の違いは？）
-- application: 応用型（〜はどのように活用されますか？）"""
-    else:
-        system_prompt = """You are an expert in educational content creation.
-Generate high-quality Q&A pairs from the given English text.
-
-Generation rules:
-1. Questions should be clear and specific
-2. Answers should be concise and accurate (1-2 sentences)
-3. Stay faithful to the text content
-4. Create questions from diverse perspectives"""
-
-        question_types_desc = """
-- fact: Factual questions (What is...?)
-- reason: Explanatory questions (Why...?)
-- comparison: Comparative questions (What's the difference...?)
-- application: Application questions (How is... used?)"""
-
-    # 言語に応じたユーザープロンプト
-    if lang == "ja":
-        user_prompt = f"""以下のテキストから{num_pairs}個のQ&Aペアを生成してください。
-
-質問タイプ:
-{question_types_desc}
-
-テキスト:
-{chunk['text']}
-
-JSON形式で出力:
-{{
-  "qa_pairs": [
-    {{
-      "question": "質問文",
-      "answer": "回答文",
-      "question_type": "fact/reason/comparison/application"
-    }}
-  ]
-}}"""
-    else:
-        user_prompt = f"""Generate {num_pairs} Q&A pairs from the following text.
-
-Question types:
-{question_types_desc}
-
-Text:
-{chunk['text']}
-
-Output in JSON format:
-{{
-  "qa_pairs": [
-    {{
-      "question": "question text",
-      "answer": "answer text",
-      "question_type": "fact/reason/comparison/application"
-    }}
-  ]
-}}"""
-
     try:
-        # チャンクが長すぎる場合は短縮（日本語テキストは長い傾向があるため）
-        max_chunk_length = 2000  # 文字数制限
-        chunk_text = chunk['text']
-        if len(chunk_text) > max_chunk_length:
-            chunk_text = chunk_text[:max_chunk_length] + "..."
-            logger.debug(f"チャンクを{max_chunk_length}文字に短縮")
-
-        # プロンプトの再構築（短縮されたテキストを使用）
-        if lang == "ja":
-            user_prompt = f"""以下のテキストから{num_pairs}個のQ&Aペアを生成してください。
-
-質問タイプ:
-{question_types_desc}
-
-テキスト:
-{chunk_text}
-
-JSON形式で出力:
-{{
-  "qa_pairs": [
-    {{
-      "question": "質問文",
-      "answer": "回答文",
-      "question_type": "fact/reason/comparison/application"
-    }}
-  ]
-}}"""
-        else:
-            user_prompt = f"""Generate {num_pairs} Q&A pairs from the following text.
-
-Question types:
-{question_types_desc}
-
-Text:
-{chunk_text}
-
-Output in JSON format:
-{{
-  "qa_pairs": [
-    {{
-      "question": "question text",
-      "answer": "answer text",
-      "question_type": "fact/reason/comparison/application"
-    }}
-  ]
-}}"""
-
-        # Gemini API を使用（構造化出力）
-        combined_input = f"{system_prompt}\n\n{user_prompt}"
+        combined_input, _ = build_chunk_qa_prompt(chunk, config, truncate=truncate)
 
         # GeminiClientの構造化出力メソッドを使用
         parsed_data = client.generate_structured(
             prompt=combined_input,
             response_schema=QAPairsResponse,
             model=model,
-            max_output_tokens=1000
+            max_output_tokens=max_output_tokens
         )
 
         # レスポンスの解析
-        qa_pairs = []
-        for qa_data in parsed_data.qa_pairs:
-            qa = {
-                "question": qa_data.question,
-                "answer": qa_data.answer,
-                "question_type": qa_data.question_type,
-                "source_chunk_id": chunk.get('id', ''),
-                "doc_id": chunk.get('doc_id', ''),
-                "dataset_type": chunk.get('dataset_type', ''),
-                "chunk_idx": chunk.get('chunk_idx', 0)
-            }
-            qa_pairs.append(qa)
+        qa_pairs = [_qa_record(qa_data, chunk) for qa_data in parsed_data.qa_pairs]
 
         # 空レスポンスチェック
         if len(qa_pairs) == 0:
@@ -1282,6 +1274,229 @@ Output in JSON format:
         return []
 
 
+def generate_rule_based_qa(chunk: Dict, config: Dict) -> List[Dict]:
+    """LLMを呼ばずに定義文・列挙パターンからQ/Aペアを生成（日本語のみ）
+    Args:
+        chunk: チャンクデータ
+        config: データセット設定
+    Returns:
+        生成されたQ/Aペアのリスト（determine_qa_count 個まで。パターンに合わなければ空）
+    """
+    if config.get("lang", "ja") != "ja":
+        return []
+    from helper_rag_qa import RuleBasedQAGenerator
+
+    generator = RuleBasedQAGenerator()
+    candidates = generator.extract_definition_qa(chunk['text']) + generator.extract_list_qa(chunk['text'])
+    return [
+        _qa_record(QAPair(question=qa["question"], answer=qa["answer"], question_type=qa["type"]), chunk)
+        for qa in candidates[:determine_qa_count(chunk, config)]
+    ]
+
+
+def apply_chunk_prefilter(
+    chunks: List[Dict],
+    config: Dict,
+    prefilter,
+    mode: str = "skip",
+    chunk_batch_size: int = 3,
+    input_token_budget: Optional[int] = None,
+    output_token_budget: Optional[int] = None
+) -> tuple:
+    """低情報チャンク（定型文・ナビゲーション・ほぼ空）をLLMに送らないよう除外
+    Args:
+        chunks: チャンクリスト（merge_small_chunks 後）
+        config: データセット設定
+        prefilter: helper_rag_qa.ChunkInformationFilter
+        mode: "skip"（生成しない）/ "template"（テンプレートQ/Aを1ペア作る）
+        chunk_batch_size / input_token_budget / output_token_budget: 削減できたAPI呼び出し数の見積もり用
+    Returns:
+        (LLMに送るチャンク, テンプレートQ/Aペア)
+    """
+    lang = config.get("lang", "ja")
+    kept, skipped = prefilter.split(chunks, lang)
+    template_pairs = []
+    if mode == "template":
+        for chunk in skipped:
+            template_pairs.extend(
+                _qa_record(QAPair(question=qa["question"], answer=qa["answer"], question_type=qa["type"]), chunk)
+                for qa in prefilter.template_qa(chunk['text'], lang)
+            )
+
+    if skipped:
+        saved = _estimate_saved_calls(skipped, len(kept), config, chunk_batch_size, input_token_budget, output_token_budget)
+        logger.info(f"プレフィルタ: 低情報チャンク {len(skipped)}/{len(chunks)}個をスキップ "
+                    f"(閾値 {prefilter.threshold}, テンプレートQ/A {len(template_pairs)}個), "
+                    f"削減したAPI呼び出し 約{saved}回")
+    return kept, template_pairs
+
+
+def _estimate_saved_calls(
+    skipped: List[Dict],
+    kept_count: int,
+    config: Dict,
+    chunk_batch_size: int,
+    input_token_budget: Optional[int],
+    output_token_budget: Optional[int]
+) -> int:
+    """プレフィルタで減ったAPI呼び出し数の見積もり（全チャンクのバッチ計画を作り直さない）
+
+    予算なしはバッチサイズから計算し、予算ありはスキップしたチャンクの入出力トークンを予算で割る。
+    """
+    if input_token_budget is None:
+        total = len(skipped) + kept_count
+        return math.ceil(total / chunk_batch_size) - math.ceil(kept_count / chunk_batch_size)
+    counter = get_token_counter(provider="gemini")
+    input_tokens = sum(chunk.get('tokens') or counter.count_tokens(chunk['text']) for chunk in skipped)
+    output_tokens = sum(determine_qa_count(chunk, config) * DEFAULT_TOKENS_PER_QA_PAIR for chunk in skipped)
+    output_budget = output_token_budget or DEFAULT_PROMPT_OUTPUT_TOKEN_BUDGET
+    return min(len(skipped), max(math.ceil(input_tokens / input_token_budget), math.ceil(output_tokens / output_budget)))
+
+
+def _sort_by_chunk_order(qa_pairs: List[Dict], chunks: List[Dict]) -> List[Dict]:
+    """Q/Aペアをソースチャンクの順に並べ替える（チャンク内の順序は保持）"""
+    positions = {chunk.get('id'): i for i, chunk in enumerate(chunks)}
+    return sorted(qa_pairs, key=lambda qa: positions.get(qa['source_chunk_id'], len(chunks)))
+
+
+def _generate_routed_batch(
+    route: ModelRoute,
+    batch: List[Dict],
+    batch_num: int,
+    config: Dict,
+    router: ModelRouter,
+    client: LLMClient,
+    batch_options: Dict
+) -> List[Dict]:
+    """ルーターが選んだルート（モデル・同時実行数）で1バッチを生成
+    Args:
+        route: 実行するルート（ルールベースの場合 batch は1チャンク）
+        batch: チャンクのリスト
+        batch_num: ログ用のバッチ番号
+        config: データセット設定
+        router: ModelRouter
+        client: LLMクライアント
+        batch_options: _generate_batch_with_fallback の追加引数
+    Returns:
+        生成されたQ/Aペアのリスト
+    """
+    if route.is_rule:
+        with router.run(route, len(batch)) as result:
+            qa_pairs = generate_rule_based_qa(batch[0], config)
+            # 2ペア（期待数が1ならその数）未満しか取れない場合は品質を優先して最速モデルで生成
+            if len(qa_pairs) >= min(2, determine_qa_count(batch[0], config)):
+                result.qa_pairs = len(qa_pairs)
+                return qa_pairs
+        router.record_fallback(route, len(batch))
+        route = router.routes[FAST_ROUTE]
+
+    with router.run(route, len(batch)) as result:
+        qa_pairs = _generate_batch_with_fallback(batch, batch_num, config, route.model, client, **batch_options)
+        result.qa_pairs = len(qa_pairs)
+    return qa_pairs
+
+
+def plan_qa_batches(
+    chunks: List[Dict],
+    config: Dict,
+    chunk_batch_size: int = 3,
+    input_token_budget: Optional[int] = None,
+    output_token_budget: Optional[int] = None
+) -> List[List[Dict]]:
+    """チャンクを1回のAPIで処理するバッチに分割
+    Args:
+        chunks: チャンクリスト
+        config: データセット設定
+        chunk_batch_size: 1バッチのチャンク数（input_token_budget 未指定時）
+        input_token_budget: 1リクエストの入力トークン予算（指定時はチャンク数ではなく予算まで詰める）
+        output_token_budget: 1リクエストの出力トークン予算（期待Q/A数 × 1ペアあたりのトークン数で見積もり）
+    Returns:
+        バッチ（チャンクのリスト）のリスト（チャンクの順序は保持）
+    """
+    if input_token_budget is None:
+        return [chunks[i:i+chunk_batch_size] for i in range(0, len(chunks), chunk_batch_size)]
+
+    counter = get_token_counter(provider="gemini")
+    # 共通部分（システムプロンプト・指示・出力形式）と、チャンクごとの見出しのトークン数
+    prompt_overhead = counter.count_tokens(build_structured_prompt(build_batch_qa_prompt([], config)[0], QAPairsResponse))
+    item_overhead = counter.count_tokens("\n\n【テキスト10】\n")
+
+    packer = TokenBudgetPacker(
+        input_budget=input_token_budget,
+        output_budget=output_token_budget or DEFAULT_PROMPT_OUTPUT_TOKEN_BUDGET,
+        prompt_overhead_tokens=prompt_overhead,
+        item_overhead_tokens=item_overhead
+    )
+    packed = packer.pack(
+        [chunk.get('tokens') or counter.count_tokens(chunk['text']) for chunk in chunks],
+        [determine_qa_count(chunk, config) * DEFAULT_TOKENS_PER_QA_PAIR for chunk in chunks]
+    )
+    batches = [[chunks[i] for i in request.indices] for request in packed]
+    logger.info(f"トークン予算パッキング: {len(chunks)}チャンク → {len(batches)}リクエスト "
+                f"(入力予算 {packer.input_budget}, 出力予算 {packer.output_budget}, "
+                f"予算超過 {sum(1 for request in packed if request.oversized)}件)")
+    return batches
+
+
+def _generate_batch_with_fallback(
+    batch: List[Dict],
+    batch_num: int,
+    config: Dict,
+    model: str,
+    client: LLMClient,
+    max_retries: int = 3,
+    truncate: bool = True,
+    max_output_tokens: Optional[int] = None
+) -> List[Dict]:
+    """1バッチのQ/Aペア生成（リトライ付き、最終試行失敗時はチャンク単位にフォールバック）
+    Args:
+        batch: チャンクのリスト（1個なら単一チャンク処理）
+        batch_num: ログ用のバッチ番号
+        config: データセット設定
+        model: 使用するモデル
+        client: LLMクライアント
+        max_retries: 最大試行回数
+        truncate: チャンクを短縮するか（トークン予算でパッキングした場合はFalse）
+        max_output_tokens: 出力トークン上限（Noneは単一チャンク/バッチそれぞれの既定値）
+    Returns:
+        生成されたQ/Aペアのリスト（失敗したチャンク分は含まない）
+    """
+    output_options = {"max_output_tokens": max_output_tokens} if max_output_tokens else {}
+    for attempt in range(max_retries):
+        try:
+            if len(batch) == 1:
+                # 単一チャンク処理
+                qa_pairs = generate_qa_pairs_for_chunk(batch[0], config, model, client, truncate=truncate, **output_options)
+            else:
+                # バッチ処理
+                qa_pairs = generate_qa_pairs_for_batch(batch, config, model, client, truncate=truncate, **output_options)
+
+            if qa_pairs:
+                logger.debug(f"バッチ {batch_num}: {len(qa_pairs)}個のQ/Aペア生成")
+            return qa_pairs or []
+
+        except Exception as e:
+            if attempt < max_retries - 1:
+                wait_time = 2 ** attempt
+                logger.warning(f"バッチ {batch_num} リトライ {attempt + 1}/{max_retries} (待機: {wait_time}秒)")
+                time.sleep(wait_time)
+                continue
+
+            logger.error(f"バッチ {batch_num} 生成失敗: {e}")
+            # 最終試行失敗時は個別処理にフォールバック
+            logger.info("個別処理にフォールバック...")
+            fallback_pairs = []
+            for chunk in batch:
+                try:
+                    qa_pairs = generate_qa_pairs_for_chunk(chunk, config, model, client, truncate=truncate, **output_options)
+                    if qa_pairs:
+                        fallback_pairs.extend(qa_pairs)
+                except Exception as chunk_error:
+                    logger.error(f"チャンク処理エラー: {chunk_error}")
+            return fallback_pairs
+    return []
+
+
 def generate_qa_for_dataset(
     chunks: List[Dict],
     dataset_type: str,
@@ -1290,7 +1505,14 @@ def generate_qa_for_dataset(
     merge_chunks: bool = True,
     min_tokens: int = 150,
     max_tokens: int = 400,
-    config: Optional[Dict] = None
+    config: Optional[Dict] = None,
+    concurrency: int = 1,
+    client: Optional[LLMClient] = None,
+    input_token_budget: Optional[int] = None,
+    output_token_budget: Optional[int] = None,
+    router: Optional[ModelRouter] = None,
+    prefilter=None,
+    prefilter_mode: str = "skip"
 ) -> List[Dict]:
     """データセット全体のQ/Aペア生成（改善版）
     Args:
@@ -1302,15 +1524,25 @@ def generate_qa_for_dataset(
         min_tokens: 統合対象の最小トークン数
         max_tokens: 統合後の最大トークン数
         config: データセット設定（指定がない場合はDATASET_CONFIGSから取得）
+        concurrency: 同時に処理するバッチ数（1は逐次処理。2以上はスレッドプールで並列実行し、
+            実際の同時リクエスト数はLLMクライアントの concurrency_controller が429に応じて調整）
+        client: LLMクライアント（CachedLLMClient 等を注入可能。Noneは新規作成）
+        input_token_budget: 1リクエストの入力トークン予算（指定時は chunk_batch_size の代わりに
+            予算までチャンクを詰め、チャンクを短縮しない）
+        output_token_budget: 1リクエストの出力トークン予算（max_output_tokens にも使う）
+        router: チャンク複雑度でモデルを選ぶルーター（指定時は model の代わりにルートごとのモデルと
+            同時実行数を使い、ルートごとにバッチを組む）
+        prefilter: 低情報チャンクをLLMに送らないプレフィルタ（helper_rag_qa.ChunkInformationFilter）
+        prefilter_mode: 低情報チャンクの扱い（"skip" / "template"）
     Returns:
-        生成されたQ/Aペアのリスト
+        生成されたQ/Aペアのリスト（concurrencyに関わらずバッチ順。router・テンプレートQ/Aがある場合はチャンク順）
     """
     if config is None:
         config = DATASET_CONFIGS.get(dataset_type)
         if not config:
             raise ValueError(f"未対応のデータセット: {dataset_type}")
 
-    client = create_llm_client(provider="gemini")
+    client = client or create_llm_client(provider="gemini")
     all_qa_pairs = []
 
     # チャンクの前処理（小さいチャンクの統合）
@@ -1319,67 +1551,200 @@ def generate_qa_for_dataset(
     else:
         processed_chunks = chunks
 
+    template_pairs = []
+    if prefilter is not None:
+        all_chunks = processed_chunks
+        processed_chunks, template_pairs = apply_chunk_prefilter(
+            processed_chunks, config, prefilter, prefilter_mode, chunk_batch_size, input_token_budget, output_token_budget
+        )
+
     total_chunks = len(processed_chunks)
-    api_calls = (total_chunks + chunk_batch_size - 1) // chunk_batch_size
+    if router is not None:
+        # ルートごとにバッチを組む（ルールベースはチャンク単位）
+        routed = router.assign(processed_chunks, lambda chunk: analyze_chunk_complexity(chunk['text'], config.get("lang", "ja")))
+        routes, batches = [], []
+        for route_name, route_chunks in routed.items():
+            route = router.routes[route_name]
+            route_batches = ([[chunk] for chunk in route_chunks] if route.is_rule else
+                             plan_qa_batches(route_chunks, config, chunk_batch_size, input_token_budget, output_token_budget))
+            routes.extend([route] * len(route_batches))
+            batches.extend(route_batches)
+    else:
+        batches = plan_qa_batches(processed_chunks, config, chunk_batch_size, input_token_budget, output_token_budget)
+    api_calls = len(batches)
+    packed = input_token_budget is not None
+    batch_options = {"truncate": False, "max_output_tokens": output_token_budget or DEFAULT_PROMPT_OUTPUT_TOKEN_BUDGET} if packed else {}
 
     logger.info(f"""
     Q/Aペア生成開始:
     - 元チャンク数: {len(chunks)}
     - 処理チャンク数: {total_chunks}
-    - バッチサイズ: {chunk_batch_size}
+    - バッチサイズ: {f'トークン予算 {input_token_budget}' if packed else chunk_batch_size}
     - API呼び出し予定: {api_calls}回
-    - モデル: {model}
+    - 同時実行バッチ数: {concurrency}
+    - モデル: {'複雑度ルーティング' if router is not None else model}
     """)
 
-    # バッチ処理
-    for i in range(0, total_chunks, chunk_batch_size):
-        batch = processed_chunks[i:i+chunk_batch_size]
-        batch_num = i // chunk_batch_size + 1
-        total_batches = api_calls
+    def run_batch(batch_num: int, batch: List[Dict]) -> List[Dict]:
+        logger.info(f"バッチ {batch_num}/{api_calls} 処理中 ({len(batch)}チャンク)...")
+        if router is not None:
+            return _generate_routed_batch(routes[batch_num - 1], batch, batch_num, config, router, client, batch_options)
+        return _generate_batch_with_fallback(batch, batch_num, config, model, client, **batch_options)
 
-        logger.info(f"バッチ {batch_num}/{total_batches} 処理中 ({len(batch)}チャンク)...")
+    # バッチ処理（並列時も executor.map で結果をバッチ順に連結）
+    if concurrency > 1 and len(batches) > 1:
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="qa-batch") as executor:
+            for qa_pairs in executor.map(run_batch, range(1, len(batches) + 1), batches):
+                all_qa_pairs.extend(qa_pairs)
+    else:
+        for batch_num, batch in enumerate(batches, 1):
+            all_qa_pairs.extend(run_batch(batch_num, batch))
 
-        # リトライ機能付きQ/A生成
-        max_retries = 3
-        for attempt in range(max_retries):
-            try:
-                if chunk_batch_size == 1:
-                    # 単一チャンク処理
-                    qa_pairs = generate_qa_pairs_for_chunk(batch[0], config, model, client)
-                else:
-                    # バッチ処理
-                    qa_pairs = generate_qa_pairs_for_batch(batch, config, model, client)
+    if router is not None or template_pairs:
+        # ルートごとに並んだ結果・テンプレートQ/Aをチャンク順に戻す
+        all_qa_pairs = _sort_by_chunk_order(all_qa_pairs + template_pairs,
+                                            all_chunks if prefilter is not None else processed_chunks)
+    if router is not None:
+        logger.info(router.format_report())
 
-                if qa_pairs:
-                    all_qa_pairs.extend(qa_pairs)
-                    logger.debug(f"バッチ {batch_num}: {len(qa_pairs)}個のQ/Aペア生成")
-                break
+    logger.info(f"""
+    Q/Aペア生成完了:
+    - 生成されたQ/Aペア: {len(all_qa_pairs)}個
+    - 実行されたAPI呼び出し: 約{api_calls}回
+    """)
 
-            except Exception as e:
-                if attempt == max_retries - 1:
-                    logger.error(f"バッチ {batch_num} 生成失敗: {e}")
-                    # 最終試行失敗時は個別処理にフォールバック
-                    logger.info("個別処理にフォールバック...")
-                    for chunk in batch:
-                        try:
-                            qa_pairs = generate_qa_pairs_for_chunk(chunk, config, model, client)
-                            if qa_pairs:
-                                all_qa_pairs.extend(qa_pairs)
-                        except Exception as chunk_error:
-                            logger.error(f"チャンク処理エラー: {chunk_error}")
-                else:
-                    wait_time = 2 ** attempt
-                    logger.warning(f"リトライ {attempt + 1}/{max_retries} (待機: {wait_time}秒)")
-                    time.sleep(wait_time)
+    return all_qa_pairs
+
+
+# バッチジョブの生成設定（全リクエスト共通のため複数チャンク処理の出力上限に合わせる）
+BATCH_JOB_GENERATION_CONFIG = {"response_mime_type": "application/json", "max_output_tokens": 4000}
+
+
+def generate_qa_for_dataset_batch_job(
+    chunks: List[Dict],
+    dataset_type: str,
+    model: str = "gemini-2.0-flash",
+    chunk_batch_size: int = 3,
+    merge_chunks: bool = True,
+    min_tokens: int = 150,
+    max_tokens: int = 400,
+    config: Optional[Dict] = None,
+    job_client: Optional[BatchJobClient] = None,
+    client: Optional[LLMClient] = None,
+    input_token_budget: Optional[int] = None,
+    output_token_budget: Optional[int] = None,
+    prefilter=None,
+    prefilter_mode: str = "skip"
+) -> List[Dict]:
+    """データセット全体のQ/Aペア生成（Gemini Batch API による非同期バッチジョブ）
+
+    全バッチのプロンプトを1つのJSONLにまとめて投入し、完了後の結果を通常処理と同じ
+    構造化出力の解析・チャンク分配に通す。対話的なレイテンシは不要だがRPM制限を
+    受けずに全件処理したい場合に使う。失敗・解析不能だったバッチのみ通常APIで再生成する。
+
+    Args:
+        chunks: チャンクリスト
+        dataset_type: データセットタイプ
+        model: 使用するモデル（デフォルト: gemini-2.0-flash）
+        chunk_batch_size: 1リクエストで処理するチャンク数（1-5）
+        merge_chunks: 小さいチャンクを統合するか
+        min_tokens: 統合対象の最小トークン数
+        max_tokens: 統合後の最大トークン数
+        config: データセット設定（指定がない場合はDATASET_CONFIGSから取得）
+        job_client: バッチジョブクライアント（Noneは GeminiBatchBackend で新規作成）
+        client: 失敗バッチの再生成に使うLLMクライアント（Noneは必要時に新規作成）
+        input_token_budget: 1リクエストの入力トークン予算（generate_qa_for_dataset と同じ）
+        output_token_budget: 1リクエストの出力トークン予算
+        prefilter: 低情報チャンクをLLMに送らないプレフィルタ（generate_qa_for_dataset と同じ）
+        prefilter_mode: 低情報チャンクの扱い（"skip" / "template"）
+    Returns:
+        生成されたQ/Aペアのリスト（バッチ順。テンプレートQ/Aがある場合はチャンク順）
+    """
+    if config is None:
+        config = DATASET_CONFIGS.get(dataset_type)
+        if not config:
+            raise ValueError(f"未対応のデータセット: {dataset_type}")
 
-        # API制限対策（最後のバッチ以外で待機）
-        if i + chunk_batch_size < total_chunks:
-            time.sleep(0.2)  # 短縮（バッチ処理により呼び出し数が減っているため）
+    if merge_chunks:
+        processed_chunks = merge_small_chunks(chunks, min_tokens, max_tokens)
+    else:
+        processed_chunks = chunks
+
+    template_pairs = []
+    if prefilter is not None:
+        all_chunks = processed_chunks
+        processed_chunks, template_pairs = apply_chunk_prefilter(
+            processed_chunks, config, prefilter, prefilter_mode, chunk_batch_size, input_token_budget, output_token_budget
+        )
+
+    batches = plan_qa_batches(processed_chunks, config, chunk_batch_size, input_token_budget, output_token_budget)
+    truncate = input_token_budget is None
+    generation_config = dict(BATCH_JOB_GENERATION_CONFIG)
+    if not truncate:
+        generation_config["max_output_tokens"] = output_token_budget or DEFAULT_PROMPT_OUTPUT_TOKEN_BUDGET
+
+    # バッチごとのリクエスト（キー → (バッチ, チャンクごとの期待Q/A数)）
+    requests = []
+    plans = {}
+    for batch_num, batch in enumerate(batches, 1):
+        key = f"batch-{batch_num:06d}"
+        if len(batch) == 1:
+            prompt, num_pairs = build_chunk_qa_prompt(batch[0], config, truncate=truncate)
+            expected_counts = None  # 単一チャンクは生成された全ペアを割り当てる
+        else:
+            prompt, expected_counts = build_batch_qa_prompt(batch, config, truncate=truncate)
+        requests.append((key, build_structured_prompt(prompt, QAPairsResponse)))
+        plans[key] = (batch, expected_counts)
 
     logger.info(f"""
-    Q/Aペア生成完了:
+    Q/Aペア生成開始（バッチジョブ）:
+    - 元チャンク数: {len(chunks)}
+    - 処理チャンク数: {len(processed_chunks)}
+    - バッチサイズ: {chunk_batch_size if truncate else f'トークン予算 {input_token_budget}'}
+    - リクエスト数: {len(requests)}
+    - モデル: {model}
+    """)
+
+    job_client = job_client or BatchJobClient(GeminiBatchBackend())
+    results: Dict[str, List[Dict]] = {}
+    for key, text, error in job_client.run(requests, model, generation_config=generation_config):
+        if key not in plans:
+            logger.warning(f"[BatchJob] 不明なキーの結果を無視: {key}")
+            continue
+        if error is not None:
+            logger.warning(f"[BatchJob] {key} 失敗: {error}")
+            continue
+        batch, expected_counts = plans[key]
+        try:
+            parsed_data = QAPairsResponse.model_validate_json(text)
+        except Exception as e:
+            logger.warning(f"[BatchJob] {key} 応答の解析に失敗: {e}")
+            continue
+        if expected_counts is None:
+            qa_pairs = [_qa_record(qa_data, batch[0]) for qa_data in parsed_data.qa_pairs]
+        else:
+            qa_pairs = _distribute_qa_pairs(batch, expected_counts, parsed_data)
+        if qa_pairs:
+            results[key] = qa_pairs
+
+    # 結果をバッチ順に連結（欠けたバッチはチャンク単位で通常APIにフォールバック）
+    all_qa_pairs = []
+    failed = 0
+    for key, _ in requests:
+        if key in results:
+            all_qa_pairs.extend(results[key])
+            continue
+        failed += 1
+        client = client or create_llm_client(provider="gemini")
+        for chunk in plans[key][0]:
+            all_qa_pairs.extend(generate_qa_pairs_for_chunk(chunk, config, model, client, truncate=truncate))
+    if template_pairs:
+        all_qa_pairs = _sort_by_chunk_order(all_qa_pairs + template_pairs, all_chunks)
+
+    logger.info(f"""
+    Q/Aペア生成完了（バッチジョブ）:
     - 生成されたQ/Aペア: {len(all_qa_pairs)}個
-    - 実行されたAPI呼び出し: 約{api_calls}回
+    - 通常APIで再生成したバッチ: {failed}/{len(requests)}
     """)
 
     return all_qa_pairs
@@ -1639,18 +2004,25 @@ def analyze_chunk_characteristics_coverage(chunks: List[Dict], coverage_matrix:
 
 
 def analyze_coverage(chunks: List[Dict], qa_pairs: List[Dict], dataset_type: str = "wikipedia_ja",
-                     custom_threshold: Optional[float] = None) -> Dict:
+                     custom_threshold: Optional[float] = None,
+                     embedding_cache: Optional[str] = None) -> Dict:
     """生成されたQ/Aペアのカバレージを分析（多段階カバレージ分析対応）
     Args:
         chunks: チャンクリスト
         qa_pairs: Q/Aペアリスト
         dataset_type: データセットタイプ（閾値自動設定に使用）
         custom_threshold: カスタム閾値（指定時はこれを使用）
+        embedding_cache: Embeddingキャッシュ（SQLite）のパス（指定時は再実行で再計算しない）
     Returns:
         カバレージ分析結果（多段階評価、チャンク特性分析を含む）
     """
     from helper_rag_qa import SemanticCoverage
-    analyzer = SemanticCoverage()
+    embedding_client = None
+    if embedding_cache:
+        from helper_embedding import DEFAULT_EMBEDDING_PROVIDER, create_embedding_client
+        from helper_embedding_cache import CachedEmbeddingClient
+        embedding_client = CachedEmbeddingClient(create_embedding_client(DEFAULT_EMBEDDING_PROVIDER), cache_path=embedding_cache)
+    analyzer = SemanticCoverage(embedding_client=embedding_client)
 
     # 埋め込み生成（バッチAPI最適化版）
     logger.info("=" * 60)
@@ -1667,6 +2039,8 @@ def analyze_coverage(chunks: List[Dict], qa_pairs: List[Dict], dataset_type: str
     logger.info(f"[Step 2/3] Q/Aペア埋め込み生成: {len(qa_texts)}件")
     qa_embeddings = analyzer.generate_embeddings_batch(qa_texts, batch_size=2048)
     logger.info(f"[Step 2/3] Q/Aペア埋め込み完了: {len(qa_embeddings)}件")
+    if embedding_client is not None:
+        embedding_client.log_stats()
 
     if len(qa_embeddings) == 0:
         return {
@@ -1678,13 +2052,9 @@ def analyze_coverage(chunks: List[Dict], qa_pairs: List[Dict], dataset_type: str
             "chunk_analysis": {}
         }
 
-    # カバレージ行列計算
+    # カバレージ行列計算（正規化済み float32 行列同士の行列積1回）
     logger.info("カバレージ行列計算中...")
-    coverage_matrix = np.zeros((len(chunks), len(qa_pairs)))
-    for i in range(len(doc_embeddings)):
-        for j in range(len(qa_embeddings)):
-            similarity = analyzer.cosine_similarity(doc_embeddings[i], qa_embeddings[j])
-            coverage_matrix[i, j] = similarity
+    coverage_matrix = analyzer.similarity_matrix(doc_embeddings, qa_embeddings)
 
     # データセット別最適閾値を取得
     thresholds = get_optimal_thresholds(dataset_type)
@@ -1941,6 +2311,77 @@ def main():
         action="store_true",
         help="Celeryによる非同期並列処理を使用"
     )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=1,
+        help="Celeryなしで同時に処理するバッチ数（デフォルト: 1=逐次。出力順は変わらない）"
+    )
+    parser.add_argument(
+        "--chunk-workers",
+        type=int,
+        default=1,
+        help="チャンク作成のワーカープロセス数（デフォルト: 1=逐次。チャンクは常に文書順）"
+    )
+    parser.add_argument(
+        "--input-token-budget",
+        type=int,
+        default=None,
+        help="1リクエストの入力トークン予算。指定時は--batch-chunksの代わりに予算までチャンクを詰め、チャンクを短縮しない"
+    )
+    parser.add_argument(
+        "--output-token-budget",
+        type=int,
+        default=None,
+        help=f"1リクエストの出力トークン予算（--input-token-budget指定時、デフォルト: {DEFAULT_PROMPT_OUTPUT_TOKEN_BUDGET}）"
+    )
+    parser.add_argument(
+        "--prefilter-threshold",
+        type=float,
+        default=None,
+        help="情報密度スコア（0-1）がこの値未満の低情報チャンク（定型文・ナビゲーション等）をLLMに送らない（例: 0.3。未指定は無効）"
+    )
+    parser.add_argument(
+        "--prefilter-mode",
+        type=str,
+        choices=["skip", "template"],
+        default="skip",
+        help="低情報チャンクの扱い（skip: 生成しない / template: テンプレートQ/Aを1ペア作る）"
+    )
+    parser.add_argument(
+        "--route-models",
+        action="store_true",
+        help="チャンク複雑度でモデルを振り分ける（low→--fast-model, medium→--model, high→--strong-model）"
+    )
+    parser.add_argument(
+        "--fast-model",
+        type=str,
+        default=DEFAULT_ROUTER_FAST_MODEL,
+        help=f"--route-models時に低複雑度チャンクに使うモデル（デフォルト: {DEFAULT_ROUTER_FAST_MODEL}）"
+    )
+    parser.add_argument(
+        "--strong-model",
+        type=str,
+        default=DEFAULT_ROUTER_STRONG_MODEL,
+        help=f"--route-models時に高複雑度チャンクに使うモデル（デフォルト: {DEFAULT_ROUTER_STRONG_MODEL}）"
+    )
+    parser.add_argument(
+        "--rule-max-tokens",
+        type=int,
+        default=None,
+        help="--route-models時、このトークン数以下の低複雑度チャンクをルールベース生成に回す（日本語のみ。取れなければ--fast-model）"
+    )
+    parser.add_argument(
+        "--route-concurrency",
+        type=str,
+        default=None,
+        help="--route-models時のルートごとの同時実行数（例: fast=8,standard=4,strong=2。--concurrency 2以上で有効）"
+    )
+    parser.add_argument(
+        "--batch-job",
+        action="store_true",
+        help="全チャンクを1つのGemini Batch APIジョブとして非同期処理（完了まで数分〜最大24時間。--use-celeryとは排他）"
+    )
     parser.add_argument(
         "--celery-workers",
         type=int,
@@ -1953,6 +2394,18 @@ def main():
         default=None,
         help="カバレージ判定の類似度閾値（デフォルト: データセット別最適値）"
     )
+    parser.add_argument(
+        "--embedding-cache",
+        type=str,
+        default=None,
+        help="カバレージ分析のEmbeddingキャッシュ（SQLite）のパス（例: qa_output/.embedding_cache.sqlite）"
+    )
+    parser.add_argument(
+        "--llm-cache",
+        type=str,
+        default=None,
+        help="Q/A生成のLLM応答キャッシュ（SQLite）のパス（例: qa_cache/llm_cache.sqlite、通常処理モードのみ）"
+    )
 
     args = parser.parse_args()
 
@@ -1971,6 +2424,34 @@ def main():
         logger.error("--dataset または --input-file のいずれかを指定してください")
         sys.exit(1)
 
+    if args.batch_job and args.use_celery:
+        logger.error("--batch-job と --use-celery は同時に指定できません")
+        sys.exit(1)
+
+    if args.route_models and args.batch_job:
+        logger.error("--route-models と --batch-job は同時に指定できません（バッチジョブは単一モデル）")
+        sys.exit(1)
+
+    if args.chunk_workers < 1:
+        logger.error("--chunk-workers は1以上を指定してください")
+        sys.exit(1)
+
+    prefilter = None
+    if args.prefilter_threshold is not None:
+        from helper_rag_qa import ChunkInformationFilter
+        prefilter = ChunkInformationFilter(threshold=args.prefilter_threshold)
+
+    router = None
+    if args.route_models:
+        router_options = {"rule_max_tokens": args.rule_max_tokens} if args.rule_max_tokens is not None else {}
+        router = ModelRouter(
+            fast_model=args.fast_model,
+            standard_model=args.model,
+            strong_model=args.strong_model,
+            concurrency=parse_route_concurrency(args.route_concurrency) if args.route_concurrency else None,
+            **router_options
+        )
+
     # ローカルファイル処理の場合はdataset_typeとconfigを動的に生成
     if args.input_file:
         dataset_type = "custom_upload"
@@ -2035,7 +2516,8 @@ def main():
         logger.info("\n[2/4] チャンク作成...")
         # ローカルファイルの場合、max_docsは読み込み時に適用済み
         max_docs_for_chunks = None if args.input_file else args.max_docs
-        chunks = create_document_chunks(df, dataset_type, max_docs_for_chunks, config=config)
+        chunks = create_document_chunks(df, dataset_type, max_docs_for_chunks, config=config,
+                                        chunk_workers=args.chunk_workers)
 
         if not chunks:
             logger.error("チャンクが作成されませんでした")
@@ -2043,6 +2525,8 @@ def main():
 
         # 3. Q/Aペア生成
         logger.info("\n[3/4] Q/Aペア生成...")
+        # このプロセスで行うLLM・埋め込み呼び出しの使用量を集計（Celeryワーカー側の呼び出しは含まない）
+        usage_sink = get_usage_meter().add_sink(InMemoryUsageSink())
 
         if args.use_celery:
             logger.info(f"Celery並列処理モード: ワーカー数={args.celery_workers}")
@@ -2058,19 +2542,54 @@ def main():
             else:
                 processed_chunks = chunks
 
+            template_pairs = []
+            if prefilter is not None:
+                processed_chunks, template_pairs = apply_chunk_prefilter(
+                    processed_chunks, config, prefilter, args.prefilter_mode, chunk_batch_size=1
+                )
+
             # 並列タスク投入（Gemini APIを使用）
-            tasks = submit_unified_qa_generation(
-                processed_chunks, config, args.model, provider="gemini"
-            )
+            if router is not None:
+                # ワーカー側にルールベース生成はないため rule ルートも最速モデルで投入する
+                routed = router.assign(processed_chunks, lambda chunk: analyze_chunk_complexity(chunk['text'], config.get("lang", "ja")))
+                tasks = []
+                for route_name, route_chunks in routed.items():
+                    route_model = router.routes[route_name].model or router.routes[FAST_ROUTE].model
+                    tasks.extend(submit_unified_qa_generation(route_chunks, config, route_model, provider="gemini"))
+            else:
+                tasks = submit_unified_qa_generation(
+                    processed_chunks, config, args.model, provider="gemini"
+                )
 
             # 結果収集（タイムアウト: タスク数 × 10秒、最低600秒、最大1800秒）
             # 大量タスクの場合でも30分以内に収集完了を想定
             timeout_seconds = min(max(len(tasks) * 10, 600), 1800)
             logger.info(f"結果収集タイムアウト: {timeout_seconds}秒（{len(tasks)}タスク）")
-            qa_pairs = collect_results(tasks, timeout=timeout_seconds)
+            qa_pairs = collect_results(tasks, timeout=timeout_seconds) + template_pairs
+        elif args.batch_job:
+            logger.info("バッチジョブモード（Gemini Batch API）")
+            logger.info(f"オプション: バッチサイズ={args.batch_chunks}, チャンク統合={'有効' if args.merge_chunks else '無効'}")
+            qa_pairs = generate_qa_for_dataset_batch_job(
+                chunks,
+                dataset_type,
+                args.model,
+                chunk_batch_size=args.batch_chunks,
+                merge_chunks=args.merge_chunks,
+                min_tokens=args.min_tokens,
+                max_tokens=args.max_tokens,
+                config=config,
+                input_token_budget=args.input_token_budget,
+                output_token_budget=args.output_token_budget,
+                prefilter=prefilter,
+                prefilter_mode=args.prefilter_mode
+            )
         else:
-            logger.info("通常処理モード")
+            logger.info("通常処理モード" if args.concurrency <= 1 else f"直接並列処理モード: 同時実行={args.concurrency}")
             logger.info(f"オプション: バッチサイズ={args.batch_chunks}, チャンク統合={'有効' if args.merge_chunks else '無効'}")
+            llm_client = None
+            if args.llm_cache:
+                llm_client = CachedLLMClient(create_llm_client(provider="gemini"), store=LLMCacheStore(args.llm_cache))
+                logger.info(f"LLM応答キャッシュ: {args.llm_cache}")
             qa_pairs = generate_qa_for_dataset(
                 chunks,
                 dataset_type,
@@ -2079,8 +2598,17 @@ def main():
                 merge_chunks=args.merge_chunks,
                 min_tokens=args.min_tokens,
                 max_tokens=args.max_tokens,
-                config=config
+                config=config,
+                concurrency=args.concurrency,
+                client=llm_client,
+                input_token_budget=args.input_token_budget,
+                output_token_budget=args.output_token_budget,
+                router=router,
+                prefilter=prefilter,
+                prefilter_mode=args.prefilter_mode
             )
+            if llm_client is not None:
+                llm_client.log_stats()
 
         if not qa_pairs:
             logger.warning("Q/Aペアが生成されませんでした")
@@ -2091,7 +2619,8 @@ def main():
             logger.info("\n[4/4] カバレージ分析を開始します（Embedding生成に時間がかかる場合があります）...")
             coverage_results = analyze_coverage(
                 chunks, qa_pairs, dataset_type,
-                custom_threshold=args.coverage_threshold
+                custom_threshold=args.coverage_threshold,
+                embedding_cache=args.embedding_cache
             )
 
             logger.info(f"""
@@ -2137,6 +2666,9 @@ def main():
             for qt, count in sorted(question_types.items()):
                 print(f"  {qt}: {count}件")
 
+        logger.info(format_usage_report(usage_sink.summary(), qa_count=len(qa_pairs)))
+        get_usage_meter().remove_sink(usage_sink)
+
         # Celeryクリーンアップ（使用している場合）
         if args.use_celery:
             try:
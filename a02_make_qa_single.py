@@ -315,11 +315,24 @@ def get_keyword_extractor() -> KeywordExtractor:
 # MeCab ベースのチャンク作成関数
 # ==========================================
 
+# グローバルなSemanticChunkerインスタンス（文書ごとに生成しない）
+_semantic_chunker = None
+
+
+def get_semantic_chunker():
+    """SemanticChunkerのシングルトンインスタンスを取得"""
+    global _semantic_chunker
+    if _semantic_chunker is None:
+        from helper_rag_qa import SemanticChunker
+        _semantic_chunker = SemanticChunker(token_count_model="text-embedding-3-small")
+    return _semantic_chunker
+
+
 def create_mecab_chunks(text: str, lang: str = "ja", max_tokens: int = 200, chunk_id_prefix: str = "chunk") -> List[Dict]:
     """
     セマンティック分割によるチャンク作成（段落優先・MeCab対応）
 
-    helper_rag_qa.pyのSemanticCoverage.create_semantic_chunks()を使用し、
+    helper_rag_qa.pyのSemanticChunker.create_semantic_chunks()を使用し、
     段落境界を最優先したセマンティック分割を実行。
     日本語の場合はMeCabによる高精度な文境界検出を自動適用。
 
@@ -332,10 +345,8 @@ def create_mecab_chunks(text: str, lang: str = "ja", max_tokens: int = 200, chun
     Returns:
         チャンクのリスト
     """
-    # SemanticCoverageを使用してセマンティック分割を実行
-    from helper_rag_qa import SemanticCoverage
-
-    semantic_analyzer = SemanticCoverage(embedding_model="text-embedding-3-small")
+    # SemanticChunkerを使用してセマンティック分割を実行（文書間で使い回す）
+    semantic_analyzer = get_semantic_chunker()
 
     # 段落優先のセマンティック分割を実行
     # prefer_paragraphs=True: 段落境界を最優先
@@ -350,7 +361,7 @@ def create_mecab_chunks(text: str, lang: str = "ja", max_tokens: int = 200, chun
         verbose=False
     )
 
-    # SemanticCoverageの出力形式をa02の形式に変換
+    # SemanticChunkerの出力形式をa02の形式に変換
     chunks = []
     tokenizer = tiktoken.get_encoding("cl100k_base")
 
@@ -1001,10 +1012,6 @@ def generate_qa_for_dataset(
                     logger.warning(f"リトライ {attempt + 1}/{max_retries} (待機: {wait_time}秒)")
                     time.sleep(wait_time)
 
-        # API制限対策（最後のバッチ以外で待機）
-        if i + chunk_batch_size < total_chunks:
-            time.sleep(0.2)  # 短縮（バッチ処理により呼び出し数が減っているため）
-
     logger.info(f"""
     Q/Aペア生成完了:
     - 生成されたQ/Aペア: {len(all_qa_pairs)}個
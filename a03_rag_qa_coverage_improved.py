@@ -79,8 +79,11 @@ from datetime import datetime
 import logging
 import re
 from collections import Counter
-from helper_llm import create_llm_client, LLMClient
+from helper_llm import create_llm_client, get_token_counter, LLMClient
+from helper_embedding import DEFAULT_EMBEDDING_PROVIDER, create_embedding_client
+from helper_embedding_cache import CachedEmbeddingClient
 from models import QAPairsResponse
+from regex_mecab import get_mecab_tagger, is_mecab_available
 
 # ログ設定
 logging.basicConfig(
@@ -177,14 +180,7 @@ class KeywordExtractor:
 
     def _check_mecab_availability(self) -> bool:
         """MeCabの利用可能性をチェック"""
-        try:
-            import MeCab
-            # 実際にインスタンス化して動作確認
-            tagger = MeCab.Tagger()
-            tagger.parse("テスト")
-            return True
-        except (ImportError, RuntimeError):
-            return False
+        return is_mecab_available()
 
     def extract(self, text: str, top_n: int = 5) -> List[str]:
         """
@@ -210,10 +206,7 @@ class KeywordExtractor:
 
     def _extract_with_mecab(self, text: str, top_n: int) -> List[str]:
         """MeCabを使用した複合名詞抽出"""
-        import MeCab
-
-        tagger = MeCab.Tagger()
-        node = tagger.parseToNode(text)
+        node = get_mecab_tagger().parseToNode(text)
 
         # 複合名詞の抽出
         compound_buffer = []
@@ -320,9 +313,8 @@ def analyze_chunk_complexity(chunk_text: str, lang: str = "auto") -> Dict:
         japanese_count = sum(1 for char in japanese_indicators if char in chunk_text[:100])
         lang = "ja" if japanese_count > 3 else "en"
 
-    # UnifiedLLMClientを使用してトークンカウント (Gemini対応)
-    llm_client = create_llm_client(provider="gemini")
-    token_count = llm_client.count_tokens(chunk_text)
+    # トークンカウント（チャンクごとに呼ぶためデフォルトはローカル計算、LLM_TOKEN_COUNT_MODE=api でGemini API）
+    token_count = get_token_counter(provider="gemini").count_tokens(chunk_text)
 
     # 基本メトリクス
     sentences = chunk_text.split('。' if lang == 'ja' else '.')
@@ -777,53 +769,20 @@ def calculate_improved_coverage(
         combined_text = f"{question} {answer} {answer}"
         qa_texts.append(combined_text)
 
-    # バッチ処理でQ/A埋め込みを生成
+    # バッチ処理でQ/A埋め込みを生成（100件/リクエストの分割はクライアント側で実施）
     logger.info(f"Q/A埋め込みをバッチ生成中... ({len(qa_texts)}個)")
-
-    # Gemini APIの制限を考慮してバッチサイズを調整
-    MAX_BATCH_SIZE = 100
-    qa_embeddings = []
-
-    if len(qa_texts) <= MAX_BATCH_SIZE:
-        # 一度にすべて処理可能
-        # generate_embeddingsは辞書のリストを想定しているため、変換
-        qa_chunks = [{"text": text} for text in qa_texts]
-        qa_embeddings = analyzer.generate_embeddings(qa_chunks)
-        logger.info(f"  バッチ処理完了: 1回のAPI呼び出しで{len(qa_texts)}個の埋め込みを生成")
-    else:
-        # バッチサイズを超える場合は分割処理
-        num_batches = (len(qa_texts) + MAX_BATCH_SIZE - 1) // MAX_BATCH_SIZE
-        logger.info(f"  大量データのため{num_batches}回に分割してバッチ処理")
-
-        for i in range(0, len(qa_texts), MAX_BATCH_SIZE):
-            batch = qa_texts[i:i+MAX_BATCH_SIZE]
-            # generate_embeddingsは辞書のリストを想定しているため、変換
-            batch_chunks = [{"text": text} for text in batch]
-            batch_embeddings = analyzer.generate_embeddings(batch_chunks)
-            qa_embeddings.extend(batch_embeddings)
-            logger.info(f"    バッチ {i//MAX_BATCH_SIZE + 1}/{num_batches} 完了: {len(batch)}個")
+    qa_embeddings = analyzer.generate_embeddings_batch(qa_texts, batch_size=100)
 
     logger.info(f"Q/A埋め込み生成完了: 合計{len(qa_embeddings)}個")
+    if isinstance(analyzer.embedding_client, CachedEmbeddingClient):
+        analyzer.embedding_client.log_stats()
 
-    # カバレッジ行列の計算
-    coverage_matrix = np.zeros((len(chunks), len(qa_pairs)))
-    covered_chunks = set()
-
-    # 各チャンクに対する最大類似度を追跡
-    max_similarities = np.zeros(len(chunks))
-
-    for i, doc_emb in enumerate(doc_embeddings):
-        for j, qa_emb in enumerate(qa_embeddings):
-            similarity = analyzer.cosine_similarity(doc_emb, qa_emb)
-            coverage_matrix[i, j] = similarity
-
-            # このチャンクの最大類似度を更新
-            if similarity > max_similarities[i]:
-                max_similarities[i] = similarity
+    # カバレッジ行列の計算（正規化済み float32 行列同士の行列積1回）
+    coverage_matrix = analyzer.similarity_matrix(doc_embeddings, qa_embeddings)
 
-            # 閾値を超えたらカバーされたとマーク
-            if similarity >= threshold:
-                covered_chunks.add(i)
+    # 各チャンクの最大類似度（0未満は0扱い）と閾値判定
+    max_similarities = np.maximum(coverage_matrix.max(axis=1), 0.0)
+    covered_chunks = set(np.flatnonzero(max_similarities >= threshold).tolist())
 
     # 統計情報の計算
     coverage_rate = len(covered_chunks) / len(chunks) if chunks else 0
@@ -855,7 +814,8 @@ def process_with_improved_methods(
     model: str = "gpt-4o-mini",
     qa_per_chunk: int = 4,
     max_chunks: int = 300,
-    lang: str = "auto"
+    lang: str = "auto",
+    embedding_cache: Optional[str] = None
 ) -> Tuple[List[Dict], SemanticCoverage, List[Dict]]:
     """
     改良版：80%カバレッジを達成するためのQ/A生成
@@ -867,12 +827,16 @@ def process_with_improved_methods(
         qa_per_chunk: チャンクあたりのQ/A数（デフォルト: 4）
         max_chunks: 処理する最大チャンク数（デフォルト: 300）
         lang: 言語コード ("en", "ja", "auto")
+        embedding_cache: Embeddingキャッシュ（SQLite）のパス（指定時は再実行で再計算しない）
     """
     all_qas = []
 
     # SemanticCoverage初期化（段落優先のセマンティック分割）
     # Gemini埋め込みモデルを使用するように変更
-    analyzer = SemanticCoverage(embedding_model="gemini-embedding-001")
+    embedding_client = None
+    if embedding_cache:
+        embedding_client = CachedEmbeddingClient(create_embedding_client(DEFAULT_EMBEDDING_PROVIDER), cache_path=embedding_cache)
+    analyzer = SemanticCoverage(embedding_model="gemini-embedding-001", embedding_client=embedding_client)
     chunks = analyzer.create_semantic_chunks(
         document=document_text,
         max_tokens=200,  # チャンクの最大トークン数
@@ -1051,6 +1015,8 @@ def main():
     parser.add_argument("--coverage-threshold", type=float, default=0.65, help="カバレッジ判定閾値")
     parser.add_argument("--qa-per-chunk", type=int, default=4, help="チャンクあたりのQ/A生成数（デフォルト: 4）")
     parser.add_argument("--max-chunks", type=int, default=300, help="処理する最大チャンク数（デフォルト: 300）")
+    parser.add_argument("--embedding-cache", type=str, default=None,
+                        help="EmbeddingキャッシュのSQLiteパス（例: qa_output/.embedding_cache.sqlite）")
     parser.add_argument("--demo", action="store_true", help="デモモード")
 
     args = parser.parse_args()
@@ -1105,7 +1071,8 @@ def main():
             args.model,
             qa_per_chunk=args.qa_per_chunk,
             max_chunks=args.max_chunks,
-            lang=lang
+            lang=lang,
+            embedding_cache=args.embedding_cache
         )
 
         # カバレッジ分析（改良版）
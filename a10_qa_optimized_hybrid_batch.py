@@ -138,6 +138,9 @@ load_dotenv()
 
 # helper_rag_qa から新しいバッチクラスをインポート
 from helper_rag_qa import BatchHybridQAGenerator, OptimizedHybridQAGenerator
+from helper_embedding_cache import CachedEmbeddingClient
+from helper_llm_cache import CachedLLMClient, LLMCacheStore
+from helper_usage import InMemoryUsageSink, format_usage_report, get_usage_meter
 
 # ログ設定
 logging.basicConfig(
@@ -239,7 +242,9 @@ def generate_batch_qa_from_dataset(
     cache_dir: str = "qa_cache",
     progressive_quality: bool = False,
     initial_coverage: float = 0.85,
-    final_coverage: float = 0.95
+    final_coverage: float = 0.95,
+    input_token_budget: Optional[int] = None,
+    output_token_budget: Optional[int] = None
 ) -> Dict:
     """バッチ処理でデータセットからQ/A生成
 
@@ -256,6 +261,10 @@ def generate_batch_qa_from_dataset(
         output_dir: 出力ディレクトリ
         quality_mode: 品質重視モード
         target_coverage: 目標カバレージ率
+        use_cache: LLM応答・埋め込みを cache_dir 以下にキャッシュ（再実行ではAPIを呼ばない）
+        cache_dir: キャッシュディレクトリ
+        input_token_budget: 1リクエストの入力トークン予算（指定時は batch_size の代わりに予算まで文書を詰める）
+        output_token_budget: 1リクエストの出力トークン予算
     """
 
     config = DATASET_CONFIGS[dataset_type]
@@ -286,9 +295,23 @@ def generate_batch_qa_from_dataset(
         batch_size=batch_size,
         embedding_batch_size=embedding_batch_size,
         quality_mode=quality_mode,
-        target_coverage=target_coverage
+        target_coverage=target_coverage,
+        input_token_budget=input_token_budget,
+        output_token_budget=output_token_budget
     )
 
+    # キャッシュ（LLM応答: llm_cache.sqlite、埋め込み: embeddings.sqlite）
+    llm_cache = None
+    if use_cache:
+        llm_cache = CachedLLMClient(
+            generator.client, store=LLMCacheStore(os.path.join(cache_dir, "llm_cache.sqlite"))
+        )
+        generator.client = llm_cache
+        generator.embedding_client = CachedEmbeddingClient(
+            generator.embedding_client, cache_path=os.path.join(cache_dir, "embeddings.sqlite")
+        )
+        logger.info(f"キャッシュ有効: {cache_dir}")
+
     # MeCab利用状況を確認（SemanticCoverageインスタンス経由）
     if hasattr(generator, 'semantic_coverage') and hasattr(generator.semantic_coverage, 'mecab_available'):
         mecab_status = "利用可能" if generator.semantic_coverage.mecab_available else "利用不可（正規表現にフォールバック）"
@@ -296,24 +319,35 @@ def generate_batch_qa_from_dataset(
 
     # 処理時間の計測開始
     start_time = time.time()
+    # LLM・埋め込み呼び出しごとの使用量（トークン数・レイテンシ・再試行）を集計
+    usage_sink = get_usage_meter().add_sink(InMemoryUsageSink())
 
     # バッチ処理でQ/A生成（言語パラメータを渡す）
-    batch_results = generator.generate_batch_hybrid_qa(
-        texts=texts,
-        qa_count=qa_count,
-        use_llm=use_llm,
-        calculate_coverage=calculate_coverage,
-        document_type=doc_type,
-        show_progress=True,
-        lang=lang
-    )
+    try:
+        batch_results = generator.generate_batch_hybrid_qa(
+            texts=texts,
+            qa_count=qa_count,
+            use_llm=use_llm,
+            calculate_coverage=calculate_coverage,
+            document_type=doc_type,
+            show_progress=True,
+            lang=lang
+        )
+    finally:
+        get_usage_meter().remove_sink(usage_sink)
 
     # 処理時間の計算
     elapsed_time = time.time() - start_time
 
+    if llm_cache is not None:
+        llm_cache.log_stats()
+        generator.embedding_client.log_stats()
+
     # 統計情報の集計
     total_qa_generated = sum(len(r["qa_pairs"]) for r in batch_results)
     total_cost = sum(r["api_usage"]["cost"] for r in batch_results)
+    usage_by_model = usage_sink.summary()
+    logger.info(format_usage_report(usage_by_model, qa_count=total_qa_generated))
 
     coverage_scores = []
     if calculate_coverage:
@@ -340,6 +374,12 @@ def generate_batch_qa_from_dataset(
         "api_usage": {
             "total_cost": total_cost,
             "cost_per_doc": total_cost / len(batch_results) if batch_results else 0,
+            "total_tokens": sum(r["api_usage"]["tokens"] for r in batch_results),
+            "llm_calls": sum(r["api_usage"]["calls"] for r in batch_results),
+            # モデル別の実測値（トークン数・tokens/sec・p50/p95レイテンシ・埋め込みを含む費用）
+            "by_model": usage_by_model,
+            "cost_per_qa": (sum(s["cost"] for s in usage_by_model.values()) / total_qa_generated
+                            if total_qa_generated else 0),
             "batch_statistics": generator.batch_stats
         },
         "coverage": {
@@ -633,10 +673,22 @@ def main():
         default=0.95,
         help="目標カバレージ率（品質モード時）"
     )
+    parser.add_argument(
+        "--input-token-budget",
+        type=int,
+        default=None,
+        help="1リクエストの入力トークン予算（指定時は--batch-sizeの代わりに予算まで文書を詰め、文書を短縮しない）"
+    )
+    parser.add_argument(
+        "--output-token-budget",
+        type=int,
+        default=None,
+        help="1リクエストの出力トークン予算（--input-token-budget指定時）"
+    )
     parser.add_argument(
         "--use-cache",
         action="store_true",
-        help="埋め込みキャッシュを使用"
+        help="LLM応答・埋め込みキャッシュを使用（同じ文書の再実行ではAPIを呼ばない）"
     )
     parser.add_argument(
         "--cache-dir",
@@ -727,7 +779,9 @@ def main():
             cache_dir=args.cache_dir,
             progressive_quality=args.progressive_quality,
             initial_coverage=args.initial_coverage,
-            final_coverage=args.final_coverage
+            final_coverage=args.final_coverage,
+            input_token_budget=args.input_token_budget,
+            output_token_budget=args.output_token_budget
         )
 
         # 結果保存
@@ -14,6 +14,12 @@ Gemini 3の3072次元Embeddingを使用してQdrantにQ/Aデータを登録
 
     # 既存コレクションを再作成して登録
     python a42_qdrant_gemini_registration.py --recreate --limit 100
+
+    # 並列Embedding（クォータ上限まで流量を上げる）
+    python a42_qdrant_gemini_registration.py --recreate --concurrency 8 --rpm 1500 --tpm 1000000
+
+    # Embeddingキャッシュ（同じQ/A行の再登録ではEmbedding API呼び出し0回）
+    python a42_qdrant_gemini_registration.py --recreate --embedding-cache qa_output/.embedding_cache.sqlite
 """
 
 import argparse
@@ -30,8 +36,8 @@ from qdrant_client_wrapper import (
     create_collection_for_provider,
     load_csv_for_qdrant,
     build_inputs_for_embedding,
-    embed_texts_unified,
-    build_points,
+    embed_texts_unified_iter,
+    iter_points_stream,
     upsert_points,
     get_collection_stats,
     get_provider_vector_size,
@@ -76,7 +82,10 @@ def register_collection(
     config: dict,
     recreate: bool = False,
     limit: int = 0,
-    include_answer: bool = True
+    include_answer: bool = True,
+    embedding_options: dict = None,
+    embedding_cache: str = None,
+    embedding_batch_size: int = 256
 ) -> dict:
     """
     単一コレクションの登録処理
@@ -88,6 +97,9 @@ def register_collection(
         recreate: 再作成フラグ
         limit: 行数制限
         include_answer: 回答をEmbeddingに含めるか
+        embedding_options: Embeddingクライアント設定（max_concurrency, rpm, tpm）
+        embedding_cache: EmbeddingキャッシュのSQLiteパス（再登録時は変更行のみEmbedding生成）
+        embedding_batch_size: パイプラインの1段あたりのユニークテキスト数
 
     Returns:
         処理結果の辞書
@@ -138,24 +150,21 @@ def register_collection(
             recreate=recreate
         )
 
-        # 3. Embedding生成（Gemini: 3072次元）
-        logger.info("Generating embeddings (Gemini 3072 dims)...")
+        # 3-5. Embedding生成 → ポイント構築 → Upsert をパイプライン実行
+        #   完了したEmbeddingバッチから順にポイント化してupsertするため、
+        #   API待ち・ポイント構築・Qdrant書き込みが重なり、全件分のベクトルを保持しない
+        logger.info("Embedding + upserting (pipelined)...")
         texts = build_inputs_for_embedding(df, include_answer=include_answer)
-        vectors = embed_texts_unified(texts, provider=provider)
-        logger.info(f"  Generated {len(vectors)} embeddings")
-        logger.info(f"  Vector dims: {len(vectors[0]) if vectors else 0}")
-
-        # 4. ポイント構築
-        logger.info("Building points...")
-        points = build_points(
+        batches = embed_texts_unified_iter(
+            texts, provider=provider, batch_size=embedding_batch_size,
+            cache_path=embedding_cache, **(embedding_options or {})
+        )
+        points = iter_points_stream(
             df=df,
-            vectors=vectors,
+            batches=batches,
             domain=domain,
             source_file=csv_path
         )
-
-        # 5. Upsert
-        logger.info("Upserting to Qdrant...")
         count = upsert_points(client, collection_name, points)
         logger.info(f"  Upserted {count} points")
 
@@ -167,7 +176,7 @@ def register_collection(
             "collection": collection_name,
             "status": "success",
             "points": count,
-            "vector_dims": len(vectors[0]) if vectors else 0,
+            "vector_dims": get_provider_vector_size(provider),
             "provider": provider,
         }
 
@@ -210,9 +219,41 @@ def main():
         default=True,
         help="回答をEmbeddingに含める"
     )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=None,
+        help="Embedding同時リクエスト数（未指定時は環境変数 GEMINI_EMBEDDING_CONCURRENCY）"
+    )
+    parser.add_argument(
+        "--rpm",
+        type=float,
+        default=None,
+        help="Embedding 1分あたりの最大リクエスト数"
+    )
+    parser.add_argument(
+        "--tpm",
+        type=float,
+        default=None,
+        help="Embedding 1分あたりの最大トークン数"
+    )
+    parser.add_argument(
+        "--embedding-cache",
+        type=str,
+        default=None,
+        help="EmbeddingキャッシュのSQLiteパス（例: qa_output/.embedding_cache.sqlite）"
+    )
 
     args = parser.parse_args()
 
+    embedding_options = {}
+    if args.concurrency is not None:
+        embedding_options["max_concurrency"] = args.concurrency
+    if args.rpm is not None:
+        embedding_options["rpm"] = args.rpm
+    if args.tpm is not None:
+        embedding_options["tpm"] = args.tpm
+
     # Qdrant接続
     logger.info("Connecting to Qdrant...")
     client = create_qdrant_client()
@@ -245,7 +286,9 @@ def main():
             config=config,
             recreate=args.recreate,
             limit=args.limit,
-            include_answer=args.include_answer
+            include_answer=args.include_answer,
+            embedding_options=embedding_options,
+            embedding_cache=args.embedding_cache
         )
         results.append(result)
 
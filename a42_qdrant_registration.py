@@ -86,6 +86,9 @@ from qdrant_client import QdrantClient
 from qdrant_client.http import models
 from openai import OpenAI
 
+from helper_embedding import EmbeddingRequestPlan, OversizedTextError, collapse_texts, expand_embeddings
+from regex_mecab import split_japanese_sentences
+
 # ------------------ デフォルト設定 ------------------
 DEFAULTS = {
     "rag": {
@@ -211,83 +214,41 @@ def embed_texts_openai(texts: List[str], model: str, client: Optional[OpenAI] =
 def embed_texts(texts: List[str], model: str, batch_size: int = 128) -> List[List[float]]:
     """
     テキストをバッチ処理でEmbeddingに変換
-    OpenAIの8192トークン制限を考慮して動的にバッチサイズを調整
+    helper_embedding の共通パッカーで、OpenAIの件数上限（2048件）・リクエストあたりの
+    トークン上限に収まるよう貪欲に詰めて送信する。1テキストあたりの上限（8191トークン）を
+    超えるテキストは送信前に OversizedTextError（ValueError）で拒否する。
 
-    Note: batch_size引数は後方互換性のために残しているが、実際にはトークン数のみで制御
+    Note: batch_size引数は後方互換性のために残しているが、実際には件数・トークン上限で制御
     """
     if hrag and hasattr(hrag, "embed_texts"):
         return hrag.embed_texts(texts, model=model, batch_size=batch_size)
 
-    import tiktoken
-
-    enc = tiktoken.get_encoding("cl100k_base")
     client = get_openai_client()
 
-    # OpenAI Embeddingの最大トークン数（安全マージン込み）
-    MAX_TOKENS_PER_REQUEST = 8000  # 8192から余裕を持たせて8000
-
-    # ★ 空文字列・空白のみの文字列を除外し、インデックスマッピングを保持
-    valid_texts = []
-    valid_indices = []
-    for i, text in enumerate(texts):
-        if text and text.strip():  # 空文字列と空白のみを除外
-            valid_texts.append(text)
-            valid_indices.append(i)
+    # ★ 空文字列・空白のみを除外し、同一テキストは1回だけ送信する（行→スロットの対応を保持）
+    unique_texts, inverse = collapse_texts(texts)
 
     # 全て空文字列の場合はダミーベクトルを返す
-    if not valid_texts:
+    if not unique_texts:
         print("\r   [WARN] 全てのテキストが空文字列です。ダミーベクトルを返します。", flush=True)
         return [[0.0] * 1536] * len(texts)
 
-    # 有効なテキストのみで埋め込み生成
-    valid_vecs: List[List[float]] = []
-    current_batch = []
-    current_tokens = 0
-    batch_count = 0
-
-    for i, text in enumerate(valid_texts):
-        text_tokens = len(enc.encode(text))
-
-        # 単一チャンクが制限を超える場合はエラー
-        if text_tokens > MAX_TOKENS_PER_REQUEST:
-            raise ValueError(
-                f"Single text at index {valid_indices[i]} has {text_tokens} tokens, "
-                f"which exceeds MAX_TOKENS_PER_REQUEST ({MAX_TOKENS_PER_REQUEST}). "
-                f"Please reduce chunk_size when creating chunks."
-            )
-
-        # 追加前にチェック：制限を超える場合は先にバッチを送信
-        if current_tokens + text_tokens > MAX_TOKENS_PER_REQUEST:
-            # 現在のバッチがあれば送信
-            if current_batch:
-                batch_count += 1
-                print(f"\r   埋め込み生成中: バッチ{batch_count} ({len(current_batch)}件, {current_tokens}トークン)... ", end="", flush=True)
-                valid_vecs.extend(embed_texts_openai(current_batch, model=model, client=client))
-                current_batch = []
-                current_tokens = 0
-
-        # バッチに追加
-        current_batch.append(text)
-        current_tokens += text_tokens
-
-    # 残りのバッチを処理
-    if current_batch:
-        batch_count += 1
-        print(f"\r   埋め込み生成中: バッチ{batch_count} ({len(current_batch)}件, {current_tokens}トークン)... ", end="", flush=True)
-        valid_vecs.extend(embed_texts_openai(current_batch, model=model, client=client))
+    # ユニークなテキストのみで埋め込み生成（上限超過テキストはここで事前に拒否）
+    try:
+        plan = EmbeddingRequestPlan(unique_texts, "openai", oversize="error")
+    except OversizedTextError as e:
+        # 元の行インデックス（初出行）で報告
+        rows = inverse.tolist()
+        raise OversizedTextError([rows.index(i) for i in e.indices], e.token_counts, e.max_tokens) from None
+
+    unique_vecs: List[List[float]] = []
+    for batch_count, indices in enumerate(plan.batches, start=1):
+        batch_tokens = sum(plan.token_counts[i] for i in indices)
+        print(f"\r   埋め込み生成中: バッチ{batch_count}/{len(plan.batches)} ({len(indices)}件, {batch_tokens}トークン)... ", end="", flush=True)
+        unique_vecs.extend(embed_texts_openai([plan.pieces[i] for i in indices], model=model, client=client))
 
     # 元のインデックスに合わせてベクトルを再配置（空文字列はゼロベクトル）
-    vecs: List[List[float]] = []
-    valid_vec_idx = 0
-    for i in range(len(texts)):
-        if i in valid_indices:
-            vecs.append(valid_vecs[valid_vec_idx])
-            valid_vec_idx += 1
-        else:
-            # 空文字列の場合はゼロベクトル
-            vecs.append([0.0] * 1536)
-
-    return vecs
+    return expand_embeddings(unique_vecs, inverse, len(unique_vecs[0]))
 
 # ------------------ 入力テキスト構築 ------------------
 def build_inputs(df: pd.DataFrame, include_answer: bool) -> List[str]:
@@ -384,16 +345,11 @@ def chunk_japanese_text(text: str, max_tokens: int = 500) -> List[str]:
 
             # 段落が大きすぎる場合は文単位で分割
             if para_tokens > max_tokens:
-                # 日本語の句点で文分割
-                sentences = re.split(r'([。！？\n])', para)
+                # 日本語の句点・改行で文分割（MeCab の Tagger はスレッドごとに共有）
                 temp_chunk = ""
                 temp_tokens = 0
 
-                for i in range(0, len(sentences), 2):
-                    sent = sentences[i]
-                    if i + 1 < len(sentences):
-                        sent += sentences[i + 1]
-
+                for sent in split_japanese_sentences(para):
                     sent_tokens = len(enc.encode(sent))
 
                     # 単一文が大きすぎる場合は強制分割
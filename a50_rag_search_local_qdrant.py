@@ -44,7 +44,7 @@ except Exception:
 from qdrant_client import QdrantClient
 from qdrant_client.http import models
 from helper_embedding import create_embedding_client
-from helper_llm import create_llm_client
+from helper_llm import get_llm_client
 
 # デフォルト設定の定義（config.ymlが存在しない場合のフォールバック）
 DEFAULTS = {
@@ -429,7 +429,7 @@ if do_search and query.strip():
                 st.code(qa_prompt_jp)
 
                 with st.spinner("Gemini AIに問い合わせ中..."):
-                    llm_client = create_llm_client(provider="gemini")
+                    llm_client = get_llm_client(provider="gemini")
                     generated_answer = llm_client.generate_content(
                         prompt=qa_prompt_jp,
                         model="gemini-2.0-flash"
@@ -12,10 +12,19 @@ celery_tasks.py
 
 import os
 import json
+import itertools
 import logging
 from typing import List, Dict
 from celery import Celery
+from celery.signals import worker_init, worker_process_init
 from dotenv import load_dotenv
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    # orjson がない環境では標準の json を使う
+    _json_loads = json.loads
+
 # 環境変数読み込み
 load_dotenv()
 
@@ -28,7 +37,9 @@ from config import ModelConfig, CeleryConfig
 # =====================================================
 # Gemini 3 Migration: 抽象化レイヤー
 # =====================================================
-from helper_llm import create_llm_client
+from helper_llm import IncrementalJSONArrayParser, clear_llm_clients, get_llm_client
+from helper_llm_cache import CachedLLMClient, get_shared_llm_cache_store
+from helper_rate_limit import set_api_key_pool_processes
 
 # デフォルトプロバイダー（環境変数で設定可能）
 DEFAULT_LLM_PROVIDER = os.getenv("LLM_PROVIDER", "gemini")  # "gemini" or "openai"
@@ -66,6 +77,33 @@ app.conf.update(
 )
 
 
+# 実際のプールサイズ（--concurrency 指定を反映した値。worker_init で親プロセスが記録し、fork後の子が参照する）
+_worker_pool_processes = None
+
+
+@worker_init.connect
+def record_worker_pool_size(sender=None, **kwargs):
+    """ワーカー起動時（fork前）に実際のプールサイズを記録する"""
+    global _worker_pool_processes
+    _worker_pool_processes = getattr(sender, "concurrency", None)
+
+
+@worker_process_init.connect
+def init_worker_llm_client(**kwargs):
+    """ワーカープロセス起動時（fork後）に共有LLMクライアントを作成し、タスクごとの初期化を省く"""
+    clear_llm_clients()  # 親プロセスから引き継いだキャッシュは使わない
+    # 複数キー（GOOGLE_API_KEYS）の予算をワーカープロセスで等分する（API_KEY_POOL_PROCESSES で上書き可能）
+    # CeleryConfig.WORKER_CONCURRENCY ではなく --concurrency を反映した実際のプールサイズで割る
+    processes = os.getenv("API_KEY_POOL_PROCESSES") or _worker_pool_processes or app.conf.worker_concurrency or 1
+    set_api_key_pool_processes(int(processes))
+    try:
+        get_llm_client(provider=DEFAULT_LLM_PROVIDER)
+        logger.info(f"[worker_process_init] LLMクライアント初期化完了: provider={DEFAULT_LLM_PROVIDER}")
+    except Exception as e:
+        # APIキー未設定などはタスク実行時に改めてエラーにする
+        logger.warning(f"[worker_process_init] LLMクライアント初期化失敗: {e}")
+
+
 # ===========================================
 # モデル別パラメータ制約（config.pyから参照）
 # ===========================================
@@ -97,10 +135,36 @@ def determine_qa_count(chunk_data: Dict, config: Dict) -> int:
         return base_qa_count
 
 
+# レスポンス構造のデバッグログは DEBUG レベルかつ N 回に1回だけ出す（高並列時のログ量・CPUを抑える）
+DEFAULT_RESPONSE_DEBUG_EVERY = int(os.getenv("CELERY_RESPONSE_DEBUG_EVERY", "100"))
+_response_debug_counter = itertools.count()
+
+
+def _sample_response_debug() -> bool:
+    """レスポンス構造をデバッグログに出す回か（DEBUG無効時はカウンタも進めない）"""
+    return (logger.isEnabledFor(logging.DEBUG) and DEFAULT_RESPONSE_DEBUG_EVERY > 0
+            and next(_response_debug_counter) % DEFAULT_RESPONSE_DEBUG_EVERY == 0)
+
+
+def _parse_qa_json(text: str):
+    """JSONテキストを QAPairsResponse に変換（qa_pairs を含まない・解析できない場合は None）"""
+    try:
+        data = _json_loads(text)
+        if isinstance(data, dict) and 'qa_pairs' in data:
+            return QAPairsResponse.model_validate(data)
+    except (ValueError, TypeError) as e:
+        logger.debug(f"JSON解析失敗: {str(e)[:100]}")
+    return None
+
+
 def _extract_parsed_response(response, model: str) -> QAPairsResponse:
     """
     responses.parse() API のレスポンスから解析済みデータを抽出
 
+    output_parsed（GPT-5系）を最初に確認し、なければ output 配列を1回だけ走査して
+    output_text の parsed（GPT-4o系）を探す。どちらもない場合のみ、走査中に控えた
+    text・output_text をJSONとして解析する。
+
     Args:
         response: OpenAI API レスポンス
         model: 使用したモデル名
@@ -111,95 +175,45 @@ def _extract_parsed_response(response, model: str) -> QAPairsResponse:
     Raises:
         ValueError: 解析可能なレスポンスがない場合
     """
-    parsed_response = None
-
-    # デバッグ: レスポンスの構造をログ出力
-    logger.info(f"レスポンスタイプ: {type(response).__name__}")
-    response_attrs = [attr for attr in dir(response) if not attr.startswith('_')]
-    logger.info(f"レスポンス属性: {response_attrs}")
-
-    # 方法1: output_parsed属性を直接確認（GPT-5シリーズ対応）
-    if hasattr(response, 'output_parsed') and response.output_parsed:
-        parsed_response = response.output_parsed
-        logger.info("GPT-5形式のレスポンス（output_parsed）を使用")
+    # 高速経路: output_parsed（GPT-5系）
+    parsed_response = getattr(response, 'output_parsed', None)
+    if parsed_response:
         return parsed_response
 
-    # 方法2: output配列から探索（GPT-4o対応）
-    if hasattr(response, 'output'):
-        logger.info(f"output配列の長さ: {len(response.output)}")
-        for idx, output in enumerate(response.output):
-            output_type = getattr(output, 'type', 'N/A')
-            logger.info(f"output[{idx}] タイプ: {type(output).__name__}, type属性: {output_type}")
-
-            # ReasoningItemはスキップ
-            if hasattr(output, 'type'):
-                if output.type == "reasoning":
-                    logger.info("  -> reasoning タイプをスキップ")
-                    continue
-                elif output.type == "message" and hasattr(output, 'content') and output.content:
-                    logger.info(f"  -> message タイプ、content長さ: {len(output.content)}")
-                    for item_idx, item in enumerate(output.content):
-                        item_type = getattr(item, 'type', 'N/A')
-                        logger.info(f"    content[{item_idx}] タイプ: {type(item).__name__}, type属性: {item_type}")
-
-                        # parsed属性をチェック
-                        if hasattr(item, 'type') and item.type == "output_text" and hasattr(item, 'parsed') and item.parsed:
-                            parsed_response = item.parsed
-                            logger.info("GPT-4o形式のレスポンス（output配列 -> parsed）を使用")
-                            return parsed_response
-
-                        # text属性がある場合もログ出力
-                        if hasattr(item, 'text') and item.text:
-                            text_preview = item.text[:100] if len(item.text) > 100 else item.text
-                            logger.info(f"    text属性あり（最初の100文字）: {text_preview}...")
-
-            if parsed_response:
-                break
-
-    # 方法3: 直接text属性からJSON解析を試みる
-    if not parsed_response and hasattr(response, 'output'):
-        logger.info("方法3: text属性からJSON直接解析を試行")
-        for output in response.output:
-            if hasattr(output, 'type') and output.type == "message" and hasattr(output, 'content'):
-                for item in output.content:
-                    if hasattr(item, 'text') and item.text:
-                        try:
-                            json_data = json.loads(item.text)
-                            if 'qa_pairs' in json_data:
-                                # JSONからQAPairsResponseを構築
-                                parsed_response = QAPairsResponse(**json_data)
-                                logger.info("JSONテキストから直接解析成功")
-                                return parsed_response
-                        except json.JSONDecodeError as e:
-                            logger.debug(f"JSON解析失敗（JSONDecodeError）: {str(e)[:100]}")
-                        except Exception as e:
-                            logger.debug(f"JSON解析失敗（その他）: {str(e)[:100]}")
-            if parsed_response:
-                break
-
-    # 方法4: output_text属性を直接確認
-    if not parsed_response and hasattr(response, 'output_text') and response.output_text:
-        logger.info("方法4: output_text属性からJSON解析を試行")
-        try:
-            json_data = json.loads(response.output_text)
-            if 'qa_pairs' in json_data:
-                parsed_response = QAPairsResponse(**json_data)
-                logger.info("output_textから直接解析成功")
-                return parsed_response
-        except Exception as e:
-            logger.debug(f"output_text解析失敗: {str(e)[:100]}")
-
-    if not parsed_response:
-        logger.error("OpenAI APIが解析可能なレスポンスを返しませんでした")
-        # レスポンスの詳細をログ出力（デバッグ用）
-        try:
-            response_str = str(response)[:1000]
-            logger.error(f"レスポンス全体（最初の1000文字）: {response_str}")
-        except Exception:
-            pass
-        raise ValueError("No parsable response from OpenAI API")
-
-    return parsed_response
+    debug = _sample_response_debug()
+    texts = []
+    for output in getattr(response, 'output', None) or ():
+        output_type = getattr(output, 'type', None)
+        if debug:
+            logger.debug(f"[{model}] output タイプ: {type(output).__name__}, type属性: {output_type}")
+        # reasoning などのメッセージ以外はスキップ
+        if output_type != "message":
+            continue
+        for item in getattr(output, 'content', None) or ():
+            if getattr(item, 'type', None) == "output_text":
+                parsed_response = getattr(item, 'parsed', None)
+                if parsed_response:
+                    return parsed_response
+            text = getattr(item, 'text', None)
+            if text:
+                texts.append(text)
+
+    # parsed がない場合: text、最後に output_text（通常は text の連結）をJSONとして解析
+    output_text = getattr(response, 'output_text', None)
+    if output_text and output_text not in texts:
+        texts.append(output_text)
+    for text in texts:
+        parsed_response = _parse_qa_json(text)
+        if parsed_response is not None:
+            if debug:
+                logger.debug(f"[{model}] JSONテキストから直接解析 ({len(text)}文字)")
+            return parsed_response
+
+    logger.error(f"[{model}] OpenAI APIが解析可能なレスポンスを返しませんでした "
+                 f"(タイプ: {type(response).__name__}, テキスト {len(texts)}件)")
+    if texts:
+        logger.debug(f"レスポンステキスト（最初の1000文字）: {texts[0][:1000]}")
+    raise ValueError("No parsable response from OpenAI API")
 
 
 @app.task(bind=True, max_retries=3)
@@ -302,13 +316,7 @@ def generate_qa_unified_async(
     try:
         provider = provider or DEFAULT_LLM_PROVIDER
 
-        # レート制限対策: Gemini API呼び出し前に短い遅延を追加
-        if provider == "gemini":
-            import time
-            import random
-            delay = random.uniform(0.5, 1.5)  # 0.5〜1.5秒のランダム遅延
-            time.sleep(delay)
-
+        # レート制限は LLMクライアントの concurrency_controller（429/Retry-After 対応）が担う
         # Geminiプロバイダー使用時にOpenAIモデル名が渡された場合はデフォルトモデルを使用
         if provider == "gemini" and model and ("gpt" in model.lower() or "o1" in model.lower() or "o3" in model.lower() or "o4" in model.lower()):
             logger.warning(f"[統合タスク] OpenAIモデル '{model}' はGeminiプロバイダーで使用できません。デフォルトモデルを使用します。")
@@ -350,60 +358,56 @@ Text:
 Output in JSON format:
 {{"qa_pairs": [{{"question": "question text", "answer": "answer text", "question_type": "fact/reason/comparison/application"}}]}}"""
 
-        # 統合LLMクライアントを使用
-        llm_client = create_llm_client(provider=str(provider))
-
-        # 構造化出力を試行
+        # 統合LLMクライアントを使用（ワーカープロセス内で共有）
+        llm_client = get_llm_client(provider=str(provider))
+        # LLM_CACHE_BACKEND=redis/sqlite の場合はワーカー間で共有する応答キャッシュを経由
+        cache_store = get_shared_llm_cache_store()
+        if cache_store is not None:
+            llm_client = CachedLLMClient(llm_client, store=cache_store, provider=str(provider))
+
+        def to_qa(question: str, answer: str, question_type: str) -> Dict:
+            return {
+                "question": question,
+                "answer": answer,
+                "question_type": question_type,
+                "source_chunk_id": chunk_data.get('id', ''),
+                "doc_id": chunk_data.get('doc_id', ''),
+                "dataset_type": chunk_data.get('dataset_type', ''),
+                "chunk_idx": chunk_data.get('chunk_idx', 0),
+                "provider": provider  # 使用プロバイダーを記録
+            }
+
+        # 構造化出力をストリーミングで受信し、完成したQ/Aから順に検証・追加
+        qa_pairs = []
         try:
-            result = llm_client.generate_structured(
+            for qa_data in llm_client.generate_stream_structured(
                 prompt=f"{system_instruction}\n\n{prompt}",
                 response_schema=QAPairsResponse,
                 model=model
-            )
-
-            qa_pairs = []
-            for qa_data in result.qa_pairs:
-                qa = {
-                    "question": qa_data.question,
-                    "answer": qa_data.answer,
-                    "question_type": qa_data.question_type,
-                    "source_chunk_id": chunk_data.get('id', ''),
-                    "doc_id": chunk_data.get('doc_id', ''),
-                    "dataset_type": chunk_data.get('dataset_type', ''),
-                    "chunk_idx": chunk_data.get('chunk_idx', 0),
-                    "provider": provider  # 使用プロバイダーを記録
-                }
-                qa_pairs.append(qa)
+            ):
+                qa_pairs.append(to_qa(qa_data.question, qa_data.answer, qa_data.question_type))
+            if not qa_pairs:
+                raise ValueError("No Q/A pairs in structured response")
 
         except Exception as e:
-            logger.warning(f"構造化出力失敗、テキスト生成にフォールバック: {str(e)[:100]}")
-
-            # フォールバック: テキスト生成してJSON解析
-            response_text = llm_client.generate_content(
-                prompt=f"{system_instruction}\n\n{prompt}",
-                model=model
-            )
-
-            # JSONを抽出して解析
-            import re
-            json_match = re.search(r'\{.*}', response_text, re.DOTALL)
-            if json_match:
-                parsed_data = json.loads(json_match.group())
-                qa_pairs = []
-                for qa_data in parsed_data.get('qa_pairs', []):
-                    qa = {
-                        "question": qa_data.get('question', ''),
-                        "answer": qa_data.get('answer', ''),
-                        "question_type": qa_data.get('question_type', 'fact'),
-                        "source_chunk_id": chunk_data.get('id', ''),
-                        "doc_id": chunk_data.get('doc_id', ''),
-                        "dataset_type": chunk_data.get('dataset_type', ''),
-                        "chunk_idx": chunk_data.get('chunk_idx', 0),
-                        "provider": provider
-                    }
-                    qa_pairs.append(qa)
+            if qa_pairs:
+                # 途中で失敗しても完成済みのQ/Aは使う
+                logger.warning(f"構造化出力が途中で失敗、生成済みの{len(qa_pairs)}個を使用: {str(e)[:100]}")
             else:
-                raise ValueError("JSON not found in response")
+                logger.warning(f"構造化出力失敗、テキスト生成にフォールバック: {str(e)[:100]}")
+
+                # フォールバック: テキスト生成して qa_pairs の要素を取り出す（途中で切れた応答も完成分は使う）
+                response_text = llm_client.generate_content(
+                    prompt=f"{system_instruction}\n\n{prompt}",
+                    model=model
+                )
+                items = IncrementalJSONArrayParser("qa_pairs").feed(response_text)
+                if not items:
+                    raise ValueError("JSON not found in response")
+                qa_pairs = [
+                    to_qa(qa_data.get('question', ''), qa_data.get('answer', ''), qa_data.get('question_type', 'fact'))
+                    for qa_data in items
+                ]
 
         logger.info(f"[統合タスク] 完了: {len(qa_pairs)}個のQ/A生成")
 
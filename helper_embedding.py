@@ -13,20 +13,49 @@ OpenAI Embeddings API と Gemini Embeddings API の両方に対応する統一
 
     # バッチ処理
     vectors = embedding.embed_texts(["Hello", "World"], batch_size=100)
+
+    # L2正規化済み float32 行列（コサイン類似度 = 内積）
+    matrix = embedding.embed_texts_array(["Hello", "World"])  # shape: (2, 3072)
+
+    # 並列実行 + レート制限（requests/min・tokens/min）
+    embedding = create_embedding_client("gemini", max_concurrency=8, rpm=1500, tpm=1_000_000)
+    vectors = embedding.embed_texts(texts)  # 入力順で返る
+
+    # 非同期版（SDKクライアント・接続プールは同期版とプロセス内で共有）
+    async_embedding = create_async_embedding_client("gemini", max_concurrency=8)
+    vectors = await async_embedding.embed_texts(texts)
 """
 
 from abc import ABC, abstractmethod
-from typing import List, Optional
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+import asyncio
+import hashlib
 import os
 import logging
+import random
+import re
+import threading
 import time
 
+import numpy as np
 from dotenv import load_dotenv
 
 # SDK imports (モジュールレベルでインポート - モック対象)
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
 from google import genai
 
+from helper_rate_limit import (
+    AdaptiveConcurrencyController,
+    APIKeyPool,
+    TokenBucketRateLimiter,
+    get_api_key_pool,
+    get_concurrency_controller,
+)
+from helper_usage import UsageRecord, get_usage_meter, openai_usage
+from regex_mecab import get_mecab_tagger
+
 load_dotenv()
 
 logger = logging.getLogger(__name__)
@@ -36,10 +65,409 @@ logger = logging.getLogger(__name__)
 DEFAULT_GEMINI_EMBEDDING_DIMS = 3072
 DEFAULT_OPENAI_EMBEDDING_DIMS = 1536
 
+# Gemini Embedding の並列度・クォータ（環境変数で上書き可能、未設定なら逐次実行）
+DEFAULT_GEMINI_EMBEDDING_CONCURRENCY = int(os.getenv("GEMINI_EMBEDDING_CONCURRENCY", "1"))
+DEFAULT_GEMINI_EMBEDDING_RPM = float(os.getenv("GEMINI_EMBEDDING_RPM", "0")) or None
+DEFAULT_GEMINI_EMBEDDING_TPM = float(os.getenv("GEMINI_EMBEDDING_TPM", "0")) or None
+
+# ローカルEmbedding（provider="local"）の模擬遅延・429注入率（環境変数で上書き可能）
+DEFAULT_LOCAL_EMBEDDING_LATENCY = float(os.getenv("LOCAL_EMBEDDING_LATENCY", "0"))
+DEFAULT_LOCAL_EMBEDDING_JITTER = float(os.getenv("LOCAL_EMBEDDING_JITTER", "0"))
+DEFAULT_LOCAL_EMBEDDING_429_RATE = float(os.getenv("LOCAL_EMBEDDING_429_RATE", "0"))
+
+# Gemini batchEmbedContents の1リクエストあたりの上限
+GEMINI_EMBEDDING_MAX_BATCH_ITEMS = 100
+GEMINI_EMBEDDING_MAX_TOKENS_PER_REQUEST = 20000
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    レート制限用の概算トークン数
+
+    日本語は概ね1文字1トークン以下のため、文字数を上限見積もりとして使用する。
+    """
+    return max(1, len(text))
+
+
+# ==========================================
+# トークン数を考慮したリクエスト分割（全プロバイダー共通）
+# ==========================================
+
+# プロバイダーごとの1リクエストあたりの上限
+#   max_items: 1リクエストの最大テキスト数
+#   max_tokens_per_request: 1リクエストの合計トークン数
+#   max_tokens_per_text: 1テキストあたりのトークン数（超過分はAPI側で400エラー/切り捨て）
+EMBEDDING_REQUEST_LIMITS: Dict[str, Dict[str, int]] = {
+    "gemini": {
+        "max_items": GEMINI_EMBEDDING_MAX_BATCH_ITEMS,
+        "max_tokens_per_request": GEMINI_EMBEDDING_MAX_TOKENS_PER_REQUEST,
+        "max_tokens_per_text": 2048,
+    },
+    "openai": {
+        "max_items": 2048,
+        "max_tokens_per_request": 300000,
+        "max_tokens_per_text": 8191,
+    },
+    # ローカル実装はGeminiと同じ上限でリクエストを模擬する
+    "local": {
+        "max_items": GEMINI_EMBEDDING_MAX_BATCH_ITEMS,
+        "max_tokens_per_request": GEMINI_EMBEDDING_MAX_TOKENS_PER_REQUEST,
+        "max_tokens_per_text": 2048,
+    },
+}
+
+# 超過テキストの扱い: "split"（トークン境界で分割し、トークン数加重平均で1ベクトルに統合） / "error"（事前に拒否）
+DEFAULT_EMBEDDING_OVERSIZE = os.getenv("EMBEDDING_OVERSIZE", "split")
+
+_TOKEN_ENCODING: Any = None
+_TOKEN_ENCODING_LOADED = False
+_TOKEN_ENCODING_LOCK = threading.Lock()
+
+
+def _get_token_encoding() -> Any:
+    """
+    ローカルトークナイザー（tiktoken cl100k_base）を遅延ロード
+
+    ロードできない環境（未インストール・オフライン）ではNoneを返し、
+    以降は estimate_tokens（文字数）で代用する。
+    """
+    global _TOKEN_ENCODING, _TOKEN_ENCODING_LOADED
+    if _TOKEN_ENCODING_LOADED:
+        return _TOKEN_ENCODING
+    with _TOKEN_ENCODING_LOCK:
+        if not _TOKEN_ENCODING_LOADED:
+            try:
+                import tiktoken
+                _TOKEN_ENCODING = tiktoken.get_encoding("cl100k_base")
+            except Exception as e:
+                logger.warning(f"tiktoken を利用できないため文字数でトークン数を概算します: {e}")
+                _TOKEN_ENCODING = None
+            _TOKEN_ENCODING_LOADED = True
+    return _TOKEN_ENCODING
+
+
+@lru_cache(maxsize=100000)
+def count_embedding_tokens(text: str) -> int:
+    """
+    リクエスト分割用のトークン数（ローカル計算・結果はキャッシュ）
+
+    同じチャンクを再計算しないよう lru_cache で保持する。
+    """
+    encoding = _get_token_encoding()
+    if encoding is None:
+        return estimate_tokens(text)
+    return max(1, len(encoding.encode(text, disallowed_special=())))
+
+
+def _set_embedding_usage(usage: UsageRecord, response: Any, texts: List[str]) -> None:
+    """入力トークン数を設定（OpenAIは usage の報告値、Geminiは返さないためローカル計算の見積もり）"""
+    reported = openai_usage(response)
+    if reported is not None:
+        usage.set_tokens(reported[0], 0)
+    else:
+        usage.set_tokens(sum(count_embedding_tokens(t) for t in texts), 0, estimated=True)
+
+
+def split_text_by_tokens(text: str, max_tokens: int) -> List[str]:
+    """
+    テキストを max_tokens 以下の断片に分割
+
+    Args:
+        text: 入力テキスト
+        max_tokens: 1断片あたりの最大トークン数
+
+    Returns:
+        断片のリスト（上限以下ならそのまま1要素）
+    """
+    if count_embedding_tokens(text) <= max_tokens:
+        return [text]
+    encoding = _get_token_encoding()
+    if encoding is None:
+        # 文字数 = 概算トークン数のため、文字単位で分割
+        return [text[i:i + max_tokens] for i in range(0, len(text), max_tokens)]
+    tokens = encoding.encode(text, disallowed_special=())
+    return [encoding.decode(tokens[i:i + max_tokens]) for i in range(0, len(tokens), max_tokens)]
+
+
+class OversizedTextError(ValueError):
+    """1テキストあたりのトークン上限を超えるテキストがある場合の例外（送信前に検出）"""
+
+    def __init__(self, indices: List[int], token_counts: List[int], max_tokens: int):
+        """
+        Args:
+            indices: 上限を超えたテキストの入力インデックス
+            token_counts: 各テキストのトークン数
+            max_tokens: 1テキストあたりの上限
+        """
+        self.indices = indices
+        self.token_counts = token_counts
+        self.max_tokens = max_tokens
+        super().__init__(
+            f"{len(indices)}件のテキストが1テキストあたりの上限 {max_tokens} トークンを超えています "
+            f"(indices={indices[:10]}, tokens={token_counts[:10]})。chunk_sizeを小さくしてください。"
+        )
+
+
+def pack_embedding_requests(
+    token_counts: List[int],
+    max_items: int,
+    max_tokens_per_request: int
+) -> List[List[int]]:
+    """
+    件数上限・トークン上限を超えないよう、入力インデックスを先頭から貪欲にリクエスト単位へ詰める
+
+    Args:
+        token_counts: 各テキストのトークン数（入力順）
+        max_items: 1リクエストの最大テキスト数
+        max_tokens_per_request: 1リクエストの合計トークン上限
+
+    Returns:
+        リクエストごとの入力インデックスのリスト
+    """
+    batches: List[List[int]] = []
+    current: List[int] = []
+    current_tokens = 0
+
+    for i, tokens in enumerate(token_counts):
+        if current and (len(current) >= max_items or current_tokens + tokens > max_tokens_per_request):
+            batches.append(current)
+            current = []
+            current_tokens = 0
+        current.append(i)
+        current_tokens += tokens
+
+    if current:
+        batches.append(current)
+    return batches
+
+
+class EmbeddingRequestPlan:
+    """
+    入力テキスト → 送信単位（断片）→ リクエストの対応表
+
+    上限超過のテキストは送信前に分割（または拒否）し、断片をリクエストに詰める。
+    分割したテキストのベクトルは断片ベクトルのトークン数加重平均に統合する。
+    """
+
+    def __init__(
+        self,
+        texts: List[str],
+        provider: str,
+        max_items: Optional[int] = None,
+        max_tokens_per_request: Optional[int] = None,
+        oversize: str = DEFAULT_EMBEDDING_OVERSIZE
+    ):
+        """
+        Args:
+            texts: 入力テキストのリスト
+            provider: "gemini" / "openai"（EMBEDDING_REQUEST_LIMITS のキー）
+            max_items: 1リクエストの最大テキスト数（プロバイダー上限でクリップ）
+            max_tokens_per_request: 1リクエストの合計トークン上限（プロバイダー上限でクリップ）
+            oversize: 超過テキストの扱い（"split" / "error"）
+        """
+        if oversize not in ("split", "error"):
+            raise ValueError(f"Unknown oversize policy: {oversize}. Use 'split' or 'error'")
+
+        limits = EMBEDDING_REQUEST_LIMITS[provider]
+        self.max_items = max(1, min(max_items or limits["max_items"], limits["max_items"]))
+        self.max_tokens_per_request = min(max_tokens_per_request or limits["max_tokens_per_request"],
+                                          limits["max_tokens_per_request"])
+        # 1断片がリクエスト上限を超えないようにする
+        max_tokens_per_text = min(limits["max_tokens_per_text"], self.max_tokens_per_request)
+        self.num_texts = len(texts)
+
+        token_counts = [count_embedding_tokens(text) for text in texts]
+        oversized = [i for i, tokens in enumerate(token_counts) if tokens > max_tokens_per_text]
+        if oversized and oversize == "error":
+            raise OversizedTextError(oversized, [token_counts[i] for i in oversized], max_tokens_per_text)
+
+        if oversized:
+            self.pieces: List[str] = []
+            self.owners: List[int] = []
+            self.token_counts: List[int] = []
+            for i, text in enumerate(texts):
+                if token_counts[i] > max_tokens_per_text:
+                    parts = split_text_by_tokens(text, max_tokens_per_text)
+                    part_tokens = [count_embedding_tokens(part) for part in parts]
+                else:
+                    parts, part_tokens = [text], [token_counts[i]]
+                self.pieces.extend(parts)
+                self.owners.extend([i] * len(parts))
+                self.token_counts.extend(part_tokens)
+            logger.info(f"[Embedding] 上限超過の{len(oversized)}件を分割: {len(texts)}件 → {len(self.pieces)}断片")
+        else:
+            self.pieces = list(texts)
+            self.owners = list(range(len(texts)))
+            self.token_counts = token_counts
+
+        self.has_splits = len(self.pieces) != len(texts)
+        self.batches = pack_embedding_requests(self.token_counts, self.max_items, self.max_tokens_per_request)
+
+    def scatter(
+        self,
+        sink: Callable[[int, List[float]], None],
+        dims: int
+    ) -> Tuple[Callable[[int, List[float]], None], Callable[[List[int]], List[int]]]:
+        """
+        断片単位の結果を入力テキスト単位の sink へ渡すための (piece_sink, finish) を返す
+
+        分割がなければ piece_sink は sink そのもの。分割がある場合は断片ベクトルを
+        バッファに溜め、finish(失敗した断片インデックス) で統合して sink へ渡す。
+        finish は失敗した入力インデックス（昇順）を返す。
+        """
+        if not self.has_splits:
+            return sink, sorted
+
+        buffer = np.zeros((len(self.pieces), dims), dtype=np.float32)
+
+        def piece_sink(idx: int, vector: List[float]) -> None:
+            buffer[idx] = vector
+
+        def finish(failed_pieces: List[int]) -> List[int]:
+            failed = sorted({self.owners[i] for i in failed_pieces})
+            merged = self.merge(buffer)
+            failed_set = set(failed)
+            for i in range(self.num_texts):
+                if i not in failed_set:
+                    sink(i, merged[i].tolist())
+            return failed
+
+        return piece_sink, finish
+
+    def merge(self, piece_matrix: np.ndarray) -> np.ndarray:
+        """断片ベクトル行列を入力テキスト単位に統合（トークン数加重平均）"""
+        owners = np.asarray(self.owners)
+        weights = np.asarray(self.token_counts, dtype=np.float32)
+        merged = np.zeros((self.num_texts, piece_matrix.shape[1]), dtype=np.float32)
+        np.add.at(merged, owners, piece_matrix * weights[:, None])
+        totals = np.bincount(owners, weights=weights, minlength=self.num_texts).astype(np.float32)
+        merged /= np.maximum(totals, 1.0)[:, None]
+        return merged
+
+
+# ==========================================
+# SDKクライアントレジストリ（プロセス内で接続プールを共有）
+# ==========================================
+
+_SDK_CLIENTS: Dict[Tuple[int, str, str, Optional[str]], Any] = {}
+_SDK_CLIENTS_LOCK = threading.Lock()
+
+
+def get_sdk_client(kind: str, api_key: str, base_url: Optional[str] = None) -> Any:
+    """
+    プロセス内で共有するSDKクライアントを取得（なければ作成）
+
+    genai.Client は同期APIと非同期API（client.aio）で同じインスタンスを共有する。
+    キーにプロセスIDを含めるため、fork後の子プロセス（Celeryワーカー等）では作り直される。
+
+    Args:
+        kind: "gemini" / "openai" / "openai_async"
+        api_key: APIキー
+        base_url: APIエンドポイントの上書き
+
+    Returns:
+        SDKクライアント（genai.Client / OpenAI / AsyncOpenAI）
+    """
+    key = (os.getpid(), kind, api_key, base_url)
+    with _SDK_CLIENTS_LOCK:
+        client = _SDK_CLIENTS.get(key)
+        if client is None:
+            client = _build_sdk_client(kind, api_key, base_url)
+            _SDK_CLIENTS[key] = client
+            logger.debug(f"SDKクライアント作成: kind={kind}, base_url={base_url}")
+        return client
+
+
+def _build_sdk_client(kind: str, api_key: str, base_url: Optional[str]) -> Any:
+    """SDKクライアントを新規作成"""
+    if kind == "gemini":
+        if base_url:
+            return genai.Client(api_key=api_key, http_options={"base_url": base_url})
+        return genai.Client(api_key=api_key)
+    elif kind == "openai":
+        if base_url:
+            return OpenAI(api_key=api_key, base_url=base_url)
+        return OpenAI(api_key=api_key)
+    elif kind == "openai_async":
+        if base_url:
+            return AsyncOpenAI(api_key=api_key, base_url=base_url)
+        return AsyncOpenAI(api_key=api_key)
+    else:
+        raise ValueError(f"Unknown SDK client kind: {kind}")
+
+
+def clear_sdk_clients() -> None:
+    """共有SDKクライアントを破棄（テストやAPIキー切り替え時に使用）"""
+    with _SDK_CLIENTS_LOCK:
+        _SDK_CLIENTS.clear()
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """
+    行ごとにL2正規化（in-place、ゼロベクトルの行はそのまま）
+
+    Args:
+        matrix: (n, dims) の浮動小数点行列
+
+    Returns:
+        正規化後の同じ行列
+    """
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    np.divide(matrix, norms, out=matrix, where=norms > 0)
+    return matrix
+
+
+# ==========================================
+# 重複テキストの集約と結果の展開（登録・カバレッジ計算の共通前処理）
+# ==========================================
+
+def collapse_texts(texts: List[str]) -> Tuple[List[str], np.ndarray]:
+    """
+    空でないテキストを重複除去し、各行がどのユニークテキストに対応するかを返す（1パス）
+
+    Args:
+        texts: 入力テキストのリスト（同一テキスト・空文字列を含んでよい）
+
+    Returns:
+        (ユニークテキストのリスト（初出順）, 各行のスロット番号の配列（空文字列・空白のみは-1）)
+    """
+    slots: Dict[str, int] = {}
+    inverse = np.full(len(texts), -1, dtype=np.int64)
+    for i, text in enumerate(texts):
+        if text and text.strip():
+            inverse[i] = slots.setdefault(text, len(slots))
+    return list(slots), inverse
+
+
+def expand_embeddings(vectors: Any, inverse: np.ndarray, dims: int) -> Any:
+    """
+    ユニークテキストのEmbeddingを元の行へ展開（-1の行はゼロベクトル）
+
+    Args:
+        vectors: ユニークテキストのEmbedding（float32 行列 または ベクトルのリスト）
+        inverse: collapse_texts が返したスロット番号の配列
+        dims: Embedding次元数
+
+    Returns:
+        vectors が行列なら (len(inverse), dims) の float32 行列、リストならベクトルのリスト
+        （リストの場合、同一テキストの行は同じベクトルオブジェクトを共有する）
+    """
+    if isinstance(vectors, np.ndarray):
+        matrix = np.zeros((len(inverse), dims), dtype=np.float32)
+        mask = inverse >= 0
+        matrix[mask] = vectors[inverse[mask]]
+        return matrix
+
+    zero = [0.0] * dims
+    return [vectors[slot] if slot >= 0 else zero for slot in inverse.tolist()]
+
 
 class EmbeddingClient(ABC):
     """Embeddingクライアント抽象基底クラス"""
 
+    # プロバイダー識別子（キャッシュキー等に使用）
+    provider = "unknown"
+
     @property
     @abstractmethod
     def dimensions(self) -> int:
@@ -77,29 +505,156 @@ class EmbeddingClient(ABC):
         """
         pass
 
+    def embed_texts_batch(
+        self,
+        texts: List[str],
+        batch_size: int = 100
+    ) -> List[List[float]]:
+        """
+        複数テキストを1リクエストにまとめたバッチEmbedding生成
+
+        デフォルトはembed_textsと同じ（embed_texts自体が複数テキストを
+        1リクエストで送るプロバイダーはこのままでよい）。
+
+        Args:
+            texts: 入力テキストのリスト
+            batch_size: 1リクエストあたりの最大テキスト数
+
+        Returns:
+            Embeddingベクトルのリスト（入力順）
+        """
+        return self.embed_texts(texts, batch_size=batch_size)
+
+    def embed_texts_array(
+        self,
+        texts: List[str],
+        batch_size: int = 100,
+        normalize: bool = True
+    ) -> np.ndarray:
+        """
+        バッチEmbedding生成（連続した float32 行列で返す）
+
+        Args:
+            texts: 入力テキストのリスト
+            batch_size: 1リクエストあたりの最大テキスト数
+            normalize: 各行をL2正規化するか（コサイン類似度を内積で計算できる）
+
+        Returns:
+            (len(texts), dimensions) の float32 行列（入力順）
+        """
+        matrix = np.empty((len(texts), self.dimensions), dtype=np.float32)
+        if not texts:
+            return matrix
+        for i, vector in enumerate(self.embed_texts_batch(texts, batch_size=batch_size)):
+            matrix[i] = vector
+        return normalize_rows(matrix) if normalize else matrix
+
+    def embed_iter(
+        self,
+        texts: List[str],
+        batch_size: int = 100,
+        normalize: bool = True,
+        prefetch: Optional[int] = None
+    ) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """
+        バッチ単位のEmbeddingを完了順に返すイテレータ
+
+        texts を batch_size 件ずつのバッチに分け、最大 prefetch バッチを
+        バックグラウンドスレッドで先行して生成する。呼び出し側が受け取ったバッチを
+        処理（ポイント構築・Qdrant書き込み等）している間も次のバッチのリクエストが進み、
+        同時に保持するのは prefetch + 1 バッチ分のベクトルだけになる。
+
+        Args:
+            texts: 入力テキストのリスト
+            batch_size: 1回に返すテキスト数
+            normalize: 各行をL2正規化するか
+            prefetch: 同時に生成するバッチ数（Noneの場合は max_concurrency + 1）
+
+        Yields:
+            (入力インデックスの配列, (len(indices), dimensions) の float32 行列)
+            バッチの順序は完了順（インデックスで対応付けること）
+
+        Raises:
+            EmbeddingBatchError: バッチ内に失敗があった場合（failed_indices は texts 全体の
+                インデックス、embeddings は該当バッチ分の結果）
+        """
+        if not texts:
+            return
+        prefetch = max(1, prefetch or getattr(self, "max_concurrency", 1) + 1)
+        starts = iter(range(0, len(texts), batch_size))
+
+        def run(start: int) -> Tuple[np.ndarray, np.ndarray]:
+            window = texts[start:start + batch_size]
+            try:
+                matrix = self.embed_texts_array(window, normalize=normalize)
+            except EmbeddingBatchError as e:
+                raise EmbeddingBatchError([start + i for i in e.failed_indices], e.embeddings) from e
+            return np.arange(start, start + len(window)), matrix
+
+        with ThreadPoolExecutor(max_workers=prefetch, thread_name_prefix="embed-iter") as executor:
+            pending = {executor.submit(run, start) for _, start in zip(range(prefetch), starts)}
+            try:
+                while pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        result = future.result()
+                        # 1バッチ受け取るごとに次のバッチを投入（同時保持数を一定に保つ）
+                        start = next(starts, None)
+                        if start is not None:
+                            pending.add(executor.submit(run, start))
+                        yield result
+            finally:
+                for future in pending:
+                    future.cancel()
+
+
+class EmbeddingBatchError(RuntimeError):
+    """一部のテキストのEmbedding生成に失敗した場合の例外（成功分の結果を保持）"""
+
+    def __init__(self, failed_indices: List[int], embeddings: List[Optional[List[float]]]):
+        """
+        Args:
+            failed_indices: 失敗したテキストの入力インデックス
+            embeddings: 入力順の結果（失敗箇所はNone）
+        """
+        self.failed_indices = failed_indices
+        self.embeddings = embeddings
+        super().__init__(
+            f"{len(failed_indices)}/{len(embeddings)}件のEmbedding生成に失敗しました "
+            f"(indices={failed_indices[:10]})"
+        )
+
 
 class OpenAIEmbedding(EmbeddingClient):
     """OpenAI Embeddings API実装"""
 
+    provider = "openai"
+
     def __init__(
         self,
         api_key: Optional[str] = None,
         model: str = "text-embedding-3-small",
-        dims: int = DEFAULT_OPENAI_EMBEDDING_DIMS
+        dims: int = DEFAULT_OPENAI_EMBEDDING_DIMS,
+        oversize: str = DEFAULT_EMBEDDING_OVERSIZE,
+        concurrency_controller: Optional[AdaptiveConcurrencyController] = None
     ):
         """
         Args:
             api_key: OpenAI APIキー（Noneの場合は環境変数から取得）
             model: 使用モデル
             dims: Embedding次元数（1536推奨）
+            oversize: 1テキストあたりの上限超過時の扱い（"split" / "error"）
+            concurrency_controller: 429/503 時の同時実行数制御（Noneはプロセス内共有の "openai-embedding"）
         """
         self.api_key = api_key or os.getenv("OPENAI_API_KEY")
         if not self.api_key:
             raise ValueError("OPENAI_API_KEY が設定されていません")
 
-        self.client = OpenAI(api_key=self.api_key)
+        self.client = get_sdk_client("openai", self.api_key)
         self.model = model
         self._dims = dims
+        self.oversize = oversize
+        self.concurrency_controller = concurrency_controller or get_concurrency_controller("openai-embedding")
 
     @property
     def dimensions(self) -> int:
@@ -107,66 +662,113 @@ class OpenAIEmbedding(EmbeddingClient):
 
     def embed_text(self, text: str) -> List[float]:
         """単一テキストのEmbedding生成"""
-        response = self.client.embeddings.create(
-            model=self.model,
-            input=text,
-            dimensions=self._dims
-        )
+        with get_usage_meter().measure("openai", self.model, "embed_text") as usage:
+            response = self.concurrency_controller.call(
+                self.client.embeddings.create,
+                model=self.model,
+                input=text,
+                dimensions=self._dims
+            )
+            _set_embedding_usage(usage, response, [text])
         return response.data[0].embedding
 
     def embed_texts(
         self,
         texts: List[str],
-        batch_size: int = 100
+        batch_size: int = 100,
+        max_tokens_per_request: Optional[int] = None
     ) -> List[List[float]]:
-        """バッチEmbedding生成"""
-        all_embeddings: List[List[float]] = []
-
-        for i in range(0, len(texts), batch_size):
-            batch = texts[i:i + batch_size]
+        """
+        バッチEmbedding生成
 
-            response = self.client.embeddings.create(
-                model=self.model,
-                input=batch,
-                dimensions=self._dims
-            )
+        件数上限（batch_size、最大2048）とトークン上限に収まるよう詰めて送信する。
+        1テキストあたりの上限を超えるテキストは self.oversize に従い分割または拒否する。
+        """
+        if not texts:
+            return []
+
+        plan = EmbeddingRequestPlan(texts, "openai", max_items=batch_size,
+                                    max_tokens_per_request=max_tokens_per_request, oversize=self.oversize)
+        all_embeddings: List[Optional[List[float]]] = [None] * len(texts)
+        piece_sink, finish = plan.scatter(all_embeddings.__setitem__, self._dims)
+
+        for indices in plan.batches:
+            # レート制限は concurrency_controller が 429/Retry-After に応じて待機・再試行する
+            batch_pieces = [plan.pieces[i] for i in indices]
+            with get_usage_meter().measure("openai", self.model, "embed_texts") as usage:
+                response = self.concurrency_controller.call(
+                    self.client.embeddings.create,
+                    model=self.model,
+                    input=batch_pieces,
+                    dimensions=self._dims
+                )
+                _set_embedding_usage(usage, response, batch_pieces)
 
             # レスポンスはindex順にソートされていない場合があるため、ソート
             sorted_data = sorted(response.data, key=lambda x: x.index)
-            batch_embeddings = [item.embedding for item in sorted_data]
-            all_embeddings.extend(batch_embeddings)
-
-            # レート制限対策
-            if i + batch_size < len(texts):
-                time.sleep(0.1)
+            for idx, item in zip(indices, sorted_data):
+                piece_sink(idx, item.embedding)
 
+        finish([])
         return all_embeddings
 
 
 class GeminiEmbedding(EmbeddingClient):
     """Gemini Embeddings API実装（3072次元: Gemini 3アドバンテージ）"""
 
+    provider = "gemini"
+
     def __init__(
         self,
         api_key: Optional[str] = None,
         model: str = "gemini-embedding-001",
-        dims: int = DEFAULT_GEMINI_EMBEDDING_DIMS
+        dims: int = DEFAULT_GEMINI_EMBEDDING_DIMS,
+        max_concurrency: int = DEFAULT_GEMINI_EMBEDDING_CONCURRENCY,
+        rpm: Optional[float] = DEFAULT_GEMINI_EMBEDDING_RPM,
+        tpm: Optional[float] = DEFAULT_GEMINI_EMBEDDING_TPM,
+        rate_limiter: Optional[TokenBucketRateLimiter] = None,
+        base_url: Optional[str] = None,
+        oversize: str = DEFAULT_EMBEDDING_OVERSIZE,
+        concurrency_controller: Optional[AdaptiveConcurrencyController] = None,
+        key_pool: Optional[APIKeyPool] = None
     ):
         """
         Args:
             api_key: Gemini APIキー（Noneの場合は環境変数から取得）
             model: 使用モデル
             dims: Embedding次元数（3072推奨: Gemini 3最大精度）
+            max_concurrency: 同時実行リクエスト数（1の場合は逐次実行）
+            rpm: 1分あたりの最大リクエスト数（Noneは無制限）
+            tpm: 1分あたりの最大トークン数（Noneは無制限）
+            rate_limiter: 共有するレートリミッター（指定時はrpm/tpmより優先）
+            base_url: APIエンドポイントの上書き（ローカルスタブサーバー等）
+            oversize: 1テキストあたりの上限超過時の扱い（"split" / "error"）
+            concurrency_controller: 429/503 時の同時実行数制御（Noneはプロセス内共有の "gemini-embedding"）
+            key_pool: 複数キーのプール（Noneかつ api_key 未指定の場合は GOOGLE_API_KEYS から作成。
+                使用時は rpm/tpm をキーごとの予算とする）
         """
-        self.api_key = api_key or os.getenv("GOOGLE_API_KEY")
+        self.key_pool = key_pool if key_pool is not None or api_key else get_api_key_pool(
+            "gemini-embedding", rpm=rpm, tpm=tpm
+        )
+        self.api_key = api_key or os.getenv("GOOGLE_API_KEY") or (self.key_pool.keys[0] if self.key_pool else None)
         if not self.api_key:
             raise ValueError("GOOGLE_API_KEY が設定されていません")
 
-        self.client = genai.Client(api_key=self.api_key)
+        self.client = get_sdk_client("gemini", self.api_key, base_url)
+        self.base_url = base_url
         self.model = model
         self._dims = dims
+        self.max_concurrency = max(1, int(max_concurrency))
+        # キープール使用時の流量はキーごとのバケットで制限する
+        self.rate_limiter = rate_limiter or TokenBucketRateLimiter(
+            rpm=None if self.key_pool else rpm, tpm=None if self.key_pool else tpm
+        )
+        self.oversize = oversize
+        self.concurrency_controller = concurrency_controller or get_concurrency_controller("gemini-embedding")
 
-        logger.info(f"GeminiEmbedding initialized: model={model}, dims={dims}")
+        logger.info(f"GeminiEmbedding initialized: model={model}, dims={dims}, "
+                    f"concurrency={self.max_concurrency}, rpm={self.rate_limiter.rpm}, tpm={self.rate_limiter.tpm}, "
+                    f"keys={len(self.key_pool) if self.key_pool else 1}")
 
     @property
     def dimensions(self) -> int:
@@ -174,13 +776,31 @@ class GeminiEmbedding(EmbeddingClient):
 
     def embed_text(self, text: str) -> List[float]:
         """単一テキストのEmbedding生成（3072次元）"""
-        response = self.client.models.embed_content(
-            model=self.model,
-            contents=text,
-            config={"output_dimensionality": self._dims}
-        )
+        with get_usage_meter().measure("gemini", self.model, "embed_text") as usage:
+            response = self._embed_content(text, count_embedding_tokens(text))
+            _set_embedding_usage(usage, response, [text])
         return response.embeddings[0].values
 
+    def _embed_content(self, contents: Any, tokens: int) -> Any:
+        """レートリミッター・キープール・concurrency_controller の枠内で embed_content を呼ぶ"""
+        self.rate_limiter.acquire(tokens)
+        config = {"output_dimensionality": self._dims}
+        if self.key_pool is None:
+            return self.concurrency_controller.call(
+                self.client.models.embed_content,
+                model=self.model,
+                contents=contents,
+                config=config
+            )
+        # 再試行のたびにプールからキーを選び直す
+        return self.concurrency_controller.call(
+            self.key_pool.call,
+            lambda key: get_sdk_client("gemini", key, self.base_url).models.embed_content(
+                model=self.model, contents=contents, config=config
+            ),
+            tokens
+        )
+
     def embed_texts(
         self,
         texts: List[str],
@@ -190,49 +810,772 @@ class GeminiEmbedding(EmbeddingClient):
         バッチEmbedding生成
 
         Note: Gemini APIは現在、1リクエストに1テキストのみ対応。
-              ループ処理でバッチを模擬し、レート制限を考慮。
+              max_concurrency > 1 の場合はスレッドプールで並列にリクエストし、
+              レートリミッター（requests/min・tokens/min）でクォータ上限まで流量を上げる。
+              いずれの場合も結果は入力順で返す。
         """
-        all_embeddings: List[List[float]] = []
         total = len(texts)
+        if total == 0:
+            return []
+
         start_time = time.time()
 
         # 開始ログ
-        logger.info(f"[Embedding] 開始: {total}件のテキストを処理します")
+        logger.info(f"[Embedding] 開始: {total}件のテキストを処理します "
+                    f"(並列度={self.max_concurrency})")
+
+        if self.max_concurrency > 1:
+            all_embeddings = self._embed_texts_concurrent(texts, start_time)
+        else:
+            all_embeddings = self._embed_texts_sequential(texts, batch_size, start_time)
+
+        elapsed_total = time.time() - start_time
+        logger.info(f"[Embedding] 完了: {total}件, 所要時間={elapsed_total:.1f}秒")
+
+        return all_embeddings
+
+    def _embed_texts_sequential(
+        self,
+        texts: List[str],
+        batch_size: int,
+        start_time: float
+    ) -> List[List[float]]:
+        """1リクエストずつ逐次処理（従来方式）"""
+        all_embeddings: List[List[float]] = []
+        total = len(texts)
 
         for i, text in enumerate(texts):
             embedding = self.embed_text(text)
             all_embeddings.append(embedding)
+            self._log_progress(i + 1, total, start_time)
 
-            # 進捗ログ（50件ごと、または最初と最後）
-            if (i + 1) % 50 == 0 or i == 0 or i + 1 == total:
-                elapsed = time.time() - start_time
-                rate = (i + 1) / elapsed if elapsed > 0 else 0
-                remaining = (total - i - 1) / rate if rate > 0 else 0
-                logger.info(f"[Embedding] 進捗: {i + 1}/{total} ({(i + 1) / total * 100:.1f}%) "
-                           f"経過={elapsed:.1f}秒, 残り≈{remaining:.0f}秒")
-
-            # レート制限対策（100リクエストごとに待機）
-            if (i + 1) % batch_size == 0 and i + 1 < len(texts):
-                logger.debug(f"Processed {i + 1}/{len(texts)} embeddings, sleeping...")
-                time.sleep(1.0)
+        return all_embeddings
 
-        elapsed_total = time.time() - start_time
-        logger.info(f"[Embedding] 完了: {total}件, 所要時間={elapsed_total:.1f}秒")
+    def _embed_texts_concurrent(
+        self,
+        texts: List[str],
+        start_time: float
+    ) -> List[List[float]]:
+        """スレッドプールによる並列処理（流量はレートリミッターで制御）"""
+        total = len(texts)
+        all_embeddings: List[Optional[List[float]]] = [None] * total
+        completed = 0
+        progress_lock = threading.Lock()
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency,
+                                thread_name_prefix="gemini-embed") as executor:
+            futures = {executor.submit(self.embed_text, text): i for i, text in enumerate(texts)}
+            try:
+                for future in as_completed(futures):
+                    # 完了順に受け取り、入力インデックスの位置に格納
+                    all_embeddings[futures[future]] = future.result()
+                    with progress_lock:
+                        completed += 1
+                        self._log_progress(completed, total, start_time)
+            except Exception:
+                # 1件でも失敗したら未着手のリクエストを取り消して例外を伝播
+                for future in futures:
+                    future.cancel()
+                raise
 
         return all_embeddings
 
+    @staticmethod
+    def _log_progress(done: int, total: int, start_time: float) -> None:
+        """進捗ログ（50件ごと、または最初と最後）"""
+        if done % 50 == 0 or done == 1 or done == total:
+            elapsed = time.time() - start_time
+            rate = done / elapsed if elapsed > 0 else 0
+            remaining = (total - done) / rate if rate > 0 else 0
+            logger.info(f"[Embedding] 進捗: {done}/{total} ({done / total * 100:.1f}%) "
+                        f"経過={elapsed:.1f}秒, 残り≈{remaining:.0f}秒")
+
     def embed_texts_batch(
         self,
-        texts: List[str]
+        texts: List[str],
+        batch_size: int = GEMINI_EMBEDDING_MAX_BATCH_ITEMS,
+        max_tokens_per_request: int = GEMINI_EMBEDDING_MAX_TOKENS_PER_REQUEST
+    ) -> List[List[float]]:
+        """
+        バッチEmbedding生成（batchEmbedContents: 1リクエストに複数テキスト）
+
+        テキストをリクエストあたりの件数上限・トークン上限に収まるよう詰めて送信し、
+        N件ごとに1回のHTTPラウンドトリップで処理する（トークン数はローカルで計算）。
+        1テキストあたりの上限を超えるテキストは送信前に self.oversize に従い分割または拒否する。
+        リクエスト単位で失敗した場合はそのリクエストの各テキストを個別に再試行し、
+        個別でも失敗したテキストがあれば EmbeddingBatchError を送出する
+        （例外には成功分の結果が入力順で格納される）。
+
+        Args:
+            texts: 入力テキストのリスト
+            batch_size: 1リクエストあたりの最大テキスト数（上限100）
+            max_tokens_per_request: 1リクエストあたりの最大トークン数
+
+        Returns:
+            Embeddingベクトルのリスト（入力順）
+        """
+        if not texts:
+            return []
+
+        all_embeddings: List[Optional[List[float]]] = [None] * len(texts)
+        failed_indices = self._run_batches(texts, batch_size, max_tokens_per_request, all_embeddings.__setitem__)
+
+        if failed_indices:
+            raise EmbeddingBatchError(failed_indices, all_embeddings)
+
+        return all_embeddings
+
+    def embed_texts_array(
+        self,
+        texts: List[str],
+        batch_size: int = GEMINI_EMBEDDING_MAX_BATCH_ITEMS,
+        normalize: bool = True,
+        max_tokens_per_request: int = GEMINI_EMBEDDING_MAX_TOKENS_PER_REQUEST
+    ) -> np.ndarray:
+        """
+        バッチEmbedding生成（float32 行列に直接書き込み）
+
+        事前確保した行列にレスポンス到着順で各行を書き込むため、
+        全ベクトルをPythonのfloatリストとして保持しない。
+
+        Args:
+            texts: 入力テキストのリスト
+            batch_size: 1リクエストあたりの最大テキスト数（上限100）
+            normalize: 各行をL2正規化するか
+            max_tokens_per_request: 1リクエストあたりの最大トークン数
+
+        Returns:
+            (len(texts), dims) の float32 行列（入力順）
+        """
+        matrix = np.empty((len(texts), self._dims), dtype=np.float32)
+        if not texts:
+            return matrix
+
+        def write_row(idx: int, vector: List[float]) -> None:
+            matrix[idx] = vector
+
+        failed_indices = self._run_batches(texts, batch_size, max_tokens_per_request, write_row)
+
+        if failed_indices:
+            failed = set(failed_indices)
+            raise EmbeddingBatchError(
+                failed_indices,
+                [None if i in failed else matrix[i].tolist() for i in range(len(texts))]
+            )
+
+        return normalize_rows(matrix) if normalize else matrix
+
+    def _run_batches(
+        self,
+        texts: List[str],
+        batch_size: int,
+        max_tokens_per_request: int,
+        sink: Callable[[int, List[float]], None]
+    ) -> List[int]:
+        """
+        テキストをリクエスト単位に詰めて送信し、結果を到着順に sink(入力インデックス, ベクトル) へ渡す
+
+        Returns:
+            失敗した入力インデックス（昇順）
+        """
+        plan = EmbeddingRequestPlan(texts, "gemini", max_items=batch_size,
+                                    max_tokens_per_request=max_tokens_per_request, oversize=self.oversize)
+        piece_sink, finish = plan.scatter(sink, self._dims)
+        texts, batches = plan.pieces, plan.batches
+        total = len(texts)
+        start_time = time.time()
+
+        logger.info(f"[Embedding] バッチ開始: {total}件 → {len(batches)}リクエスト "
+                    f"(並列度={self.max_concurrency})")
+
+        failed_indices: List[int] = []
+        completed = 0
+
+        def store(result: Tuple[Dict[int, List[float]], List[int]]) -> None:
+            nonlocal completed
+            vectors, failed = result
+            for idx, vector in vectors.items():
+                piece_sink(idx, vector)
+            failed_indices.extend(failed)
+            completed += len(vectors) + len(failed)
+            self._log_progress(completed, total, start_time)
+
+        if self.max_concurrency > 1 and len(batches) > 1:
+            with ThreadPoolExecutor(max_workers=self.max_concurrency,
+                                    thread_name_prefix="gemini-embed-batch") as executor:
+                futures = [executor.submit(self._embed_batch, texts, indices) for indices in batches]
+                for future in as_completed(futures):
+                    store(future.result())
+        else:
+            for indices in batches:
+                store(self._embed_batch(texts, indices))
+
+        elapsed_total = time.time() - start_time
+        logger.info(f"[Embedding] バッチ完了: {total}件, {len(batches)}リクエスト, "
+                    f"所要時間={elapsed_total:.1f}秒")
+
+        return finish(failed_indices)
+
+    def _embed_batch(
+        self,
+        texts: List[str],
+        indices: List[int]
+    ) -> Tuple[Dict[int, List[float]], List[int]]:
+        """
+        1リクエスト分のバッチEmbedding（失敗時は個別リクエストにフォールバック）
+
+        Returns:
+            (入力インデックス→ベクトル, 失敗したインデックスのリスト)
+        """
+        batch_texts = [texts[i] for i in indices]
+        try:
+            with get_usage_meter().measure("gemini", self.model, "embed_texts") as usage:
+                response = self._embed_content(batch_texts, sum(count_embedding_tokens(t) for t in batch_texts))
+                _set_embedding_usage(usage, response, batch_texts)
+            embeddings = response.embeddings or []
+            if len(embeddings) != len(indices):
+                raise ValueError(f"レスポンス件数不一致: expected={len(indices)}, actual={len(embeddings)}")
+            return {idx: emb.values for idx, emb in zip(indices, embeddings)}, []
+
+        except Exception as e:
+            if len(indices) == 1:
+                logger.warning(f"[Embedding] テキスト {indices[0]} の生成に失敗: {e}")
+                return {}, list(indices)
+            logger.warning(f"[Embedding] バッチリクエスト失敗（{len(indices)}件）、個別処理にフォールバック: {e}")
+
+        vectors: Dict[int, List[float]] = {}
+        failed: List[int] = []
+        for idx in indices:
+            try:
+                vectors[idx] = self.embed_text(texts[idx])
+            except Exception as item_error:
+                logger.warning(f"[Embedding] テキスト {idx} の生成に失敗: {item_error}")
+                failed.append(idx)
+        return vectors, failed
+
+
+# ==========================================
+# ローカルEmbedding（オフラインのベンチマーク・回帰テスト用）
+# ==========================================
+
+# 特徴抽出: カタカナ語・漢字列・ひらがな列・英数字語（regex_mecab と同系統のパターン）
+_LOCAL_TOKEN_PATTERN = re.compile(r"[ァ-ヴー]+|[一-龥々]+|[ぁ-ん]+|[A-Za-z0-9]+")
+# tokenizer="mecab" の分かち書き用 Tagger 引数
+_WAKATI_TAGGER_ARGS = "-Owakati"
+
+
+class SimulatedRateLimitError(RuntimeError):
+    """LocalEmbedding が注入する 429 RESOURCE_EXHAUSTED 相当の例外"""
+
+    status_code = 429
+
+    def __init__(self, retry_after: float):
+        self.retry_after = retry_after
+        super().__init__(f"429 RESOURCE_EXHAUSTED (simulated, retry_after={retry_after:.2f}s)")
+
+
+@lru_cache(maxsize=200000)
+def _hash_feature(feature: str, dims: int) -> Tuple[int, float]:
+    """特徴量 → (次元インデックス, 符号)。プロセス・実行をまたいで決定的（blake2b）"""
+    digest = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+    return digest % dims, (1.0 if digest >> 63 else -1.0)
+
+
+class LocalEmbedding(EmbeddingClient):
+    """
+    APIを呼ばない決定的なEmbedding実装（feature hashing）
+
+    トークン（正規表現 or MeCab）と日本語の文字bigramを符号付きハッシュで
+    dims 次元へ射影し、L2正規化する。同じテキストは常に同じベクトルになり、
+    語彙の重なりが多いテキストほどコサイン類似度が高い。
+    latency / jitter / rate_limit_error_rate でリクエスト単位の遅延と429を模擬できるため、
+    チャンク分割 → カバレッジ計算 → Qdrant登録のスループットをオフラインで計測できる。
+    """
+
+    provider = "local"
+
+    def __init__(
+        self,
+        model: str = "local-feature-hashing",
+        dims: int = DEFAULT_GEMINI_EMBEDDING_DIMS,
+        tokenizer: str = "regex",
+        latency: float = DEFAULT_LOCAL_EMBEDDING_LATENCY,
+        jitter: float = DEFAULT_LOCAL_EMBEDDING_JITTER,
+        rate_limit_error_rate: float = DEFAULT_LOCAL_EMBEDDING_429_RATE,
+        retry_after: float = 1.0,
+        max_concurrency: int = 1,
+        seed: int = 0,
+        sleep: Callable[[float], None] = time.sleep,
+        oversize: str = DEFAULT_EMBEDDING_OVERSIZE,
+        concurrency_controller: Optional[AdaptiveConcurrencyController] = None
+    ):
+        """
+        Args:
+            model: モデル名（キャッシュキー用）
+            dims: Embedding次元数（3072: Gemini相当, 1536: OpenAI相当）
+            tokenizer: "regex" または "mecab"（MeCab未インストール時はregex）
+            latency: 1リクエストあたりの模擬遅延（秒）
+            jitter: 遅延に加える一様乱数の幅（秒）
+            rate_limit_error_rate: 1リクエストあたりの429注入確率（0〜1）
+            retry_after: 注入する429の Retry-After（秒）
+            max_concurrency: 同時実行リクエスト数
+            seed: 遅延・429注入の乱数シード（ベクトル自体は常に決定的）
+            sleep: 遅延に使う関数（テストで差し替え可能）
+            oversize: 1テキストあたりの上限超過時の扱い（"split" / "error"）
+            concurrency_controller: 429時の同時実行数制御・再試行（Noneはプロセス内共有の "local-embedding"）
+        """
+        self.model = model
+        self._dims = dims
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit_error_rate = rate_limit_error_rate
+        self.retry_after = retry_after
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.oversize = oversize
+        self.concurrency_controller = concurrency_controller or get_concurrency_controller("local-embedding")
+        self._sleep = sleep
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self.request_count = 0
+        # Tagger は並列ワーカーのスレッドごとに regex_mecab.get_mecab_tagger から取得する
+        self._use_mecab = False
+        if tokenizer == "mecab":
+            try:
+                get_mecab_tagger(_WAKATI_TAGGER_ARGS)
+                self._use_mecab = True
+            except Exception as e:
+                logger.warning(f"MeCabを利用できないため正規表現で分割します: {e}")
+
+        logger.info(f"LocalEmbedding initialized: dims={dims}, tokenizer={'mecab' if self._use_mecab else 'regex'}, "
+                    f"latency={latency}, jitter={jitter}, 429_rate={rate_limit_error_rate}")
+
+    @property
+    def dimensions(self) -> int:
+        return self._dims
+
+    def _features(self, text: str) -> List[str]:
+        """トークンと日本語の文字bigramを特徴量として列挙"""
+        if self._use_mecab:
+            tokens = get_mecab_tagger(_WAKATI_TAGGER_ARGS).parse(text).split()
+        else:
+            tokens = _LOCAL_TOKEN_PATTERN.findall(text)
+        features = [token.lower() for token in tokens]
+        for token in tokens:
+            if not token.isascii():
+                features.extend(token[i:i + 2] for i in range(len(token) - 1))
+        return features
+
+    def _vectorize(self, text: str) -> np.ndarray:
+        """1テキストを L2正規化済みの float32 ベクトルへ射影"""
+        vector = np.zeros(self._dims, dtype=np.float32)
+        features = self._features(text)
+        if not features:
+            return vector
+        indices, signs = zip(*(_hash_feature(feature, self._dims) for feature in features))
+        np.add.at(vector, list(indices), signs)
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector /= norm
+        return vector
+
+    def _simulate_request(self) -> None:
+        """1リクエスト分の遅延と429を模擬"""
+        with self._rng_lock:
+            self.request_count += 1
+            delay = self.latency + (self._rng.uniform(0, self.jitter) if self.jitter > 0 else 0.0)
+            rate_limited = self.rate_limit_error_rate > 0 and self._rng.random() < self.rate_limit_error_rate
+        if delay > 0:
+            self._sleep(delay)
+        if rate_limited:
+            raise SimulatedRateLimitError(self.retry_after)
+
+    def embed_text(self, text: str) -> List[float]:
+        """単一テキストのEmbedding生成"""
+        self.concurrency_controller.call(self._simulate_request)
+        return self._vectorize(text).tolist()
+
+    def embed_texts(
+        self,
+        texts: List[str],
+        batch_size: int = GEMINI_EMBEDDING_MAX_BATCH_ITEMS
     ) -> List[List[float]]:
+        """バッチEmbedding生成（リクエスト単位は embed_texts_array と同じ）"""
+        return self.embed_texts_array(texts, batch_size=batch_size, normalize=False).tolist()
+
+    def embed_texts_array(
+        self,
+        texts: List[str],
+        batch_size: int = GEMINI_EMBEDDING_MAX_BATCH_ITEMS,
+        normalize: bool = True
+    ) -> np.ndarray:
         """
-        バッチEmbedding生成（Gemini Batch API使用）
+        バッチEmbedding生成（float32 行列に直接書き込み）
 
-        Note: 大量データの場合はBatch APIを使用すると50%割引
-              現時点では通常のAPIを使用（Batch API実装は将来対応）
+        EmbeddingRequestPlan でリクエスト単位に詰め、リクエストごとに遅延・429を模擬する。
+        注入された429（SimulatedRateLimitError）は concurrency_controller が Retry-After 秒待って
+        再試行し、再試行回数を超えた場合のみ呼び出し元へ伝播する。
         """
-        # 現在はembed_textsと同じ実装
-        return self.embed_texts(texts)
+        matrix = np.empty((len(texts), self._dims), dtype=np.float32)
+        if not texts:
+            return matrix
+
+        plan = EmbeddingRequestPlan(texts, "local", max_items=batch_size, oversize=self.oversize)
+
+        def write_row(idx: int, vector: List[float]) -> None:
+            matrix[idx] = vector
+
+        piece_sink, finish = plan.scatter(write_row, self._dims)
+
+        def run(indices: List[int]) -> None:
+            self.concurrency_controller.call(self._simulate_request)
+            for idx in indices:
+                piece_sink(idx, self._vectorize(plan.pieces[idx]))
+
+        if self.max_concurrency > 1 and len(plan.batches) > 1:
+            with ThreadPoolExecutor(max_workers=self.max_concurrency,
+                                    thread_name_prefix="local-embed") as executor:
+                for future in [executor.submit(run, indices) for indices in plan.batches]:
+                    future.result()
+        else:
+            for indices in plan.batches:
+                run(indices)
+        finish([])
+
+        # 各行は正規化済み（分割テキストの統合行のみ再正規化が必要）
+        return normalize_rows(matrix) if normalize else matrix
+
+
+# ==========================================
+# 非同期Embeddingクライアント（asyncio）
+# ==========================================
+
+class AsyncEmbeddingClient(ABC):
+    """非同期Embeddingクライアント抽象基底クラス（スレッドを使わずI/Oを重ねる）"""
+
+    # プロバイダー識別子
+    provider = "unknown"
+
+    @property
+    @abstractmethod
+    def dimensions(self) -> int:
+        """Embedding次元数を返す"""
+        pass
+
+    @abstractmethod
+    async def embed_text(self, text: str) -> List[float]:
+        """単一テキストのEmbedding生成"""
+        pass
+
+    @abstractmethod
+    async def embed_texts(
+        self,
+        texts: List[str],
+        batch_size: int = 100
+    ) -> List[List[float]]:
+        """
+        バッチEmbedding生成（リクエストは同時実行数の範囲で並行に送信）
+
+        Args:
+            texts: 入力テキストのリスト
+            batch_size: 1リクエストあたりの最大テキスト数
+
+        Returns:
+            Embeddingベクトルのリスト（入力順）
+        """
+        pass
+
+    async def embed_texts_array(
+        self,
+        texts: List[str],
+        batch_size: int = 100,
+        normalize: bool = True
+    ) -> np.ndarray:
+        """
+        バッチEmbedding生成（連続した float32 行列で返す）
+
+        Returns:
+            (len(texts), dimensions) の float32 行列（入力順）
+        """
+        matrix = np.empty((len(texts), self.dimensions), dtype=np.float32)
+        if not texts:
+            return matrix
+        for i, vector in enumerate(await self.embed_texts(texts, batch_size=batch_size)):
+            matrix[i] = vector
+        return normalize_rows(matrix) if normalize else matrix
+
+
+class AsyncGeminiEmbedding(AsyncEmbeddingClient):
+    """Gemini Embeddings API 非同期実装（同期版と genai.Client を共有）"""
+
+    provider = "gemini"
+
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        model: str = "gemini-embedding-001",
+        dims: int = DEFAULT_GEMINI_EMBEDDING_DIMS,
+        max_concurrency: int = DEFAULT_GEMINI_EMBEDDING_CONCURRENCY,
+        rpm: Optional[float] = DEFAULT_GEMINI_EMBEDDING_RPM,
+        tpm: Optional[float] = DEFAULT_GEMINI_EMBEDDING_TPM,
+        rate_limiter: Optional[TokenBucketRateLimiter] = None,
+        base_url: Optional[str] = None,
+        oversize: str = DEFAULT_EMBEDDING_OVERSIZE,
+        concurrency_controller: Optional[AdaptiveConcurrencyController] = None,
+        key_pool: Optional[APIKeyPool] = None
+    ):
+        """
+        Args:
+            api_key: Gemini APIキー（Noneの場合は環境変数から取得）
+            model: 使用モデル
+            dims: Embedding次元数
+            max_concurrency: 同時実行リクエスト数
+            rpm: 1分あたりの最大リクエスト数（Noneは無制限）
+            tpm: 1分あたりの最大トークン数（Noneは無制限）
+            rate_limiter: 共有するレートリミッター（指定時はrpm/tpmより優先）
+            base_url: APIエンドポイントの上書き（ローカルスタブサーバー等）
+            oversize: 1テキストあたりの上限超過時の扱い（"split" / "error"）
+            concurrency_controller: 429/503 時の同時実行数制御（Noneはプロセス内共有の "gemini-embedding"）
+            key_pool: 複数キーのプール（Noneかつ api_key 未指定の場合は GOOGLE_API_KEYS から作成。
+                使用時は rpm/tpm をキーごとの予算とする）
+        """
+        self.key_pool = key_pool if key_pool is not None or api_key else get_api_key_pool(
+            "gemini-embedding", rpm=rpm, tpm=tpm
+        )
+        self.api_key = api_key or os.getenv("GOOGLE_API_KEY") or (self.key_pool.keys[0] if self.key_pool else None)
+        if not self.api_key:
+            raise ValueError("GOOGLE_API_KEY が設定されていません")
+
+        self.client = get_sdk_client("gemini", self.api_key, base_url)
+        self.base_url = base_url
+        self.model = model
+        self._dims = dims
+        self.max_concurrency = max(1, int(max_concurrency))
+        # キープール使用時の流量はキーごとのバケットで制限する
+        self.rate_limiter = rate_limiter or TokenBucketRateLimiter(
+            rpm=None if self.key_pool else rpm, tpm=None if self.key_pool else tpm
+        )
+        self.oversize = oversize
+        self.concurrency_controller = concurrency_controller or get_concurrency_controller("gemini-embedding")
+
+    @property
+    def dimensions(self) -> int:
+        return self._dims
+
+    async def embed_text(self, text: str) -> List[float]:
+        """単一テキストのEmbedding生成"""
+        with get_usage_meter().measure("gemini", self.model, "embed_text") as usage:
+            response = await self._embed_content(text, count_embedding_tokens(text))
+            _set_embedding_usage(usage, response, [text])
+        return response.embeddings[0].values
+
+    async def _embed_content(self, contents: Any, tokens: int) -> Any:
+        """GeminiEmbedding._embed_content の asyncio 版"""
+        await self.rate_limiter.acquire_async(tokens)
+        config = {"output_dimensionality": self._dims}
+        if self.key_pool is None:
+            return await self.concurrency_controller.call_async(
+                self.client.aio.models.embed_content,
+                model=self.model,
+                contents=contents,
+                config=config
+            )
+        return await self.concurrency_controller.call_async(
+            self.key_pool.call_async,
+            lambda key: get_sdk_client("gemini", key, self.base_url).aio.models.embed_content(
+                model=self.model, contents=contents, config=config
+            ),
+            tokens
+        )
+
+    async def embed_texts(
+        self,
+        texts: List[str],
+        batch_size: int = GEMINI_EMBEDDING_MAX_BATCH_ITEMS,
+        max_tokens_per_request: int = GEMINI_EMBEDDING_MAX_TOKENS_PER_REQUEST
+    ) -> List[List[float]]:
+        """
+        バッチEmbedding生成（batchEmbedContents をmax_concurrency件まで並行送信）
+
+        失敗時の挙動は GeminiEmbedding.embed_texts_batch と同じ
+        （個別リクエストで再試行し、残った失敗は EmbeddingBatchError）。
+        """
+        if not texts:
+            return []
+
+        all_embeddings: List[Optional[List[float]]] = [None] * len(texts)
+        failed_indices = await self._run_batches(texts, batch_size, max_tokens_per_request,
+                                                 all_embeddings.__setitem__)
+        if failed_indices:
+            raise EmbeddingBatchError(failed_indices, all_embeddings)
+        return all_embeddings
+
+    async def embed_texts_array(
+        self,
+        texts: List[str],
+        batch_size: int = GEMINI_EMBEDDING_MAX_BATCH_ITEMS,
+        normalize: bool = True,
+        max_tokens_per_request: int = GEMINI_EMBEDDING_MAX_TOKENS_PER_REQUEST
+    ) -> np.ndarray:
+        """バッチEmbedding生成（レスポンス到着順に float32 行列へ直接書き込み）"""
+        matrix = np.empty((len(texts), self._dims), dtype=np.float32)
+        if not texts:
+            return matrix
+
+        def write_row(idx: int, vector: List[float]) -> None:
+            matrix[idx] = vector
+
+        failed_indices = await self._run_batches(texts, batch_size, max_tokens_per_request, write_row)
+        if failed_indices:
+            failed = set(failed_indices)
+            raise EmbeddingBatchError(
+                failed_indices,
+                [None if i in failed else matrix[i].tolist() for i in range(len(texts))]
+            )
+        return normalize_rows(matrix) if normalize else matrix
+
+    async def _run_batches(
+        self,
+        texts: List[str],
+        batch_size: int,
+        max_tokens_per_request: int,
+        sink: Callable[[int, List[float]], None]
+    ) -> List[int]:
+        """リクエスト単位に詰めて並行送信し、結果を到着順に sink へ渡す（失敗インデックスを返す）"""
+        plan = EmbeddingRequestPlan(texts, "gemini", max_items=batch_size,
+                                    max_tokens_per_request=max_tokens_per_request, oversize=self.oversize)
+        piece_sink, finish = plan.scatter(sink, self._dims)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        failed_indices: List[int] = []
+
+        async def run(indices: List[int]) -> None:
+            async with semaphore:
+                vectors, failed = await self._embed_batch(plan.pieces, indices)
+            for idx, vector in vectors.items():
+                piece_sink(idx, vector)
+            failed_indices.extend(failed)
+
+        await asyncio.gather(*(run(indices) for indices in plan.batches))
+        return finish(failed_indices)
+
+    async def _embed_batch(
+        self,
+        texts: List[str],
+        indices: List[int]
+    ) -> Tuple[Dict[int, List[float]], List[int]]:
+        """1リクエスト分のバッチEmbedding（失敗時は個別リクエストにフォールバック）"""
+        batch_texts = [texts[i] for i in indices]
+        try:
+            with get_usage_meter().measure("gemini", self.model, "embed_texts") as usage:
+                response = await self._embed_content(batch_texts, sum(count_embedding_tokens(t) for t in batch_texts))
+                _set_embedding_usage(usage, response, batch_texts)
+            embeddings = response.embeddings or []
+            if len(embeddings) != len(indices):
+                raise ValueError(f"レスポンス件数不一致: expected={len(indices)}, actual={len(embeddings)}")
+            return {idx: emb.values for idx, emb in zip(indices, embeddings)}, []
+
+        except Exception as e:
+            if len(indices) == 1:
+                logger.warning(f"[Embedding] テキスト {indices[0]} の生成に失敗: {e}")
+                return {}, list(indices)
+            logger.warning(f"[Embedding] バッチリクエスト失敗（{len(indices)}件）、個別処理にフォールバック: {e}")
+
+        vectors: Dict[int, List[float]] = {}
+        failed: List[int] = []
+        for idx in indices:
+            try:
+                vectors[idx] = await self.embed_text(texts[idx])
+            except Exception as item_error:
+                logger.warning(f"[Embedding] テキスト {idx} の生成に失敗: {item_error}")
+                failed.append(idx)
+        return vectors, failed
+
+
+class AsyncOpenAIEmbedding(AsyncEmbeddingClient):
+    """OpenAI Embeddings API 非同期実装（AsyncOpenAIをプロセス内で共有）"""
+
+    provider = "openai"
+
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        model: str = "text-embedding-3-small",
+        dims: int = DEFAULT_OPENAI_EMBEDDING_DIMS,
+        max_concurrency: int = 4,
+        base_url: Optional[str] = None,
+        oversize: str = DEFAULT_EMBEDDING_OVERSIZE,
+        concurrency_controller: Optional[AdaptiveConcurrencyController] = None
+    ):
+        """
+        Args:
+            api_key: OpenAI APIキー（Noneの場合は環境変数から取得）
+            model: 使用モデル
+            dims: Embedding次元数
+            max_concurrency: 同時実行リクエスト数
+            base_url: APIエンドポイントの上書き
+            oversize: 1テキストあたりの上限超過時の扱い（"split" / "error"）
+            concurrency_controller: 429/503 時の同時実行数制御（Noneはプロセス内共有の "openai-embedding"）
+        """
+        self.api_key = api_key or os.getenv("OPENAI_API_KEY")
+        if not self.api_key:
+            raise ValueError("OPENAI_API_KEY が設定されていません")
+
+        self.client = get_sdk_client("openai_async", self.api_key, base_url)
+        self.model = model
+        self._dims = dims
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.oversize = oversize
+        self.concurrency_controller = concurrency_controller or get_concurrency_controller("openai-embedding")
+
+    @property
+    def dimensions(self) -> int:
+        return self._dims
+
+    async def embed_text(self, text: str) -> List[float]:
+        """単一テキストのEmbedding生成"""
+        with get_usage_meter().measure("openai", self.model, "embed_text") as usage:
+            response = await self.concurrency_controller.call_async(
+                self.client.embeddings.create,
+                model=self.model,
+                input=text,
+                dimensions=self._dims
+            )
+            _set_embedding_usage(usage, response, [text])
+        return response.data[0].embedding
+
+    async def embed_texts(
+        self,
+        texts: List[str],
+        batch_size: int = 100,
+        max_tokens_per_request: Optional[int] = None
+    ) -> List[List[float]]:
+        """バッチEmbedding生成（件数・トークン上限に詰めたリクエストを並行送信）"""
+        if not texts:
+            return []
+
+        plan = EmbeddingRequestPlan(texts, "openai", max_items=batch_size,
+                                    max_tokens_per_request=max_tokens_per_request, oversize=self.oversize)
+        all_embeddings: List[Optional[List[float]]] = [None] * len(texts)
+        piece_sink, finish = plan.scatter(all_embeddings.__setitem__, self._dims)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def run(indices: List[int]) -> None:
+            batch_pieces = [plan.pieces[i] for i in indices]
+            async with semaphore:
+                with get_usage_meter().measure("openai", self.model, "embed_texts") as usage:
+                    response = await self.concurrency_controller.call_async(
+                        self.client.embeddings.create,
+                        model=self.model,
+                        input=batch_pieces,
+                        dimensions=self._dims
+                    )
+                    _set_embedding_usage(usage, response, batch_pieces)
+            # レスポンスはindex順にソートされていない場合があるため、ソート
+            for idx, item in zip(indices, sorted(response.data, key=lambda x: x.index)):
+                piece_sink(idx, item.embedding)
+
+        await asyncio.gather(*(run(indices) for indices in plan.batches))
+        finish([])
+        return all_embeddings
 
 
 def create_embedding_client(
@@ -243,7 +1586,7 @@ def create_embedding_client(
     Embeddingクライアントのファクトリ関数
 
     Args:
-        provider: "openai" or "gemini"
+        provider: "openai" / "gemini" / "local"
         **kwargs: クライアント初期化パラメータ
 
     Returns:
@@ -258,11 +1601,44 @@ def create_embedding_client(
 
         # カスタム次元数
         embedding = create_embedding_client("gemini", dims=1536)
+
+        # オフライン用（決定的なfeature hashing、遅延・429を模擬）
+        embedding = create_embedding_client("local", latency=0.2, jitter=0.1, rate_limit_error_rate=0.01)
     """
     if provider.lower() == "openai":
         return OpenAIEmbedding(**kwargs)
     elif provider.lower() == "gemini":
         return GeminiEmbedding(**kwargs)
+    elif provider.lower() == "local":
+        return LocalEmbedding(**kwargs)
+    else:
+        raise ValueError(f"Unknown provider: {provider}. Use 'openai', 'gemini' or 'local'")
+
+
+def create_async_embedding_client(
+    provider: str = "gemini",
+    **kwargs
+) -> AsyncEmbeddingClient:
+    """
+    非同期Embeddingクライアントのファクトリ関数
+
+    同期版と同じSDKクライアント（接続プール）をプロセス内で共有する。
+
+    Args:
+        provider: "openai" or "gemini"
+        **kwargs: クライアント初期化パラメータ
+
+    Returns:
+        AsyncEmbeddingClientインスタンス
+
+    Example:
+        embedding = create_async_embedding_client("gemini", max_concurrency=8)
+        vectors = await embedding.embed_texts(texts)
+    """
+    if provider.lower() == "openai":
+        return AsyncOpenAIEmbedding(**kwargs)
+    elif provider.lower() == "gemini":
+        return AsyncGeminiEmbedding(**kwargs)
     else:
         raise ValueError(f"Unknown provider: {provider}. Use 'openai' or 'gemini'")
 
@@ -284,12 +1660,12 @@ def get_embedding_dimensions(provider: str = "gemini") -> int:
     Qdrantコレクション作成時に使用
 
     Args:
-        provider: "openai" or "gemini"
+        provider: "openai" / "gemini" / "local"（localはGeminiと同じ3072）
 
     Returns:
         次元数
     """
-    if provider.lower() == "gemini":
+    if provider.lower() in ("gemini", "local"):
         return DEFAULT_GEMINI_EMBEDDING_DIMS  # 3072
     elif provider.lower() == "openai":
         return DEFAULT_OPENAI_EMBEDDING_DIMS  # 1536
@@ -0,0 +1,395 @@
+"""
+Embeddingキャッシュ（永続・コンテンツアドレス方式）
+
+任意の EmbeddingClient をラップし、生成済みベクトルを SQLite に float32 BLOB として保存する。
+キーは (provider, model, dims, sha256(text)) で、同一データの再実行では API を呼び出さない。
+
+使用例:
+    from helper_embedding import create_embedding_client
+    from helper_embedding_cache import CachedEmbeddingClient
+
+    embedding = CachedEmbeddingClient(
+        create_embedding_client("gemini"),
+        cache_path="qa_output/.embedding_cache.sqlite",
+        max_bytes=2 * 1024 ** 3  # 2GBを超えたら古いものから削除
+    )
+    vectors = embedding.embed_texts_batch(texts)  # キャッシュミス分のみAPIへ送信
+    print(embedding.stats())  # {'hits': ..., 'misses': ..., 'hit_rate': ...}
+"""
+
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Union
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from helper_embedding import EmbeddingBatchError, EmbeddingClient, normalize_rows
+
+logger = logging.getLogger(__name__)
+
+
+# キャッシュファイルと容量上限（環境変数で上書き可能）
+DEFAULT_EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "qa_output/.embedding_cache.sqlite")
+DEFAULT_EMBEDDING_CACHE_MAX_BYTES = int(os.getenv("EMBEDDING_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+
+# SQLiteのプレースホルダ数上限（999）を超えないための1クエリあたりのキー数
+_LOOKUP_CHUNK_SIZE = 500
+
+# 容量超過時にこの割合まで削減する（毎回の削除を避けるための余裕）
+_EVICTION_TARGET_RATIO = 0.9
+
+# ベクトル（floatリスト または float32 配列）
+Vector = Union[List[float], np.ndarray]
+
+
+def make_cache_key(provider: str, model: str, dims: int, text: str) -> str:
+    """
+    キャッシュキーを生成
+
+    Args:
+        provider: プロバイダー名
+        model: モデル名
+        dims: 次元数
+        text: 入力テキスト
+
+    Returns:
+        "provider/model/dims/sha256" 形式のキー
+    """
+    digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    return f"{provider}/{model}/{dims}/{digest}"
+
+
+class EmbeddingCacheStore:
+    """
+    SQLiteによるEmbeddingの永続ストア（スレッドセーフ）
+
+    ベクトルはfloat32のBLOBとして保存し、容量がmax_bytesを超えると
+    最終アクセスが古いものから削除する（LRU）。
+    """
+
+    def __init__(self, path: str = DEFAULT_EMBEDDING_CACHE_PATH,
+                 max_bytes: Optional[int] = DEFAULT_EMBEDDING_CACHE_MAX_BYTES):
+        """
+        Args:
+            path: SQLiteファイルパス（":memory:" でメモリ上）
+            max_bytes: ベクトル総容量の上限（Noneまたは0以下で無制限）
+        """
+        self.path = path
+        self.max_bytes = max_bytes if max_bytes and max_bytes > 0 else None
+        self._lock = threading.Lock()
+
+        if path != ":memory:":
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                vector BLOB NOT NULL,
+                nbytes INTEGER NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_access ON embeddings(last_access)")
+        self._conn.commit()
+        self._total_bytes = self._conn.execute(
+            "SELECT COALESCE(SUM(nbytes), 0) FROM embeddings"
+        ).fetchone()[0]
+
+    def get_many(self, keys: Iterable[str], as_array: bool = False) -> Dict[str, Vector]:
+        """
+        複数キーを一括取得（見つかったものだけを返す）
+
+        Args:
+            keys: キャッシュキー
+            as_array: Trueの場合はリストに変換せず float32 配列で返す
+
+        Returns:
+            キー → ベクトル の辞書
+        """
+        keys = list(dict.fromkeys(keys))
+        found: Dict[str, Vector] = {}
+        if not keys:
+            return found
+
+        now = time.time()
+        with self._lock:
+            for start in range(0, len(keys), _LOOKUP_CHUNK_SIZE):
+                chunk = keys[start:start + _LOOKUP_CHUNK_SIZE]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk
+                ).fetchall()
+                for key, blob in rows:
+                    vector = np.frombuffer(blob, dtype=np.float32)
+                    found[key] = vector if as_array else vector.tolist()
+
+            if found:
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_access = ? WHERE key = ?",
+                    [(now, key) for key in found]
+                )
+                self._conn.commit()
+        return found
+
+    def put_many(self, items: Dict[str, Vector]) -> None:
+        """
+        複数ベクトルを一括保存（容量超過時は古いものから削除）
+
+        Args:
+            items: キー → ベクトル の辞書
+        """
+        if not items:
+            return
+
+        now = time.time()
+        rows = []
+        for key, vector in items.items():
+            blob = np.asarray(vector, dtype=np.float32).tobytes()
+            rows.append((key, blob, len(blob), now))
+
+        with self._lock:
+            # 上書きされる既存分の容量を差し引いてから加算する
+            existing = 0
+            keys = [row[0] for row in rows]
+            for start in range(0, len(keys), _LOOKUP_CHUNK_SIZE):
+                chunk = keys[start:start + _LOOKUP_CHUNK_SIZE]
+                placeholders = ",".join("?" * len(chunk))
+                existing += self._conn.execute(
+                    f"SELECT COALESCE(SUM(nbytes), 0) FROM embeddings WHERE key IN ({placeholders})", chunk
+                ).fetchone()[0]
+
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, nbytes, last_access) VALUES (?, ?, ?, ?)",
+                rows
+            )
+            self._total_bytes += sum(row[2] for row in rows) - existing
+            self._evict_if_needed()
+            self._conn.commit()
+
+    def _evict_if_needed(self) -> None:
+        """容量上限を超えていれば最終アクセスが古い順に削除（ロック保持中に呼ぶこと）"""
+        if self.max_bytes is None or self._total_bytes <= self.max_bytes:
+            return
+
+        target = int(self.max_bytes * _EVICTION_TARGET_RATIO)
+        to_free = self._total_bytes - target
+        freed = 0
+        evict_keys = []
+        for key, nbytes in self._conn.execute(
+            "SELECT key, nbytes FROM embeddings ORDER BY last_access ASC"
+        ):
+            if freed >= to_free:
+                break
+            evict_keys.append((key,))
+            freed += nbytes
+
+        self._conn.executemany("DELETE FROM embeddings WHERE key = ?", evict_keys)
+        self._total_bytes -= freed
+        logger.info(f"[EmbeddingCache] {len(evict_keys)}件を削除 ({freed / 1024 ** 2:.1f}MB解放)")
+
+    @property
+    def total_bytes(self) -> int:
+        """保存中のベクトル総容量（バイト）"""
+        return self._total_bytes
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def close(self) -> None:
+        """接続を閉じる"""
+        with self._lock:
+            self._conn.close()
+
+
+class CachedEmbeddingClient(EmbeddingClient):
+    """
+    永続キャッシュ付きEmbeddingクライアント（デコレータ）
+
+    キャッシュをまとめて照会し、ミスしたテキストだけをラップ先クライアントへ送る。
+    同一呼び出し内の重複テキストも1回だけ送信する。
+    """
+
+    def __init__(
+        self,
+        client: EmbeddingClient,
+        cache_path: str = DEFAULT_EMBEDDING_CACHE_PATH,
+        max_bytes: Optional[int] = DEFAULT_EMBEDDING_CACHE_MAX_BYTES,
+        store: Optional[EmbeddingCacheStore] = None
+    ):
+        """
+        Args:
+            client: ラップするEmbeddingクライアント
+            cache_path: SQLiteファイルパス
+            max_bytes: キャッシュ容量の上限（バイト）
+            store: 共有するストア（指定時はcache_path/max_bytesより優先）
+        """
+        self.client = client
+        self.store = store if store is not None else EmbeddingCacheStore(cache_path, max_bytes=max_bytes)
+        self.model = getattr(client, "model", "")
+        self.provider = getattr(client, "provider", type(client).__name__)
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+
+        logger.info(f"CachedEmbeddingClient initialized: path={self.store.path}, "
+                    f"provider={self.provider}, model={self.model}, dims={self.dimensions}")
+
+    @property
+    def dimensions(self) -> int:
+        return self.client.dimensions
+
+    @property
+    def max_concurrency(self) -> int:
+        """ラップ先クライアントの同時実行数（embed_iter の先読み数に使用）"""
+        return getattr(self.client, "max_concurrency", 1)
+
+    def cache_key(self, text: str) -> str:
+        """テキストのキャッシュキー"""
+        return make_cache_key(self.provider, self.model, self.dimensions, text)
+
+    def embed_text(self, text: str) -> List[float]:
+        """単一テキストのEmbedding生成（キャッシュ優先）"""
+        return self._embed_cached([text], lambda misses: [self.client.embed_text(misses[0])])[0]
+
+    def embed_texts(
+        self,
+        texts: List[str],
+        batch_size: int = 100
+    ) -> List[List[float]]:
+        """バッチEmbedding生成（キャッシュミス分のみembed_textsで生成）"""
+        return self._embed_cached(texts, lambda misses: self.client.embed_texts(misses, batch_size=batch_size))
+
+    def embed_texts_batch(
+        self,
+        texts: List[str],
+        batch_size: int = 100
+    ) -> List[List[float]]:
+        """複数テキストを1リクエストにまとめたバッチEmbedding生成（キャッシュミス分のみ送信）"""
+        return self._embed_cached(texts, lambda misses: self.client.embed_texts_batch(misses, batch_size=batch_size))
+
+    def embed_texts_array(
+        self,
+        texts: List[str],
+        batch_size: int = 100,
+        normalize: bool = True
+    ) -> np.ndarray:
+        """
+        バッチEmbedding生成（float32 行列、キャッシュミス分のみembed_texts_arrayで生成）
+
+        キャッシュのBLOBはリストに変換せず、そのまま行列の各行へコピーする。
+        """
+        matrix = np.empty((len(texts), self.dimensions), dtype=np.float32)
+        if not texts:
+            return matrix
+
+        keys, vectors = self._resolve(
+            texts,
+            lambda misses: self.client.embed_texts_array(misses, batch_size=batch_size, normalize=False),
+            as_array=True
+        )
+        for i, key in enumerate(keys):
+            matrix[i] = vectors[key]
+        return normalize_rows(matrix) if normalize else matrix
+
+    def _embed_cached(
+        self,
+        texts: List[str],
+        embed_misses: Callable[[List[str]], List[List[float]]]
+    ) -> List[List[float]]:
+        """
+        キャッシュを一括照会し、ミス分のみembed_missesで生成して保存する
+
+        Args:
+            texts: 入力テキスト
+            embed_misses: ミスしたテキスト（重複除去済み）のベクトルを返す関数
+
+        Returns:
+            入力順のベクトル
+        """
+        if not texts:
+            return []
+
+        keys, vectors = self._resolve(texts, embed_misses)
+        return [vectors[key] for key in keys]
+
+    def _resolve(
+        self,
+        texts: List[str],
+        embed_misses: Callable[[List[str]], Iterable[Vector]],
+        as_array: bool = False
+    ) -> Tuple[List[str], Dict[str, Vector]]:
+        """
+        入力テキストのキーと、全キーのベクトル（キャッシュ＋新規生成分）を返す
+
+        Returns:
+            (入力順のキー, キー → ベクトル)
+        """
+        keys = [self.cache_key(text) for text in texts]
+        cached = self.store.get_many(keys, as_array=as_array)
+
+        # 未キャッシュのキーを初出順に1件ずつ集める
+        miss_keys: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in miss_keys:
+                miss_keys[key] = text
+
+        hit_count = sum(1 for key in keys if key in cached)
+        with self._stats_lock:
+            self.hits += hit_count
+            self.misses += len(texts) - hit_count
+
+        if miss_keys:
+            logger.debug(f"[EmbeddingCache] hit={hit_count}, miss={len(miss_keys)} (API送信)")
+            miss_texts = list(miss_keys.values())
+            try:
+                new_vectors = embed_misses(miss_texts)
+            except EmbeddingBatchError as e:
+                # 成功分は保存し、失敗位置を入力インデックスに変換して再送出
+                partial = {
+                    key: vector for key, vector in zip(miss_keys, e.embeddings) if vector is not None
+                }
+                self.store.put_many(partial)
+                cached.update(partial)
+                embeddings = [cached.get(key) for key in keys]
+                if as_array:
+                    embeddings = [None if v is None else np.asarray(v).tolist() for v in embeddings]
+                failed = [i for i, vector in enumerate(embeddings) if vector is None]
+                raise EmbeddingBatchError(failed, embeddings) from e
+
+            fresh = dict(zip(miss_keys, new_vectors))
+            self.store.put_many(fresh)
+            cached.update(fresh)
+
+        return keys, cached
+
+    def stats(self) -> Dict[str, float]:
+        """ヒット/ミス統計"""
+        with self._stats_lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "entries": len(self.store),
+                "bytes": self.store.total_bytes,
+            }
+
+    def log_stats(self) -> None:
+        """統計をログ出力"""
+        s = self.stats()
+        logger.info(
+            f"[EmbeddingCache] hit={s['hits']}, miss={s['misses']}, hit_rate={s['hit_rate']:.1%}, "
+            f"entries={s['entries']}, size={s['bytes'] / 1024 ** 2:.1f}MB"
+        )
@@ -5,10 +5,13 @@ OpenAI API と Gemini 3 API の両方に対応する統一インターフェー
 """
 
 from abc import ABC, abstractmethod
-from typing import Any, Optional, Type, List, Dict
+from functools import lru_cache
+from typing import Any, Iterator, Optional, Type, List, Dict, Tuple, get_args
 import os
 import json
 import logging
+import math
+import threading
 
 from pydantic import BaseModel
 from dotenv import load_dotenv
@@ -21,12 +24,18 @@ except ImportError:
 
 try:
     import google.generativeai as genai
+    # google.generativeai は __init__ で client サブモジュール名を削除するため、import 時に束縛しておく
+    from google.generativeai import client as genai_client
     from google.api_core import exceptions
 except ImportError:
     genai = None
+    genai_client = None
 
 import tiktoken
 
+from helper_rate_limit import AdaptiveConcurrencyController, APIKeyPool, get_api_key_pool, get_concurrency_controller
+from helper_usage import UsageRecord, gemini_usage, get_usage_meter, openai_usage
+
 load_dotenv()
 
 logger = logging.getLogger(__name__)
@@ -34,6 +43,8 @@ logger = logging.getLogger(__name__)
 # --- LLM モデル設定 --- #
 LLM_MODELS = [
     "gemini-2.0-flash",
+    "gemini-2.0-flash-lite",
+    "gemini-2.5-flash",
     "gemini-2.0-pro",
     "gemini-1.5-pro-latest",
     "gemini-1.5-flash-latest",
@@ -43,6 +54,8 @@ LLM_MODELS = [
 
 LLM_PRICING = {
     "gemini-2.0-flash": {"input": 0.0001, "output": 0.0002},
+    "gemini-2.0-flash-lite": {"input": 0.000075, "output": 0.0003},
+    "gemini-2.5-flash": {"input": 0.0003, "output": 0.0025},
     "gemini-2.0-pro": {"input": 0.002, "output": 0.004},
     "gemini-1.5-pro-latest": {"input": 0.0035, "output": 0.0105},
     "gemini-1.5-flash-latest": {"input": 0.00035, "output": 0.00105},
@@ -52,6 +65,8 @@ LLM_PRICING = {
 
 LLM_LIMITS = {
     "gemini-2.0-flash": {"max_tokens": 1048576, "max_output": 8192},
+    "gemini-2.0-flash-lite": {"max_tokens": 1048576, "max_output": 8192},
+    "gemini-2.5-flash": {"max_tokens": 1048576, "max_output": 65536},
     "gemini-2.0-pro": {"max_tokens": 1048576, "max_output": 8192},
     "gpt-4o-mini": {"max_tokens": 128000, "max_output": 4096},
     "gpt-4o": {"max_tokens": 128000, "max_output": 4096},
@@ -78,6 +93,245 @@ EMBEDDING_DIMS = {
 
 DEFAULT_LLM_PROVIDER = os.getenv("LLM_PROVIDER", "gemini")
 
+# GOOGLE_API_KEYS で複数キーを使う場合の、キー（プロジェクト）ごとの生成APIの予算（0は無制限）
+DEFAULT_GEMINI_KEY_RPM = float(os.getenv("GEMINI_KEY_RPM", "0")) or None
+DEFAULT_GEMINI_KEY_TPM = float(os.getenv("GEMINI_KEY_TPM", "0")) or None
+
+# --- トークンカウント設定 --- #
+# "api": プロバイダーのAPIで正確に数える（Geminiは呼び出しごとにネットワーク往復）
+# "local": オフラインのトークナイザー（tiktoken cl100k_base）× モデル別補正係数
+# "estimate": 文字種ごとの係数による概算（トークナイザー不要・最速）
+TOKEN_COUNT_MODES = ("api", "local", "estimate")
+DEFAULT_TOKEN_COUNT_MODE = os.getenv("LLM_TOKEN_COUNT_MODE", "local")
+
+# モデルごとの補正係数（APIのトークン数 / ローカル計算のトークン数）。
+# LocalTokenCounter.calibrate で実測値に更新できる。未登録モデルは 1.0
+TOKEN_COUNT_CALIBRATION: Dict[str, float] = {}
+
+
+@lru_cache(maxsize=1)
+def _get_local_encoding():
+    """tiktoken のエンコーディングを取得（取得できない環境ではNone）"""
+    try:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        logger.warning(f"tiktokenを利用できないため文字種による概算でトークン数を数えます: {e}")
+        return None
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    文字種ごとの係数でトークン数を概算（cl100k_base 相当）
+
+    ASCIIは約4文字で1トークン、日本語などの非ASCII文字は1文字1トークンとして数える。
+    """
+    ascii_chars = sum(1 for ch in text if ch.isascii())
+    return math.ceil(ascii_chars / 4) + (len(text) - ascii_chars)
+
+
+@lru_cache(maxsize=65536)
+def _count_local_tokens(text: str, mode: str) -> int:
+    """補正前のローカルトークン数（チャンク分割で同じ段落・文を何度も数えるためキャッシュ）"""
+    if mode == "local":
+        encoding = _get_local_encoding()
+        if encoding is not None:
+            # 文書中の <|endoftext|> 等も通常の文字列として数える
+            return len(encoding.encode(text, disallowed_special=()))
+    return estimate_tokens(text)
+
+
+class LocalTokenCounter:
+    """
+    ネットワークを使わないトークンカウンター（LLMClient.count_tokens と同じインターフェース）
+
+    mode="local" は tiktoken、mode="estimate" は文字種係数で数え、モデル別の補正係数を掛ける。
+    APIキーも不要なため、チャンク分割・Q/A数決定などの繰り返し呼び出しに使う。
+    """
+
+    def __init__(
+        self,
+        mode: str = "local",
+        default_model: str = "gemini-2.0-flash",
+        calibration: Optional[Dict[str, float]] = None
+    ):
+        """
+        Args:
+            mode: "local" または "estimate"
+            default_model: model 省略時に補正係数を引くモデル名
+            calibration: モデル別補正係数（Noneはモジュール共通の TOKEN_COUNT_CALIBRATION）
+        """
+        if mode not in ("local", "estimate"):
+            raise ValueError(f"LocalTokenCounter mode must be 'local' or 'estimate': {mode}")
+        self.mode = mode
+        self.default_model = default_model
+        self.calibration = TOKEN_COUNT_CALIBRATION if calibration is None else calibration
+
+    def count_tokens(self, text: str, model: Optional[str] = None) -> int:
+        if not text:
+            return 0
+        raw = _count_local_tokens(text, self.mode)
+        factor = self.calibration.get(model or self.default_model, 1.0)
+        return raw if factor == 1.0 else max(1, round(raw * factor))
+
+    def calibrate(self, client: "LLMClient", samples: List[str], model: Optional[str] = None) -> float:
+        """
+        サンプルテキストをAPIとローカルの両方で数え、補正係数を更新する
+
+        Args:
+            client: token_count_mode="api" のLLMクライアント
+            samples: 代表的なテキスト
+            model: 補正対象のモデル（Noneは default_model）
+
+        Returns:
+            更新後の補正係数
+        """
+        model = model or self.default_model
+        samples = [s for s in samples if s]
+        local_total = sum(_count_local_tokens(s, self.mode) for s in samples)
+        if local_total == 0:
+            raise ValueError("calibrate requires at least one non-empty sample")
+        api_total = sum(client.count_tokens(s, model=model) for s in samples)
+        factor = api_total / local_total
+        self.calibration[model] = factor
+        logger.info(f"トークン数補正係数を更新: model={model}, mode={self.mode}, factor={factor:.3f} "
+                    f"(api={api_total}, local={local_total}, samples={len(samples)})")
+        return factor
+
+
+def create_token_counter(
+    provider: str = "gemini",
+    mode: Optional[str] = None,
+    default_model: Optional[str] = None
+):
+    """
+    トークンカウンターを作成
+
+    mode="api" の場合のみLLMクライアント（APIキー必須）を返し、
+    それ以外はネットワーク・APIキー不要の LocalTokenCounter を返す。
+
+    Args:
+        provider: "gemini" または "openai"（mode="api" 時に使用）
+        mode: "api" / "local" / "estimate"（Noneは DEFAULT_TOKEN_COUNT_MODE）
+        default_model: model 省略時のモデル名
+
+    Returns:
+        count_tokens(text, model=None) を持つオブジェクト
+    """
+    mode = mode or DEFAULT_TOKEN_COUNT_MODE
+    if mode not in TOKEN_COUNT_MODES:
+        raise ValueError(f"Unknown token count mode: {mode} (expected one of {TOKEN_COUNT_MODES})")
+    kwargs = {"default_model": default_model} if default_model else {}
+    if mode == "api":
+        # OpenAIClient は常に tiktoken でローカル計算するため指定不要
+        if provider != "openai":
+            kwargs["token_count_mode"] = "api"
+        return create_llm_client(provider=provider, **kwargs)
+    return LocalTokenCounter(mode=mode, **kwargs)
+
+
+def build_structured_prompt(prompt: str, response_schema: Type[BaseModel]) -> str:
+    """
+    JSONモード用にスキーマをプロンプトへ追加（GeminiClient.generate_structured とバッチジョブで共通）
+
+    スキーマをプロンプトに追加する簡易実装（SDKの進化に合わせて変更可能）
+    """
+    return f"{prompt}\n\nOutput in JSON format following this schema: {response_schema.model_json_schema()}"
+
+
+def _set_usage_tokens(usage: UsageRecord, reported: Optional[Tuple[int, int]], prompt: str, output: Any) -> None:
+    """プロバイダー報告のトークン数を設定（報告がなければプロンプト・出力テキストから見積もる）"""
+    if reported is not None:
+        usage.set_tokens(*reported)
+    else:
+        usage.set_tokens(estimate_tokens(prompt), estimate_tokens(output if isinstance(output, str) else ""),
+                         estimated=True)
+
+
+class IncrementalJSONArrayParser:
+    """
+    ストリーミング中のJSONテキストから、指定キーの配列要素（オブジェクト）を完成した順に取り出す
+
+    {"qa_pairs": [{...}, {...}, ...]} のような応答で、要素の閉じ括弧が届いた時点で
+    その要素を返す。```json フェンスや前置きの文章は読み飛ばす。応答が途中で切れても
+    それまでに完成した要素は取り出せる。最初に現れた array_key の配列のみを対象とする。
+    """
+
+    def __init__(self, array_key: str = "qa_pairs"):
+        self.array_key = array_key
+        self.complete = False  # 対象の配列が閉じたか
+        self._buffer = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._last_string: Optional[str] = None
+        self._pending_key: Optional[str] = None
+        self._array_depth: Optional[int] = None
+        self._item_start: Optional[int] = None
+
+    def feed(self, text: str) -> List[Dict[str, Any]]:
+        """
+        テキスト断片を追加し、新たに完成した要素を返す
+
+        Args:
+            text: 応答テキストの断片
+
+        Returns:
+            完成した要素（dict）のリスト（解析できない要素は警告して読み飛ばす）
+        """
+        self._buffer += text
+        items = []
+        buffer = self._buffer
+        while self._pos < len(buffer):
+            ch = buffer[self._pos]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    self._last_string = buffer[self._string_start + 1:self._pos]
+            elif ch == '"':
+                self._in_string = True
+                self._string_start = self._pos
+            elif ch == ":":
+                self._pending_key = self._last_string
+            elif ch == ",":
+                self._pending_key = None
+            elif ch in "{[":
+                self._depth += 1
+                if self._array_depth is None:
+                    if ch == "[" and not self.complete and self._pending_key == self.array_key:
+                        self._array_depth = self._depth
+                elif ch == "{" and self._depth == self._array_depth + 1:
+                    self._item_start = self._pos
+                self._pending_key = None
+            elif ch in "}]":
+                if self._array_depth is not None:
+                    if ch == "}" and self._depth == self._array_depth + 1 and self._item_start is not None:
+                        try:
+                            items.append(json.loads(buffer[self._item_start:self._pos + 1]))
+                        except json.JSONDecodeError as e:
+                            logger.warning(f"配列要素のJSON解析に失敗したため読み飛ばします: {e}")
+                        self._item_start = None
+                    elif ch == "]" and self._depth == self._array_depth:
+                        self._array_depth = None
+                        self.complete = True
+                self._depth -= 1
+            self._pos += 1
+        return items
+
+
+def _array_item_schema(response_schema: Type[BaseModel], array_key: str) -> Type[BaseModel]:
+    """応答スキーマの配列フィールド（List[Item]）から要素のモデルを取り出す"""
+    field = response_schema.model_fields[array_key]
+    args = get_args(field.annotation)
+    if not args or not isinstance(args[0], type) or not issubclass(args[0], BaseModel):
+        raise TypeError(f"{response_schema.__name__}.{array_key} is not a list of models")
+    return args[0]
+
 
 class LLMClient(ABC):
     @abstractmethod
@@ -88,13 +342,67 @@ class LLMClient(ABC):
     def generate_structured(self, prompt: str, response_schema: Type[BaseModel], model: Optional[str] = None, **kwargs) -> BaseModel:
         pass
 
+    def generate_content_stream(self, prompt: str, model: Optional[str] = None, **kwargs) -> Iterator[str]:
+        """テキストを生成しながら断片を返す（ストリーミング非対応のクライアントは全文を1回で返す）"""
+        yield self.generate_content(prompt, model=model, **kwargs)
+
+    def _structured_text_stream(self, prompt: str, response_schema: Type[BaseModel], model: Optional[str] = None, **kwargs) -> Iterator[str]:
+        """generate_stream_structured 用のJSON応答テキストのストリーム"""
+        return self.generate_content_stream(build_structured_prompt(prompt, response_schema), model=model, **kwargs)
+
+    def generate_stream_structured(
+        self,
+        prompt: str,
+        response_schema: Type[BaseModel],
+        model: Optional[str] = None,
+        array_key: str = "qa_pairs",
+        **kwargs
+    ) -> Iterator[BaseModel]:
+        """
+        構造化出力の配列要素を、応答の受信中に完成した順に検証して返す
+
+        Args:
+            prompt: プロンプト
+            response_schema: 応答全体のスキーマ（例: QAPairsResponse）
+            model: モデル名
+            array_key: 要素を取り出す配列フィールド（例: "qa_pairs"）
+
+        Yields:
+            検証済みの要素モデル（例: QAPair）。検証に失敗した要素は読み飛ばし、
+            応答が途中で切れた場合もそれまでに完成した要素は返す
+        """
+        item_schema = _array_item_schema(response_schema, array_key)
+        parser = IncrementalJSONArrayParser(array_key)
+        count = 0
+        for text in self._structured_text_stream(prompt, response_schema, model=model, **kwargs):
+            for item in parser.feed(text or ""):
+                try:
+                    validated = item_schema.model_validate(item)
+                except Exception as e:
+                    logger.warning(f"{item_schema.__name__} の検証に失敗したため読み飛ばします: {e}")
+                    continue
+                count += 1
+                yield validated
+        if not parser.complete:
+            logger.warning(f"構造化出力が途中で終了しました（完成した要素 {count}件を使用）")
+
     @abstractmethod
     def count_tokens(self, text: str, model: Optional[str] = None) -> int:
         pass
 
 
+def _openai_messages(prompt: str, kwargs: Dict[str, Any]) -> List[Dict[str, str]]:
+    """プロンプトと system_instruction（kwargs から取り除く）を Chat Completions のメッセージにする"""
+    messages = [{"role": "user", "content": prompt}]
+    system_instruction = kwargs.pop("system_instruction", None)
+    if system_instruction:
+        messages.insert(0, {"role": "developer", "content": system_instruction})
+    return messages
+
+
 class OpenAIClient(LLMClient):
-    def __init__(self, api_key: Optional[str] = None, default_model: str = "gpt-4o-mini"):
+    def __init__(self, api_key: Optional[str] = None, default_model: str = "gpt-4o-mini",
+                 concurrency_controller: Optional[AdaptiveConcurrencyController] = None):
         if not OpenAI:
             raise ImportError("openai package is not installed.")
         self.api_key = api_key or os.getenv("OPENAI_API_KEY")
@@ -102,23 +410,63 @@ class OpenAIClient(LLMClient):
             raise ValueError("OPENAI_API_KEY is not set")
         self.client = OpenAI(api_key=self.api_key)
         self.default_model = default_model
+        # 429/503 時の同時実行数制御・再試行（プロセス内で共有）
+        self.concurrency_controller = concurrency_controller or get_concurrency_controller("openai")
 
     def generate_content(self, prompt: str, model: Optional[str] = None, **kwargs) -> str:
         model = model or self.default_model
-        messages = [{"role": "user", "content": prompt}]
-        response = self.client.chat.completions.create(model=model, messages=messages, **kwargs)
-        return response.choices[0].message.content
+        messages = _openai_messages(prompt, kwargs)
+        with get_usage_meter().measure("openai", model, "generate_content") as usage:
+            response = self.concurrency_controller.call(
+                self.client.chat.completions.create, model=model, messages=messages, **kwargs
+            )
+            text = response.choices[0].message.content
+            _set_usage_tokens(usage, openai_usage(response), prompt, text)
+        return text
 
     def generate_structured(self, prompt: str, response_schema: Type[BaseModel], model: Optional[str] = None, **kwargs) -> BaseModel:
         model = model or self.default_model
-        messages = [{"role": "user", "content": prompt}]
-        response = self.client.beta.chat.completions.parse(
-            model=model,
-            messages=messages,
-            response_format=response_schema,
-            **kwargs
-        )
-        return response.choices[0].message.parsed
+        messages = _openai_messages(prompt, kwargs)
+        with get_usage_meter().measure("openai", model, "generate_structured") as usage:
+            response = self.concurrency_controller.call(
+                self.client.beta.chat.completions.parse,
+                model=model,
+                messages=messages,
+                response_format=response_schema,
+                **kwargs
+            )
+            message = response.choices[0].message
+            _set_usage_tokens(usage, openai_usage(response), prompt, message.content)
+        return message.parsed
+
+    def generate_content_stream(self, prompt: str, model: Optional[str] = None, **kwargs) -> Iterator[str]:
+        model = model or self.default_model
+        messages = _openai_messages(prompt, kwargs)
+        # 最後の断片で usage を受け取る
+        kwargs.setdefault("stream_options", {"include_usage": True})
+        meter = get_usage_meter()
+        usage = meter.start("openai", model, "generate_content_stream")
+        reported, parts, error = None, [], None
+        try:
+            with meter.track(usage):
+                stream = self.concurrency_controller.call(
+                    self.client.chat.completions.create, model=model, messages=messages, stream=True, **kwargs
+                )
+            for chunk in stream:
+                reported = openai_usage(chunk) or reported
+                if chunk.choices and chunk.choices[0].delta.content:
+                    parts.append(chunk.choices[0].delta.content)
+                    yield chunk.choices[0].delta.content
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            _set_usage_tokens(usage, reported, prompt, "".join(parts))
+            meter.finish(usage, error=error)
+
+    def _structured_text_stream(self, prompt: str, response_schema: Type[BaseModel], model: Optional[str] = None, **kwargs) -> Iterator[str]:
+        kwargs.setdefault("response_format", {"type": "json_object"})
+        return self.generate_content_stream(build_structured_prompt(prompt, response_schema), model=model, **kwargs)
 
     def count_tokens(self, text: str, model: Optional[str] = None) -> int:
         model = model or self.default_model
@@ -130,31 +478,112 @@ class OpenAIClient(LLMClient):
 
 
 class GeminiClient(LLMClient):
-    def __init__(self, api_key: Optional[str] = None, default_model: str = "gemini-2.0-flash"):
+    def __init__(self, api_key: Optional[str] = None, default_model: str = "gemini-2.0-flash",
+                 concurrency_controller: Optional[AdaptiveConcurrencyController] = None,
+                 token_count_mode: str = DEFAULT_TOKEN_COUNT_MODE,
+                 key_pool: Optional[APIKeyPool] = None):
         if not genai:
             raise ImportError("google-generativeai package is not installed.")
-        self.api_key = api_key or os.getenv("GOOGLE_API_KEY")
+        # 複数キー（GOOGLE_API_KEYS）があればリクエストごとにプールから選ぶ。api_key 指定時は単一キー
+        self.key_pool = key_pool if key_pool is not None or api_key else get_api_key_pool(
+            "gemini", rpm=DEFAULT_GEMINI_KEY_RPM, tpm=DEFAULT_GEMINI_KEY_TPM
+        )
+        self.api_key = api_key or os.getenv("GOOGLE_API_KEY") or (self.key_pool.keys[0] if self.key_pool else None)
         if not self.api_key:
             raise ValueError("GOOGLE_API_KEY is not set")
-        genai.configure(api_key=self.api_key)
+        # genai.configure（プロセス全体の設定）は呼ばず、モデルごとにキー専用のクライアントを使う
         self.default_model = default_model
+        # 429/503 時の同時実行数制御・再試行（プロセス内で共有）
+        self.concurrency_controller = concurrency_controller or get_concurrency_controller("gemini")
+        # "api" 以外はローカルで数える（count_tokens がネットワーク往復しない）
+        if token_count_mode not in TOKEN_COUNT_MODES:
+            raise ValueError(f"Unknown token count mode: {token_count_mode} (expected one of {TOKEN_COUNT_MODES})")
+        self.token_count_mode = token_count_mode
+        self.token_counter = (LocalTokenCounter(mode=token_count_mode, default_model=default_model)
+                              if token_count_mode != "api" else None)
+
+    def _call_model(
+        self,
+        model_name: str,
+        request: Any,
+        prompt: str,
+        generation_config: Optional[Dict[str, Any]] = None,
+        system_instruction: Optional[str] = None
+    ) -> Any:
+        """
+        request(GenerativeModel) を concurrency_controller の枠内で実行する
+
+        キープールがある場合は試行ごとにプールからキーを選ぶ（429 の再試行は別のキーで行われる）。
+        """
+        def send(api_key: str) -> Any:
+            model = get_generative_model(model_name, generation_config, api_key=api_key,
+                                         system_instruction=system_instruction)
+            return request(model)
+
+        if self.key_pool is None:
+            return self.concurrency_controller.call(send, self.api_key)
+        return self.concurrency_controller.call(self.key_pool.call, send, estimate_tokens(prompt))
 
     def generate_content(self, prompt: str, model: Optional[str] = None, **kwargs) -> str:
         model_name = model or self.default_model
-        model = genai.GenerativeModel(model_name)
-        response = model.generate_content(prompt, **kwargs)
-        return response.text
+        system_instruction, kwargs = _split_gemini_kwargs(kwargs)
+        with get_usage_meter().measure("gemini", model_name, "generate_content") as usage:
+            response = self._call_model(model_name, lambda m: m.generate_content(prompt, **kwargs), prompt,
+                                        system_instruction=system_instruction)
+            text = response.text
+            _set_usage_tokens(usage, gemini_usage(response), prompt, text)
+        return text
+
+    def generate_content_stream(self, prompt: str, model: Optional[str] = None, **kwargs) -> Iterator[str]:
+        model_name = model or self.default_model
+        system_instruction, kwargs = _split_gemini_kwargs(kwargs)
+        return self._iter_stream(model_name, prompt, kwargs, system_instruction=system_instruction)
+
+    def _structured_text_stream(self, prompt: str, response_schema: Type[BaseModel], model: Optional[str] = None, **kwargs) -> Iterator[str]:
+        model_name = model or self.default_model
+        system_instruction, kwargs = _split_gemini_kwargs(kwargs)
+        return self._iter_stream(model_name, build_structured_prompt(prompt, response_schema), kwargs,
+                                 GEMINI_JSON_GENERATION_CONFIG, system_instruction)
+
+    def _iter_stream(self, model_name: str, prompt: str, kwargs: Dict[str, Any],
+                     generation_config: Optional[Dict[str, Any]] = None,
+                     system_instruction: Optional[str] = None) -> Iterator[str]:
+        # 最初の応答までを concurrency_controller で制御し、以降の断片は受信順に返す
+        meter = get_usage_meter()
+        usage = meter.start("gemini", model_name, "generate_content_stream")
+        reported, parts, error = None, [], None
+        try:
+            with meter.track(usage):
+                response = self._call_model(model_name, lambda m: m.generate_content(prompt, stream=True, **kwargs),
+                                            prompt, generation_config, system_instruction)
+            for chunk in response:
+                # usage_metadata は断片ごとの累計（最後の断片が合計）
+                reported = gemini_usage(chunk) or reported
+                try:
+                    text = chunk.text
+                except ValueError:
+                    # 本文を含まない断片（終了理由のみ等）
+                    continue
+                if text:
+                    parts.append(text)
+                    yield text
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            _set_usage_tokens(usage, reported, prompt, "".join(parts))
+            meter.finish(usage, error=error)
 
     def generate_structured(self, prompt: str, response_schema: Type[BaseModel], model: Optional[str] = None, **kwargs) -> BaseModel:
         model_name = model or self.default_model
-        model = genai.GenerativeModel(model_name)
-        
-        # Gemini JSON mode
-        generation_config = {"response_mime_type": "application/json"}
-        # スキーマをプロンプトに追加する簡易実装（SDKの進化に合わせて変更可能）
-        schema_prompt = f"{prompt}\n\nOutput in JSON format following this schema: {response_schema.model_json_schema()}"
-        
-        response = model.generate_content(schema_prompt, generation_config=generation_config, **kwargs)
+        # Gemini JSON mode（生成設定ごとにモデルオブジェクトを共有）
+        system_instruction, kwargs = _split_gemini_kwargs(kwargs)
+
+        schema_prompt = build_structured_prompt(prompt, response_schema)
+        with get_usage_meter().measure("gemini", model_name, "generate_structured") as usage:
+            response = self._call_model(model_name, lambda m: m.generate_content(schema_prompt, **kwargs),
+                                        schema_prompt, GEMINI_JSON_GENERATION_CONFIG, system_instruction)
+            _set_usage_tokens(usage, gemini_usage(response), schema_prompt, response.text)
         try:
             return response_schema.model_validate_json(response.text)
         except Exception as e:
@@ -163,13 +592,191 @@ class GeminiClient(LLMClient):
 
     def count_tokens(self, text: str, model: Optional[str] = None) -> int:
         model_name = model or self.default_model
-        model = genai.GenerativeModel(model_name)
-        return model.count_tokens(text).total_tokens
+        if self.token_counter is not None:
+            return self.token_counter.count_tokens(text, model=model_name)
+        return self._call_model(model_name, lambda m: m.count_tokens(text), text).total_tokens
 
 def create_llm_client(provider: str = "gemini", **kwargs) -> LLMClient:
+    provider = provider.lower()
     if provider == "openai":
         return OpenAIClient(**kwargs)
-    return GeminiClient(**kwargs)
+    if provider == "gemini":
+        return GeminiClient(**kwargs)
+    raise ValueError(f"Unknown provider: {provider} (expected 'gemini' or 'openai')")
+
+
+# ==========================================
+# プロセス内キャッシュ（GenerativeModel / LLMクライアント）
+# ==========================================
+
+# 構造化出力（JSONモード）の生成設定
+GEMINI_JSON_GENERATION_CONFIG = {"response_mime_type": "application/json"}
+
+# generate_content / generate_structured のキーワード引数のうち generation_config にまとめるもの
+# （GenerativeModel.generate_content は temperature 等を直接受け取らない）
+GEMINI_GENERATION_CONFIG_KEYS = (
+    "temperature", "top_p", "top_k", "max_output_tokens",
+    "candidate_count", "stop_sequences", "response_mime_type",
+)
+
+
+def _split_gemini_kwargs(kwargs: Dict[str, Any]) -> Tuple[Optional[str], Dict[str, Any]]:
+    """
+    呼び出し引数を (system_instruction, GenerativeModel.generate_content の引数) に分ける
+
+    temperature / max_output_tokens 等は generation_config に移し、
+    system_instruction はモデル作成時の引数として返す。
+    """
+    kwargs = dict(kwargs)
+    system_instruction = kwargs.pop("system_instruction", None)
+    # google-generativeai には思考レベルの設定がないため送信しない
+    if kwargs.pop("thinking_level", None) is not None:
+        logger.debug("thinking_level は google-generativeai では指定できないため無視します")
+    generation_config = dict(kwargs.pop("generation_config", None) or {})
+    for key in GEMINI_GENERATION_CONFIG_KEYS:
+        if key in kwargs:
+            generation_config[key] = kwargs.pop(key)
+    if generation_config:
+        kwargs["generation_config"] = generation_config
+    return system_instruction, kwargs
+
+
+# キーにプロセスIDを含めるため、fork後の子プロセス（Celeryワーカー等）では作り直される
+_GENERATIVE_MODELS: Dict[Tuple[int, Optional[str], str, str, Optional[str]], Any] = {}
+_GENERATIVE_SERVICE_CLIENTS: Dict[Tuple[int, str], Any] = {}
+_LLM_CLIENTS: Dict[Tuple[int, str, Tuple[Tuple[str, Any], ...]], LLMClient] = {}
+_TOKEN_COUNTERS: Dict[Tuple[int, str, Optional[str]], "LocalTokenCounter"] = {}
+_LLM_CACHE_LOCK = threading.Lock()
+
+
+def _config_key(generation_config: Optional[Dict[str, Any]]) -> str:
+    """生成設定を辞書キー用の文字列に変換（キー順に依存しない）"""
+    return json.dumps(generation_config or {}, sort_keys=True, default=str)
+
+
+def _get_generative_service_client(api_key: str) -> Any:
+    """
+    APIキー専用の GenerativeServiceClient を取得（_LLM_CACHE_LOCK 内で呼ぶ）
+
+    genai.configure はプロセス全体の既定クライアントを差し替えるため、スレッド間で競合する。
+    キーごとに SDK の _ClientManager を作り、既定設定に触れずにクライアントを作成する。
+    """
+    key = (os.getpid(), api_key)
+    client = _GENERATIVE_SERVICE_CLIENTS.get(key)
+    if client is None:
+        manager = genai_client._ClientManager()
+        manager.configure(api_key=api_key)
+        client = manager.get_default_client("generative")
+        _GENERATIVE_SERVICE_CLIENTS[key] = client
+    return client
+
+
+def get_generative_model(
+    model_name: str,
+    generation_config: Optional[Dict[str, Any]] = None,
+    api_key: Optional[str] = None,
+    system_instruction: Optional[str] = None
+) -> Any:
+    """
+    プロセス内で共有する genai.GenerativeModel を取得（なければ作成）
+
+    GenerativeModel は初回呼び出し時に接続済みのクライアントを保持するため、
+    呼び出しごとに作り直さずに (APIキー, モデル名, 生成設定) ごとに使い回す。
+
+    Args:
+        model_name: モデル名
+        generation_config: モデルに固定する生成設定（呼び出し時の generation_config とマージされる）
+        api_key: モデルの送信に使うAPIキー（キーごとに別インスタンス）
+        system_instruction: システム指示（指示ごとに別インスタンス）
+
+    Returns:
+        genai.GenerativeModel
+    """
+    key = (os.getpid(), api_key, model_name, _config_key(generation_config), system_instruction)
+    with _LLM_CACHE_LOCK:
+        model = _GENERATIVE_MODELS.get(key)
+        if model is None:
+            model = genai.GenerativeModel(model_name, generation_config=generation_config,
+                                          system_instruction=system_instruction)
+            if api_key:
+                # 作成時にこのキーのクライアントを固定する
+                # （キープールで複数キーのモデルが混在しても、各モデルは自分のキーで送信する）
+                model._client = _get_generative_service_client(api_key)
+            _GENERATIVE_MODELS[key] = model
+            logger.debug(f"GenerativeModel作成: model={model_name}, config={generation_config}")
+        return model
+
+
+def get_llm_client(provider: Optional[str] = None, **kwargs) -> LLMClient:
+    """
+    プロセス内で共有するLLMクライアントを取得（なければ create_llm_client で作成）
+
+    Celeryタスクや検索画面のクリックなど、リクエストごとに呼ばれる経路で使う。
+    HTTPクライアントやトークナイザの初期化をプロセスあたり1回にする。
+
+    Args:
+        provider: "gemini" / "openai"（Noneは DEFAULT_LLM_PROVIDER）
+        **kwargs: create_llm_client の引数（引数が異なれば別インスタンス）
+
+    Returns:
+        LLMクライアント
+    """
+    provider = provider or DEFAULT_LLM_PROVIDER
+    key = (os.getpid(), provider, tuple(sorted(kwargs.items())))
+    with _LLM_CACHE_LOCK:
+        client = _LLM_CLIENTS.get(key)
+    if client is None:
+        # クライアント作成はロック外で行い、先に登録された方を使う
+        created = create_llm_client(provider=provider, **kwargs)
+        with _LLM_CACHE_LOCK:
+            client = _LLM_CLIENTS.setdefault(key, created)
+        logger.debug(f"LLMクライアント作成: provider={provider}")
+    return client
+
+
+def get_token_counter(
+    provider: str = "gemini",
+    mode: Optional[str] = None,
+    default_model: Optional[str] = None
+):
+    """
+    プロセス内で共有するトークンカウンターを取得（なければ作成）
+
+    チャンクごとにトークン数を数える経路（Q/A数の決定・バッチ計画など）で使う。
+    mode="api" は get_llm_client の共有クライアント、それ以外は共有の LocalTokenCounter を返す。
+
+    Args:
+        provider: "gemini" または "openai"（mode="api" 時に使用）
+        mode: "api" / "local" / "estimate"（Noneは DEFAULT_TOKEN_COUNT_MODE）
+        default_model: model 省略時のモデル名
+
+    Returns:
+        count_tokens(text, model=None) を持つオブジェクト
+    """
+    mode = mode or DEFAULT_TOKEN_COUNT_MODE
+    if mode not in TOKEN_COUNT_MODES:
+        raise ValueError(f"Unknown token count mode: {mode} (expected one of {TOKEN_COUNT_MODES})")
+    if mode == "api":
+        kwargs = {"default_model": default_model} if default_model else {}
+        if provider != "openai":
+            kwargs["token_count_mode"] = "api"
+        return get_llm_client(provider=provider, **kwargs)
+    key = (os.getpid(), mode, default_model)
+    with _LLM_CACHE_LOCK:
+        counter = _TOKEN_COUNTERS.get(key)
+        if counter is None:
+            counter = create_token_counter(provider=provider, mode=mode, default_model=default_model)
+            _TOKEN_COUNTERS[key] = counter
+        return counter
+
+
+def clear_llm_clients() -> None:
+    """共有の GenerativeModel / LLMクライアント / トークンカウンターを破棄（テストやAPIキー切り替え時に使用）"""
+    with _LLM_CACHE_LOCK:
+        _GENERATIVE_MODELS.clear()
+        _GENERATIVE_SERVICE_CLIENTS.clear()
+        _LLM_CLIENTS.clear()
+        _TOKEN_COUNTERS.clear()
 
 # Helper functions
 def get_available_llm_models() -> List[str]:
@@ -0,0 +1,260 @@
+"""
+LLMバッチジョブ（非同期一括処理）
+
+全チャンクのプロンプトを JSONL のリクエストファイルに書き出し、1つの非同期バッチジョブとして
+投入・ポーリングし、完了後に結果を1行ずつ返す。対話的なレイテンシが不要な全件処理で、
+スループットを RPM クォータではなくプロバイダーのバッチ処理枠で決まるようにする。
+
+バックエンド:
+    - GeminiBatchBackend: Gemini Batch API（google-genai の client.batches / client.files）
+    - LocalBatchBackend: 同じJSONLを handler でローカル処理する代替（テスト・オフライン用）
+
+使用例:
+    from helper_llm_batch import BatchJobClient, GeminiBatchBackend
+
+    job = BatchJobClient(GeminiBatchBackend(), workdir="qa_output/batch_jobs")
+    for key, text, error in job.run([("chunk-0", prompt0), ("chunk-1", prompt1)], model="gemini-2.0-flash"):
+        ...
+"""
+
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+import json
+import logging
+import os
+import time
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+
+# ポーリング間隔とタイムアウト（環境変数で上書き可能）
+DEFAULT_BATCH_POLL_INTERVAL = float(os.getenv("LLM_BATCH_POLL_INTERVAL", "30"))
+DEFAULT_BATCH_TIMEOUT = float(os.getenv("LLM_BATCH_TIMEOUT", str(24 * 3600)))
+
+BATCH_JOB_SUCCEEDED = "JOB_STATE_SUCCEEDED"
+# 終了状態（JOB_STATE_SUCCEEDED 以外は失敗として扱う）
+BATCH_JOB_TERMINAL_STATES = (
+    BATCH_JOB_SUCCEEDED,
+    "JOB_STATE_FAILED",
+    "JOB_STATE_CANCELLED",
+    "JOB_STATE_EXPIRED",
+)
+
+# (キー, プロンプト)
+BatchRequest = Tuple[str, str]
+# (キー, 応答テキスト（失敗時None）, エラーメッセージ（成功時None）)
+BatchResult = Tuple[str, Optional[str], Optional[str]]
+
+
+def write_batch_requests(
+    path: str,
+    requests: List[BatchRequest],
+    generation_config: Optional[Dict[str, Any]] = None
+) -> int:
+    """
+    リクエストを Gemini Batch API の JSONL 形式で書き出す
+
+    Args:
+        path: 出力ファイルパス
+        requests: (キー, プロンプト) のリスト
+        generation_config: 全リクエスト共通の生成設定
+
+    Returns:
+        書き出したリクエスト数
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        for key, prompt in requests:
+            request: Dict[str, Any] = {"contents": [{"role": "user", "parts": [{"text": prompt}]}]}
+            if generation_config:
+                request["generation_config"] = generation_config
+            f.write(json.dumps({"key": key, "request": request}, ensure_ascii=False) + "\n")
+    return len(requests)
+
+
+def parse_batch_result_line(line: str) -> BatchResult:
+    """
+    結果JSONLの1行を (キー, 応答テキスト, エラー) に変換
+
+    Args:
+        line: {"key": ..., "response": {...}} または {"key": ..., "error": {...}}
+
+    Returns:
+        (キー, 応答テキスト, エラーメッセージ)
+    """
+    record = json.loads(line)
+    key = record.get("key", "")
+    if record.get("error"):
+        return key, None, str(record["error"])
+    try:
+        parts = record["response"]["candidates"][0]["content"]["parts"]
+        return key, "".join(part.get("text", "") for part in parts), None
+    except (KeyError, IndexError, TypeError) as e:
+        return key, None, f"応答の形式が不正です: {e}"
+
+
+class GeminiBatchBackend:
+    """Gemini Batch API バックエンド（google-genai SDK）"""
+
+    def __init__(self, api_key: Optional[str] = None):
+        """
+        Args:
+            api_key: Google APIキー（Noneの場合は環境変数 GOOGLE_API_KEY）
+        """
+        from helper_embedding import get_sdk_client
+
+        self.api_key = api_key or os.getenv("GOOGLE_API_KEY")
+        if not self.api_key:
+            raise ValueError("GOOGLE_API_KEY is not set")
+        self.client = get_sdk_client("gemini", self.api_key)
+
+    def submit(self, requests_path: str, model: str, display_name: str) -> str:
+        """リクエストファイルをアップロードしてバッチジョブを作成し、ジョブ名を返す"""
+        uploaded = self.client.files.upload(
+            file=requests_path,
+            config={"display_name": display_name, "mime_type": "jsonl"}
+        )
+        job = self.client.batches.create(
+            model=model,
+            src=uploaded.name,
+            config={"display_name": display_name}
+        )
+        return job.name
+
+    def state(self, job_name: str) -> str:
+        """ジョブの状態（JOB_STATE_*）"""
+        job = self.client.batches.get(name=job_name)
+        return getattr(job.state, "name", str(job.state))
+
+    def iter_result_lines(self, job_name: str) -> Iterator[str]:
+        """完了したジョブの結果JSONLを1行ずつ返す"""
+        job = self.client.batches.get(name=job_name)
+        content = self.client.files.download(file=job.dest.file_name)
+        for line in content.decode("utf-8").splitlines():
+            if line.strip():
+                yield line
+
+
+class LocalBatchBackend:
+    """
+    バッチエンドポイントのローカル代替（テスト・オフライン用）
+
+    投入時に各リクエストを handler(プロンプト, 生成設定) で処理し、
+    polls_until_done 回のポーリングで完了状態になる。
+    handler が例外を送出したリクエストはエラー行として返す。
+    """
+
+    def __init__(self, handler: Callable[[str, Dict[str, Any]], str], polls_until_done: int = 1):
+        self.handler = handler
+        self.polls_until_done = polls_until_done
+        self.submitted: List[str] = []
+        self._results: Dict[str, List[str]] = {}
+        self._polls: Dict[str, int] = {}
+
+    def submit(self, requests_path: str, model: str, display_name: str) -> str:
+        job_name = f"local-batches/{len(self.submitted)}"
+        lines = []
+        with open(requests_path, encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                request = record["request"]
+                prompt = "".join(part.get("text", "") for part in request["contents"][0]["parts"])
+                try:
+                    text = self.handler(prompt, request.get("generation_config", {}))
+                    result = {"key": record["key"],
+                              "response": {"candidates": [{"content": {"parts": [{"text": text}]}}]}}
+                except Exception as e:
+                    result = {"key": record["key"], "error": {"message": str(e)}}
+                lines.append(json.dumps(result, ensure_ascii=False))
+        self.submitted.append(requests_path)
+        self._results[job_name] = lines
+        self._polls[job_name] = 0
+        return job_name
+
+    def state(self, job_name: str) -> str:
+        self._polls[job_name] += 1
+        return BATCH_JOB_SUCCEEDED if self._polls[job_name] >= self.polls_until_done else "JOB_STATE_RUNNING"
+
+    def iter_result_lines(self, job_name: str) -> Iterator[str]:
+        yield from self._results[job_name]
+
+
+class BatchJobClient:
+    """バッチジョブの投入・ポーリング・結果取得"""
+
+    def __init__(
+        self,
+        backend,
+        workdir: str = "qa_output/batch_jobs",
+        poll_interval: float = DEFAULT_BATCH_POLL_INTERVAL,
+        timeout: float = DEFAULT_BATCH_TIMEOUT,
+        sleep: Callable[[float], None] = time.sleep,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        """
+        Args:
+            backend: GeminiBatchBackend または LocalBatchBackend
+            workdir: リクエストJSONLの出力ディレクトリ
+            poll_interval: ポーリング間隔（秒）
+            timeout: 完了待ちの上限（秒）
+            sleep: 待機関数（テスト用に差し替え可能）
+            clock: 単調増加クロック（テスト用に差し替え可能）
+        """
+        self.backend = backend
+        self.workdir = workdir
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self._sleep = sleep
+        self._clock = clock
+
+    def run(
+        self,
+        requests: List[BatchRequest],
+        model: str,
+        generation_config: Optional[Dict[str, Any]] = None,
+        display_name: Optional[str] = None
+    ) -> Iterator[BatchResult]:
+        """
+        リクエストを1つのバッチジョブとして実行し、結果を順不同で返す
+
+        Args:
+            requests: (キー, プロンプト) のリスト（キーは一意）
+            model: モデル名
+            generation_config: 全リクエスト共通の生成設定
+            display_name: ジョブ名（Noneは日時から生成）
+
+        Yields:
+            (キー, 応答テキスト, エラーメッセージ)
+
+        Raises:
+            TimeoutError: timeout 秒以内に終了しない場合
+            RuntimeError: ジョブが成功以外の状態で終了した場合
+        """
+        if not requests:
+            return
+        display_name = display_name or f"qa-batch-{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        requests_path = os.path.join(self.workdir, f"{display_name}.jsonl")
+        count = write_batch_requests(requests_path, requests, generation_config)
+
+        job_name = self.backend.submit(requests_path, model, display_name)
+        logger.info(f"[BatchJob] 投入: {job_name} ({count}リクエスト, model={model})")
+
+        started = self._clock()
+        while True:
+            state = self.backend.state(job_name)
+            if state in BATCH_JOB_TERMINAL_STATES:
+                break
+            elapsed = self._clock() - started
+            if elapsed > self.timeout:
+                raise TimeoutError(f"Batch job {job_name} did not finish in {self.timeout:.0f}s (state={state})")
+            logger.info(f"[BatchJob] {job_name}: {state} (経過 {elapsed:.0f}秒)")
+            self._sleep(self.poll_interval)
+
+        if state != BATCH_JOB_SUCCEEDED:
+            raise RuntimeError(f"Batch job {job_name} ended with {state}")
+
+        logger.info(f"[BatchJob] 完了: {job_name} (所要 {self._clock() - started:.0f}秒)")
+        for line in self.backend.iter_result_lines(job_name):
+            yield parse_batch_result_line(line)
@@ -0,0 +1,459 @@
+"""
+LLM応答キャッシュ（永続・プロンプトアドレス方式）
+
+任意の LLMClient をラップし、generate_content / generate_structured の応答を保存する。
+キーは (provider, model, 生成パラメータ, 応答スキーマ, sha256(prompt)) で、
+同じチャンクに対する再実行（下流ステージの調整など）では LLM API を呼び出さない。
+
+保存先:
+    - SQLite（デフォルト）: 単一マシン・複数スレッド/プロセスから共有。TTLと容量上限（LRU）で削除
+    - Redis: Celeryワーカー間で共有。TTLはRedisの有効期限、容量はRedisの maxmemory ポリシーに委ねる
+
+使用例:
+    from helper_llm import create_llm_client
+    from helper_llm_cache import CachedLLMClient, create_llm_cache_store
+
+    client = CachedLLMClient(
+        create_llm_client("gemini"),
+        store=create_llm_cache_store("sqlite", path="qa_cache/llm_cache.sqlite", ttl=7 * 86400)
+    )
+    result = client.generate_structured(prompt, QAPairsResponse)  # 2回目以降はキャッシュから
+    print(client.stats())  # {'hits': ..., 'misses': ..., 'hit_rate': ...}
+
+環境変数（Celeryワーカーなど get_shared_llm_cache_store を使う経路）:
+    LLM_CACHE_BACKEND: "sqlite" / "redis"（未設定・"none" で無効）
+    LLM_CACHE_PATH: SQLiteファイルパス
+    LLM_CACHE_REDIS_URL: RedisのURL（未設定時は CELERY_RESULT_BACKEND）
+    LLM_CACHE_TTL: 有効期限（秒、0で無期限）
+    LLM_CACHE_MAX_BYTES: SQLiteの容量上限（バイト）
+"""
+
+from typing import Any, Dict, Iterator, Optional, Type
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from pydantic import BaseModel
+
+from helper_llm import LLMClient
+
+logger = logging.getLogger(__name__)
+
+
+# キャッシュ設定（環境変数で上書き可能）
+DEFAULT_LLM_CACHE_BACKEND = os.getenv("LLM_CACHE_BACKEND", "none")
+DEFAULT_LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "qa_cache/llm_cache.sqlite")
+DEFAULT_LLM_CACHE_REDIS_URL = os.getenv(
+    "LLM_CACHE_REDIS_URL", os.getenv("CELERY_RESULT_BACKEND", "redis://localhost:6379/0")
+)
+DEFAULT_LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", str(30 * 86400)))
+DEFAULT_LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(512 * 1024 ** 2)))
+
+# 容量超過時にこの割合まで削減する（毎回の削除を避けるための余裕）
+_EVICTION_TARGET_RATIO = 0.9
+
+
+def make_llm_cache_key(
+    provider: str,
+    model: str,
+    prompt: str,
+    params: Optional[Dict[str, Any]] = None,
+    schema: Optional[Dict[str, Any]] = None
+) -> str:
+    """
+    キャッシュキーを生成
+
+    Args:
+        provider: プロバイダー名
+        model: モデル名
+        prompt: プロンプト
+        params: 生成パラメータ（temperature 等、キー順に依存しない）
+        schema: 構造化出力のJSONスキーマ（テキスト生成はNone）
+
+    Returns:
+        "provider/model/sha256" 形式のキー
+    """
+    payload = json.dumps(
+        {"prompt": prompt, "params": params or {}, "schema": schema},
+        sort_keys=True, ensure_ascii=False, default=str
+    )
+    digest = hashlib.sha256(payload.encode("utf-8")).hexdigest()
+    return f"{provider}/{model}/{digest}"
+
+
+class LLMCacheStore:
+    """
+    SQLiteによるLLM応答の永続ストア（スレッドセーフ）
+
+    ttl 秒を過ぎた応答は読み出し時に破棄し、容量が max_bytes を超えると
+    最終アクセスが古いものから削除する（LRU）。
+    """
+
+    def __init__(self, path: str = DEFAULT_LLM_CACHE_PATH,
+                 ttl: Optional[float] = DEFAULT_LLM_CACHE_TTL,
+                 max_bytes: Optional[int] = DEFAULT_LLM_CACHE_MAX_BYTES):
+        """
+        Args:
+            path: SQLiteファイルパス（":memory:" でメモリ上）
+            ttl: 有効期限（秒、Noneまたは0以下で無期限）
+            max_bytes: 応答総容量の上限（Noneまたは0以下で無制限）
+        """
+        self.path = path
+        self.ttl = ttl if ttl and ttl > 0 else None
+        self.max_bytes = max_bytes if max_bytes and max_bytes > 0 else None
+        self._lock = threading.Lock()
+
+        if path != ":memory:":
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+
+        # 複数プロセス（Celeryワーカー）から同じファイルを開いても書き込み待ちで失敗しないようにする
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS llm_responses (
+                key TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                nbytes INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_responses_last_access ON llm_responses(last_access)")
+        self._conn.commit()
+        self._total_bytes = self._conn.execute(
+            "SELECT COALESCE(SUM(nbytes), 0) FROM llm_responses"
+        ).fetchone()[0]
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        応答を取得（期限切れ・未保存はNone）
+
+        Args:
+            key: キャッシュキー
+
+        Returns:
+            保存された応答テキスト
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, nbytes, created_at FROM llm_responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            response, nbytes, created_at = row
+            if self.ttl is not None and now - created_at > self.ttl:
+                self._conn.execute("DELETE FROM llm_responses WHERE key = ?", (key,))
+                self._total_bytes -= nbytes
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE llm_responses SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            return response
+
+    def put(self, key: str, response: str) -> None:
+        """
+        応答を保存（容量超過時は古いものから削除）
+
+        Args:
+            key: キャッシュキー
+            response: 応答テキスト
+        """
+        now = time.time()
+        nbytes = len(response.encode("utf-8"))
+        with self._lock:
+            existing = self._conn.execute(
+                "SELECT COALESCE(SUM(nbytes), 0) FROM llm_responses WHERE key = ?", (key,)
+            ).fetchone()[0]
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_responses (key, response, nbytes, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, response, nbytes, now, now)
+            )
+            self._total_bytes += nbytes - existing
+            self._evict_if_needed(now)
+            self._conn.commit()
+
+    def _evict_if_needed(self, now: float) -> None:
+        """期限切れと容量超過分を削除（ロック保持中に呼ぶこと）"""
+        if self.max_bytes is None or self._total_bytes <= self.max_bytes:
+            return
+
+        freed = 0
+        if self.ttl is not None:
+            freed = self._conn.execute(
+                "SELECT COALESCE(SUM(nbytes), 0) FROM llm_responses WHERE created_at < ?", (now - self.ttl,)
+            ).fetchone()[0]
+            self._conn.execute("DELETE FROM llm_responses WHERE created_at < ?", (now - self.ttl,))
+            self._total_bytes -= freed
+
+        to_free = self._total_bytes - int(self.max_bytes * _EVICTION_TARGET_RATIO)
+        evict_keys = []
+        if to_free > 0:
+            released = 0
+            for key, nbytes in self._conn.execute(
+                "SELECT key, nbytes FROM llm_responses ORDER BY last_access ASC"
+            ):
+                if released >= to_free:
+                    break
+                evict_keys.append((key,))
+                released += nbytes
+            self._conn.executemany("DELETE FROM llm_responses WHERE key = ?", evict_keys)
+            self._total_bytes -= released
+            freed += released
+        logger.info(f"[LLMCache] 期限切れ分とLRU {len(evict_keys)}件を削除 ({freed / 1024 ** 2:.1f}MB解放)")
+
+    @property
+    def total_bytes(self) -> int:
+        """保存中の応答総容量（バイト）"""
+        return self._total_bytes
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM llm_responses").fetchone()[0]
+
+    def close(self) -> None:
+        """接続を閉じる"""
+        with self._lock:
+            self._conn.close()
+
+
+class RedisLLMCacheStore:
+    """
+    RedisによるLLM応答ストア（Celeryワーカー間で共有）
+
+    有効期限はキーごとの EXPIRE で管理する。容量上限は Redis 側の
+    maxmemory / maxmemory-policy（allkeys-lru 推奨）で設定する。
+    """
+
+    def __init__(self, url: str = DEFAULT_LLM_CACHE_REDIS_URL,
+                 ttl: Optional[float] = DEFAULT_LLM_CACHE_TTL,
+                 prefix: str = "llm_cache:"):
+        """
+        Args:
+            url: RedisのURL
+            ttl: 有効期限（秒、Noneまたは0以下で無期限）
+            prefix: キーの接頭辞
+        """
+        try:
+            import redis
+        except ImportError as e:
+            raise ImportError("redis package is not installed.") from e
+        self.url = url
+        self.ttl = int(ttl) if ttl and ttl > 0 else None
+        self.prefix = prefix
+        self._redis = redis.Redis.from_url(url)
+
+    def get(self, key: str) -> Optional[str]:
+        value = self._redis.get(self.prefix + key)
+        return value.decode("utf-8") if value is not None else None
+
+    def put(self, key: str, response: str) -> None:
+        self._redis.set(self.prefix + key, response.encode("utf-8"), ex=self.ttl)
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self._redis.scan_iter(match=self.prefix + "*"))
+
+    def close(self) -> None:
+        self._redis.close()
+
+
+def create_llm_cache_store(
+    backend: str = "sqlite",
+    path: str = DEFAULT_LLM_CACHE_PATH,
+    url: str = DEFAULT_LLM_CACHE_REDIS_URL,
+    ttl: Optional[float] = DEFAULT_LLM_CACHE_TTL,
+    max_bytes: Optional[int] = DEFAULT_LLM_CACHE_MAX_BYTES
+):
+    """
+    キャッシュストアを作成
+
+    Args:
+        backend: "sqlite" または "redis"
+        path: SQLiteファイルパス（sqlite時）
+        url: RedisのURL（redis時）
+        ttl: 有効期限（秒）
+        max_bytes: 容量上限（sqlite時）
+
+    Returns:
+        LLMCacheStore または RedisLLMCacheStore
+    """
+    if backend == "redis":
+        return RedisLLMCacheStore(url, ttl=ttl)
+    if backend == "sqlite":
+        return LLMCacheStore(path, ttl=ttl, max_bytes=max_bytes)
+    raise ValueError(f"Unknown LLM cache backend: {backend}")
+
+
+_SHARED_STORES: Dict[int, Any] = {}
+_SHARED_STORES_LOCK = threading.Lock()
+
+
+def get_shared_llm_cache_store():
+    """
+    環境変数 LLM_CACHE_BACKEND の設定でプロセス内共有のストアを取得
+
+    Returns:
+        ストア（LLM_CACHE_BACKEND が未設定・"none" の場合はNone）
+    """
+    if DEFAULT_LLM_CACHE_BACKEND in ("", "none"):
+        return None
+    # fork後の子プロセスでは接続を作り直す
+    pid = os.getpid()
+    with _SHARED_STORES_LOCK:
+        store = _SHARED_STORES.get(pid)
+        if store is None:
+            store = create_llm_cache_store(DEFAULT_LLM_CACHE_BACKEND)
+            _SHARED_STORES[pid] = store
+            logger.info(f"[LLMCache] 共有ストア作成: backend={DEFAULT_LLM_CACHE_BACKEND}")
+        return store
+
+
+class CachedLLMClient(LLMClient):
+    """
+    永続キャッシュ付きLLMクライアント（デコレータ）
+
+    generate_content はテキスト、generate_structured は検証済みモデルのJSONを保存する。
+    count_tokens やその他の属性はラップ先クライアントへ委譲する。
+    """
+
+    def __init__(
+        self,
+        client: LLMClient,
+        store=None,
+        provider: Optional[str] = None
+    ):
+        """
+        Args:
+            client: ラップするLLMクライアント
+            store: LLMCacheStore / RedisLLMCacheStore（Noneは DEFAULT_LLM_CACHE_PATH のSQLite）
+            provider: キャッシュキー用のプロバイダー名（Noneはクライアントのクラス名から推定）
+        """
+        self.client = client
+        self.store = store if store is not None else LLMCacheStore()
+        self.provider = provider or type(client).__name__.replace("Client", "").lower()
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+
+    def __getattr__(self, name: str) -> Any:
+        # default_model / concurrency_controller などはラップ先の値を使う
+        if name == "client":
+            raise AttributeError(name)
+        return getattr(self.client, name)
+
+    def _model_name(self, model: Optional[str]) -> str:
+        return model or getattr(self.client, "default_model", "") or ""
+
+    def _lookup(self, key: str) -> Optional[str]:
+        cached = self.store.get(key)
+        with self._stats_lock:
+            if cached is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return cached
+
+    def generate_content(self, prompt: str, model: Optional[str] = None, **kwargs) -> str:
+        key = make_llm_cache_key(self.provider, self._model_name(model), prompt, kwargs)
+        cached = self._lookup(key)
+        if cached is not None:
+            return cached
+        response = self.client.generate_content(prompt, model=model, **kwargs)
+        if response:
+            self.store.put(key, response)
+        return response
+
+    def generate_structured(self, prompt: str, response_schema: Type[BaseModel], model: Optional[str] = None, **kwargs) -> BaseModel:
+        key = make_llm_cache_key(
+            self.provider, self._model_name(model), prompt, kwargs, response_schema.model_json_schema()
+        )
+        cached = self._lookup(key)
+        if cached is not None:
+            try:
+                return response_schema.model_validate_json(cached)
+            except Exception as e:
+                logger.warning(f"[LLMCache] キャッシュ済み応答の検証に失敗したため再生成します: {e}")
+        response = self.client.generate_structured(prompt, response_schema, model=model, **kwargs)
+        self.store.put(key, response.model_dump_json())
+        return response
+
+    def generate_content_stream(self, prompt: str, model: Optional[str] = None, **kwargs) -> Iterator[str]:
+        """キャッシュ済みなら全文を1回で返し、未キャッシュなら受信しながら返して完了後に保存"""
+        key = make_llm_cache_key(self.provider, self._model_name(model), prompt, kwargs)
+        cached = self._lookup(key)
+        if cached is not None:
+            yield cached
+            return
+        parts = []
+        for text in self.client.generate_content_stream(prompt, model=model, **kwargs):
+            parts.append(text)
+            yield text
+        if parts:
+            self.store.put(key, "".join(parts))
+
+    def _stream_structured_key(self, prompt: str, response_schema: Type[BaseModel], model: Optional[str], kwargs: Dict[str, Any]) -> str:
+        # generate_structured と同じキー（どちらで生成した応答も共有する）
+        return make_llm_cache_key(
+            self.provider, self._model_name(model), prompt, kwargs, response_schema.model_json_schema()
+        )
+
+    def _structured_text_stream(self, prompt: str, response_schema: Type[BaseModel], model: Optional[str] = None, **kwargs) -> Iterator[str]:
+        """ラップ先のストリームを中継し、応答全体がスキーマを満たす場合のみ保存（途中で切れた応答は保存しない）"""
+        key = self._stream_structured_key(prompt, response_schema, model, kwargs)
+        parts = []
+        for text in self.client._structured_text_stream(prompt, response_schema, model=model, **kwargs):
+            parts.append(text)
+            yield text
+        try:
+            response = response_schema.model_validate_json("".join(parts))
+        except Exception:
+            return
+        self.store.put(key, response.model_dump_json())
+
+    def generate_stream_structured(
+        self,
+        prompt: str,
+        response_schema: Type[BaseModel],
+        model: Optional[str] = None,
+        array_key: str = "qa_pairs",
+        **kwargs
+    ) -> Iterator[BaseModel]:
+        """キャッシュ済みなら保存済みの要素を返し、未キャッシュなら受信しながら返す"""
+        cached = self._lookup(self._stream_structured_key(prompt, response_schema, model, kwargs))
+        if cached is not None:
+            try:
+                yield from getattr(response_schema.model_validate_json(cached), array_key)
+                return
+            except Exception as e:
+                logger.warning(f"[LLMCache] キャッシュ済み応答の検証に失敗したため再生成します: {e}")
+        yield from LLMClient.generate_stream_structured(
+            self, prompt, response_schema, model=model, array_key=array_key, **kwargs
+        )
+
+    def count_tokens(self, text: str, model: Optional[str] = None) -> int:
+        return self.client.count_tokens(text, model=model)
+
+    def stats(self) -> Dict[str, float]:
+        """ヒット/ミス統計"""
+        with self._stats_lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+    def log_stats(self) -> None:
+        """統計をログ出力"""
+        s = self.stats()
+        logger.info(f"[LLMCache] hit={s['hits']}, miss={s['misses']}, hit_rate={s['hit_rate']:.1%}")
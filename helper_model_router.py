@@ -0,0 +1,263 @@
+"""
+チャンク複雑度によるQ/A生成モデルのルーティング
+
+短い・平易なチャンクまで同じモデルで生成するとレイテンシと費用が無駄になるため、
+analyze_chunk_complexity の指標（complexity_level / token_count）でチャンクを振り分ける。
+
+ルート:
+    - rule: LLMを呼ばないルールベース生成（rule_max_tokens 以下の low チャンク。既定は無効）
+    - fast: 最速モデル（low）
+    - standard: 既定モデル（medium）
+    - strong: 高性能モデル（high）
+
+各ルートは同時実行数の上限（セマフォ）を持ち、遅い高性能モデルが実行枠を占有しても
+速いルートのリクエストが詰まらないようにする。ルートごとのチャンク数・1チャンクあたりの
+レイテンシ・費用を集計してレポートする。
+
+使用例:
+    from helper_model_router import ModelRouter
+
+    router = ModelRouter(standard_model="gemini-2.0-flash", concurrency={"strong": 2})
+    routes = router.assign(chunks, lambda chunk: analyze_chunk_complexity(chunk['text'], "ja"))
+    for route_name, route_chunks in routes.items():
+        route = router.routes[route_name]
+        with router.run(route, len(route_chunks)) as result:
+            qa_pairs = generate(route_chunks, route.model)
+            result.qa_pairs = len(qa_pairs)
+    print(router.format_report())
+"""
+
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional
+import logging
+import os
+import threading
+import time
+
+from helper_usage import collect_usage, percentile, summarize_usage
+
+logger = logging.getLogger(__name__)
+
+
+# ルートごとのモデル（環境変数で上書き可能）
+DEFAULT_ROUTER_FAST_MODEL = os.getenv("QA_ROUTER_FAST_MODEL", "gemini-2.0-flash-lite")
+DEFAULT_ROUTER_STANDARD_MODEL = os.getenv("QA_ROUTER_STANDARD_MODEL", "gemini-2.0-flash")
+DEFAULT_ROUTER_STRONG_MODEL = os.getenv("QA_ROUTER_STRONG_MODEL", "gemini-2.5-flash")
+# このトークン数以下の low チャンクをルールベース生成に回す（0は無効）
+DEFAULT_ROUTER_RULE_MAX_TOKENS = int(os.getenv("QA_ROUTER_RULE_MAX_TOKENS", "0"))
+# ルートごとの同時実行数（"fast=8,standard=4,strong=2" 形式）
+DEFAULT_ROUTER_CONCURRENCY = os.getenv("QA_ROUTER_CONCURRENCY", "rule=8,fast=8,standard=4,strong=2")
+
+RULE_ROUTE = "rule"
+FAST_ROUTE = "fast"
+STANDARD_ROUTE = "standard"
+STRONG_ROUTE = "strong"
+
+# complexity_level → ルート
+_LEVEL_ROUTES = {"low": FAST_ROUTE, "medium": STANDARD_ROUTE, "high": STRONG_ROUTE}
+
+
+def parse_route_concurrency(spec: str) -> Dict[str, int]:
+    """
+    "fast=8,standard=4" 形式の文字列をルート名→同時実行数の辞書に変換
+
+    Raises:
+        ValueError: 書式が不正、または1未満の値
+    """
+    concurrency: Dict[str, int] = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, sep, value = item.partition("=")
+        if not sep or int(value) < 1:
+            raise ValueError(f"ルートの同時実行数の書式が不正です: {item!r}（例: fast=8）")
+        concurrency[name.strip()] = int(value)
+    return concurrency
+
+
+@dataclass
+class ModelRoute:
+    """1つのルート（モデルと同時実行数の上限）"""
+    name: str
+    model: Optional[str]             # Noneはルールベース生成（LLMを呼ばない）
+    max_concurrency: int = 4
+    _slots: threading.BoundedSemaphore = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        self._slots = threading.BoundedSemaphore(self.max_concurrency)
+
+    @property
+    def is_rule(self) -> bool:
+        return self.model is None
+
+
+@dataclass
+class RouteResult:
+    """ルートで実行した1リクエスト分の結果（呼び出し側が qa_pairs を設定する）"""
+    chunks: int
+    qa_pairs: int = 0
+
+
+@dataclass
+class _RouteStats:
+    """ルートごとの集計"""
+    chunks: int = 0
+    requests: int = 0
+    qa_pairs: int = 0
+    fallbacks: int = 0
+    chunk_latencies: List[float] = field(default_factory=list)
+    usage: List[Any] = field(default_factory=list)
+
+
+class ModelRouter:
+    """チャンク複雑度でQ/A生成のモデルを選ぶルーター"""
+
+    def __init__(
+        self,
+        fast_model: str = DEFAULT_ROUTER_FAST_MODEL,
+        standard_model: str = DEFAULT_ROUTER_STANDARD_MODEL,
+        strong_model: str = DEFAULT_ROUTER_STRONG_MODEL,
+        rule_max_tokens: int = DEFAULT_ROUTER_RULE_MAX_TOKENS,
+        concurrency: Optional[Dict[str, int]] = None,
+        clock: Callable[[], float] = time.perf_counter
+    ):
+        """
+        Args:
+            fast_model: low チャンクのモデル
+            standard_model: medium チャンクのモデル
+            strong_model: high チャンクのモデル
+            rule_max_tokens: このトークン数以下の low チャンクをルールベース生成に回す（0は無効）
+            concurrency: ルート名→同時実行数（省略したルートは QA_ROUTER_CONCURRENCY の値）
+            clock: レイテンシ計測用の時計（テスト用）
+        """
+        limits = parse_route_concurrency(DEFAULT_ROUTER_CONCURRENCY)
+        limits.update(concurrency or {})
+        models = {RULE_ROUTE: None, FAST_ROUTE: fast_model, STANDARD_ROUTE: standard_model, STRONG_ROUTE: strong_model}
+        self.routes: Dict[str, ModelRoute] = {
+            name: ModelRoute(name, model, limits.get(name, 4)) for name, model in models.items()
+        }
+        self.rule_max_tokens = rule_max_tokens
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._stats: Dict[str, _RouteStats] = {name: _RouteStats() for name in self.routes}
+
+    def select(self, complexity: Dict[str, Any]) -> ModelRoute:
+        """
+        複雑度指標からルートを選ぶ
+
+        Args:
+            complexity: analyze_chunk_complexity の戻り値（complexity_level, token_count）
+
+        Returns:
+            ModelRoute（未知のレベルは standard）
+        """
+        level = complexity.get("complexity_level")
+        if (level == "low" and self.rule_max_tokens > 0
+                and complexity.get("token_count", self.rule_max_tokens + 1) <= self.rule_max_tokens):
+            return self.routes[RULE_ROUTE]
+        return self.routes[_LEVEL_ROUTES.get(level, STANDARD_ROUTE)]
+
+    def assign(
+        self,
+        chunks: List[Dict],
+        complexity_fn: Callable[[Dict], Dict[str, Any]]
+    ) -> Dict[str, List[Dict]]:
+        """
+        チャンクをルートごとに分ける（各ルート内の順序は保持）
+
+        Args:
+            chunks: チャンクリスト
+            complexity_fn: チャンク→複雑度指標の関数
+
+        Returns:
+            {ルート名: チャンクリスト}（チャンクのないルートは含まない）
+        """
+        routed: Dict[str, List[Dict]] = {}
+        for chunk in chunks:
+            routed.setdefault(self.select(complexity_fn(chunk)).name, []).append(chunk)
+        with self._lock:
+            for name, route_chunks in routed.items():
+                self._stats[name].chunks += len(route_chunks)
+        logger.info("モデルルーティング: " + ", ".join(
+            f"{name}({self.routes[name].model or 'ルールベース'}) {len(route_chunks)}チャンク"
+            for name, route_chunks in routed.items()
+        ))
+        return routed
+
+    @contextmanager
+    def run(self, route: ModelRoute, chunks: int) -> Iterator[RouteResult]:
+        """
+        ルートの実行枠内で1リクエストを実行し、レイテンシ・使用量を記録する
+
+        Args:
+            route: 実行するルート
+            chunks: このリクエストで処理するチャンク数（1チャンクあたりのレイテンシ計算用）
+        """
+        result = RouteResult(chunks=chunks)
+        with route._slots:
+            start = self._clock()
+            with collect_usage() as records:
+                try:
+                    yield result
+                finally:
+                    elapsed = self._clock() - start
+                    with self._lock:
+                        stats = self._stats[route.name]
+                        stats.requests += 1
+                        stats.qa_pairs += result.qa_pairs
+                        stats.chunk_latencies.extend([elapsed / max(chunks, 1)] * max(chunks, 1))
+                        stats.usage.extend(records)
+
+    def record_fallback(self, route: ModelRoute, chunks: int = 1) -> None:
+        """ルールベース生成で足りずにLLMへ回したチャンク数を記録"""
+        with self._lock:
+            self._stats[route.name].fallbacks += chunks
+
+    def report(self) -> Dict[str, Dict[str, Any]]:
+        """
+        ルート別の集計
+
+        Returns:
+            {ルート名: {"model", "chunks", "requests", "qa_pairs", "fallbacks", "calls",
+                        "latency_per_chunk_avg", "latency_per_chunk_p95", "cost", "cost_per_chunk"}}
+            （実行のないルートは含まない。ルールベースからLLMへ回したリクエストは fast ルートに計上）
+        """
+        report: Dict[str, Dict[str, Any]] = {}
+        with self._lock:
+            for name, stats in self._stats.items():
+                if not stats.chunks and not stats.requests:
+                    continue
+                latencies = sorted(stats.chunk_latencies)
+                cost = sum(s["cost"] for s in summarize_usage(stats.usage).values())
+                report[name] = {
+                    "model": self.routes[name].model,
+                    "chunks": stats.chunks,
+                    "requests": stats.requests,
+                    "qa_pairs": stats.qa_pairs,
+                    "fallbacks": stats.fallbacks,
+                    "calls": len(stats.usage),
+                    "latency_per_chunk_avg": sum(latencies) / len(latencies) if latencies else 0.0,
+                    "latency_per_chunk_p95": percentile(latencies, 95),
+                    "cost": cost,
+                    "cost_per_chunk": cost / max(stats.chunks, 1),
+                }
+        return report
+
+    def format_report(self) -> str:
+        """report() を表示用の文字列にする"""
+        report = self.report()
+        if not report:
+            return "モデルルーティング: 記録なし"
+        total_chunks = max(sum(r["chunks"] for r in report.values()), 1)
+        lines = ["モデルルーティング（ルート別）:"]
+        for name, r in report.items():
+            fallback = f", LLMへフォールバック {r['fallbacks']}" if r["fallbacks"] else ""
+            lines.append(
+                f"  {name} [{r['model'] or 'ルールベース'}]: {r['chunks']}チャンク ({r['chunks'] / total_chunks:.0%}), "
+                f"{r['requests']}リクエスト, Q/A {r['qa_pairs']}個{fallback}, "
+                f"1チャンクあたり 平均 {r['latency_per_chunk_avg']:.2f}s / p95 {r['latency_per_chunk_p95']:.2f}s, "
+                f"${r['cost']:.4f} (${r['cost_per_chunk']:.6f}/チャンク)"
+            )
+        latency_total = sum(r["latency_per_chunk_avg"] * r["chunks"] for r in report.values())
+        lines.append(f"  全体: 1チャンクあたり平均 {latency_total / total_chunks:.2f}s, "
+                     f"${sum(r['cost'] for r in report.values()):.4f}")
+        return "\n".join(lines)
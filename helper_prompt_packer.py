@@ -0,0 +1,118 @@
+"""
+トークン予算によるプロンプトのパッキング
+
+複数チャンク（文書）を1回のLLMリクエストにまとめる際、固定の件数ではなく
+入力・出力トークンの予算まで詰めてリクエストを分割する。
+
+- 入力: プロンプト共通部分 + 各アイテムのトークン数（+ 見出し等のアイテムごとのオーバーヘッド）
+- 出力: 各アイテムの期待Q/A数 × 1ペアあたりのトークン数
+- 順序は保持する（結果の分配・出力順が固定件数の場合と同じになる）
+- 切り詰めは行わない。単独で予算を超えるアイテムは1件だけのリクエストにし、oversized として警告する
+
+使用例:
+    from helper_prompt_packer import TokenBudgetPacker
+
+    packer = TokenBudgetPacker(input_budget=6000, output_budget=4000, prompt_overhead_tokens=300)
+    for packed in packer.pack(input_tokens=[120, 800, 90], output_tokens=[240, 400, 160]):
+        batch = [chunks[i] for i in packed.indices]
+"""
+
+from dataclasses import dataclass, field
+from typing import List, Optional, Sequence
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+
+# 1リクエストあたりの入力・出力トークン予算（環境変数で上書き可能）
+DEFAULT_PROMPT_INPUT_TOKEN_BUDGET = int(os.getenv("LLM_PROMPT_INPUT_TOKEN_BUDGET", "6000"))
+DEFAULT_PROMPT_OUTPUT_TOKEN_BUDGET = int(os.getenv("LLM_PROMPT_OUTPUT_TOKEN_BUDGET", "4000"))
+# Q/A 1ペア（JSONの質問・回答・タイプ）あたりの出力トークン見積もり
+DEFAULT_TOKENS_PER_QA_PAIR = int(os.getenv("LLM_TOKENS_PER_QA_PAIR", "120"))
+
+
+@dataclass
+class PackedRequest:
+    """1回のLLMリクエストにまとめるアイテム"""
+    indices: List[int] = field(default_factory=list)
+    input_tokens: int = 0
+    output_tokens: int = 0
+    oversized: bool = False
+
+
+class TokenBudgetPacker:
+    """入力・出力トークン予算まで順にアイテムを詰めるパッカー"""
+
+    def __init__(
+        self,
+        input_budget: int = DEFAULT_PROMPT_INPUT_TOKEN_BUDGET,
+        output_budget: int = DEFAULT_PROMPT_OUTPUT_TOKEN_BUDGET,
+        prompt_overhead_tokens: int = 0,
+        item_overhead_tokens: int = 0,
+        max_items: Optional[int] = None
+    ):
+        """
+        Args:
+            input_budget: 1リクエストの入力トークン上限（プロンプト共通部分を含む）
+            output_budget: 1リクエストの出力トークン上限（max_output_tokens に使う値）
+            prompt_overhead_tokens: システムプロンプト・指示文など共通部分のトークン数
+            item_overhead_tokens: アイテムごとの見出し・区切りのトークン数
+            max_items: 1リクエストの最大アイテム数（Noneは無制限）
+        """
+        if input_budget <= 0 or output_budget <= 0:
+            raise ValueError("input_budget and output_budget must be positive")
+        self.input_budget = input_budget
+        self.output_budget = output_budget
+        self.prompt_overhead_tokens = prompt_overhead_tokens
+        self.item_overhead_tokens = item_overhead_tokens
+        self.max_items = max_items
+
+    def pack(self, input_tokens: Sequence[int], output_tokens: Sequence[int]) -> List[PackedRequest]:
+        """
+        アイテムを順序を保ったままリクエストに分割
+
+        Args:
+            input_tokens: 各アイテムの入力トークン数
+            output_tokens: 各アイテムの期待出力トークン数
+
+        Returns:
+            PackedRequest のリスト（indices を連結すると 0..n-1）
+        """
+        if len(input_tokens) != len(output_tokens):
+            raise ValueError("input_tokens and output_tokens must have the same length")
+
+        requests: List[PackedRequest] = []
+        current = PackedRequest(input_tokens=self.prompt_overhead_tokens)
+
+        for i, (item_in, item_out) in enumerate(zip(input_tokens, output_tokens)):
+            item_in += self.item_overhead_tokens
+            fits = (
+                current.input_tokens + item_in <= self.input_budget
+                and current.output_tokens + item_out <= self.output_budget
+                and (self.max_items is None or len(current.indices) < self.max_items)
+            )
+            if current.indices and not fits:
+                requests.append(current)
+                current = PackedRequest(input_tokens=self.prompt_overhead_tokens)
+
+            current.indices.append(i)
+            current.input_tokens += item_in
+            current.output_tokens += item_out
+
+            # 単独で予算を超えるアイテムは切り詰めずに1件で送る
+            if len(current.indices) == 1 and (
+                current.input_tokens > self.input_budget or current.output_tokens > self.output_budget
+            ):
+                current.oversized = True
+                logger.warning(
+                    f"[Packer] アイテム {i} が単独で予算を超えています "
+                    f"(入力 {current.input_tokens}/{self.input_budget}, 出力 {current.output_tokens}/{self.output_budget})。"
+                    f"切り詰めずに1件のリクエストとして送信します"
+                )
+                requests.append(current)
+                current = PackedRequest(input_tokens=self.prompt_overhead_tokens)
+
+        if current.indices:
+            requests.append(current)
+        return requests
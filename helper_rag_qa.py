@@ -8,7 +8,7 @@ SmartKeywordSelector
 QAOptimizedExtractor
 """
 
-from regex_mecab import KeywordExtractor
+from regex_mecab import KeywordExtractor, get_mecab_tagger, is_mecab_available
 from typing import List, Dict, Tuple, Optional, Any
 import re
 import math
@@ -17,8 +17,14 @@ import os
 from collections import defaultdict
 import numpy as np
 import tiktoken
-from helper_llm import create_llm_client
-from helper_embedding import create_embedding_client, get_embedding_dimensions
+from helper_llm import IncrementalJSONArrayParser, create_llm_client, create_token_counter, get_token_counter
+from helper_prompt_packer import TokenBudgetPacker, DEFAULT_PROMPT_OUTPUT_TOKEN_BUDGET, DEFAULT_TOKENS_PER_QA_PAIR
+from helper_usage import collect_usage
+from helper_embedding import (
+    DEFAULT_EMBEDDING_PROVIDER,
+    EmbeddingClient,
+    create_embedding_client,
+)
 from pydantic import BaseModel
 import spacy
 
@@ -36,6 +42,7 @@ load_dotenv()
 [セマンティックカバレッジ関連クラス]
 
 4. SemanticCoverage - 意味的な網羅性を測定するクラス（文書のセマンティックチャンク分割、埋め込みベクトル生成、コサイン類似度計算）
+   SemanticChunker - ネットワーク不要の段落優先セマンティックチャンク分割（SemanticCoverage が委譲、文書間で使い回し可能）
 5. QAGenerationConsiderations - Q/A生成前のチェックリストクラス（文書特性分析、Q/A要件定義、品質基準設定）
 
 [データモデル pydanticクラス]
@@ -57,6 +64,10 @@ load_dotenv()
 13. AdvancedQAGenerationTechniques - 高度なQ/A生成技術クラス（敵対的Q/A、マルチホップ推論Q/A、反事実的Q/A生成）
 14. QAGenerationOptimizer - Q/A生成の最適化クラス（カバレッジ最大化戦略、適応的生成、コスト最適化）
 
+[前処理クラス]
+
+15. ChunkInformationFilter - LLMに送る前の低情報チャンクのプレフィルタ（定型文除去、情報密度スコア、テンプレートQ/A）
+
 
 """
 class BestKeywordSelector:
@@ -480,9 +491,12 @@ def get_smart_keywords(text: str, mode: str = "auto", prefer_mecab: bool = True)
 class QACountOptimizer:
     """Q/Aペア数の最適化を行うクラス"""
 
-    def __init__(self, llm_model: str = "gemini-2.0-flash"):
+    def __init__(self, llm_model: str = "gemini-2.0-flash", token_count_mode: Optional[str] = None):
         self.llm_model_for_token_count = llm_model
-        self.unified_client = create_llm_client(provider="gemini", default_model=self.llm_model_for_token_count)
+        # トークンカウント（デフォルトはローカル計算、"api" 指定時のみGemini APIを呼ぶ）
+        self.token_counter = create_token_counter(
+            provider="gemini", mode=token_count_mode, default_model=self.llm_model_for_token_count
+        )
 
     def calculate_optimal_qa_count(self, document: str, mode: str = "auto") -> Dict[str, Any]:
         """
@@ -536,7 +550,7 @@ class QACountOptimizer:
         sentences = [s.strip() for s in sentences if s.strip()]
 
         # トークン数の計算
-        token_count = self.unified_client.count_tokens(document, model=self.llm_model_for_token_count)
+        token_count = self.token_counter.count_tokens(document, model=self.llm_model_for_token_count)
 
         # キーワード候補の抽出
         technical_terms = re.findall(r'[ァ-ヴー]{3,}|[A-Z]{2,}[A-Z0-9]*|[一-龥]{4,}', document)
@@ -690,6 +704,118 @@ class QACountOptimizer:
         }
 
 
+# LLMに送る前のプレフィルタ: この情報密度スコア未満のチャンクは生成をスキップする（環境変数で上書き可能）
+DEFAULT_CHUNK_INFO_THRESHOLD = float(os.getenv("QA_CHUNK_INFO_THRESHOLD", "0.3"))
+
+# ナビゲーション・著作権表示などの定型文（情報密度の計算前に取り除く）
+_BOILERPLATE_PATTERN = re.compile(
+    r'(?:copyright|\(c\)|©)[^\n。]*|all rights reserved\.?|続きを読む|関連記事|写真拡大|記事を(?:シェア|共有)|'
+    r'ログイン|会員登録|お問い合わせ|サイトマップ|プライバシーポリシー|利用規約|'
+    r'sign in|subscribe|privacy policy|terms of use|read more',
+    re.IGNORECASE
+)
+_SENTENCE_PATTERN = re.compile(r'[^。．.！？!?\n]+[。．.！？!?]')
+
+
+class ChunkInformationFilter:
+    """LLMに送る前にチャンクの情報密度をローカルで評価し、低情報チャンクを除外するプレフィルタ
+
+    merge_small_chunks の後にも残るナビゲーション・定型文・ほぼ空のチャンクに
+    API呼び出しを使わないようにする。スコア（0.0-1.0）は
+    文として書かれた部分の割合 × 重複していない行の割合 ×
+    （キーワードの多様性・QACountOptimizer のキーワード密度・複雑度の加重和）。
+    """
+
+    def __init__(
+        self,
+        threshold: float = DEFAULT_CHUNK_INFO_THRESHOLD,
+        min_chars: int = 20,
+        optimizer: Optional[QACountOptimizer] = None,
+        keyword_extractors: Optional[Dict[str, KeywordExtractor]] = None
+    ):
+        """
+        Args:
+            threshold: このスコア未満のチャンクを低情報とみなす
+            min_chars: 定型文を除いた文字数がこれ未満ならスコア0
+            optimizer: 文書メトリクスの計算に使う QACountOptimizer
+            keyword_extractors: 言語→KeywordExtractor（英語は正規表現で単語単位に抽出）
+        """
+        self.threshold = threshold
+        self.min_chars = min_chars
+        self.optimizer = optimizer or QACountOptimizer()
+        self.keyword_extractors = keyword_extractors or {
+            "ja": KeywordExtractor(prefer_mecab=True),
+            "en": KeywordExtractor(prefer_mecab=False),
+        }
+
+    def score(self, text: str, lang: str = "ja") -> Dict[str, Any]:
+        """
+        チャンクの情報密度スコアを計算
+
+        Returns:
+            {"score", "sentence_ratio", "unique_ratio", "keyword_score", "metrics"}
+        """
+        content = _BOILERPLATE_PATTERN.sub(" ", text)
+        compact = re.sub(r'\s+', '', content)
+        if len(compact) < self.min_chars:
+            return {"score": 0.0, "sentence_ratio": 0.0, "unique_ratio": 0.0, "keyword_score": 0.0, "metrics": None}
+
+        metrics = self.optimizer._analyze_document_metrics(content)
+        extractor = self.keyword_extractors.get(lang) or self.keyword_extractors["ja"]
+        keywords = extractor.extract(content, top_n=50, use_scoring=False)
+        # 日本語は15文字、英語は40文字あたり1語で満点
+        keyword_score = min(1.0, len(keywords) / max(1.0, len(compact) / (40 if lang == "en" else 15)))
+
+        sentence_chars = sum(len(re.sub(r'\s+', '', s)) for s in _SENTENCE_PATTERN.findall(content))
+        sentence_ratio = min(1.0, sentence_chars / len(compact))
+        lines = [line.strip() for line in re.split(r'[。．！？!?\n]+', content) if line.strip()]
+        unique_ratio = len(set(lines)) / max(1, len(lines))
+
+        information = (0.6 * keyword_score
+                       + 0.2 * min(1.0, metrics['keyword_density'] / 3)
+                       + 0.2 * metrics['complexity_score'])
+        return {
+            "score": sentence_ratio * unique_ratio * information,
+            "sentence_ratio": sentence_ratio,
+            "unique_ratio": unique_ratio,
+            "keyword_score": keyword_score,
+            "metrics": metrics,
+        }
+
+    def split(self, chunks: List[Dict], lang: str = "ja") -> Tuple[List[Dict], List[Dict]]:
+        """
+        チャンクをLLMに送るものと低情報のものに分ける（それぞれ元の順序を保持）
+
+        Returns:
+            (送るチャンク, 低情報チャンク)。低情報チャンクには "info_score" を付与
+        """
+        kept, skipped = [], []
+        for chunk in chunks:
+            score = self.score(chunk['text'], lang)["score"]
+            if score < self.threshold:
+                skipped.append({**chunk, "info_score": score})
+            else:
+                kept.append(chunk)
+        return kept, skipped
+
+    def template_qa(self, text: str, lang: str = "ja") -> List[Dict]:
+        """
+        低情報チャンク用の1ペアのテンプレートQ/A（最上位キーワードとそれを含む文）
+
+        Returns:
+            [{"question", "answer", "type"}]（キーワードを含む文がなければ空）
+        """
+        content = _BOILERPLATE_PATTERN.sub(" ", text)
+        extractor = self.keyword_extractors.get(lang) or self.keyword_extractors["ja"]
+        for keyword in extractor.extract(content, top_n=3):
+            sentence = next((s.strip() for s in _SENTENCE_PATTERN.findall(content) if keyword in s), None)
+            if sentence:
+                question = (f"What does the text say about {keyword}?" if lang == "en"
+                            else f"{keyword}について何と述べられていますか？")
+                return [{"question": question, "answer": sentence, "type": "fact"}]
+        return []
+
+
 class QAOptimizedExtractor(SmartKeywordSelector):
     """Q&Aペア生成に最適化されたキーワード抽出クラス"""
 
@@ -1483,35 +1609,38 @@ class QAOptimizedExtractor(SmartKeywordSelector):
 # Classes moved from a03_rag_qa_coverage.py
 # -----------------------------
 
-class SemanticCoverage:
-    """意味的な網羅性を測定するクラス（Gemini API使用）"""
+class SemanticChunker:
+    """
+    段落優先のセマンティックチャンク分割（ネットワーク・APIキー不要）
 
-    def __init__(self, embedding_model="gemini-embedding-001"):
-        self.embedding_model = embedding_model
-        # Gemini埋め込みクライアントを使用
-        self.embedding_client = create_embedding_client(provider="gemini")
-        self.embedding_dims = get_embedding_dimensions("gemini")  # 3072
-        # トークンカウント用のLLMクライアント (decode機能がないためtiktokenを併用)
-        self.unified_client = create_llm_client(provider="gemini") 
-        self.tokenizer = tiktoken.get_encoding("cl100k_base") # 強制分割・デコード用にtiktokenを使用
-        
-        # APIキーの有無フラグ（クライアント作成成功ならTrue）
-        self.has_api_key = True
+    トークンカウンター・トークナイザー・文分割だけを持ち、文書ごとの状態を持たないため、
+    1つのインスタンスを複数文書・スレッドで使い回せる（ワーカープロセスではプロセスごとに1つ）。
+    SemanticCoverage.create_semantic_chunks はこのクラスに委譲する。
+    """
 
+    def __init__(self, token_count_model: str = "gemini-embedding-001", token_count_mode: Optional[str] = None):
+        """
+        Args:
+            token_count_model: トークン数を数える際のモデル名
+            token_count_mode: "local"/"estimate"（Noneは LLM_TOKEN_COUNT_MODE）。"api" はGemini APIで数える
+        """
+        self.token_count_model = token_count_model
+        # トークンカウント（段落・文ごとに呼ぶため、デフォルトはネットワーク不要のローカル計算）
+        self.token_counter = create_token_counter(provider="gemini", mode=token_count_mode)
+        self._tokenizer = None
         # MeCab利用可否チェック
         self.mecab_available = self._check_mecab_availability()
 
+    @property
+    def tokenizer(self):
+        """強制分割・デコード用の tiktoken（長すぎる文の強制分割時に初めて読み込む）"""
+        if self._tokenizer is None:
+            self._tokenizer = tiktoken.get_encoding("cl100k_base")
+        return self._tokenizer
 
     def _check_mecab_availability(self) -> bool:
         """MeCabの利用可能性をチェック"""
-        try:
-            import MeCab
-            # 実際にインスタンス化して動作確認
-            tagger = MeCab.Tagger()
-            tagger.parse("テスト")
-            return True
-        except (ImportError, RuntimeError):
-            return False
+        return is_mecab_available()
 
     def create_semantic_chunks(self, document: str, max_tokens: int = 200, min_tokens: int = 50,
                                prefer_paragraphs: bool = True, verbose: bool = True) -> List[Dict]:
@@ -1572,12 +1701,12 @@ class SemanticCoverage:
             current_tokens = 0
 
             for i, sentence in enumerate(sentences):
-                sentence_tokens = self.unified_client.count_tokens(sentence, model=self.embedding_model)
+                sentence_tokens = self.token_counter.count_tokens(sentence, model=self.token_count_model)
 
                 # 現在のチャンクにこの文を追加すべきか判断
                 if current_tokens + sentence_tokens > max_tokens and current_chunk:
                     # Use unified client for token counting when forming chunks
-                    chunk_text_tokens = self.unified_client.count_tokens(" ".join(current_chunk), model=self.embedding_model)
+                    chunk_text_tokens = self.token_counter.count_tokens(" ".join(current_chunk), model=self.token_count_model)
                     # チャンクを保存
                     chunk_text = " ".join(current_chunk)
                     chunks.append({
@@ -1644,7 +1773,7 @@ class SemanticCoverage:
         chunks = []
 
         for para in paragraphs:
-            para_tokens = self.unified_client.count_tokens(para, model=self.embedding_model)
+            para_tokens = self.token_counter.count_tokens(para, model=self.token_count_model)
 
             if para_tokens <= max_tokens:
                 # 段落がそのままチャンクとして適切
@@ -1656,7 +1785,7 @@ class SemanticCoverage:
                 current_tokens = 0
 
                 for sent in sentences:
-                    sent_tokens = self.unified_client.count_tokens(sent, model=self.embedding_model)
+                    sent_tokens = self.token_counter.count_tokens(sent, model=self.token_count_model)
 
                     if sent_tokens > max_tokens:
                         # 単一文が上限超過 → 強制分割
@@ -1737,11 +1866,8 @@ class SemanticCoverage:
         return sentences
 
     def _split_sentences_mecab(self, text: str) -> List[str]:
-        """MeCabを使った文分割（日本語用）"""
-        import MeCab
-
-        tagger = MeCab.Tagger()
-        node = tagger.parseToNode(text)
+        """MeCabを使った文分割（日本語用。Tagger はスレッドごとに共有）"""
+        node = get_mecab_tagger().parseToNode(text)
 
         sentences = []
         current_sentence = []
@@ -1786,14 +1912,14 @@ class SemanticCoverage:
         adjusted_chunks = []
 
         for i, chunk in enumerate(chunks):
-            chunk_tokens = self.unified_client.count_tokens(chunk["text"], model=self.embedding_model)
+            chunk_tokens = self.token_counter.count_tokens(chunk["text"], model=self.token_count_model)
 
             # 最小トークン数以下の短いチャンクの場合
             if i > 0 and chunk_tokens < min_tokens:
                 # 前のチャンクとマージを検討
                 prev_chunk = adjusted_chunks[-1]
                 combined_text = prev_chunk["text"] + " " + chunk["text"]
-                combined_tokens = self.unified_client.count_tokens(combined_text, model=self.embedding_model)
+                combined_tokens = self.token_counter.count_tokens(combined_text, model=self.token_count_model)
 
                 # マージしても最大トークン数（300）を超えない場合はマージ
                 if combined_tokens < 300:
@@ -1812,6 +1938,36 @@ class SemanticCoverage:
 
         return adjusted_chunks
 
+
+class SemanticCoverage:
+    """意味的な網羅性を測定するクラス（Gemini API使用）"""
+
+    def __init__(self, embedding_model="gemini-embedding-001", embedding_client: Optional[EmbeddingClient] = None,
+                 token_count_mode: Optional[str] = None):
+        self.embedding_model = embedding_model
+        # Gemini埋め込みクライアントを使用（キャッシュ付きクライアント等を注入可能、
+        # 環境変数 EMBEDDING_PROVIDER=local でオフライン実行）
+        self.embedding_client = embedding_client or create_embedding_client(provider=DEFAULT_EMBEDDING_PROVIDER)
+        self.embedding_dims = self.embedding_client.dimensions  # 3072
+        # チャンク分割（トークンカウントは段落・文ごとに呼ぶため、デフォルトはネットワーク不要のローカル計算。
+        # token_count_mode="api" または環境変数 LLM_TOKEN_COUNT_MODE=api でGemini APIの正確な値）
+        self.chunker = SemanticChunker(token_count_model=embedding_model, token_count_mode=token_count_mode)
+        self.token_counter = self.chunker.token_counter
+        self.mecab_available = self.chunker.mecab_available
+
+        # APIキーの有無フラグ（クライアント作成成功ならTrue）
+        self.has_api_key = True
+
+    @property
+    def tokenizer(self):
+        """強制分割・デコード用の tiktoken"""
+        return self.chunker.tokenizer
+
+    def create_semantic_chunks(self, document: str, max_tokens: int = 200, min_tokens: int = 50,
+                               prefer_paragraphs: bool = True, verbose: bool = True) -> List[Dict]:
+        """文書を段落優先でセマンティックチャンクに分割（SemanticChunker.create_semantic_chunks に委譲）"""
+        return self.chunker.create_semantic_chunks(document, max_tokens, min_tokens, prefer_paragraphs, verbose)
+
     def generate_embeddings(self, doc_chunks: List[Dict]) -> np.ndarray:
         """
         チャンクのリストから埋め込みベクトルを生成（Gemini API使用）
@@ -1825,30 +1981,19 @@ class SemanticCoverage:
         if not self.has_api_key:
             print("⚠️  Gemini APIキーが設定されていません。埋め込み生成をスキップします。")
             # ダミーのゼロベクトルを返す
-            return np.zeros((len(doc_chunks), self.embedding_dims))
+            return np.zeros((len(doc_chunks), self.embedding_dims), dtype=np.float32)
 
         texts = [chunk["text"] for chunk in doc_chunks]
 
         try:
-            # Gemini Embedding APIを呼び出し
-            embedding_vectors = self.embedding_client.embed_texts(texts, batch_size=100)
-
-            # 埋め込みベクトルを正規化
-            embeddings = []
-            for embedding in embedding_vectors:
-                embedding = np.array(embedding)
-                # L2正規化（コサイン類似度の計算を高速化）
-                norm = np.linalg.norm(embedding)
-                if norm > 0:
-                    embedding = embedding / norm
-                embeddings.append(embedding)
-
-            return np.array(embeddings)
+            # Gemini Embedding APIを呼び出し（batchEmbedContents: 100件/リクエスト）
+            # L2正規化済みの float32 行列で受け取る（コサイン類似度 = 内積）
+            return self.embedding_client.embed_texts_array(texts, batch_size=100)
 
         except Exception as e:
             print(f"埋め込み生成エラー: {e}")
             # エラー時はゼロベクトルを返す
-            return np.zeros((len(doc_chunks), self.embedding_dims))
+            return np.zeros((len(doc_chunks), self.embedding_dims), dtype=np.float32)
 
     def generate_embedding(self, text: str) -> np.ndarray:
         """単一テキストの埋め込み生成（Gemini API使用）"""
@@ -1874,35 +2019,23 @@ class SemanticCoverage:
 
         Args:
             texts: テキストのリスト
-            batch_size: 1リクエストあたりのテキスト数（デフォルト: 100）
+            batch_size: 1リクエストあたりのテキスト数（デフォルト: 100、Geminiの上限は100）
 
         Returns:
-            埋め込みベクトルの配列 (len(texts), 3072)
+            L2正規化済み埋め込みの float32 配列 (len(texts), 3072)
         """
         if not self.has_api_key:
             print("⚠️  Gemini APIキーが設定されていません。埋め込み生成をスキップします。")
-            return np.zeros((len(texts), self.embedding_dims))
+            return np.zeros((len(texts), self.embedding_dims), dtype=np.float32)
 
         try:
-            # Gemini Embedding APIを使用
-            embedding_vectors = self.embedding_client.embed_texts(texts, batch_size=batch_size)
-
-            # 埋め込みベクトルを正規化
-            embeddings = []
-            for embedding in embedding_vectors:
-                embedding = np.array(embedding)
-                # L2正規化
-                norm = np.linalg.norm(embedding)
-                if norm > 0:
-                    embedding = embedding / norm
-                embeddings.append(embedding)
-
-            return np.array(embeddings)
+            # Gemini Embedding APIを使用（batch_size件ずつ1リクエストにまとめる）
+            return self.embedding_client.embed_texts_array(texts, batch_size=batch_size)
 
         except Exception as e:
             print(f"バッチ埋め込み生成エラー: {e}")
             # エラー時はゼロベクトルを返す
-            return np.zeros((len(texts), self.embedding_dims))
+            return np.zeros((len(texts), self.embedding_dims), dtype=np.float32)
 
     def cosine_similarity(self, doc_emb: np.ndarray, qa_emb: np.ndarray) -> float:
         """
@@ -1928,6 +2061,24 @@ class SemanticCoverage:
 
         return float(dot_product / (float(norm_doc) * float(norm_qa)))
 
+    @staticmethod
+    def similarity_matrix(doc_embs: np.ndarray, qa_embs: np.ndarray) -> np.ndarray:
+        """
+        コサイン類似度行列を一括計算（行列積1回）
+
+        Args:
+            doc_embs: L2正規化済みのチャンク埋め込み (n_docs, dims)
+            qa_embs: L2正規化済みのQ/A埋め込み (n_qa, dims)
+
+        Returns:
+            (n_docs, n_qa) の類似度行列
+        """
+        doc_embs = np.asarray(doc_embs, dtype=np.float32)
+        qa_embs = np.asarray(qa_embs, dtype=np.float32)
+        if doc_embs.size == 0 or qa_embs.size == 0:
+            return np.zeros((len(doc_embs), len(qa_embs)), dtype=np.float32)
+        return doc_embs @ qa_embs.T
+
 
 class QAGenerationConsiderations:
     """Q/A生成前のチェックリスト"""
@@ -2152,7 +2303,14 @@ class RuleBasedQAGenerator:
     """ルールベースのQ/A生成"""
 
     def __init__(self):
-        self.nlp = spacy.load("ja_core_news_lg")
+        self._nlp = None
+
+    @property
+    def nlp(self):
+        """spaCyモデル（extract_fact_qa で初めて使う時にロード。正規表現のみの抽出では不要）"""
+        if self._nlp is None:
+            self._nlp = spacy.load("ja_core_news_lg")
+        return self._nlp
 
     def extract_definition_qa(self, text: str) -> List[Dict]:
         """定義文からQ/A生成"""
@@ -2542,6 +2700,7 @@ class OptimizedHybridQAGenerator:
         self.embedding_model = embedding_model
         self.qa_extractor = QAOptimizedExtractor()
         self.tokenizer = tiktoken.get_encoding("cl100k_base")
+        self.chunker = SemanticChunker(token_count_model=embedding_model)
 
         # サポートモデルリスト（Gemini）
         self.supported_models = [
@@ -2594,7 +2753,7 @@ class OptimizedHybridQAGenerator:
             results["api_usage"]["calls"] += 1
             results["api_usage"]["tokens"] = enhanced_qa.get("tokens_used", 0)
             results["api_usage"]["cost"] = self._calculate_cost(
-                enhanced_qa.get("tokens_used", 0)
+                enhanced_qa.get("tokens_used", 0), enhanced_qa.get("output_tokens")
             )
         else:
             # テンプレートからQ/Aペアを生成
@@ -2643,23 +2802,21 @@ Instructions:
 4. Generate {len(rule_result.get('suggested_qa_pairs', [])[:5])} Q&A pairs
 """
 
-        try:
-            # Gemini構造化出力APIを使用
-            response = self.client.generate_structured(
-                prompt=prompt,
-                response_schema=EnhancedQAPairsList,
-                model=self.model
-            )
-
-            qa_pairs = [qa.model_dump() for qa in response.qa_pairs]
+        with collect_usage() as usage_records:
+            try:
+                # Gemini構造化出力APIを使用
+                response = self.client.generate_structured(
+                    prompt=prompt,
+                    response_schema=EnhancedQAPairsList,
+                    model=self.model
+                )
+                qa_pairs = [qa.model_dump() for qa in response.qa_pairs]
+            except Exception as e:
+                print(f"LLM enhancement failed: {e}")
+                qa_pairs = self._template_to_qa(rule_result)
 
-            return {
-                "qa_pairs": qa_pairs,
-                "tokens_used": 0  # Gemini APIはトークン数を直接返さない
-            }
-        except Exception as e:
-            print(f"LLM enhancement failed: {e}")
-            return {"qa_pairs": self._template_to_qa(rule_result), "tokens_used": 0}
+        # 失敗した呼び出しも課金対象になり得るため記録された使用量をそのまま使う
+        return {"qa_pairs": qa_pairs, **self._split_usage(usage_records, 1)[0]}
 
     def _template_to_qa(self, rule_result: Dict) -> List[Dict]:
         """テンプレートからQ/Aペアを生成"""
@@ -2703,14 +2860,8 @@ Instructions:
             qa_texts = [f"{qa['question']} {qa['answer']}" for qa in qa_pairs]
             qa_embeddings = self._get_embeddings(qa_texts)
 
-            # カバレージ計算
-            coverage_scores = []
-            for chunk_emb in chunk_embeddings:
-                max_similarity = 0
-                for qa_emb in qa_embeddings:
-                    similarity = self._cosine_similarity(chunk_emb, qa_emb)
-                    max_similarity = max(max_similarity, similarity)
-                coverage_scores.append(max_similarity)
+            # カバレージ計算（チャンクごとの最大類似度）
+            coverage_scores = self._max_similarities(chunk_embeddings, qa_embeddings).tolist()
 
             # 多段階閾値評価（TODO-B3）
             thresholds = {
@@ -2812,15 +2963,12 @@ Instructions:
         """
         テキストをセマンティックチャンクに分割（段落優先・MeCab対応）
 
-        SemanticCoverage.create_semantic_chunks()を使用して、
+        SemanticChunker.create_semantic_chunks()を使用して、
         段落境界を最優先したセマンティック分割を実行。
         日本語の場合はMeCabによる高精度な文境界検出を自動適用。
         """
-        # SemanticCoverageインスタンスを使用
-        semantic_analyzer = SemanticCoverage(embedding_model=self.embedding_model)
-
-        # 段落優先のセマンティック分割を実行
-        semantic_chunks = semantic_analyzer.create_semantic_chunks(
+        # 段落優先のセマンティック分割を実行（チャンカーはインスタンス内で使い回す）
+        semantic_chunks = self.chunker.create_semantic_chunks(
             document=text,
             max_tokens=chunk_size,
             min_tokens=50,  # 最小トークン数
@@ -2828,7 +2976,7 @@ Instructions:
             verbose=False
         )
 
-        # SemanticCoverageの出力形式をBatchHybridQAGeneratorの形式に変換
+        # SemanticChunkerの出力形式をBatchHybridQAGeneratorの形式に変換
         chunks = []
         for semantic_chunk in semantic_chunks:
             chunk_text = semantic_chunk['text']
@@ -2843,14 +2991,21 @@ Instructions:
 
         return chunks
 
-    def _get_embeddings(self, texts: List[str]) -> List[List[float]]:
-        """テキストの埋め込みを取得（Gemini API使用）"""
+    def _get_embeddings(self, texts: List[str]) -> np.ndarray:
+        """テキストの埋め込みを取得（Gemini API使用、L2正規化済み float32 行列）"""
         try:
-            embeddings = self.embedding_client.embed_texts(texts)
-            return embeddings
+            return self.embedding_client.embed_texts_array(texts)
         except Exception as e:
             print(f"Embedding generation failed: {e}")
-            return []
+            return np.zeros((0, self.embedding_client.dimensions), dtype=np.float32)
+
+    @staticmethod
+    def _max_similarities(chunk_embeddings: np.ndarray, qa_embeddings: np.ndarray) -> np.ndarray:
+        """チャンクごとのQ/Aとの最大コサイン類似度（負値は0扱い）"""
+        if len(chunk_embeddings) == 0 or len(qa_embeddings) == 0:
+            return np.zeros(len(chunk_embeddings), dtype=np.float32)
+        similarities = SemanticCoverage.similarity_matrix(chunk_embeddings, qa_embeddings)
+        return np.maximum(similarities.max(axis=1), 0.0)
 
     def _cosine_similarity(self, vec1: List[float], vec2: List[float]) -> float:
         """コサイン類似度を計算"""
@@ -2869,8 +3024,38 @@ Instructions:
 
         return dot_product / (norm1 * norm2)
 
-    def _calculate_cost(self, tokens: int) -> float:
-        """API使用コストを計算（Gemini料金）"""
+    @staticmethod
+    def _split_usage(usage_records: List[Any], n: int) -> List[Dict[str, int]]:
+        """
+        1リクエストの使用量（helper_usage.UsageRecord）を n 文書に按分
+
+        合計が実際の値と一致するよう、トークンの端数と呼び出し回数は先頭の文書に寄せる。
+
+        Returns:
+            文書ごとの {"tokens_used", "output_tokens", "llm_calls"}
+        """
+        input_tokens = sum(r.input_tokens for r in usage_records)
+        output_tokens = sum(r.output_tokens for r in usage_records)
+        shares = []
+        for i in range(n):
+            first = i == 0
+            doc_in = input_tokens // n + (input_tokens % n if first else 0)
+            doc_out = output_tokens // n + (output_tokens % n if first else 0)
+            shares.append({
+                "tokens_used": doc_in + doc_out,
+                "output_tokens": doc_out,
+                "llm_calls": len(usage_records) if first else 0
+            })
+        return shares
+
+    def _calculate_cost(self, tokens: int, output_tokens: Optional[int] = None) -> float:
+        """
+        API使用コストを計算（Gemini料金）
+
+        Args:
+            tokens: 入力+出力の合計トークン数
+            output_tokens: 出力トークン数（Noneの場合は入力:出力 = 7:3 と仮定）
+        """
         # Geminiモデル別の料金（1Mトークンあたり、USD）
         # https://ai.google.dev/pricing
         pricing = {
@@ -2882,9 +3067,12 @@ Instructions:
         }
 
         model_pricing = pricing.get(self.model, pricing["gemini-2.0-flash"])
-        # 簡易計算（入力:出力 = 7:3の仮定）
-        input_tokens = int(tokens * 0.7)
-        output_tokens = int(tokens * 0.3)
+        if output_tokens is None:
+            # 簡易計算（入力:出力 = 7:3の仮定）
+            input_tokens = int(tokens * 0.7)
+            output_tokens = int(tokens * 0.3)
+        else:
+            input_tokens = tokens - output_tokens
 
         cost = (input_tokens * model_pricing["input"] +
                 output_tokens * model_pricing["output"]) / 1_000_000
@@ -2905,7 +3093,9 @@ class BatchHybridQAGenerator(OptimizedHybridQAGenerator):
                  batch_size: int = 10,
                  embedding_batch_size: int = 100,
                  quality_mode: bool = False,
-                 target_coverage: float = 0.95):
+                 target_coverage: float = 0.95,
+                 input_token_budget: Optional[int] = None,
+                 output_token_budget: Optional[int] = None):
         """
         Args:
             model: 使用するLLMモデル（デフォルト: gemini-2.0-flash）
@@ -2914,12 +3104,17 @@ class BatchHybridQAGenerator(OptimizedHybridQAGenerator):
             embedding_batch_size: 埋め込み処理のバッチサイズ
             quality_mode: 品質重視モード（True: カバレージ優先、False: 効率優先）
             target_coverage: 目標カバレージ率（デフォルト95%）
+            input_token_budget: 1リクエストの入力トークン予算（指定時は batch_size の代わりに
+                予算まで文書を詰め、文書を短縮しない）
+            output_token_budget: 1リクエストの出力トークン予算（max_output_tokens にも使う）
         """
         super().__init__(model, embedding_model)
         self.batch_size = batch_size if not quality_mode else min(5, batch_size)  # 品質モードでは最大5
         self.embedding_batch_size = embedding_batch_size
         self.quality_mode = quality_mode
         self.target_coverage = target_coverage
+        self.input_token_budget = input_token_budget
+        self.output_token_budget = output_token_budget or DEFAULT_PROMPT_OUTPUT_TOKEN_BUDGET
 
         # バッチ処理統計
         self.batch_stats = {
@@ -3144,12 +3339,8 @@ class BatchHybridQAGenerator(OptimizedHybridQAGenerator):
         uncovered = []
         threshold = 0.65 if self.quality_mode else 0.7
 
-        for i, chunk in enumerate(chunks):
-            max_similarity = 0
-            for qa_emb in qa_embeddings:
-                similarity = self._cosine_similarity(chunk_embeddings[i], qa_emb)
-                max_similarity = max(max_similarity, similarity)
-
+        max_similarities = self._max_similarities(chunk_embeddings, qa_embeddings)
+        for chunk, max_similarity in zip(chunks, max_similarities):
             if max_similarity < threshold:
                 uncovered.append(chunk["text"])
 
@@ -3263,10 +3454,14 @@ class BatchHybridQAGenerator(OptimizedHybridQAGenerator):
                     "hybrid_mode": use_llm
                 },
                 "coverage": coverage_results[i] if calculate_coverage else {},
+                # バッチの使用量は文書数で按分済み（呼び出し回数はバッチ先頭の文書に計上）
                 "api_usage": {
-                    "calls": 0,  # バッチ処理後に更新
+                    "calls": enhanced_qa_results[i].get("llm_calls", 0),
                     "tokens": enhanced_qa_results[i].get("tokens_used", 0),
-                    "cost": self._calculate_cost(enhanced_qa_results[i].get("tokens_used", 0))
+                    "cost": self._calculate_cost(
+                        enhanced_qa_results[i].get("tokens_used", 0),
+                        enhanced_qa_results[i].get("output_tokens", 0)
+                    )
                 }
             }
             all_results.append(result)
@@ -3289,55 +3484,113 @@ class BatchHybridQAGenerator(OptimizedHybridQAGenerator):
         from tqdm import tqdm
 
         enhanced_results = []
-        total_batches = (len(texts) + self.batch_size - 1) // self.batch_size
+        packed = self.input_token_budget is not None
+        batches = self._plan_llm_batches(texts, rule_results, doc_type, lang)
+        total_batches = len(batches)
+        # トークン予算でパッキングした場合は出力上限も予算に合わせる
+        output_options = {"max_output_tokens": self.output_token_budget} if packed else {}
 
         progress_bar = tqdm(total=len(texts), desc="LLM処理", disable=not show_progress)
 
-        for batch_idx in range(0, len(texts), self.batch_size):
-            batch_end = min(batch_idx + self.batch_size, len(texts))
-            batch_texts = texts[batch_idx:batch_end]
-            batch_rules = rule_results[batch_idx:batch_end]
+        for batch_num, indices in enumerate(batches, 1):
+            batch_texts = [texts[i] for i in indices]
+            batch_rules = [rule_results[i] for i in indices]
 
             # バッチプロンプト作成（言語情報を渡す）
-            batch_prompt = self._create_batch_prompt(batch_texts, batch_rules, doc_type, lang)
-
-            try:
-                # Gemini API で generate_content を使用（JSON出力）
-                system_instruction = "You are a Q&A generation expert. Process multiple documents. Always respond with valid JSON."
-
-                response_text = self.client.generate_content(
-                    prompt=batch_prompt,
-                    model=self.model,
-                    system_instruction=system_instruction,
-                    temperature=0.7
-                )
-
-                self.batch_stats["llm_batches"] += 1
-                self.batch_stats["total_llm_calls"] += 1
+            batch_prompt = self._create_batch_prompt(batch_texts, batch_rules, doc_type, lang, truncate=not packed)
+
+            batch_results = []
+            with collect_usage() as usage_records:
+                try:
+                    # Gemini API でストリーミング生成（JSON出力）
+                    system_instruction = "You are a Q&A generation expert. Process multiple documents. Always respond with valid JSON."
+
+                    # results 配列の各文書の結果を、応答の受信中に完成した順に取り出す
+                    parser = IncrementalJSONArrayParser("results")
+                    for response_text in self.client.generate_content_stream(
+                        prompt=batch_prompt,
+                        model=self.model,
+                        system_instruction=system_instruction,
+                        temperature=0.7,
+                        **output_options
+                    ):
+                        for doc_result in parser.feed(response_text):
+                            batch_results.append({"qa_pairs": doc_result.get("qa_pairs", [])})
+
+                    self.batch_stats["llm_batches"] += 1
+                    self.batch_stats["total_llm_calls"] += 1
+                    if not parser.complete:
+                        print(f"バッチ {batch_num}/{total_batches}: 応答が途中で終了（完成した{len(batch_results)}件を使用）")
+
+                except Exception as e:
+                    # 途中で失敗しても完成済みの文書の結果は使う
+                    print(f"バッチ {batch_num}/{total_batches} でエラー（完成した{len(batch_results)}件を使用）: {e}")
+
+            # 結果が足りない文書はテンプレートにフォールバック
+            batch_results = batch_results[:len(batch_texts)]
+            while len(batch_results) < len(batch_texts):
+                batch_results.append({"qa_pairs": self._template_to_qa(batch_rules[len(batch_results)])})
+
+            # プロバイダーが報告したバッチの使用量を文書に按分
+            for doc_result, usage in zip(batch_results, self._split_usage(usage_records, len(batch_texts))):
+                doc_result.update(usage)
+            enhanced_results.extend(batch_results)
 
-                # バッチ応答のパース（Gemini形式）
-                batch_results = self._parse_batch_response_gemini(response_text, len(batch_texts))
+            progress_bar.update(len(batch_texts))
 
-                # 結果が足りない場合は個別処理にフォールバック
-                while len(batch_results) < len(batch_texts):
-                    batch_results.append({
-                        "qa_pairs": self._template_to_qa(batch_rules[len(batch_results)]),
-                        "tokens_used": 0
-                    })
+        progress_bar.close()
+        return enhanced_results
 
-                enhanced_results.extend(batch_results)
+    def _plan_llm_batches(
+        self,
+        texts: List[str],
+        rule_results: List[Dict],
+        doc_type: str,
+        lang: str
+    ) -> List[List[int]]:
+        """
+        LLMリクエストごとの文書インデックスを決定
 
-            except Exception as e:
-                print(f"バッチ {batch_idx//self.batch_size + 1}/{total_batches} でエラー: {e}")
-                # エラー時は個別処理にフォールバック
-                for i in range(len(batch_texts)):
-                    qa_pairs = self._template_to_qa(batch_rules[i])
-                    enhanced_results.append({"qa_pairs": qa_pairs, "tokens_used": 0})
+        input_token_budget 未指定時は batch_size 件ずつ。指定時はプロンプト内の文書JSONの
+        トークン数と期待出力（1文書あたり最大6ペア）で予算まで詰める。
+        """
+        if self.input_token_budget is None:
+            return [list(range(i, min(i + self.batch_size, len(texts))))
+                    for i in range(0, len(texts), self.batch_size)]
 
-            progress_bar.update(len(batch_texts))
+        counter = get_token_counter(provider="gemini")
+        packer = TokenBudgetPacker(
+            input_budget=self.input_token_budget,
+            output_budget=self.output_token_budget,
+            prompt_overhead_tokens=counter.count_tokens(self._create_batch_prompt([], [], doc_type, lang)),
+            max_items=None
+        )
+        document_tokens = [
+            counter.count_tokens(json.dumps(self._batch_document_info(i, text, rule_result, lang, truncate=False),
+                                            ensure_ascii=False, indent=2))
+            for i, (text, rule_result) in enumerate(zip(texts, rule_results))
+        ]
+        packed = packer.pack(document_tokens, [6 * DEFAULT_TOKENS_PER_QA_PAIR] * len(texts))
+        oversized = sum(1 for request in packed if request.oversized)
+        if oversized:
+            print(f"警告: {oversized}件の文書が単独で入力トークン予算を超えています（短縮せずに送信します）")
+        return [request.indices for request in packed]
 
-        progress_bar.close()
-        return enhanced_results
+    def _batch_document_info(
+        self,
+        document_id: int,
+        text: str,
+        rule_result: Dict,
+        lang: str,
+        truncate: bool = True
+    ) -> Dict:
+        """バッチプロンプトに埋め込む1文書分の情報"""
+        return {
+            "document_id": document_id,
+            "text": text[:1500] if truncate else text,  # より長いコンテキスト（1000→1500）
+            "keywords": rule_result.get("suggested_qa_pairs", [])[:8],  # より多くのキーワード（5→8）
+            "key_entities": self._extract_key_entities(text, lang)[:5]
+        }
 
     def _create_batch_prompt(
         self,
@@ -3345,7 +3598,8 @@ class BatchHybridQAGenerator(OptimizedHybridQAGenerator):
         rule_results: List[Dict],
         doc_type: str,
         lang: str = "en",
-        uncovered_chunks: List[List[str]] = None
+        uncovered_chunks: List[List[str]] = None,
+        truncate: bool = True
     ) -> str:
         """
         バッチ処理用の高品質プロンプト作成
@@ -3356,6 +3610,7 @@ class BatchHybridQAGenerator(OptimizedHybridQAGenerator):
             doc_type: 文書タイプ
             lang: 言語コード
             uncovered_chunks: 未カバーチャンク（マルチパス時）
+            truncate: 各文書を1500文字で短縮するか（トークン予算でパッキングした場合はFalse）
         """
         # 言語別の指示文（高品質化）
         if lang == "ja":
@@ -3413,12 +3668,7 @@ Balance coverage of main concepts and important details."""
 
         documents = []
         for i, (text, rule_result) in enumerate(zip(texts, rule_results)):
-            doc_info = {
-                "document_id": i,
-                "text": text[:1500],  # より長いコンテキスト（1000→1500）
-                "keywords": rule_result.get("suggested_qa_pairs", [])[:8],  # より多くのキーワード（5→8）
-                "key_entities": self._extract_key_entities(text, lang)[:5]
-            }
+            doc_info = self._batch_document_info(i, text, rule_result, lang, truncate=truncate)
 
             # マルチパス時は未カバー領域を明示
             if uncovered_chunks and i < len(uncovered_chunks) and uncovered_chunks[i]:
@@ -3501,32 +3751,6 @@ IMPORTANT: Return your response in JSON format.
         entity_counts = Counter(entities)
         return [entity for entity, count in entity_counts.most_common(10)]
 
-    def _parse_batch_response_gemini(self, response_text: str, expected_count: int) -> List[Dict]:
-        """Gemini APIのバッチ応答をパース"""
-        try:
-            # JSONブロックを抽出（```json ... ``` または直接JSON）
-            json_match = re.search(r'```json\s*([\s\S]*?)\s*```', response_text)
-            if json_match:
-                json_str = json_match.group(1)
-            else:
-                # 直接JSONの場合
-                json_str = response_text.strip()
-
-            parsed = json.loads(json_str)
-
-            results = []
-            for doc_result in parsed.get("results", []):
-                results.append({
-                    "qa_pairs": doc_result.get("qa_pairs", []),
-                    "tokens_used": 0  # Gemini APIはトークン数を直接返さない
-                })
-
-            return results
-
-        except Exception as e:
-            print(f"Geminiバッチ応答のパースエラー: {e}")
-            return []
-
     def _batch_calculate_coverage(
         self,
         texts: List[str],
@@ -3574,14 +3798,8 @@ IMPORTANT: Return your response in JSON format.
             doc_chunk_embs = chunk_embeddings[chunk_start:chunk_end]
             doc_qa_embs = qa_embeddings[qa_start:qa_end]
 
-            # カバレージ計算
-            coverage_scores = []
-            for chunk_emb in doc_chunk_embs:
-                max_similarity = 0
-                for qa_emb in doc_qa_embs:
-                    similarity = self._cosine_similarity(chunk_emb, qa_emb)
-                    max_similarity = max(max_similarity, similarity)
-                coverage_scores.append(max_similarity)
+            # カバレージ計算（チャンクごとの最大類似度）
+            coverage_scores = self._max_similarities(doc_chunk_embs, doc_qa_embs).tolist()
 
             # 閾値判定
             is_rule_based = any("文書内で" in qa.get("answer", "") or
@@ -3595,7 +3813,7 @@ IMPORTANT: Return your response in JSON format.
             all_coverages.append({
                 "total_chunks": len(doc_chunk_embs),
                 "covered_chunks": covered_chunks,
-                "coverage_percentage": (covered_chunks / len(doc_chunk_embs)) * 100 if doc_chunk_embs else 0,
+                "coverage_percentage": (covered_chunks / len(doc_chunk_embs)) * 100 if len(doc_chunk_embs) else 0,
                 "average_similarity": np.mean(coverage_scores) if coverage_scores else 0,
                 "embedding_calls": 0  # バッチ処理のため個別カウントなし
             })
@@ -3607,11 +3825,12 @@ IMPORTANT: Return your response in JSON format.
         texts: List[str],
         desc: str,
         show_progress: bool
-    ) -> List[List[float]]:
-        """バッチ処理で埋め込みを取得（Gemini API使用）"""
+    ) -> np.ndarray:
+        """バッチ処理で埋め込みを取得（Gemini API使用、L2正規化済み float32 行列）"""
         from tqdm import tqdm
 
-        embeddings = []
+        # 結果行列を事前確保し、バッチごとに該当行へ直接書き込む（エラー時はゼロベクトルのまま）
+        embeddings = np.zeros((len(texts), self.embedding_client.dimensions), dtype=np.float32)
 
         progress_bar = tqdm(
             total=len(texts),
@@ -3623,20 +3842,16 @@ IMPORTANT: Return your response in JSON format.
             batch = texts[i:i + self.embedding_batch_size]
 
             try:
-                # Gemini Embedding APIを使用
-                batch_embeddings = self.embedding_client.embed_texts(batch)
+                # Gemini Embedding APIを使用（複数テキストを1リクエストにまとめる）
+                embeddings[i:i + len(batch)] = self.embedding_client.embed_texts_array(
+                    batch, batch_size=self.embedding_batch_size
+                )
 
                 self.batch_stats["embedding_batches"] += 1
                 self.batch_stats["total_embedding_calls"] += 1
 
-                embeddings.extend(batch_embeddings)
-
             except Exception as e:
                 print(f"埋め込み生成エラー: {e}")
-                # エラー時はゼロベクトル（Gemini embeddingは3072次元）
-                embedding_dims = get_embedding_dimensions("gemini")
-                for _ in batch:
-                    embeddings.append([0.0] * embedding_dims)
 
             progress_bar.update(len(batch))
 
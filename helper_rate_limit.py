@@ -0,0 +1,884 @@
+"""
+レート制限ユーティリティ
+
+Gemini / OpenAI API 呼び出しの流量を制御する共通部品を提供。
+helper_embedding.py / helper_llm.py から共有して使用する。
+
+使用例:
+    from helper_rate_limit import TokenBucketRateLimiter, get_concurrency_controller
+
+    # 1分あたり1500リクエスト・100万トークンまで
+    limiter = TokenBucketRateLimiter(rpm=1500, tpm=1_000_000)
+    limiter.acquire(tokens=120)  # 枠が空くまでブロック
+
+    # AIMD同時実行数制御（429/503で半減・Retry-Afterを尊重して再試行）
+    controller = get_concurrency_controller("gemini")
+    response = controller.call(model.generate_content, prompt)
+    print(controller.limit)  # 現在の同時実行上限
+
+    # 1回の呼び出し（再試行込み）の枠待ち時間・再試行回数・HTTPステータスを記録
+    with track_call_stats() as stats:
+        controller.call(model.generate_content, prompt)
+    print(stats.queue_wait, stats.retries, stats.status)
+
+    # 複数APIキー（プロジェクト）への振り分け（キーごとの RPM/TPM、429が続くキーは休止）
+    pool = APIKeyPool(parse_api_keys("KEY_A,KEY_B:2000:4000000", rpm=1000, tpm=1_000_000))
+    response = controller.call(pool.call, lambda api_key: send(api_key, prompt), 120)
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+import asyncio
+import logging
+import os
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CallStats:
+    """API呼び出し1回分（再試行込み）の待ち時間・再試行回数・ステータス"""
+    queue_wait: float = 0.0          # レート制限・実行枠・クールダウン待ちの合計秒数
+    retries: int = 0                 # 429/503 による再試行回数
+    status: Optional[int] = None     # 最後に受けたエラーのHTTPステータス（成功のみならNone）
+
+
+_CALL_STATS: ContextVar[Optional[CallStats]] = ContextVar("call_stats", default=None)
+
+
+@contextmanager
+def track_call_stats(stats: Optional[CallStats] = None) -> Iterator[CallStats]:
+    """
+    ブロック内の TokenBucketRateLimiter.acquire と AdaptiveConcurrencyController.call の統計を stats に加算する
+
+    ContextVar で受け渡すため、スレッド・asyncioタスクごとに独立して記録される。
+
+    Args:
+        stats: 加算先（Noneの場合は新規作成）
+
+    Yields:
+        CallStats
+    """
+    stats = stats if stats is not None else CallStats()
+    token = _CALL_STATS.set(stats)
+    try:
+        yield stats
+    finally:
+        _CALL_STATS.reset(token)
+
+
+def _add_queue_wait(seconds: float) -> None:
+    """track_call_stats のブロック内なら待機秒数を加算する"""
+    stats = _CALL_STATS.get()
+    if stats is not None and seconds > 0:
+        stats.queue_wait += seconds
+
+
+class TokenBucketRateLimiter:
+    """
+    requests/min と tokens/min の2つのトークンバケットによるレート制限（スレッドセーフ）
+
+    各バケットは1分あたりの上限値を容量とし、経過時間に比例して連続的に補充される。
+    rpm / tpm に None を指定した側は制限しない。
+    """
+
+    def __init__(
+        self,
+        rpm: Optional[float] = None,
+        tpm: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep
+    ):
+        """
+        Args:
+            rpm: 1分あたりの最大リクエスト数（Noneは無制限）
+            tpm: 1分あたりの最大トークン数（Noneは無制限）
+            clock: 単調増加クロック（テスト用に差し替え可能）
+            sleep: 待機関数（テスト用に差し替え可能）
+        """
+        if rpm is not None and rpm <= 0:
+            raise ValueError(f"rpm must be positive: {rpm}")
+        if tpm is not None and tpm <= 0:
+            raise ValueError(f"tpm must be positive: {tpm}")
+
+        self.rpm = rpm
+        self.tpm = tpm
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+
+        # 初期状態は満タン（1分ぶんのバースト）
+        self._request_allowance = float(rpm) if rpm else 0.0
+        self._token_allowance = float(tpm) if tpm else 0.0
+        self._last_refill = clock()
+
+    @property
+    def enabled(self) -> bool:
+        """いずれかの制限が有効か"""
+        return self.rpm is not None or self.tpm is not None
+
+    def _refill(self, now: float) -> None:
+        """経過時間に応じてバケットを補充（ロック保持中に呼ぶこと）"""
+        elapsed = max(0.0, now - self._last_refill)
+        self._last_refill = now
+        if self.rpm:
+            self._request_allowance = min(float(self.rpm), self._request_allowance + elapsed * self.rpm / 60.0)
+        if self.tpm:
+            self._token_allowance = min(float(self.tpm), self._token_allowance + elapsed * self.tpm / 60.0)
+
+    def headroom(self) -> float:
+        """現在の残り枠の割合（0〜1、rpm/tpm の小さい方。制限なしは1）"""
+        with self._lock:
+            self._refill(self._clock())
+            fractions = []
+            if self.rpm:
+                fractions.append(self._request_allowance / self.rpm)
+            if self.tpm:
+                fractions.append(self._token_allowance / self.tpm)
+            return max(0.0, min(fractions)) if fractions else 1.0
+
+    def acquire(self, tokens: int = 0) -> float:
+        """
+        1リクエスト分（＋tokensトークン分）の枠を確保する。枠が空くまでブロックする。
+
+        Args:
+            tokens: このリクエストが消費する見込みトークン数
+
+        Returns:
+            待機した秒数
+        """
+        if not self.enabled:
+            return 0.0
+
+        waited = 0.0
+        while True:
+            wait = self._try_acquire(tokens)
+            if wait <= 0:
+                _add_queue_wait(waited)
+                return waited
+            logger.debug(f"[RateLimit] 待機: {wait:.2f}秒 (tokens={tokens})")
+            self._sleep(wait)
+            waited += wait
+
+    async def acquire_async(self, tokens: int = 0) -> float:
+        """
+        acquire の asyncio 版（待機中はイベントループをブロックしない）
+
+        Args:
+            tokens: このリクエストが消費する見込みトークン数
+
+        Returns:
+            待機した秒数
+        """
+        if not self.enabled:
+            return 0.0
+
+        waited = 0.0
+        while True:
+            wait = self._try_acquire(tokens)
+            if wait <= 0:
+                _add_queue_wait(waited)
+                return waited
+            logger.debug(f"[RateLimit] 待機: {wait:.2f}秒 (tokens={tokens})")
+            await asyncio.sleep(wait)
+            waited += wait
+
+    def _try_acquire(self, tokens: int) -> float:
+        """
+        枠があれば消費して0を返し、なければ必要な待機秒数を返す
+
+        Args:
+            tokens: このリクエストが消費する見込みトークン数
+
+        Returns:
+            0（確保済み）または待機すべき秒数
+        """
+        # 単一リクエストがバケット容量を超える場合は容量に丸める（デッドロック防止）
+        if self.tpm:
+            tokens = min(tokens, int(self.tpm))
+
+        with self._lock:
+            self._refill(self._clock())
+
+            wait_requests = 0.0
+            if self.rpm and self._request_allowance < 1.0:
+                wait_requests = (1.0 - self._request_allowance) * 60.0 / self.rpm
+
+            wait_tokens = 0.0
+            if self.tpm and self._token_allowance < tokens:
+                wait_tokens = (tokens - self._token_allowance) * 60.0 / self.tpm
+
+            wait = max(wait_requests, wait_tokens)
+            if wait <= 0:
+                if self.rpm:
+                    self._request_allowance -= 1.0
+                if self.tpm:
+                    self._token_allowance -= tokens
+                return 0.0
+            return wait
+
+
+# ==========================================
+# AIMD同時実行数制御（429/503 と Retry-After への適応）
+# ==========================================
+
+# レート制限・一時的な過負荷として扱うHTTPステータス
+RATE_LIMIT_STATUS_CODES = (429, 503)
+
+DEFAULT_CONCURRENCY_INITIAL = int(os.getenv("API_CONCURRENCY_INITIAL", "4"))
+DEFAULT_CONCURRENCY_MAX = int(os.getenv("API_CONCURRENCY_MAX", "32"))
+DEFAULT_RATE_LIMIT_MAX_RETRIES = int(os.getenv("API_RATE_LIMIT_MAX_RETRIES", "5"))
+
+# エラーメッセージ中の再試行待機時間（Gemini: "retry in 12.3s" / "retryDelay": "12s" / retry_delay { seconds: 12 }）
+_RETRY_DELAY_PATTERN = re.compile(
+    r"retry(?:[ _]?delay)?\W*(?:in\s*|seconds\W*)?(\d+(?:\.\d+)?)\s*s?", re.IGNORECASE
+)
+
+
+def _error_status_code(error: BaseException) -> Optional[int]:
+    """SDK例外からHTTPステータスコードを取り出す（OpenAI: status_code / Google: code）"""
+    response = getattr(error, "response", None)
+    for value in (getattr(error, "status_code", None), getattr(error, "code", None),
+                  getattr(response, "status_code", None)):
+        try:
+            if value is not None:
+                return int(value)
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+def _retry_after_seconds(error: BaseException) -> Optional[float]:
+    """例外から Retry-After（秒）を取り出す（属性 → レスポンスヘッダー → メッセージの順）"""
+    retry_after = getattr(error, "retry_after", None)
+    if retry_after is not None:
+        return max(0.0, float(retry_after))
+
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    value = headers.get("retry-after") if headers is not None else None
+    if value:
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+
+    match = _RETRY_DELAY_PATTERN.search(str(error))
+    return float(match.group(1)) if match else None
+
+
+def classify_rate_limit_error(error: BaseException) -> Tuple[bool, Optional[float]]:
+    """
+    例外がレート制限（429）・一時的な過負荷（503）かを判定
+
+    Args:
+        error: API呼び出しで発生した例外
+
+    Returns:
+        (再試行すべきか, Retry-After秒数（不明ならNone）)
+    """
+    status = _error_status_code(error)
+    if status is not None:
+        retryable = status in RATE_LIMIT_STATUS_CODES
+    else:
+        message = str(error)
+        retryable = any(marker in message for marker in
+                        ("429", "RESOURCE_EXHAUSTED", "503", "UNAVAILABLE", "Too Many Requests"))
+    return retryable, (_retry_after_seconds(error) if retryable else None)
+
+
+class AdaptiveConcurrencyController:
+    """
+    AIMD（加算増加・乗算減少）による同時実行数制御（スレッドセーフ、asyncioからも利用可）
+
+    成功が続くと同時実行上限を1ウィンドウ（上限件数の成功）あたり increase ずつ増やし、
+    429/503 を受けると decrease_factor 倍に減らす。減少は「直前の減少以降に開始した
+    リクエスト」の失敗でのみ行うため、同時に返ってきた429の束で何度も半減しない。
+    Retry-After（なければ指数バックオフ）の間は全呼び出しの開始を止める。
+    """
+
+    def __init__(
+        self,
+        initial_limit: int = DEFAULT_CONCURRENCY_INITIAL,
+        min_limit: int = 1,
+        max_limit: int = DEFAULT_CONCURRENCY_MAX,
+        increase: float = 1.0,
+        decrease_factor: float = 0.5,
+        max_retries: int = DEFAULT_RATE_LIMIT_MAX_RETRIES,
+        base_backoff: float = 1.0,
+        max_backoff: float = 60.0,
+        name: str = "default",
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep
+    ):
+        """
+        Args:
+            initial_limit: 同時実行上限の初期値
+            min_limit: 同時実行上限の下限
+            max_limit: 同時実行上限の上限
+            increase: 1ウィンドウの成功あたりの増加量
+            decrease_factor: 429/503 時の乗数（0〜1）
+            max_retries: 429/503 の最大再試行回数
+            base_backoff: Retry-Afterがない場合の初回待機秒数（試行ごとに倍）
+            max_backoff: バックオフの最大秒数
+            name: ログ表示用の名前
+            clock: 単調増加クロック（テスト用に差し替え可能）
+            sleep: 待機関数（テスト用に差し替え可能）
+        """
+        if not 0 < decrease_factor < 1:
+            raise ValueError(f"decrease_factor must be in (0, 1): {decrease_factor}")
+        self.min_limit = max(1, int(min_limit))
+        self.max_limit = max(self.min_limit, int(max_limit))
+        self.increase = increase
+        self.decrease_factor = decrease_factor
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.name = name
+        self._clock = clock
+        self._sleep = sleep
+        self._cond = threading.Condition()
+
+        self._limit = float(min(max(int(initial_limit), self.min_limit), self.max_limit))
+        self._in_flight = 0
+        self._epoch = 0
+        self._cooldown_until = 0.0
+        self.successes = 0
+        self.rate_limited = 0
+
+    @property
+    def limit(self) -> int:
+        """現在の同時実行上限"""
+        return int(self._limit)
+
+    @property
+    def in_flight(self) -> int:
+        """実行中の呼び出し数"""
+        return self._in_flight
+
+    def snapshot(self) -> Dict[str, Any]:
+        """現在の状態（ログ・メトリクス用）"""
+        with self._cond:
+            return {
+                "name": self.name,
+                "limit": int(self._limit),
+                "in_flight": self._in_flight,
+                "successes": self.successes,
+                "rate_limited": self.rate_limited,
+                "cooldown_remaining": max(0.0, self._cooldown_until - self._clock()),
+            }
+
+    def _try_acquire(self) -> Tuple[Optional[int], Optional[float]]:
+        """
+        枠があれば確保してエポックを返す（ロック保持中に呼ぶこと）
+
+        Returns:
+            (エポック, None)（確保済み） / (None, 待機秒数)（クールダウン中） /
+            (None, None)（同時実行数が上限）
+        """
+        remaining = self._cooldown_until - self._clock()
+        if remaining > 0:
+            return None, remaining
+        if self._in_flight >= int(self._limit):
+            return None, None
+        self._in_flight += 1
+        return self._epoch, None
+
+    def acquire(self) -> int:
+        """
+        実行枠を確保する（枠が空くまで・クールダウンが明けるまでブロック）
+
+        Returns:
+            release に渡すエポック
+        """
+        while True:
+            with self._cond:
+                epoch, wait = self._try_acquire()
+                if epoch is not None:
+                    return epoch
+                if wait is None:
+                    self._cond.wait(timeout=0.1)
+                    continue
+            self._sleep(wait)
+
+    async def acquire_async(self) -> int:
+        """acquire の asyncio 版（待機中はイベントループをブロックしない）"""
+        while True:
+            with self._cond:
+                epoch, wait = self._try_acquire()
+            if epoch is not None:
+                return epoch
+            await asyncio.sleep(wait if wait is not None else 0.01)
+
+    def release(self, epoch: int, rate_limited: bool = False, delay: float = 0.0, success: bool = True) -> None:
+        """
+        実行枠を返却し、結果に応じて上限を調整する
+
+        Args:
+            epoch: acquire が返したエポック
+            rate_limited: 429/503 を受けたか
+            delay: rate_limited 時のクールダウン秒数（Retry-After）
+            success: 成功したか（rate_limited 以外のエラーは上限を変えない）
+        """
+        with self._cond:
+            self._in_flight -= 1
+            if rate_limited:
+                self.rate_limited += 1
+                self._cooldown_until = max(self._cooldown_until, self._clock() + delay)
+                if epoch == self._epoch:
+                    previous = int(self._limit)
+                    self._limit = max(float(self.min_limit), self._limit * self.decrease_factor)
+                    self._epoch += 1
+                    logger.warning(f"[Concurrency:{self.name}] レート制限 → 同時実行上限 {previous} → "
+                                   f"{int(self._limit)}、{delay:.1f}秒待機")
+            elif success:
+                self.successes += 1
+                if epoch == self._epoch and self._limit < self.max_limit:
+                    self._limit = min(float(self.max_limit), self._limit + self.increase / self._limit)
+            self._cond.notify_all()
+
+    def _backoff(self, attempt: int, retry_after: Optional[float]) -> float:
+        """待機秒数（Retry-Afterを優先、なければ指数バックオフ）"""
+        if retry_after is not None:
+            return retry_after
+        return min(self.max_backoff, self.base_backoff * (2 ** attempt))
+
+    def call(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        同時実行数の枠内で fn を実行し、429/503 は待機して再試行する
+
+        Raises:
+            fn の例外（429/503 は max_retries 回の再試行後）
+        """
+        stats = _CALL_STATS.get()
+        attempt = 0
+        while True:
+            waiting_since = self._clock() if stats is not None else 0.0
+            epoch = self.acquire()
+            if stats is not None:
+                stats.queue_wait += self._clock() - waiting_since
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                if stats is not None:
+                    stats.status = _error_status_code(e)
+                retryable, retry_after = classify_rate_limit_error(e)
+                if not retryable:
+                    self.release(epoch, success=False)
+                    raise
+                delay = self._backoff(attempt, retry_after)
+                self.release(epoch, rate_limited=True, delay=delay)
+                if attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                if stats is not None:
+                    stats.retries += 1
+                logger.info(f"[Concurrency:{self.name}] 再試行 {attempt}/{self.max_retries}: {str(e)[:100]}")
+                continue
+            self.release(epoch)
+            return result
+
+    async def call_async(self, fn: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        """call の asyncio 版（fn はコルーチン関数）"""
+        stats = _CALL_STATS.get()
+        attempt = 0
+        while True:
+            waiting_since = self._clock() if stats is not None else 0.0
+            epoch = await self.acquire_async()
+            if stats is not None:
+                stats.queue_wait += self._clock() - waiting_since
+            try:
+                result = await fn(*args, **kwargs)
+            except Exception as e:
+                if stats is not None:
+                    stats.status = _error_status_code(e)
+                retryable, retry_after = classify_rate_limit_error(e)
+                if not retryable:
+                    self.release(epoch, success=False)
+                    raise
+                delay = self._backoff(attempt, retry_after)
+                self.release(epoch, rate_limited=True, delay=delay)
+                if attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                if stats is not None:
+                    stats.retries += 1
+                logger.info(f"[Concurrency:{self.name}] 再試行 {attempt}/{self.max_retries}: {str(e)[:100]}")
+                continue
+            self.release(epoch)
+            return result
+
+
+# プロセス内で共有するコントローラー（同じクォータを使う呼び出し同士で429の情報を共有する）
+_CONTROLLERS: Dict[str, AdaptiveConcurrencyController] = {}
+_CONTROLLERS_LOCK = threading.Lock()
+
+
+def get_concurrency_controller(name: str, **kwargs) -> AdaptiveConcurrencyController:
+    """
+    名前ごとに共有する AdaptiveConcurrencyController を取得（なければ作成）
+
+    Args:
+        name: クォータ単位の名前（例: "gemini" / "gemini-embedding" / "openai"）
+        **kwargs: 初回作成時の AdaptiveConcurrencyController 引数
+
+    Returns:
+        共有コントローラー
+    """
+    with _CONTROLLERS_LOCK:
+        controller = _CONTROLLERS.get(name)
+        if controller is None:
+            controller = AdaptiveConcurrencyController(name=name, **kwargs)
+            _CONTROLLERS[name] = controller
+        return controller
+
+
+def clear_concurrency_controllers() -> None:
+    """共有コントローラーを破棄（テスト用）"""
+    with _CONTROLLERS_LOCK:
+        _CONTROLLERS.clear()
+
+
+# ==========================================
+# APIキープール（複数プロジェクトのクォータを束ねる）
+# ==========================================
+
+# 複数キー（カンマ区切り、各要素は "KEY" または "KEY:RPM:TPM"）
+API_KEY_POOL_ENV = {"gemini": "GOOGLE_API_KEYS"}
+# 連続でこの回数 429/503 を受けたキーを休止させる
+DEFAULT_API_KEY_BENCH_AFTER = int(os.getenv("API_KEY_BENCH_AFTER", "3"))
+# 休止時間（秒、Retry-After の方が長ければそちらを使う）
+DEFAULT_API_KEY_BENCH_SECONDS = float(os.getenv("API_KEY_BENCH_SECONDS", "60"))
+# 同じキーを使うプロセス数（Celeryワーカー等）。キーごとの予算をこの数で割る
+DEFAULT_API_KEY_POOL_PROCESSES = int(os.getenv("API_KEY_POOL_PROCESSES", "1"))
+
+
+@dataclass
+class APIKeySpec:
+    """プール内の1キーの設定"""
+    key: str
+    rpm: Optional[float] = None      # このキー（プロジェクト）の1分あたりリクエスト上限
+    tpm: Optional[float] = None      # このキー（プロジェクト）の1分あたりトークン上限
+    weight: Optional[float] = None   # 振り分けの重み（Noneは rpm、rpm もなければ1）
+
+
+def parse_api_keys(value: str, rpm: Optional[float] = None, tpm: Optional[float] = None) -> List[APIKeySpec]:
+    """
+    "KEY1,KEY2:1000:4000000" 形式の文字列を APIKeySpec のリストに変換
+
+    Args:
+        value: カンマ区切りのキー（":RPM:TPM" で個別の予算を指定、空欄は既定値）
+        rpm: 個別指定がないキーの rpm
+        tpm: 個別指定がないキーの tpm
+    """
+    specs = []
+    for entry in value.split(","):
+        parts = [part.strip() for part in entry.split(":")]
+        if not parts[0]:
+            continue
+        key_rpm = float(parts[1]) if len(parts) > 1 and parts[1] else rpm
+        key_tpm = float(parts[2]) if len(parts) > 2 and parts[2] else tpm
+        specs.append(APIKeySpec(parts[0], rpm=key_rpm, tpm=key_tpm))
+    return specs
+
+
+def _mask_key(key: str) -> str:
+    """ログ表示用にキーを伏せる"""
+    return f"...{key[-4:]}" if len(key) > 4 else "***"
+
+
+class _APIKeyState:
+    """プール内の1キーの状態（APIKeyPool のロック保持中に更新する）"""
+
+    def __init__(self, spec: APIKeySpec, index: int, clock: Callable[[], float], sleep: Callable[[float], None]):
+        self.spec = spec
+        self.index = index
+        self.limiter = TokenBucketRateLimiter(rpm=spec.rpm, tpm=spec.tpm, clock=clock, sleep=sleep)
+        self.weight = spec.weight or spec.rpm or 1.0
+        self.in_flight = 0
+        self.consecutive_rate_limits = 0
+        self.unavailable_until = 0.0
+        self.requests = 0
+        self.rate_limited = 0
+        self.benched = 0
+
+
+class APIKeyPool:
+    """
+    複数のAPIキー（プロジェクト）にリクエストを振り分けるプール（スレッドセーフ、asyncioからも利用可）
+
+    キーごとに RPM/TPM のトークンバケットと状態を持ち、休止中でないキーのうち
+    残り枠（割合 × 重み）が最も大きいキーを選ぶ。429/503 を受けたキーは Retry-After の間
+    使わず、連続 bench_after 回で bench_seconds 秒休止させる。全キーが使えない間は
+    最も早く空くまで待機する。
+
+    AdaptiveConcurrencyController と組み合わせる場合は controller.call(pool.call, send) とし、
+    再試行のたびに別のキーが選ばれるようにする。
+    """
+
+    def __init__(
+        self,
+        keys: Sequence[Union[str, APIKeySpec]],
+        rpm: Optional[float] = None,
+        tpm: Optional[float] = None,
+        bench_after: int = DEFAULT_API_KEY_BENCH_AFTER,
+        bench_seconds: float = DEFAULT_API_KEY_BENCH_SECONDS,
+        name: str = "default",
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep
+    ):
+        """
+        Args:
+            keys: APIキーまたは APIKeySpec のリスト
+            rpm: 文字列で渡したキーの rpm（Noneは無制限）
+            tpm: 文字列で渡したキーの tpm（Noneは無制限）
+            bench_after: 連続で何回 429/503 を受けたら休止させるか
+            bench_seconds: 休止秒数
+            name: ログ表示用の名前
+            clock: 単調増加クロック（テスト用に差し替え可能）
+            sleep: 待機関数（テスト用に差し替え可能）
+        """
+        specs = [k if isinstance(k, APIKeySpec) else APIKeySpec(k, rpm=rpm, tpm=tpm) for k in keys]
+        if not specs:
+            raise ValueError("APIKeyPool requires at least one key")
+        self.bench_after = max(1, int(bench_after))
+        self.bench_seconds = bench_seconds
+        self.name = name
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._states = [_APIKeyState(spec, i, clock, sleep) for i, spec in enumerate(specs)]
+        self._by_key = {state.spec.key: state for state in self._states}
+        # 同じ残り枠のキーが複数ある場合の開始位置（プロセスごとにずらして最初のキーに集中させない）
+        self._rotation = os.getpid()
+
+    def __len__(self) -> int:
+        return len(self._states)
+
+    @property
+    def keys(self) -> List[str]:
+        return [state.spec.key for state in self._states]
+
+    def _try_acquire(self, tokens: int, exclude: Sequence[str] = ()) -> Tuple[Optional[str], float]:
+        """
+        使えるキーがあれば枠を消費してキーを返す
+
+        Returns:
+            (キー, 0) / (None, 次にいずれかのキーが使えるまでの秒数)
+        """
+        with self._lock:
+            now = self._clock()
+            self._rotation += 1
+            available = [s for s in self._states if s.unavailable_until <= now and s.spec.key not in exclude]
+            ranked = sorted(
+                available,
+                key=lambda s: (-s.limiter.headroom() * s.weight, s.in_flight,
+                               (s.index - self._rotation) % len(self._states))
+            )
+            waits = [s.unavailable_until - now for s in self._states if s.unavailable_until > now]
+            for state in ranked:
+                wait = state.limiter._try_acquire(tokens)
+                if wait <= 0:
+                    state.in_flight += 1
+                    state.requests += 1
+                    return state.spec.key, 0.0
+                waits.append(wait)
+            return None, max(0.01, min(waits, default=0.01))
+
+    def acquire(self, tokens: int = 0, exclude: Sequence[str] = ()) -> str:
+        """
+        キーを1つ選んで枠を確保する（いずれかのキーが使えるまでブロック）
+
+        Args:
+            tokens: このリクエストが消費する見込みトークン数
+            exclude: 選ばないキー（この呼び出しで 429 を受けたキー）
+
+        Returns:
+            release に渡すAPIキー
+        """
+        waited = 0.0
+        while True:
+            key, wait = self._try_acquire(tokens, exclude)
+            if key is not None:
+                _add_queue_wait(waited)
+                return key
+            self._sleep(wait)
+            waited += wait
+
+    async def acquire_async(self, tokens: int = 0, exclude: Sequence[str] = ()) -> str:
+        """acquire の asyncio 版（待機中はイベントループをブロックしない）"""
+        waited = 0.0
+        while True:
+            key, wait = self._try_acquire(tokens, exclude)
+            if key is not None:
+                _add_queue_wait(waited)
+                return key
+            await asyncio.sleep(wait)
+            waited += wait
+
+    def release(self, key: str, error: Optional[BaseException] = None) -> None:
+        """
+        キーを返却し、結果に応じて状態を更新する
+
+        Args:
+            key: acquire が返したキー
+            error: 発生した例外（成功時はNone）。429/503 はキーの一時停止・休止に使う
+        """
+        retryable, retry_after = classify_rate_limit_error(error) if error is not None else (False, None)
+        with self._lock:
+            state = self._by_key[key]
+            state.in_flight -= 1
+            if not retryable:
+                if error is None:
+                    state.consecutive_rate_limits = 0
+                return
+            state.rate_limited += 1
+            state.consecutive_rate_limits += 1
+            pause = retry_after or 0.0
+            if state.consecutive_rate_limits >= self.bench_after:
+                pause = max(pause, self.bench_seconds)
+                state.benched += 1
+                state.consecutive_rate_limits = 0
+                logger.warning(f"[KeyPool:{self.name}] キー {_mask_key(key)} が連続でレート制限 → {pause:.0f}秒休止")
+            state.unavailable_until = max(state.unavailable_until, self._clock() + pause)
+
+    def _retry_elsewhere(self, key: str, error: Exception, tried: List[str]) -> bool:
+        """
+        429/503 を受けたキーを除いて、すぐ使える別のキーで再試行するか
+
+        別のキーがなければ例外を呼び出し元（AdaptiveConcurrencyController）に返し、
+        全体のクールダウン・再試行に委ねる。
+        """
+        tried.append(key)
+        retryable, _ = classify_rate_limit_error(error)
+        if not retryable:
+            return False
+        with self._lock:
+            now = self._clock()
+            if not any(s.unavailable_until <= now and s.spec.key not in tried for s in self._states):
+                return False
+        stats = _CALL_STATS.get()
+        if stats is not None:
+            stats.retries += 1
+        logger.info(f"[KeyPool:{self.name}] キー {_mask_key(key)} がレート制限 → 別のキーで再試行")
+        return True
+
+    def call(self, fn: Callable[[str], Any], tokens: int = 0) -> Any:
+        """
+        キーを選んで fn(api_key) を実行する
+
+        429/503 はキーの状態に反映し、使える別のキーがあればそのキーで再試行する。
+
+        Args:
+            fn: APIキーを受け取ってリクエストを送る関数
+            tokens: このリクエストが消費する見込みトークン数
+        """
+        tried: List[str] = []
+        while True:
+            key = self.acquire(tokens, exclude=tried)
+            try:
+                result = fn(key)
+            except Exception as e:
+                self.release(key, e)
+                if self._retry_elsewhere(key, e, tried):
+                    continue
+                raise
+            self.release(key)
+            return result
+
+    async def call_async(self, fn: Callable[[str], Awaitable[Any]], tokens: int = 0) -> Any:
+        """call の asyncio 版（fn はAPIキーを受け取るコルーチン関数）"""
+        tried: List[str] = []
+        while True:
+            key = await self.acquire_async(tokens, exclude=tried)
+            try:
+                result = await fn(key)
+            except Exception as e:
+                self.release(key, e)
+                if self._retry_elsewhere(key, e, tried):
+                    continue
+                raise
+            self.release(key)
+            return result
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """キーごとの状態（ログ・メトリクス用、キーは伏せる）"""
+        with self._lock:
+            now = self._clock()
+            return [{
+                "key": _mask_key(state.spec.key),
+                "rpm": state.spec.rpm,
+                "tpm": state.spec.tpm,
+                "headroom": state.limiter.headroom(),
+                "in_flight": state.in_flight,
+                "requests": state.requests,
+                "rate_limited": state.rate_limited,
+                "benched": state.benched,
+                "unavailable_remaining": max(0.0, state.unavailable_until - now),
+            } for state in self._states]
+
+
+# プロセス内で共有するキープール（同じキーを使うLLM生成・Embedding同士で状態を共有する）
+_KEY_POOLS: Dict[Tuple[int, str], Optional[APIKeyPool]] = {}
+_KEY_POOLS_LOCK = threading.Lock()
+_KEY_POOL_PROCESSES = DEFAULT_API_KEY_POOL_PROCESSES
+
+
+def set_api_key_pool_processes(processes: int) -> None:
+    """
+    同じキーを使うプロセス数を設定（以降に作成するプールはキーごとの予算をこの数で割る）
+
+    Celeryワーカーの各プロセスがそれぞれプールを持つため、worker_process_init で
+    ワーカーの同時実行数を設定し、プロセス合計がキーの予算を超えないようにする。
+    """
+    global _KEY_POOL_PROCESSES
+    _KEY_POOL_PROCESSES = max(1, int(processes))
+
+
+def get_api_key_pool(
+    name: str,
+    provider: str = "gemini",
+    rpm: Optional[float] = None,
+    tpm: Optional[float] = None,
+    **kwargs
+) -> Optional[APIKeyPool]:
+    """
+    名前ごとに共有する APIKeyPool を取得（環境変数から初回作成）
+
+    Args:
+        name: クォータ単位の名前（例: "gemini" / "gemini-embedding"）。同じキーでも
+            LLM生成とEmbeddingはクォータが別のため別のプールにする
+        provider: キーを読む環境変数のプロバイダー（API_KEY_POOL_ENV）
+        rpm: 個別指定がないキーの rpm
+        tpm: 個別指定がないキーの tpm
+        **kwargs: 初回作成時の APIKeyPool 引数
+
+    Returns:
+        共有プール。環境変数（例: GOOGLE_API_KEYS）が未設定ならNone（単一キーで動作）
+    """
+    key = (os.getpid(), name)
+    with _KEY_POOLS_LOCK:
+        if key not in _KEY_POOLS:
+            specs = parse_api_keys(os.getenv(API_KEY_POOL_ENV.get(provider, ""), ""), rpm=rpm, tpm=tpm)
+            for spec in specs:
+                spec.weight = spec.weight or spec.rpm
+                spec.rpm = spec.rpm / _KEY_POOL_PROCESSES if spec.rpm else None
+                spec.tpm = spec.tpm / _KEY_POOL_PROCESSES if spec.tpm else None
+            _KEY_POOLS[key] = APIKeyPool(specs, name=name, **kwargs) if specs else None
+            if specs:
+                logger.info(f"[KeyPool:{name}] {len(specs)}キーで作成 (プロセス数={_KEY_POOL_PROCESSES})")
+        return _KEY_POOLS[key]
+
+
+def clear_api_key_pools() -> None:
+    """共有キープールを破棄（テストやキー変更時に使用）"""
+    with _KEY_POOLS_LOCK:
+        _KEY_POOLS.clear()
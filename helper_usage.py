@@ -0,0 +1,384 @@
+"""
+API使用量の計測（トークン数・レイテンシ・再試行）
+
+LLMClient の generate_* / EmbeddingClient の embed_* 呼び出しごとに、プロバイダーが返す
+入力・出力トークン数、所要時間（ウォール時間）、実行枠の待ち時間、再試行回数、HTTPステータスを
+UsageRecord として記録し、登録されたシンクへ送る。
+
+シンク:
+    - InMemoryUsageSink: メモリに保持（実行終了時のレポート用）
+    - JSONLUsageSink: 1呼び出し1行のJSONLに追記（環境変数 LLM_USAGE_LOG で既定メーターに登録）
+    - record(UsageRecord) を持つ任意のオブジェクト
+
+使用例:
+    from helper_usage import InMemoryUsageSink, get_usage_meter, format_usage_report
+
+    sink = InMemoryUsageSink()
+    get_usage_meter().add_sink(sink)
+    ...  # Q/A生成
+    print(format_usage_report(sink.summary(), qa_count=len(qa_pairs)))
+
+    # 特定の処理で発生した呼び出しだけを集める
+    with collect_usage() as records:
+        client.generate_structured(prompt, QAPairsResponse)
+    tokens = sum(r.total_tokens for r in records)
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+import json
+import logging
+import math
+import os
+import threading
+import time
+
+from helper_rate_limit import CallStats, _error_status_code, track_call_stats
+
+logger = logging.getLogger(__name__)
+
+
+# 設定すると既定メーターが全呼び出しをこのJSONLファイルに追記する
+DEFAULT_USAGE_LOG_PATH = os.getenv("LLM_USAGE_LOG", "")
+
+
+@dataclass
+class UsageRecord:
+    """API呼び出し1回（再試行込み）の使用量"""
+    provider: str                    # "gemini" / "openai" など
+    model: str
+    operation: str                   # "generate_content" / "embed_texts" など
+    input_tokens: int = 0
+    output_tokens: int = 0
+    latency: float = 0.0             # ウォール時間（秒、枠待ち・再試行・ストリーム受信を含む）
+    queue_wait: float = 0.0          # レート制限・同時実行枠の待ち時間（秒）
+    retries: int = 0
+    status: Optional[int] = None     # HTTPステータス（成功は200）
+    success: bool = True
+    estimated: bool = False          # トークン数がプロバイダー報告値ではなくローカル見積もりか
+    timestamp: float = field(default_factory=time.time)
+
+    @property
+    def total_tokens(self) -> int:
+        return self.input_tokens + self.output_tokens
+
+    def set_tokens(self, input_tokens: Optional[int], output_tokens: Optional[int] = 0,
+                   estimated: bool = False) -> None:
+        """トークン数を設定（Noneは変更しない）"""
+        if input_tokens is not None:
+            self.input_tokens = input_tokens
+        if output_tokens is not None:
+            self.output_tokens = output_tokens
+        self.estimated = estimated
+
+
+def _token_count(obj: Any, *names: str) -> Optional[int]:
+    """usage オブジェクトから最初に見つかった整数のトークン数を取り出す"""
+    for name in names:
+        value = getattr(obj, name, None)
+        if isinstance(value, int) and not isinstance(value, bool):
+            return value
+    return None
+
+
+def gemini_usage(response: Any) -> Optional[tuple]:
+    """
+    Gemini の応答（google-generativeai / google-genai 共通）から (入力, 出力) トークン数を取り出す
+
+    Returns:
+        (入力トークン数, 出力トークン数)。usage_metadata がなければNone
+    """
+    metadata = getattr(response, "usage_metadata", None)
+    input_tokens = _token_count(metadata, "prompt_token_count")
+    if input_tokens is None:
+        return None
+    return input_tokens, _token_count(metadata, "candidates_token_count") or 0
+
+
+def openai_usage(response: Any) -> Optional[tuple]:
+    """
+    OpenAI の応答（Chat Completions / Embeddings / Responses）から (入力, 出力) トークン数を取り出す
+
+    Returns:
+        (入力トークン数, 出力トークン数)。usage がなければNone
+    """
+    usage = getattr(response, "usage", None)
+    input_tokens = _token_count(usage, "prompt_tokens", "input_tokens")
+    if input_tokens is None:
+        return None
+    return input_tokens, _token_count(usage, "completion_tokens", "output_tokens") or 0
+
+
+# ====================================
+# シンク
+# ====================================
+
+class InMemoryUsageSink:
+    """記録をメモリに保持するシンク（スレッドセーフ）"""
+
+    def __init__(self):
+        self._records: List[UsageRecord] = []
+        self._lock = threading.Lock()
+
+    def record(self, usage: UsageRecord) -> None:
+        with self._lock:
+            self._records.append(usage)
+
+    @property
+    def records(self) -> List[UsageRecord]:
+        with self._lock:
+            return list(self._records)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._records.clear()
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        """モデル別の集計（summarize_usage）"""
+        return summarize_usage(self.records)
+
+
+class JSONLUsageSink:
+    """1呼び出し1行のJSONLに追記するシンク（スレッドセーフ）"""
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+
+    def record(self, usage: UsageRecord) -> None:
+        line = json.dumps(asdict(usage), ensure_ascii=False)
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+
+# ====================================
+# メーター
+# ====================================
+
+# collect_usage のブロック内で記録された UsageRecord の収集先
+_COLLECTORS: ContextVar[tuple] = ContextVar("usage_collectors", default=())
+
+
+@contextmanager
+def collect_usage() -> Iterator[List[UsageRecord]]:
+    """
+    ブロック内（同じスレッド・asyncioタスク）で記録された呼び出しをリストに集める
+
+    シンクの登録有無に関わらず収集する。入れ子にした場合は外側にも記録される。
+    """
+    records: List[UsageRecord] = []
+    token = _COLLECTORS.set(_COLLECTORS.get() + (records,))
+    try:
+        yield records
+    finally:
+        _COLLECTORS.reset(token)
+
+
+class UsageMeter:
+    """UsageRecord をシンクへ配信するメーター"""
+
+    def __init__(self, sinks: Optional[Iterable[Any]] = None):
+        self._sinks: List[Any] = list(sinks or [])
+        self._lock = threading.Lock()
+
+    def add_sink(self, sink: Any) -> Any:
+        """シンクを登録（登録したシンクを返す）"""
+        with self._lock:
+            self._sinks.append(sink)
+        return sink
+
+    def remove_sink(self, sink: Any) -> None:
+        """シンクの登録を解除（未登録なら何もしない）"""
+        with self._lock:
+            if sink in self._sinks:
+                self._sinks.remove(sink)
+
+    def start(self, provider: str, model: str, operation: str) -> UsageRecord:
+        """計測を開始（latency は finish までの経過時間になる）"""
+        usage = UsageRecord(provider=provider, model=model, operation=operation)
+        usage.latency = time.perf_counter()  # finish で経過時間に置き換える
+        return usage
+
+    @contextmanager
+    def track(self, usage: UsageRecord) -> Iterator[UsageRecord]:
+        """ブロック内の controller.call の待ち時間・再試行回数・ステータスを usage に加算する"""
+        stats = CallStats()
+        try:
+            with track_call_stats(stats):
+                yield usage
+        finally:
+            usage.queue_wait += stats.queue_wait
+            usage.retries += stats.retries
+            if stats.status is not None:
+                usage.status = stats.status
+
+    def finish(self, usage: UsageRecord, error: Optional[BaseException] = None) -> UsageRecord:
+        """計測を終了してシンクへ送る"""
+        usage.latency = time.perf_counter() - usage.latency
+        if error is not None:
+            usage.success = False
+            usage.status = _error_status_code(error) or usage.status
+        elif usage.success:
+            usage.status = 200
+        self.record(usage)
+        return usage
+
+    @contextmanager
+    def measure(self, provider: str, model: str, operation: str) -> Iterator[UsageRecord]:
+        """
+        ブロックを1回の呼び出しとして計測する
+
+        ブロック内で usage.set_tokens(...) を呼んでトークン数を設定する。
+        例外は記録した上でそのまま送出する。
+        """
+        usage = self.start(provider, model, operation)
+        try:
+            with self.track(usage):
+                yield usage
+        except BaseException as e:
+            self.finish(usage, error=e)
+            raise
+        self.finish(usage)
+
+    def record(self, usage: UsageRecord) -> None:
+        """記録をシンク・collect_usage の収集先へ送る（シンクの例外は警告のみ）"""
+        for records in _COLLECTORS.get():
+            records.append(usage)
+        with self._lock:
+            sinks = list(self._sinks)
+        for sink in sinks:
+            try:
+                sink.record(usage)
+            except Exception as e:
+                logger.warning(f"[Usage] シンクへの記録に失敗しました ({type(sink).__name__}): {e}")
+
+
+_METER: Optional[UsageMeter] = None
+_METER_PID: Optional[int] = None
+_METER_LOCK = threading.Lock()
+
+
+def get_usage_meter() -> UsageMeter:
+    """
+    プロセス内で共有する UsageMeter を取得
+
+    環境変数 LLM_USAGE_LOG が設定されていれば JSONLUsageSink を登録した状態で作成する。
+    fork 後の子プロセス（Celeryワーカー等）では作り直す。
+    """
+    global _METER, _METER_PID
+    pid = os.getpid()
+    with _METER_LOCK:
+        if _METER is None or _METER_PID != pid:
+            _METER = UsageMeter()
+            _METER_PID = pid
+            if DEFAULT_USAGE_LOG_PATH:
+                _METER.add_sink(JSONLUsageSink(DEFAULT_USAGE_LOG_PATH))
+        return _METER
+
+
+# ====================================
+# 集計・レポート
+# ====================================
+
+def percentile(values: List[float], q: float) -> float:
+    """
+    最近傍法によるパーセンタイル
+
+    Args:
+        values: 昇順に並べた値（空なら0.0）
+        q: パーセンタイル（0-100）
+
+    Returns:
+        q パーセンタイルの値
+    """
+    if not values:
+        return 0.0
+    rank = max(1, math.ceil(q / 100 * len(values)))
+    return values[rank - 1]
+
+
+def _default_cost(usage: UsageRecord) -> float:
+    """helper_llm の料金表（1Kトークンあたり）による費用"""
+    from helper_llm import get_embedding_model_pricing, get_llm_model_pricing
+
+    if usage.operation.startswith("embed"):
+        return usage.input_tokens / 1000 * get_embedding_model_pricing(usage.model)
+    pricing = get_llm_model_pricing(usage.model)
+    return (usage.input_tokens / 1000 * pricing["input"]
+            + usage.output_tokens / 1000 * pricing["output"])
+
+
+def summarize_usage(
+    records: Iterable[UsageRecord],
+    cost_fn: Optional[Callable[[UsageRecord], float]] = None
+) -> Dict[str, Dict[str, Any]]:
+    """
+    モデル別に使用量を集計
+
+    Args:
+        records: UsageRecord の列
+        cost_fn: 1呼び出しの費用（USD）を返す関数（Noneは helper_llm の料金表）
+
+    Returns:
+        {モデル名: {"calls", "errors", "retries", "input_tokens", "output_tokens",
+                    "tokens_per_sec", "latency_p50", "latency_p95", "queue_wait_total",
+                    "cost", "estimated_calls"}}
+        tokens_per_sec は成功した呼び出しの合計トークン数 / 合計レイテンシ
+    """
+    cost_fn = cost_fn or _default_cost
+    grouped: Dict[str, List[UsageRecord]] = {}
+    for usage in records:
+        grouped.setdefault(usage.model, []).append(usage)
+
+    summary: Dict[str, Dict[str, Any]] = {}
+    for model, items in grouped.items():
+        succeeded = [u for u in items if u.success]
+        busy = sum(u.latency for u in succeeded)
+        latencies = sorted(u.latency for u in items)
+        summary[model] = {
+            "calls": len(items),
+            "errors": len(items) - len(succeeded),
+            "retries": sum(u.retries for u in items),
+            "input_tokens": sum(u.input_tokens for u in items),
+            "output_tokens": sum(u.output_tokens for u in items),
+            "tokens_per_sec": sum(u.total_tokens for u in succeeded) / busy if busy > 0 else 0.0,
+            "latency_p50": percentile(latencies, 50),
+            "latency_p95": percentile(latencies, 95),
+            "queue_wait_total": sum(u.queue_wait for u in items),
+            "cost": sum(cost_fn(u) for u in items),
+            "estimated_calls": sum(1 for u in items if u.estimated),
+        }
+    return summary
+
+
+def format_usage_report(summary: Dict[str, Dict[str, Any]], qa_count: Optional[int] = None) -> str:
+    """
+    summarize_usage の結果を表示用の文字列にする
+
+    Args:
+        summary: summarize_usage の戻り値
+        qa_count: 生成したQ/A数（指定すると Q/A あたりの費用を表示）
+    """
+    if not summary:
+        return "API使用量: 記録なし"
+    lines = ["API使用量（モデル別）:"]
+    for model, s in sorted(summary.items()):
+        lines.append(
+            f"  {model}: {s['calls']}回 (エラー {s['errors']}, 再試行 {s['retries']}), "
+            f"入力 {s['input_tokens']:,} / 出力 {s['output_tokens']:,} トークン, "
+            f"{s['tokens_per_sec']:.1f} tokens/s, "
+            f"p50 {s['latency_p50']:.2f}s / p95 {s['latency_p95']:.2f}s, "
+            f"待ち {s['queue_wait_total']:.1f}s, ${s['cost']:.4f}"
+            + (f" (見積もり {s['estimated_calls']}回)" if s["estimated_calls"] else "")
+        )
+    total_cost = sum(s["cost"] for s in summary.values())
+    lines.append(f"  合計費用: ${total_cost:.4f}")
+    if qa_count:
+        lines.append(f"  Q/Aあたり費用: ${total_cost / qa_count:.6f} ({qa_count}件)")
+    return "\n".join(lines)
@@ -81,6 +81,9 @@ def run_qa_generator(
     use_celery: bool = False,
     celery_workers: int = 8,
     coverage_threshold: Optional[float] = None,
+    batch_job: bool = False,
+    input_token_budget: Optional[int] = None,
+    output_token_budget: Optional[int] = None,
     log_callback=None
 ):
     """
@@ -176,6 +179,20 @@ def run_qa_generator(
             timeout_seconds = min(max(len(tasks) * 10, 600), 1800)
             logger.info(f"結果収集タイムアウト: {timeout_seconds}秒（{len(tasks)}タスク）")
             qa_pairs = collect_results(tasks, timeout=timeout_seconds)
+        elif batch_job:
+            logger.info("バッチジョブモード（Gemini Batch API）")
+            qa_pairs = original_script.generate_qa_for_dataset_batch_job(
+                chunks,
+                dataset_type,
+                model,
+                chunk_batch_size=batch_chunks,
+                merge_chunks=merge_chunks,
+                min_tokens=min_tokens,
+                max_tokens=max_tokens,
+                config=config,
+                input_token_budget=input_token_budget,
+                output_token_budget=output_token_budget
+            )
         else:
             logger.info("通常処理モード")
             qa_pairs = original_script.generate_qa_for_dataset(
@@ -186,7 +203,9 @@ def run_qa_generator(
                 merge_chunks=merge_chunks,
                 min_tokens=min_tokens,
                 max_tokens=max_tokens,
-                config=config
+                config=config,
+                input_token_budget=input_token_budget,
+                output_token_budget=output_token_budget
             )
 
         if not qa_pairs:
@@ -16,9 +16,10 @@ import logging
 import socket
 import time
 import traceback
-from typing import Dict, List, Optional, Any, Tuple, Iterable
+from typing import Dict, List, Optional, Any, Tuple, Iterable, Iterator, Union
 from datetime import datetime, timezone
 
+import numpy as np
 import pandas as pd
 import tiktoken
 from qdrant_client import QdrantClient
@@ -27,7 +28,9 @@ from qdrant_client.http.exceptions import UnexpectedResponse
 
 # Gemini 3 Migration: Embedding抽象化レイヤー
 from helper_embedding import (
+    collapse_texts,
     create_embedding_client,
+    expand_embeddings,
     get_embedding_dimensions,
     EmbeddingClient,
     DEFAULT_GEMINI_EMBEDDING_DIMS,
@@ -503,8 +506,11 @@ def embed_query(
 def embed_texts_unified(
     texts: List[str],
     provider: str = None,
-    batch_size: int = 100
-) -> List[List[float]]:
+    batch_size: int = 100,
+    cache_path: Optional[str] = None,
+    as_array: bool = False,
+    **client_kwargs
+) -> Union[List[List[float]], np.ndarray]:
     """
     テキストをEmbeddingに変換（プロバイダー抽象化版）
 
@@ -514,9 +520,14 @@ def embed_texts_unified(
         texts: テキストリスト
         provider: "gemini" or "openai"（Noneの場合はデフォルト）
         batch_size: バッチサイズ
+        cache_path: EmbeddingキャッシュのSQLiteパス（指定時はキャッシュミス分のみAPIへ送信）
+        as_array: Trueの場合はL2正規化済みの float32 行列 (len(texts), dims) で返す
+        **client_kwargs: Embeddingクライアント初期化パラメータ
+            （例: max_concurrency, rpm, tpm）
 
     Returns:
         埋め込みベクトルのリスト（Gemini: 3072次元, OpenAI: 1536次元）
+        空文字列の位置はゼロベクトル。同一テキストは1回だけEmbeddingし、全ての行へ展開する
 
     Example:
         # Gemini Embedding（3072次元）
@@ -526,36 +537,81 @@ def embed_texts_unified(
         vectors = embed_texts_unified(texts, provider="openai")
     """
     provider = provider or DEFAULT_EMBEDDING_PROVIDER
-    embedding_client = create_embedding_client(provider=provider)
+    embedding_client = create_embedding_client(provider=provider, **client_kwargs)
+    if cache_path:
+        from helper_embedding_cache import CachedEmbeddingClient
+        embedding_client = CachedEmbeddingClient(embedding_client, cache_path=cache_path)
 
-    # 空文字列・空白のみの文字列を除外して処理
-    valid_texts = []
-    valid_indices = []
-    for i, text in enumerate(texts):
-        if text and text.strip():
-            valid_texts.append(text)
-            valid_indices.append(i)
+    # 空文字列・空白のみを除外し、同一テキストは1回だけ送信する
+    unique_texts, inverse = collapse_texts(texts)
 
-    if not valid_texts:
+    if not unique_texts:
         logger.warning("全てのテキストが空文字列です。ダミーベクトルを返します。")
         dims = get_embedding_dimensions(provider)
+        if as_array:
+            return np.zeros((len(texts), dims), dtype=np.float32)
         return [[0.0] * dims] * len(texts)
 
-    # 抽象化レイヤーを使用してEmbedding生成
-    valid_vecs = embedding_client.embed_texts(valid_texts, batch_size=batch_size)
+    if len(unique_texts) < len(texts):
+        logger.info(f"[Embedding] 重複・空文字列を除外: {len(texts)}行 → {len(unique_texts)}件")
+
+    if as_array:
+        # L2正規化済み float32 行列で取得（空文字列の行は展開時にゼロ）
+        unique_vecs = embedding_client.embed_texts_array(unique_texts, batch_size=batch_size)
+    else:
+        # 抽象化レイヤーを使用してEmbedding生成（複数テキストを1リクエストにまとめる）
+        unique_vecs = embedding_client.embed_texts_batch(unique_texts, batch_size=batch_size)
 
     # 元のインデックスに合わせてベクトルを再配置
+    return expand_embeddings(unique_vecs, inverse, embedding_client.dimensions)
+
+
+def embed_texts_unified_iter(
+    texts: List[str],
+    provider: str = None,
+    batch_size: int = 256,
+    cache_path: Optional[str] = None,
+    **client_kwargs
+) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """
+    テキストをEmbeddingに変換し、完了したバッチから順に返す（embed_texts_unified のストリーミング版）
+
+    重複・空文字列の扱いは embed_texts_unified と同じ（ユニークテキストのみ送信し、
+    同一テキストの全行へ展開、空文字列の行はゼロベクトル）。
+    全行分の行列を作らないため、ポイント構築・upsertと並行して処理できる。
+
+    Args:
+        texts: テキストリスト
+        provider: "gemini" / "openai" / "local"（Noneの場合はデフォルト）
+        batch_size: 1回に返すユニークテキスト数
+        cache_path: EmbeddingキャッシュのSQLiteパス
+        **client_kwargs: Embeddingクライアント初期化パラメータ
+
+    Yields:
+        (行インデックスの配列, (len(rows), dims) のL2正規化済み float32 行列)
+    """
+    provider = provider or DEFAULT_EMBEDDING_PROVIDER
+    embedding_client = create_embedding_client(provider=provider, **client_kwargs)
+    if cache_path:
+        from helper_embedding_cache import CachedEmbeddingClient
+        embedding_client = CachedEmbeddingClient(embedding_client, cache_path=cache_path)
+
+    unique_texts, inverse = collapse_texts(texts)
     dims = embedding_client.dimensions
-    vecs: List[List[float]] = []
-    valid_vec_idx = 0
-    for i in range(len(texts)):
-        if i in valid_indices:
-            vecs.append(valid_vecs[valid_vec_idx])
-            valid_vec_idx += 1
-        else:
-            vecs.append([0.0] * dims)
 
-    return vecs
+    # 空文字列の行は先にゼロベクトルで返す
+    empty_rows = np.flatnonzero(inverse < 0)
+    if len(empty_rows):
+        yield empty_rows, np.zeros((len(empty_rows), dims), dtype=np.float32)
+
+    # スロット → 行の対応（スロット順に並べた行インデックスと各スロットの範囲）
+    order = np.argsort(inverse, kind="stable")[len(empty_rows):]
+    bounds = np.searchsorted(inverse[order], np.arange(len(unique_texts) + 1))
+
+    for slots, matrix in embedding_client.embed_iter(unique_texts, batch_size=batch_size):
+        counts = bounds[slots + 1] - bounds[slots]
+        rows = np.concatenate([order[bounds[slot]:bounds[slot + 1]] for slot in slots])
+        yield rows, np.repeat(matrix, counts, axis=0)
 
 
 def embed_query_unified(
@@ -640,7 +696,7 @@ def get_provider_vector_size(provider: str = None) -> int:
 
 def build_points(
     df: pd.DataFrame,
-    vectors: List[List[float]],
+    vectors: Union[List[List[float]], np.ndarray],
     domain: str,
     source_file: str
 ) -> List[models.PointStruct]:
@@ -649,40 +705,103 @@ def build_points(
 
     Args:
         df: DataFrame
-        vectors: 埋め込みベクトル
+        vectors: 埋め込みベクトル（リスト または (n, dims) 行列）
         domain: ドメイン名
         source_file: ソースファイル名
 
     Returns:
         PointStructのリスト
     """
+    return list(iter_points(df, vectors, domain, source_file))
+
+
+def iter_points(
+    df: pd.DataFrame,
+    vectors: Union[List[List[float]], np.ndarray],
+    domain: str,
+    source_file: str
+) -> Iterator[models.PointStruct]:
+    """
+    Qdrantポイントを1件ずつ生成（upsert_pointsに渡すとバッチ分だけ保持して送信できる）
+
+    Args:
+        df: DataFrame
+        vectors: 埋め込みベクトル（リスト または (n, dims) 行列）
+        domain: ドメイン名
+        source_file: ソースファイル名
+
+    Yields:
+        PointStruct
+    """
     n = len(df)
     if len(vectors) != n:
         raise ValueError(f"vectors length mismatch: df={n}, vecs={len(vectors)}")
 
     now_iso = datetime.now(timezone.utc).isoformat()
-    points: List[models.PointStruct] = []
+    is_matrix = isinstance(vectors, np.ndarray)
 
     for i, row in enumerate(df.itertuples(index=False)):
-        payload = {
-            "domain": domain,
-            "question": getattr(row, "question"),
-            "answer": getattr(row, "answer"),
-            "source": os.path.basename(source_file),
-            "created_at": now_iso,
-            "schema": "qa:v1",
-        }
+        vector = vectors[i].tolist() if is_matrix else vectors[i]
+        yield _make_point(i, getattr(row, "question"), getattr(row, "answer"), vector,
+                          domain, source_file, now_iso)
+
+
+def iter_points_stream(
+    df: pd.DataFrame,
+    batches: Iterable[Tuple[np.ndarray, np.ndarray]],
+    domain: str,
+    source_file: str
+) -> Iterator[models.PointStruct]:
+    """
+    embed_texts_unified_iter のバッチからQdrantポイントを生成（完了したバッチから順に）
+
+    ポイントIDは行番号から決まるため、バッチの到着順に依存しない。
 
-        pid = abs(hash(f"{domain}-{source_file}-{i}")) & 0x7FFFFFFFFFFFFFFF
-        points.append(models.PointStruct(id=pid, vector=vectors[i], payload=payload))
+    Args:
+        df: DataFrame
+        batches: (行インデックスの配列, ベクトル行列) のイテラブル
+        domain: ドメイン名
+        source_file: ソースファイル名
+
+    Yields:
+        PointStruct
+    """
+    now_iso = datetime.now(timezone.utc).isoformat()
+    questions = df["question"].tolist()
+    answers = df["answer"].tolist()
+
+    for rows, matrix in batches:
+        for i, vector in zip(rows.tolist(), matrix):
+            yield _make_point(i, questions[i], answers[i], vector.tolist(), domain, source_file, now_iso)
+
+
+def _make_point(
+    i: int,
+    question: Any,
+    answer: Any,
+    vector: List[float],
+    domain: str,
+    source_file: str,
+    now_iso: str
+) -> models.PointStruct:
+    """行番号・質問・回答・ベクトルからPointStructを作成"""
+    payload = {
+        "domain": domain,
+        "question": question,
+        "answer": answer,
+        "source": os.path.basename(source_file),
+        "created_at": now_iso,
+        "schema": "qa:v1",
+    }
 
-    return points
+    pid = abs(hash(f"{domain}-{source_file}-{i}")) & 0x7FFFFFFFFFFFFFFF
+    return models.PointStruct(id=pid, vector=vector, payload=payload)
 
 
 def upsert_points(
     client: QdrantClient,
     collection: str,
-    points: List[models.PointStruct],
+    points: Iterable[models.PointStruct],
     batch_size: int = 128,
 ) -> int:
     """
@@ -691,7 +810,7 @@ def upsert_points(
     Args:
         client: Qdrantクライアント
         collection: コレクション名
-        points: ポイントリスト
+        points: ポイントリスト（iter_pointsのイテレータも可）
         batch_size: バッチサイズ
 
     Returns:
@@ -1001,12 +1120,15 @@ __all__ = [
 
     # Gemini 3 Migration: 埋め込み（抽象化版）
     "embed_texts_unified",
+    "embed_texts_unified_iter",
     "embed_query_unified",
     "create_collection_for_provider",
     "get_provider_vector_size",
 
     # ポイント操作
     "build_points",
+    "iter_points",
+    "iter_points_stream",
     "upsert_points",
 
     # データ取得
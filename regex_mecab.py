@@ -1,11 +1,99 @@
 # python sample_regex_mecab.py
 # MeCab複合名詞版と正規表現版を統合したロバストなキーワード抽出システム
 
+import os
 import re
+import threading
+from functools import lru_cache
 from typing import List, Dict, Tuple
 from collections import Counter
 
 
+# ====================================
+# MeCab Tagger の共有（スレッドローカル）
+# ====================================
+
+# MeCab.Tagger の生成は辞書の読み込みを伴い重いが、1つの Tagger を複数スレッドで
+# 同時に使うことはできない。そこでスレッド（とプロセス）ごとに引数別の Tagger を
+# 1つだけ作って使い回す。
+_tagger_local = threading.local()
+
+# 文末とみなす形態素（表層形）
+SENTENCE_END_SURFACES = frozenset(['。', '．', '？', '！', '?', '!'])
+# MeCab が使えない場合の文分割（文末記号・改行を文に含める）
+_SENTENCE_FALLBACK_PATTERN = re.compile(r'[^。．？！?!\n]*(?:[。．？！?!]|\n|$)')
+
+
+def get_mecab_tagger(args: str = ""):
+    """
+    呼び出し元スレッド専用の MeCab.Tagger を返す（スレッド・引数ごとに1回だけ生成）
+
+    fork 後の子プロセスでは親から引き継いだ Tagger を使わずに作り直す。
+
+    Args:
+        args: MeCab.Tagger の引数（例: "-Owakati"）
+
+    Raises:
+        ImportError: MeCab 未インストール
+        RuntimeError: 辞書が見つからない等で Tagger を生成できない
+    """
+    taggers = getattr(_tagger_local, "taggers", None)
+    if taggers is None or _tagger_local.pid != os.getpid():
+        taggers = _tagger_local.taggers = {}
+        _tagger_local.pid = os.getpid()
+    tagger = taggers.get(args)
+    if tagger is None:
+        import MeCab
+        tagger = taggers[args] = MeCab.Tagger(args) if args else MeCab.Tagger()
+    return tagger
+
+
+@lru_cache(maxsize=None)
+def is_mecab_available() -> bool:
+    """MeCabの利用可能性をチェック（結果はプロセス内でキャッシュ）"""
+    try:
+        get_mecab_tagger().parse("テスト")
+        return True
+    except (ImportError, RuntimeError):
+        return False
+
+
+def split_japanese_sentences(text: str) -> List[str]:
+    """
+    日本語テキストを文に分割（文末記号・改行は直前の文に含め、元のテキストを変えない）
+
+    MeCabが利用可能なら形態素の表層形で文末を判定し、利用不可なら正規表現で分割する。
+    """
+    sentences = []
+    for line in text.splitlines(keepends=True):
+        if is_mecab_available():
+            sentences.extend(_split_line_mecab(line))
+        else:
+            sentences.extend(s for s in _SENTENCE_FALLBACK_PATTERN.findall(line) if s)
+    return sentences
+
+
+def _split_line_mecab(line: str) -> List[str]:
+    """1行を MeCab の形態素で文に分割（表層形の位置を元の行から辿る）"""
+    sentences = []
+    start = pos = 0
+    node = get_mecab_tagger().parseToNode(line)
+    while node:
+        surface = node.surface
+        if surface:
+            found = line.find(surface, pos)
+            if found < 0:
+                break
+            pos = found + len(surface)
+            if surface in SENTENCE_END_SURFACES:
+                sentences.append(line[start:pos])
+                start = pos
+        node = node.next
+    if line[start:]:
+        sentences.append(line[start:])
+    return sentences
+
+
 class KeywordExtractor:
     """
     MeCabと正規表現を統合したキーワード抽出クラス
@@ -45,14 +133,7 @@ class KeywordExtractor:
 
     def _check_mecab_availability(self) -> bool:
         """MeCabの利用可能性をチェック"""
-        try:
-            import MeCab
-            # 実際にインスタンス化して動作確認
-            tagger = MeCab.Tagger()
-            tagger.parse("テスト")
-            return True
-        except (ImportError, RuntimeError):
-            return False
+        return is_mecab_available()
 
     def extract(self, text: str, top_n: int = 5,
                 use_scoring: bool = True) -> List[str]:
@@ -81,10 +162,7 @@ class KeywordExtractor:
     def _extract_with_mecab(self, text: str, top_n: int,
                            use_scoring: bool) -> List[str]:
         """MeCabを使用した複合名詞抽出"""
-        import MeCab
-
-        tagger = MeCab.Tagger()
-        node = tagger.parseToNode(text)
+        node = get_mecab_tagger().parseToNode(text)
 
         # 複合名詞の抽出
         compound_buffer = []
@@ -23,7 +23,12 @@ from typing import Dict, List, Any, Optional, Tuple, Iterable
 
 import pandas as pd
 import tiktoken
-from helper_embedding import create_embedding_client, get_embedding_dimensions
+from helper_embedding import (
+    collapse_texts,
+    create_embedding_client,
+    expand_embeddings,
+    get_embedding_dimensions,
+)
 from qdrant_client import QdrantClient
 from qdrant_client.http import models
 from qdrant_client.http.exceptions import UnexpectedResponse
@@ -474,32 +479,18 @@ def embed_texts_for_qdrant(
     embedding_client = create_embedding_client(provider="gemini")
     dims = get_embedding_dimensions("gemini")  # 3072
 
-    # 空文字列・空白のみの文字列を除外
-    valid_texts = []
-    valid_indices = []
-    for i, text in enumerate(texts):
-        if text and text.strip():
-            valid_texts.append(text)
-            valid_indices.append(i)
+    # 空文字列・空白のみを除外し、同一テキストは1回だけ送信する
+    unique_texts, inverse = collapse_texts(texts)
 
-    if not valid_texts:
+    if not unique_texts:
         logger.warning("全てのテキストが空文字列です。ダミーベクトルを返します。")
         return [[0.0] * dims] * len(texts)
 
     # Gemini Embeddingでバッチ処理
-    valid_vecs = embedding_client.embed_texts(valid_texts, batch_size=batch_size)
+    unique_vecs = embedding_client.embed_texts(unique_texts, batch_size=batch_size)
 
     # 元のインデックスに合わせてベクトルを再配置
-    vecs: List[List[float]] = []
-    valid_vec_idx = 0
-    for i in range(len(texts)):
-        if i in valid_indices:
-            vecs.append(valid_vecs[valid_vec_idx])
-            valid_vec_idx += 1
-        else:
-            vecs.append([0.0] * dims)
-
-    return vecs
+    return expand_embeddings(unique_vecs, inverse, dims)
 
 
 def create_or_recreate_collection_for_qdrant(
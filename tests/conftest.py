@@ -26,6 +26,12 @@ def temp_dir():
         yield Path(tmpdir)
 
 
+@pytest.fixture
+def cache_path(tmp_path):
+    """永続キャッシュ（SQLite）のパス（親ディレクトリは未作成）"""
+    return str(tmp_path / "cache" / "cache.sqlite")
+
+
 @pytest.fixture
 def sample_qa_df():
     """サンプルQ/AデータのDataFrame"""
@@ -0,0 +1,39 @@
+"""
+テスト共通ヘルパー
+
+複数のテストモジュールで使う擬似クロック・擬似API例外・バッチジョブクライアント。
+"""
+
+from typing import List
+
+from helper_llm_batch import BatchJobClient
+
+
+class FakeClock:
+    """sleepで時間が進む擬似クロック（now を直接進めてもよい）"""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps: List[float] = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class FakeAPIError(Exception):
+    """status_code を持つSDK例外の代用"""
+
+    def __init__(self, message: str, status_code: int = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def make_job_client(backend, tmp_path, **kwargs):
+    """擬似クロックで待機する BatchJobClient（tmp_path/jobs を作業ディレクトリにする）"""
+    clock = FakeClock()
+    client = BatchJobClient(backend, workdir=str(tmp_path / "jobs"), sleep=clock.sleep, clock=clock, **kwargs)
+    return client, clock
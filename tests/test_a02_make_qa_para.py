@@ -0,0 +1,287 @@
+"""
+a02_make_qa_para.py 単体テスト
+
+テスト実行:
+    pytest tests/test_a02_make_qa_para.py -v
+"""
+
+import pytest
+import json
+import os
+
+# テスト対象
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+a02 = pytest.importorskip("a02_make_qa_para")
+import pandas as pd
+
+from helper_llm_batch import LocalBatchBackend
+from helper_model_router import ModelRouter
+from tests.helpers import make_job_client
+
+CONFIG = {"text_column": "Combined_Text", "title_column": "title", "chunk_size": 200, "lang": "ja"}
+
+
+def fake_semantic_chunks(text, lang="ja", max_tokens=200, chunk_id_prefix="chunk"):
+    """句点で区切るだけのチャンク分割（ネットワーク不要）"""
+    if "エラー" in text:
+        raise RuntimeError("broken document")
+    sentences = [s + "。" for s in text.split("。") if s]
+    return [{"id": f"{chunk_id_prefix}_{i}", "text": s, "tokens": len(s)} for i, s in enumerate(sentences)]
+
+
+@pytest.fixture
+def offline_chunking(monkeypatch):
+    # fork したワーカーにも置き換えが引き継がれる
+    monkeypatch.setattr(a02, "create_semantic_chunks", fake_semantic_chunks)
+    monkeypatch.setattr(a02, "_init_chunk_worker", lambda: None)
+
+
+def make_df(n):
+    return pd.DataFrame({
+        "Combined_Text": [f"文書{i}の一文目。文書{i}の二文目。" if i != 3 else "エラー" for i in range(n)],
+        "title": [f"タイトル{i}" if i % 2 else None for i in range(n)],
+    }, index=range(100, 100 + n))
+
+
+# ====================================
+# create_document_chunks テスト
+# ====================================
+
+class TestCreateDocumentChunks:
+    """create_document_chunks のテスト"""
+
+    def test_metadata_and_doc_order(self, offline_chunking):
+        chunks = a02.create_document_chunks(make_df(5), "livedoor", config=CONFIG)
+        assert [c["doc_idx"] for c in chunks] == [100, 100, 101, 101, 102, 102, 104, 104]
+        assert chunks[2]["doc_id"] == "livedoor_101_タイトル1"
+        assert chunks[0]["doc_id"] == "livedoor_100"
+        assert [c["chunk_idx"] for c in chunks[:2]] == [0, 1]
+        assert chunks[1]["id"] == "livedoor_100_chunk_1"
+
+    def test_process_pool_matches_sequential(self, offline_chunking):
+        """ワーカープロセスで分割しても文書順・内容は逐次と同じ"""
+        df = make_df(60)
+        sequential = a02.create_document_chunks(df, "livedoor", config=CONFIG)
+        parallel = a02.create_document_chunks(df, "livedoor", config=CONFIG, chunk_workers=3)
+        assert parallel == sequential
+        assert len(parallel) == 59 * 2
+
+    def test_max_docs(self, offline_chunking):
+        chunks = a02.create_document_chunks(make_df(10), "livedoor", max_docs=2, config=CONFIG, chunk_workers=4)
+        assert {c["doc_idx"] for c in chunks} == {100, 101}
+
+    def test_chunker_created_once(self, monkeypatch):
+        """チャンク分割用の SemanticChunker はプロセス内で1回だけ生成"""
+        import helper_rag_qa
+        created = []
+        monkeypatch.setattr(helper_rag_qa, "SemanticChunker", lambda **kwargs: created.append(kwargs) or object())
+        monkeypatch.setattr(a02, "_chunker", None)
+        assert a02._get_chunker() is a02._get_chunker()
+        assert len(created) == 1
+
+
+# ====================================
+# _generate_batch_with_fallback テスト
+# ====================================
+
+class TestGenerateBatchWithFallback:
+    """_generate_batch_with_fallback のテスト"""
+
+    def test_fallback_keeps_output_budget(self, monkeypatch):
+        """バッチが最終試行まで失敗しても、チャンク単位のフォールバックに出力トークン上限を渡す"""
+        def failing_batch(*args, **kwargs):
+            raise RuntimeError("batch failed")
+
+        calls = []
+        monkeypatch.setattr(a02, "generate_qa_pairs_for_batch", failing_batch)
+        monkeypatch.setattr(a02, "generate_qa_pairs_for_chunk",
+                            lambda chunk, *args, **kwargs: calls.append(kwargs) or [{"question": chunk["id"]}])
+        monkeypatch.setattr(a02.time, "sleep", lambda seconds: None)
+
+        batch = [{"id": "c1", "text": "a"}, {"id": "c2", "text": "b"}]
+        pairs = a02._generate_batch_with_fallback(batch, 1, {}, "model", None, max_retries=2,
+                                                  truncate=False, max_output_tokens=4000)
+
+        assert [p["question"] for p in pairs] == ["c1", "c2"]
+        assert calls == [{"truncate": False, "max_output_tokens": 4000}] * 2
+
+
+# ====================================
+# apply_chunk_prefilter テスト
+# ====================================
+
+class FakePrefilter:
+    """text が "skip" のチャンクを低情報とみなすプレフィルタ"""
+    threshold = 0.3
+
+    def split(self, chunks, lang):
+        return [c for c in chunks if c["text"] != "skip"], [c for c in chunks if c["text"] == "skip"]
+
+
+class TestApplyChunkPrefilter:
+    """apply_chunk_prefilter のテスト"""
+
+    @pytest.fixture(autouse=True)
+    def no_replanning(self, monkeypatch):
+        def plan_qa_batches(*args, **kwargs):
+            raise AssertionError("plan_qa_batches called")
+
+        monkeypatch.setattr(a02, "plan_qa_batches", plan_qa_batches)
+
+    @staticmethod
+    def chunks(texts):
+        return [{"id": f"c{i}", "text": text, "tokens": 100} for i, text in enumerate(texts)]
+
+    def test_saved_calls_by_batch_size(self, caplog):
+        """予算なし: バッチサイズから削減数を計算（全チャンクを計画し直さない）"""
+        chunks = self.chunks(["a", "skip", "b", "skip", "skip", "c", "d"])
+        with caplog.at_level("INFO", logger=a02.logger.name):
+            kept, template_pairs = a02.apply_chunk_prefilter(chunks, {"lang": "ja"}, FakePrefilter(), chunk_batch_size=3)
+        assert [c["id"] for c in kept] == ["c0", "c2", "c5", "c6"]
+        assert template_pairs == []
+        assert "削減したAPI呼び出し 約1回" in caplog.text
+
+    def test_saved_calls_by_token_budget(self, caplog, monkeypatch):
+        """予算あり: スキップしたチャンクの入出力トークンを予算で割る"""
+        monkeypatch.setattr(a02, "determine_qa_count", lambda chunk, config: 2)
+        chunks = self.chunks(["skip"] * 5 + ["a"])
+        with caplog.at_level("INFO", logger=a02.logger.name):
+            a02.apply_chunk_prefilter(chunks, {"lang": "ja"}, FakePrefilter(),
+                                      input_token_budget=200, output_token_budget=100000)
+        assert "削減したAPI呼び出し 約3回" in caplog.text
+
+
+# ====================================
+# a02 ルーティング連携テスト
+# ====================================
+
+class TestGenerateQAForDatasetRouted:
+    """a02_make_qa_para.generate_qa_for_dataset(router=...) のテスト"""
+
+    class RecordingClient:
+        def __init__(self):
+            self.models = []
+
+        def generate_structured(self, prompt, response_schema, model=None, **kwargs):
+            self.models.append(model)
+            return response_schema.model_validate_json(json.dumps({"qa_pairs": [
+                {"question": f"{model}-q{i}", "answer": "a", "question_type": "fact"} for i in range(3)
+            ]}))
+
+    @staticmethod
+    def fake_complexity(levels):
+        """テキスト→complexity_level の対応で analyze_chunk_complexity を置き換える"""
+        return lambda text, lang="ja": {"complexity_level": levels[text], "token_count": len(text)}
+
+    def test_chunks_use_route_model_and_keep_chunk_order(self, monkeypatch):
+        texts = ["今日は晴れです。", "量子ビットの誤り訂正符号。", "明日は雨です。"]
+        monkeypatch.setattr(a02, "analyze_chunk_complexity",
+                            self.fake_complexity(dict(zip(texts, ["low", "high", "low"]))))
+        chunks = [
+            {"id": f"c{i}", "text": text, "doc_id": "d", "dataset_type": "wikipedia_ja", "chunk_idx": i}
+            for i, text in enumerate(texts)
+        ]
+        client = self.RecordingClient()
+        router = ModelRouter(fast_model="fast-m", standard_model="std-m", strong_model="strong-m")
+
+        qa_pairs = a02.generate_qa_for_dataset(
+            chunks, "wikipedia_ja", chunk_batch_size=1, merge_chunks=False, client=client, router=router
+        )
+
+        assert sorted(client.models) == ["fast-m", "fast-m", "strong-m"]
+        assert [qa["source_chunk_id"] for qa in qa_pairs] == ["c0"] * 3 + ["c1"] * 3 + ["c2"] * 3
+        assert qa_pairs[3]["question"].startswith("strong-m")
+
+    def test_rule_route_falls_back_to_fast_model(self, monkeypatch):
+        """ルールベースで足りないチャンクは最速モデルで生成する"""
+        texts = ["機械学習とは、データから規則を学ぶ手法である。深層学習とは、多層の仕組みである。", "今日は晴れです。"]
+        monkeypatch.setattr(a02, "analyze_chunk_complexity", self.fake_complexity(dict.fromkeys(texts, "low")))
+        chunks = [
+            {"id": f"c{i}", "text": text, "doc_id": "d", "dataset_type": "wikipedia_ja", "chunk_idx": i}
+            for i, text in enumerate(texts)
+        ]
+        client = self.RecordingClient()
+        router = ModelRouter(fast_model="fast-m", rule_max_tokens=200)
+
+        qa_pairs = a02.generate_qa_for_dataset(
+            chunks, "wikipedia_ja", chunk_batch_size=1, merge_chunks=False, client=client, router=router
+        )
+
+        assert client.models == ["fast-m"]
+        assert [qa["question"] for qa in qa_pairs if qa["source_chunk_id"] == "c0"][0] == "機械学習とは何ですか？"
+        assert router.report()["rule"]["fallbacks"] == 1
+
+
+# ====================================
+# a02 バッチジョブモード テスト
+# ====================================
+
+class TestGenerateQAForDatasetBatchJob:
+    """a02_make_qa_para.generate_qa_for_dataset_batch_job のテスト"""
+
+    @staticmethod
+    def make_chunks(n):
+        return [
+            {"id": f"doc_{i}_chunk_0", "text": f"テキスト{i}の内容です。" * 20, "tokens": 200,
+             "doc_id": f"doc_{i}", "dataset_type": "wikipedia_ja", "chunk_idx": 0}
+            for i in range(n)
+        ]
+
+    @staticmethod
+    def qa_json(count, tag):
+        return json.dumps({"qa_pairs": [
+            {"question": f"{tag}-q{i}", "answer": f"{tag}-a{i}", "question_type": "fact"} for i in range(count)
+        ]})
+
+    def test_results_are_distributed_in_batch_order(self, tmp_path):
+        """結果を通常処理と同じ分配でバッチ順に連結する"""
+        chunks = self.make_chunks(5)
+        config = a02.DATASET_CONFIGS["wikipedia_ja"]
+        backend = LocalBatchBackend(lambda prompt, generation_config: self.qa_json(20, "x"))
+        job_client, _ = make_job_client(backend, tmp_path)
+
+        qa_pairs = a02.generate_qa_for_dataset_batch_job(
+            chunks, "wikipedia_ja", chunk_batch_size=2, merge_chunks=False,
+            config=config, job_client=job_client, client=object()
+        )
+
+        expected = [a02.determine_qa_count(chunk, config) for chunk in chunks]
+        # 3リクエスト（2+2+1チャンク）、単一チャンクのバッチは生成された全ペアを割り当てる
+        assert len(qa_pairs) == sum(expected[:4]) + 20
+        assert [qa["source_chunk_id"] for qa in qa_pairs[:expected[0]]] == ["doc_0_chunk_0"] * expected[0]
+        assert qa_pairs[-1]["source_chunk_id"] == "doc_4_chunk_0"
+        with open(backend.submitted[0], encoding="utf-8") as f:
+            records = [json.loads(line) for line in f]
+        assert len(records) == 3
+        assert records[0]["request"]["generation_config"]["response_mime_type"] == "application/json"
+
+    def test_failed_batches_fall_back_to_online_generation(self, tmp_path):
+        """失敗・解析不能なバッチだけ通常APIでチャンク単位に再生成する"""
+        from models import QAPairsResponse
+
+        def handler(prompt, generation_config):
+            if "テキスト1の内容" in prompt:
+                raise RuntimeError("safety")
+            if "テキスト2の内容" in prompt:
+                return "not json"
+            return self.qa_json(10, "batch")
+
+        class OnlineClient:
+            def __init__(self):
+                self.calls = 0
+
+            def generate_structured(self, prompt, response_schema, model=None, **kwargs):
+                self.calls += 1
+                return QAPairsResponse.model_validate_json(TestGenerateQAForDatasetBatchJob.qa_json(1, "online"))
+
+        online = OnlineClient()
+        job_client, _ = make_job_client(LocalBatchBackend(handler), tmp_path)
+        qa_pairs = a02.generate_qa_for_dataset_batch_job(
+            self.make_chunks(3), "wikipedia_ja", chunk_batch_size=1, merge_chunks=False,
+            job_client=job_client, client=online
+        )
+
+        assert online.calls == 2
+        assert [qa["question"].split("-")[0] for qa in qa_pairs] == ["batch"] * 10 + ["online", "online"]
@@ -0,0 +1,134 @@
+"""
+celery_tasks.py 単体テスト
+
+テスト実行:
+    pytest tests/test_celery_tasks.py -v
+"""
+
+import pytest
+import json
+import logging
+import os
+from types import SimpleNamespace
+
+# テスト対象
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+celery_tasks = pytest.importorskip("celery_tasks")
+from models import QAPairsResponse
+
+
+QA_JSON = json.dumps({"qa_pairs": [{"question": "q", "answer": "a", "question_type": "fact"}]})
+
+
+class NoIntrospection(SimpleNamespace):
+    """dir() されると失敗するレスポンス（高速経路で構造を列挙しないことの確認用）"""
+
+    def __dir__(self):
+        raise AssertionError("dir() called")
+
+
+def message(*content):
+    return SimpleNamespace(type="message", content=list(content))
+
+
+# ====================================
+# _extract_parsed_response テスト
+# ====================================
+
+class TestExtractParsedResponse:
+    """_extract_parsed_response のテスト"""
+
+    def test_output_parsed_fast_path(self):
+        parsed = QAPairsResponse.model_validate_json(QA_JSON)
+        response = NoIntrospection(output_parsed=parsed, output=None)
+        assert celery_tasks._extract_parsed_response(response, "gpt-5-mini") is parsed
+
+    def test_parsed_item_in_output(self):
+        """reasoning をスキップし、output_text の parsed を返す（テキストは解析しない）"""
+        parsed = QAPairsResponse.model_validate_json(QA_JSON)
+        response = NoIntrospection(output_parsed=None, output=[
+            SimpleNamespace(type="reasoning"),
+            message(SimpleNamespace(type="output_text", parsed=parsed, text="not json")),
+        ])
+        assert celery_tasks._extract_parsed_response(response, "gpt-4o") is parsed
+
+    def test_parsed_in_later_item_wins_over_earlier_text(self):
+        parsed = QAPairsResponse.model_validate_json(QA_JSON)
+        response = NoIntrospection(output_parsed=None, output=[
+            message(SimpleNamespace(type="output_text", parsed=None, text=QA_JSON.replace('"q"', '"text"'))),
+            message(SimpleNamespace(type="output_text", parsed=parsed, text=None)),
+        ])
+        assert celery_tasks._extract_parsed_response(response, "gpt-4o") is parsed
+
+    def test_text_json_fallback(self):
+        response = NoIntrospection(output_parsed=None, output=[
+            message(SimpleNamespace(type="output_text", parsed=None, text="{broken"),
+                    SimpleNamespace(type="output_text", parsed=None, text=QA_JSON)),
+        ])
+        result = celery_tasks._extract_parsed_response(response, "gpt-4o")
+        assert result.qa_pairs[0].question == "q"
+
+    def test_output_text_fallback(self):
+        response = NoIntrospection(output_parsed=None, output=[], output_text=QA_JSON)
+        assert len(celery_tasks._extract_parsed_response(response, "gpt-4o").qa_pairs) == 1
+
+    def test_unparsable_response_raises(self):
+        response = NoIntrospection(output_parsed=None, output=[
+            message(SimpleNamespace(type="output_text", parsed=None, text='{"other": 1}'))
+        ], output_text=None)
+        with pytest.raises(ValueError):
+            celery_tasks._extract_parsed_response(response, "gpt-4o")
+
+    def test_no_info_logging_per_call(self, caplog):
+        """成功時は INFO 以上のログを出さない"""
+        parsed = QAPairsResponse.model_validate_json(QA_JSON)
+        response = NoIntrospection(output_parsed=None, output=[
+            message(SimpleNamespace(type="output_text", parsed=parsed, text="x" * 10_000))
+        ])
+        with caplog.at_level(logging.INFO, logger=celery_tasks.logger.name):
+            celery_tasks._extract_parsed_response(response, "gpt-4o")
+        assert caplog.records == []
+
+    def test_debug_introspection_is_sampled(self, caplog, monkeypatch):
+        """DEBUG 有効時もレスポンス構造のログは N 回に1回だけ"""
+        monkeypatch.setattr(celery_tasks, "DEFAULT_RESPONSE_DEBUG_EVERY", 5)
+        monkeypatch.setattr(celery_tasks, "_response_debug_counter", iter(range(10**6)))
+        parsed = QAPairsResponse.model_validate_json(QA_JSON)
+        response = NoIntrospection(output_parsed=None, output=[
+            message(SimpleNamespace(type="output_text", parsed=parsed, text=None))
+        ])
+        with caplog.at_level(logging.DEBUG, logger=celery_tasks.logger.name):
+            for _ in range(10):
+                celery_tasks._extract_parsed_response(response, "gpt-4o")
+        assert len(caplog.records) == 2
+
+
+# ====================================
+# ワーカー初期化テスト
+# ====================================
+
+class TestWorkerPoolSize:
+    """APIキープールの予算分割に使うプロセス数のテスト"""
+
+    @pytest.fixture(autouse=True)
+    def reset_pool_size(self, monkeypatch):
+        monkeypatch.setattr(celery_tasks, "_worker_pool_processes", None)
+        monkeypatch.setattr(celery_tasks, "get_llm_client", lambda **kwargs: None)
+        monkeypatch.delenv("API_KEY_POOL_PROCESSES", raising=False)
+        self.processes = []
+        monkeypatch.setattr(celery_tasks, "set_api_key_pool_processes", self.processes.append)
+
+    def test_uses_cli_concurrency(self):
+        """--concurrency で起動した実際のプールサイズで割る（CeleryConfig の値ではない）"""
+        celery_tasks.record_worker_pool_size(sender=SimpleNamespace(concurrency=16))
+        celery_tasks.init_worker_llm_client()
+        assert self.processes == [16]
+
+    def test_env_overrides_pool_size(self, monkeypatch):
+        """API_KEY_POOL_PROCESSES の指定を優先する"""
+        monkeypatch.setenv("API_KEY_POOL_PROCESSES", "3")
+        celery_tasks.record_worker_pool_size(sender=SimpleNamespace(concurrency=16))
+        celery_tasks.init_worker_llm_client()
+        assert self.processes == [3]
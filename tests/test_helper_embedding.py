@@ -21,12 +21,43 @@ from helper_embedding import (
     EmbeddingClient,
     OpenAIEmbedding,
     GeminiEmbedding,
+    AsyncGeminiEmbedding,
+    AsyncOpenAIEmbedding,
+    clear_sdk_clients,
+    create_async_embedding_client,
     create_embedding_client,
     get_default_embedding_client,
     get_embedding_dimensions,
     DEFAULT_GEMINI_EMBEDDING_DIMS,
     DEFAULT_OPENAI_EMBEDDING_DIMS,
 )
+from helper_rate_limit import clear_concurrency_controllers
+
+
+@pytest.fixture(autouse=True)
+def reset_sdk_clients():
+    """テストごとにモックしたSDKクライアントが共有されないようレジストリを初期化"""
+    clear_sdk_clients()
+    yield
+    clear_sdk_clients()
+
+
+@pytest.fixture(autouse=True)
+def reset_concurrency_controllers():
+    """共有の同時実行数コントローラー（429で縮小した上限）をテスト間で持ち越さない"""
+    clear_concurrency_controllers()
+    yield
+    clear_concurrency_controllers()
+
+
+@pytest.fixture(autouse=True)
+def char_token_counts(monkeypatch):
+    """トークン数を文字数で数える（tiktokenの有無・ネットワークに依存させない）"""
+    import helper_embedding
+    monkeypatch.setattr(helper_embedding, "_get_token_encoding", lambda: None)
+    helper_embedding.count_embedding_tokens.cache_clear()
+    yield
+    helper_embedding.count_embedding_tokens.cache_clear()
 
 
 # ====================================
@@ -270,6 +301,600 @@ class TestGeminiEmbedding:
         call_args = mock_instance.models.embed_content.call_args
         assert call_args.kwargs.get("model") == "gemini-embedding-001"
 
+    def test_embed_texts_concurrent_preserves_order(self):
+        """並列モード: 完了順に関係なく入力順で返す"""
+        import random
+        import time as _time
+
+        def fake_embed_content(model, contents, config):
+            # 完了順をばらつかせる
+            _time.sleep(random.uniform(0, 0.01))
+            embedding = Mock()
+            embedding.values = [float(contents)] * 4
+            response = Mock()
+            response.embeddings = [embedding]
+            return response
+
+        with patch.dict(os.environ, {"GOOGLE_API_KEY": "test-key"}):
+            with patch("helper_embedding.genai") as mock_genai:
+                mock_instance = Mock()
+                mock_instance.models.embed_content.side_effect = fake_embed_content
+                mock_genai.Client.return_value = mock_instance
+                client = GeminiEmbedding(dims=4, max_concurrency=8)
+
+        texts = [str(i) for i in range(40)]
+        result = client.embed_texts(texts)
+
+        assert [v[0] for v in result] == [float(i) for i in range(40)]
+        assert mock_instance.models.embed_content.call_count == 40
+
+    def test_embed_texts_uses_rate_limiter(self, mock_gemini_client):
+        """レートリミッター設定時はリクエストごとに枠を確保し、固定sleepしない"""
+        client, mock_instance = mock_gemini_client
+        client.rate_limiter = Mock()
+        client.rate_limiter.enabled = True
+
+        mock_embedding = Mock()
+        mock_embedding.values = [0.1] * 3072
+        mock_response = Mock()
+        mock_response.embeddings = [mock_embedding]
+        mock_instance.models.embed_content.return_value = mock_response
+
+        with patch("helper_embedding.time.sleep") as mock_sleep:
+            client.embed_texts(["a", "bb", "ccc"], batch_size=1)
+
+        assert client.rate_limiter.acquire.call_count == 3
+        mock_sleep.assert_not_called()
+
+    def test_key_pool_spreads_requests(self):
+        """キープール使用時はリクエストごとにキーを選び、キーごとのSDKクライアントで送信する"""
+        from helper_rate_limit import APIKeyPool
+
+        sdk_clients = {}
+
+        def make_client(api_key, **kwargs):
+            sdk = Mock()
+            sdk.models.embed_content.side_effect = lambda model, contents, config: _batch_response(
+                [contents] if isinstance(contents, str) else contents
+            )
+            sdk_clients[api_key] = sdk
+            return sdk
+
+        with patch("helper_embedding.genai") as mock_genai:
+            mock_genai.Client.side_effect = make_client
+            client = GeminiEmbedding(key_pool=APIKeyPool(["key-1", "key-2"]), dims=4, max_concurrency=1)
+            result = client.embed_texts(["a", "bb", "ccc", "dddd"], batch_size=1)
+
+        assert [v[0] for v in result] == [1.0, 2.0, 3.0, 4.0]
+        assert [sdk_clients[k].models.embed_content.call_count for k in ("key-1", "key-2")] == [2, 2]
+
+
+# ====================================
+# GeminiEmbedding バッチAPIテスト
+# ====================================
+
+def _batch_response(texts):
+    """contentsの各テキストを先頭値に埋め込んだモックレスポンス"""
+    response = Mock()
+    response.embeddings = []
+    for text in texts:
+        emb = Mock()
+        emb.values = [float(len(text))] * 4
+        response.embeddings.append(emb)
+    return response
+
+
+class TestGeminiEmbedTextsBatch:
+    """GeminiEmbedding.embed_texts_batch のテスト"""
+
+    @pytest.fixture
+    def mock_gemini_client(self):
+        with patch.dict(os.environ, {"GOOGLE_API_KEY": "test-key"}):
+            with patch("helper_embedding.genai") as mock_genai:
+                mock_instance = Mock()
+                mock_genai.Client.return_value = mock_instance
+                client = GeminiEmbedding(dims=4, max_concurrency=1)
+                return client, mock_instance
+
+    def test_packs_by_item_limit(self, mock_gemini_client):
+        """250件 → 100件ずつ3リクエスト、入力順で返す"""
+        client, mock_instance = mock_gemini_client
+        mock_instance.models.embed_content.side_effect = \
+            lambda model, contents, config: _batch_response(contents)
+
+        texts = ["x" * (i % 7 + 1) for i in range(250)]
+        result = client.embed_texts_batch(texts)
+
+        assert mock_instance.models.embed_content.call_count == 3
+        assert [v[0] for v in result] == [float(len(t)) for t in texts]
+
+    def test_packs_by_token_limit(self, mock_gemini_client):
+        """トークン上限を超える手前でリクエストを分ける"""
+        client, mock_instance = mock_gemini_client
+        mock_instance.models.embed_content.side_effect = \
+            lambda model, contents, config: _batch_response(contents)
+
+        texts = ["a" * 60] * 5
+        client.embed_texts_batch(texts, max_tokens_per_request=100)
+
+        sizes = [len(c.kwargs["contents"]) for c in mock_instance.models.embed_content.call_args_list]
+        assert sizes == [1, 1, 1, 1, 1]
+
+    def test_partial_failure_falls_back_per_item(self, mock_gemini_client):
+        """バッチ失敗時は個別リクエストで再試行し、失敗分のみ例外に記録"""
+        from helper_embedding import EmbeddingBatchError
+        client, mock_instance = mock_gemini_client
+
+        def fake_embed_content(model, contents, config):
+            if isinstance(contents, list):
+                raise RuntimeError("400 Bad Request")
+            if contents == "bad":
+                raise RuntimeError("400 Bad Request")
+            return _batch_response([contents])
+
+        mock_instance.models.embed_content.side_effect = fake_embed_content
+
+        with pytest.raises(EmbeddingBatchError) as exc_info:
+            client.embed_texts_batch(["ok", "bad", "fine"])
+
+        assert exc_info.value.failed_indices == [1]
+        assert exc_info.value.embeddings[0] == [2.0] * 4
+        assert exc_info.value.embeddings[1] is None
+        assert exc_info.value.embeddings[2] == [4.0] * 4
+
+    def test_embed_texts_array_returns_normalized_float32(self, mock_gemini_client):
+        """embed_texts_array: 入力順・L2正規化済みの連続 float32 行列"""
+        import numpy as np
+        client, mock_instance = mock_gemini_client
+        mock_instance.models.embed_content.side_effect = \
+            lambda model, contents, config: _batch_response(contents)
+
+        texts = ["a", "bbb", "cc"] * 70
+        matrix = client.embed_texts_array(texts)
+
+        assert matrix.shape == (210, 4)
+        assert matrix.dtype == np.float32
+        assert matrix.flags["C_CONTIGUOUS"]
+        np.testing.assert_allclose(np.linalg.norm(matrix, axis=1), 1.0, rtol=1e-6)
+        assert mock_instance.models.embed_content.call_count == 3
+
+        raw = client.embed_texts_array(["bbb"], normalize=False)
+        np.testing.assert_array_equal(raw, [[3.0] * 4])
+
+    def test_embed_texts_array_empty(self, mock_gemini_client):
+        """空入力は (0, dims) の行列"""
+        client, _ = mock_gemini_client
+        assert client.embed_texts_array([]).shape == (0, 4)
+
+
+class TestNormalizeRows:
+    """normalize_rows のテスト"""
+
+    def test_zero_rows_are_kept(self):
+        """ゼロベクトルの行は0のまま（NaNにならない）"""
+        import numpy as np
+        from helper_embedding import normalize_rows
+        matrix = np.array([[3.0, 4.0], [0.0, 0.0]], dtype=np.float32)
+        result = normalize_rows(matrix)
+        assert result is matrix
+        np.testing.assert_allclose(matrix, [[0.6, 0.8], [0.0, 0.0]])
+
+
+# ====================================
+# トークン数ベースのリクエスト分割テスト
+# ====================================
+
+class TestEmbeddingRequestPlan:
+    """pack_embedding_requests / EmbeddingRequestPlan のテスト"""
+
+    def test_pack_greedily_fills_requests(self):
+        """件数・トークン上限いっぱいまで先頭から詰める"""
+        from helper_embedding import pack_embedding_requests
+        assert pack_embedding_requests([40, 40, 30, 90, 10], max_items=10, max_tokens_per_request=100) == \
+            [[0, 1], [2], [3, 4]]
+        assert pack_embedding_requests([1] * 5, max_items=2, max_tokens_per_request=100) == \
+            [[0, 1], [2, 3], [4]]
+
+    def test_limits_are_clipped_to_provider(self):
+        """指定値はプロバイダー上限でクリップされる"""
+        from helper_embedding import EmbeddingRequestPlan
+        plan = EmbeddingRequestPlan(["a"] * 150, "gemini", max_items=500, max_tokens_per_request=10 ** 9)
+        assert plan.max_items == 100
+        assert plan.max_tokens_per_request == 20000
+        assert [len(b) for b in plan.batches] == [100, 50]
+
+    def test_oversized_text_error_up_front(self):
+        """oversize="error" では送信前に超過テキストを列挙して拒否"""
+        from helper_embedding import EmbeddingRequestPlan, OversizedTextError
+        with pytest.raises(OversizedTextError) as exc_info:
+            EmbeddingRequestPlan(["ok", "x" * 9000, "y" * 8192], "openai", oversize="error")
+        assert exc_info.value.indices == [1, 2]
+        assert exc_info.value.max_tokens == 8191
+        assert isinstance(exc_info.value, ValueError)
+
+    def test_oversized_text_is_split_and_merged(self):
+        """oversize="split" では分割して送信し、トークン数加重平均で1ベクトルに統合"""
+        import numpy as np
+        from helper_embedding import EmbeddingRequestPlan
+        plan = EmbeddingRequestPlan(["a" * 3000, "b"], "gemini", oversize="split")
+        assert plan.pieces == ["a" * 2048, "a" * 952, "b"]
+        assert plan.owners == [0, 0, 1]
+
+        merged = plan.merge(np.array([[1.0, 0.0], [0.0, 1.0], [5.0, 5.0]], dtype=np.float32))
+        np.testing.assert_allclose(merged, [[2048 / 3000, 952 / 3000], [5.0, 5.0]], rtol=1e-6)
+
+    def test_openai_embed_texts_splits_oversized(self):
+        """OpenAIEmbedding: 超過テキストで400を出さず、入力件数分のベクトルを返す"""
+        with patch.dict(os.environ, {"OPENAI_API_KEY": "test-key"}):
+            with patch("helper_embedding.OpenAI") as mock_class:
+                mock_instance = Mock()
+                mock_class.return_value = mock_instance
+
+                def fake_create(model, input, dimensions):
+                    assert all(len(t) <= 8191 for t in input)
+                    response = Mock()
+                    response.data = [Mock(index=i, embedding=[1.0, 0.0]) for i in range(len(input))]
+                    return response
+
+                mock_instance.embeddings.create.side_effect = fake_create
+                client = OpenAIEmbedding(dims=2)
+                result = client.embed_texts(["short", "z" * 20000])
+
+        assert len(result) == 2
+        assert mock_instance.embeddings.create.call_count == 1
+        assert len(mock_instance.embeddings.create.call_args.kwargs["input"]) == 4
+
+    def test_gemini_batch_split_failure_maps_to_owner(self):
+        """分割した断片が失敗した場合は元テキストのインデックスで報告"""
+        from helper_embedding import EmbeddingBatchError
+        with patch.dict(os.environ, {"GOOGLE_API_KEY": "test-key"}):
+            with patch("helper_embedding.genai") as mock_genai:
+                mock_instance = Mock()
+                mock_genai.Client.return_value = mock_instance
+
+                def fake_embed_content(model, contents, config):
+                    if isinstance(contents, list):
+                        raise RuntimeError("400 Bad Request")
+                    if contents.startswith("q"):
+                        raise RuntimeError("400 Bad Request")
+                    return _batch_response([contents])
+
+                mock_instance.models.embed_content.side_effect = fake_embed_content
+                client = GeminiEmbedding(dims=4, max_concurrency=1)
+                with pytest.raises(EmbeddingBatchError) as exc_info:
+                    client.embed_texts_batch(["ok", "q" * 5000])
+
+        assert exc_info.value.failed_indices == [1]
+        assert exc_info.value.embeddings[0] == [2.0] * 4
+
+
+class TestCollapseTexts:
+    """collapse_texts / expand_embeddings のテスト"""
+
+    def test_unique_texts_and_inverse(self):
+        """空文字列は-1、同一テキストは同じスロット（初出順）"""
+        from helper_embedding import collapse_texts
+        unique, inverse = collapse_texts(["q1", "", "q2", "q1", "  ", "q2"])
+        assert unique == ["q1", "q2"]
+        assert inverse.tolist() == [0, -1, 1, 0, -1, 1]
+
+    def test_expand_list(self):
+        """リストは行ごとに展開し、空文字列はゼロベクトル"""
+        from helper_embedding import expand_embeddings
+        import numpy as np
+        result = expand_embeddings([[1.0, 2.0], [3.0, 4.0]], np.array([1, -1, 0, 1]), dims=2)
+        assert result == [[3.0, 4.0], [0.0, 0.0], [1.0, 2.0], [3.0, 4.0]]
+
+    def test_expand_array(self):
+        """行列はfancy indexingで一括展開"""
+        import numpy as np
+        from helper_embedding import expand_embeddings
+        unique = np.array([[1.0, 0.0], [0.0, 1.0]], dtype=np.float32)
+        result = expand_embeddings(unique, np.array([-1, 1, 1, 0]), dims=2)
+        assert result.dtype == np.float32
+        np.testing.assert_array_equal(result, [[0, 0], [0, 1], [0, 1], [1, 0]])
+
+
+class TestLocalEmbedding:
+    """LocalEmbedding（provider="local"）のテスト"""
+
+    def test_factory_and_dimensions(self):
+        """ファクトリから生成でき、APIキー不要・Gemini相当の次元数"""
+        from helper_embedding import LocalEmbedding
+        client = create_embedding_client("local")
+        assert isinstance(client, LocalEmbedding)
+        assert client.dimensions == DEFAULT_GEMINI_EMBEDDING_DIMS
+        assert get_embedding_dimensions("local") == DEFAULT_GEMINI_EMBEDDING_DIMS
+        assert create_embedding_client("local", dims=1536).dimensions == 1536
+
+    def test_deterministic_and_lexically_similar(self):
+        """同じテキストは同じベクトル、語彙が重なるほど類似度が高い"""
+        import numpy as np
+        from helper_embedding import LocalEmbedding
+        matrix = LocalEmbedding(dims=256).embed_texts_array(
+            ["東京の天気は晴れです", "東京の天気は雨です", "Pythonでデータを解析する"]
+        )
+        again = LocalEmbedding(dims=256).embed_texts_array(["東京の天気は晴れです"])
+        np.testing.assert_array_equal(matrix[0], again[0])
+        np.testing.assert_allclose(np.linalg.norm(matrix, axis=1), 1.0, rtol=1e-6)
+        assert matrix[0] @ matrix[1] > matrix[0] @ matrix[2]
+
+    def test_list_and_array_paths_match(self):
+        """embed_text / embed_texts / embed_texts_array は同じベクトル"""
+        import numpy as np
+        from helper_embedding import LocalEmbedding
+        client = LocalEmbedding(dims=64)
+        texts = ["alpha beta", "ガンマ線"]
+        np.testing.assert_allclose(client.embed_texts(texts), client.embed_texts_array(texts), rtol=1e-6)
+        np.testing.assert_allclose(client.embed_text(texts[1]), client.embed_texts_array(texts)[1], rtol=1e-6)
+
+    def test_simulated_latency_per_request(self):
+        """遅延はリクエスト単位（250件 → 3リクエスト）で、jitterは seed で再現可能"""
+        from helper_embedding import LocalEmbedding
+        delays = []
+        client = LocalEmbedding(dims=8, latency=0.5, jitter=0.1, seed=1, sleep=delays.append)
+        client.embed_texts_array([f"text {i}" for i in range(250)])
+        assert client.request_count == 3
+        assert len(delays) == 3
+        assert all(0.5 <= d <= 0.6 for d in delays)
+
+        replay = []
+        LocalEmbedding(dims=8, latency=0.5, jitter=0.1, seed=1, sleep=replay.append) \
+            .embed_texts_array([f"text {i}" for i in range(250)])
+        assert replay == delays
+
+    def test_injected_rate_limit_error(self):
+        """429注入率1.0では再試行後に SimulatedRateLimitError（retry_after付き）"""
+        from helper_embedding import LocalEmbedding, SimulatedRateLimitError
+        from helper_rate_limit import AdaptiveConcurrencyController
+        now = [0.0]
+        waits = []
+
+        def fake_sleep(seconds):
+            waits.append(seconds)
+            now[0] += seconds
+
+        controller = AdaptiveConcurrencyController(max_retries=2, sleep=fake_sleep, clock=lambda: now[0])
+        client = LocalEmbedding(dims=8, rate_limit_error_rate=1.0, retry_after=2.5,
+                                concurrency_controller=controller)
+        with pytest.raises(SimulatedRateLimitError) as exc_info:
+            client.embed_texts(["x"])
+        assert exc_info.value.status_code == 429
+        assert exc_info.value.retry_after == 2.5
+        assert client.request_count == 3
+        assert waits == [2.5, 2.5]
+
+
+class TestEmbedIter:
+    """EmbeddingClient.embed_iter のテスト"""
+
+    def test_yields_every_index_once(self):
+        """全インデックスを1回ずつ返し、ベクトルは embed_texts_array と一致"""
+        import numpy as np
+        from helper_embedding import LocalEmbedding
+        client = LocalEmbedding(dims=32)
+        texts = [f"文書 {i} の本文" for i in range(23)]
+        expected = client.embed_texts_array(texts)
+
+        seen = []
+        for indices, matrix in client.embed_iter(texts, batch_size=5):
+            assert matrix.shape == (len(indices), 32)
+            np.testing.assert_allclose(matrix, expected[indices], rtol=1e-6)
+            seen.extend(indices.tolist())
+        assert sorted(seen) == list(range(23))
+
+    def test_prefetch_bounds_in_flight_batches(self):
+        """同時に生成中のバッチ数は prefetch 以下"""
+        import threading
+        import time as time_module
+        from helper_embedding import LocalEmbedding
+
+        class SlowEmbedding(LocalEmbedding):
+            def __init__(self):
+                super().__init__(dims=8)
+                self.active = 0
+                self.peak = 0
+                self.lock = threading.Lock()
+
+            def embed_texts_array(self, texts, batch_size=100, normalize=True):
+                with self.lock:
+                    self.active += 1
+                    self.peak = max(self.peak, self.active)
+                time_module.sleep(0.01)
+                try:
+                    return super().embed_texts_array(texts, batch_size=batch_size, normalize=normalize)
+                finally:
+                    with self.lock:
+                        self.active -= 1
+
+        client = SlowEmbedding()
+        batches = list(client.embed_iter([str(i) for i in range(40)], batch_size=2, prefetch=3))
+        assert len(batches) == 20
+        assert client.peak <= 3
+
+    def test_batch_error_uses_global_indices(self):
+        """バッチ内の失敗は texts 全体のインデックスで報告"""
+        from helper_embedding import EmbeddingBatchError, LocalEmbedding
+
+        class FailingEmbedding(LocalEmbedding):
+            def embed_texts_array(self, texts, batch_size=100, normalize=True):
+                if "bad" in texts:
+                    raise EmbeddingBatchError([texts.index("bad")], [None] * len(texts))
+                return super().embed_texts_array(texts, batch_size=batch_size, normalize=normalize)
+
+        with pytest.raises(EmbeddingBatchError) as exc_info:
+            list(FailingEmbedding(dims=8).embed_iter(["a", "b", "c", "bad"], batch_size=2, prefetch=1))
+        assert exc_info.value.failed_indices == [3]
+
+
+class TestSdkClientRegistry:
+    """SDKクライアントレジストリのテスト"""
+
+    def test_sync_clients_share_sdk_client(self):
+        """同じAPIキーのクライアントはgenai.Clientを1つだけ作成"""
+        with patch("helper_embedding.genai") as mock_genai:
+            first = GeminiEmbedding(api_key="k", dims=4)
+            second = create_embedding_client("gemini", api_key="k", dims=4)
+            assert first.client is second.client
+            assert mock_genai.Client.call_count == 1
+
+            GeminiEmbedding(api_key="other", dims=4)
+            assert mock_genai.Client.call_count == 2
+
+    def test_async_gemini_shares_sync_client(self):
+        """非同期版は同期版と同じgenai.Client（client.aio）を使う"""
+        with patch("helper_embedding.genai") as mock_genai:
+            sync_client = GeminiEmbedding(api_key="k", dims=4)
+            async_client = create_async_embedding_client("gemini", api_key="k", dims=4)
+            assert isinstance(async_client, AsyncGeminiEmbedding)
+            assert async_client.client is sync_client.client
+            assert mock_genai.Client.call_count == 1
+
+    def test_openai_sync_and_async_are_pooled_separately(self):
+        """OpenAIは同期/非同期それぞれ1インスタンス"""
+        with patch("helper_embedding.OpenAI") as mock_openai, \
+                patch("helper_embedding.AsyncOpenAI") as mock_async_openai:
+            OpenAIEmbedding(api_key="k")
+            OpenAIEmbedding(api_key="k")
+            AsyncOpenAIEmbedding(api_key="k")
+            AsyncOpenAIEmbedding(api_key="k")
+            assert mock_openai.call_count == 1
+            assert mock_async_openai.call_count == 1
+
+    def test_unknown_async_provider_raises_error(self):
+        """不明なプロバイダーはエラー"""
+        with pytest.raises(ValueError, match="Unknown provider"):
+            create_async_embedding_client("unknown")
+
+
+class TestAsyncGeminiEmbedding:
+    """AsyncGeminiEmbedding クラスのテスト"""
+
+    @pytest.fixture
+    def mock_async_client(self):
+        from unittest.mock import AsyncMock
+        with patch("helper_embedding.genai") as mock_genai:
+            mock_instance = Mock()
+            mock_instance.aio.models.embed_content = AsyncMock(
+                side_effect=lambda model, contents, config: _batch_response(
+                    contents if isinstance(contents, list) else [contents]
+                )
+            )
+            mock_genai.Client.return_value = mock_instance
+            client = AsyncGeminiEmbedding(api_key="k", dims=4, max_concurrency=4)
+            return client, mock_instance
+
+    def test_embed_texts_batches_and_preserves_order(self, mock_async_client):
+        """250件 → 3リクエストを並行送信し、入力順で返す"""
+        import asyncio
+        client, mock_instance = mock_async_client
+        texts = ["x" * (i % 5 + 1) for i in range(250)]
+
+        result = asyncio.run(client.embed_texts(texts))
+
+        assert mock_instance.aio.models.embed_content.await_count == 3
+        assert [v[0] for v in result] == [float(len(t)) for t in texts]
+
+    def test_embed_texts_array(self, mock_async_client):
+        """embed_texts_array: 正規化済み float32 行列"""
+        import asyncio
+        import numpy as np
+        client, _ = mock_async_client
+
+        matrix = asyncio.run(client.embed_texts_array(["a", "bb"]))
+
+        assert matrix.dtype == np.float32
+        np.testing.assert_allclose(np.linalg.norm(matrix, axis=1), 1.0, rtol=1e-6)
+
+    def test_respects_max_concurrency(self, mock_async_client):
+        """同時実行数はmax_concurrency以下"""
+        import asyncio
+        client, mock_instance = mock_async_client
+        client.max_concurrency = 2
+        state = {"active": 0, "peak": 0}
+
+        async def slow_embed(model, contents, config):
+            state["active"] += 1
+            state["peak"] = max(state["peak"], state["active"])
+            await asyncio.sleep(0.01)
+            state["active"] -= 1
+            return _batch_response(contents)
+
+        mock_instance.aio.models.embed_content.side_effect = slow_embed
+        asyncio.run(client.embed_texts(["t"] * 500, batch_size=50))
+
+        assert state["peak"] == 2
+        assert mock_instance.aio.models.embed_content.await_count == 10
+
+
+class TestGeminiBatchStubServer:
+    """ローカルスタブサーバーでHTTPリクエスト数の削減を検証"""
+
+    @pytest.fixture
+    def stub_server(self):
+        import json
+        import threading
+        from http.server import BaseHTTPRequestHandler, HTTPServer
+
+        counts = {"batchEmbedContents": 0, "items": 0}
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                requests = body.get("requests", [])
+                counts["batchEmbedContents"] += 1
+                counts["items"] += len(requests)
+                payload = json.dumps({
+                    "embeddings": [
+                        {"values": [float(len(r["content"]["parts"][0]["text"]))] * 4}
+                        for r in requests
+                    ]
+                }).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        server = HTTPServer(("127.0.0.1", 0), Handler)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        yield f"http://127.0.0.1:{server.server_port}", counts
+        server.shutdown()
+
+    def test_batch_reduces_round_trips(self, stub_server):
+        """embed_texts: 1件1リクエスト / embed_texts_batch: 100件1リクエスト"""
+        pytest.importorskip("google.genai")
+        base_url, counts = stub_server
+        client = GeminiEmbedding(api_key="test-key", dims=4, max_concurrency=1, base_url=base_url)
+        texts = [f"text-{i}" for i in range(120)]
+
+        per_text = client.embed_texts(texts[:20])
+        assert counts["batchEmbedContents"] == 20
+
+        counts["batchEmbedContents"] = 0
+        batched = client.embed_texts_batch(texts)
+        assert counts["batchEmbedContents"] == 2
+        assert counts["items"] == 20 + 120
+        assert [v[0] for v in batched] == [float(len(t)) for t in texts]
+        assert per_text == batched[:20]
+
+    def test_async_client_against_stub(self, stub_server):
+        """非同期版も同じスタブに対して1リクエスト100件で送信"""
+        import asyncio
+        pytest.importorskip("google.genai")
+        base_url, counts = stub_server
+        client = AsyncGeminiEmbedding(api_key="test-key", dims=4, max_concurrency=2, base_url=base_url)
+        texts = [f"text-{i}" for i in range(150)]
+
+        result = asyncio.run(client.embed_texts(texts))
+
+        assert counts["batchEmbedContents"] == 2
+        assert [v[0] for v in result] == [float(len(t)) for t in texts]
+
 
 # ====================================
 # 統合テスト（実API使用）
@@ -0,0 +1,202 @@
+"""
+helper_embedding_cache.py 単体テスト
+
+テスト実行:
+    pytest tests/test_helper_embedding_cache.py -v
+"""
+
+import pytest
+import os
+from typing import List
+
+# テスト対象
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from helper_embedding import EmbeddingBatchError, EmbeddingClient
+from helper_embedding_cache import (
+    CachedEmbeddingClient,
+    EmbeddingCacheStore,
+    make_cache_key,
+)
+
+
+class CountingEmbedding(EmbeddingClient):
+    """送信テキストを記録する決定的なテスト用クライアント"""
+
+    provider = "fake"
+
+    def __init__(self, model: str = "fake-model", dims: int = 4, fail_on: str = None):
+        self.model = model
+        self._dims = dims
+        self.fail_on = fail_on
+        self.sent: List[str] = []
+
+    @property
+    def dimensions(self) -> int:
+        return self._dims
+
+    def _vector(self, text: str) -> List[float]:
+        return [float(len(text))] + [0.5] * (self._dims - 1)
+
+    def embed_text(self, text: str) -> List[float]:
+        self.sent.append(text)
+        return self._vector(text)
+
+    def embed_texts(self, texts: List[str], batch_size: int = 100) -> List[List[float]]:
+        self.sent.extend(texts)
+        if self.fail_on in texts:
+            embeddings = [None if t == self.fail_on else self._vector(t) for t in texts]
+            raise EmbeddingBatchError([texts.index(self.fail_on)], embeddings)
+        return [self._vector(t) for t in texts]
+
+
+# ====================================
+# キャッシュキーテスト
+# ====================================
+
+class TestMakeCacheKey:
+    """make_cache_key のテスト"""
+
+    def test_key_depends_on_provider_model_dims(self):
+        """provider/model/dimsのいずれかが違えば別キー"""
+        base = make_cache_key("gemini", "gemini-embedding-001", 3072, "テキスト")
+        assert base != make_cache_key("openai", "gemini-embedding-001", 3072, "テキスト")
+        assert base != make_cache_key("gemini", "other-model", 3072, "テキスト")
+        assert base != make_cache_key("gemini", "gemini-embedding-001", 1536, "テキスト")
+        assert base == make_cache_key("gemini", "gemini-embedding-001", 3072, "テキスト")
+
+
+# ====================================
+# CachedEmbeddingClient テスト
+# ====================================
+
+class TestCachedEmbeddingClient:
+    """CachedEmbeddingClient のテスト"""
+
+    def test_rerun_costs_zero_calls(self, cache_path):
+        """同一データの再実行ではAPIを呼ばない（別インスタンス・永続化）"""
+        texts = ["alpha", "beta", "gamma"]
+
+        first = CountingEmbedding()
+        cached = CachedEmbeddingClient(first, cache_path=cache_path)
+        vectors = cached.embed_texts_batch(texts)
+        assert first.sent == texts
+        cached.store.close()
+
+        second = CountingEmbedding()
+        cached = CachedEmbeddingClient(second, cache_path=cache_path)
+        assert cached.embed_texts_batch(texts) == vectors
+        assert second.sent == []
+        assert cached.stats()["hits"] == 3
+        assert cached.stats()["hit_rate"] == 1.0
+
+    def test_only_misses_are_sent(self, cache_path):
+        """ミス分のみ・重複は1回だけ送信し、結果は入力順"""
+        inner = CountingEmbedding()
+        cached = CachedEmbeddingClient(inner, cache_path=cache_path)
+        cached.embed_texts(["a", "bb"])
+        inner.sent.clear()
+
+        result = cached.embed_texts(["bb", "ccc", "a", "ccc"])
+
+        assert inner.sent == ["ccc"]
+        assert [v[0] for v in result] == [2.0, 3.0, 1.0, 3.0]
+        stats = cached.stats()
+        assert stats["hits"] == 2
+        assert stats["misses"] == 2 + 2
+
+    def test_vectors_round_trip_as_float32(self, cache_path):
+        """float32で保存・復元される"""
+        inner = CountingEmbedding()
+        cached = CachedEmbeddingClient(inner, cache_path=cache_path)
+        cached.embed_text("abc")
+        assert cached.embed_text("abc") == [3.0, 0.5, 0.5, 0.5]
+        assert cached.store.total_bytes == 4 * 4
+
+    def test_different_model_is_cache_miss(self, cache_path):
+        """モデルが違えばキャッシュを共有しない"""
+        store = EmbeddingCacheStore(cache_path)
+        CachedEmbeddingClient(CountingEmbedding(model="m1"), store=store).embed_texts(["x"])
+        other = CountingEmbedding(model="m2")
+        CachedEmbeddingClient(other, store=store).embed_texts(["x"])
+        assert other.sent == ["x"]
+
+    def test_partial_failure_keeps_successes(self, cache_path):
+        """部分失敗時は成功分を保存し、入力インデックスで失敗を報告"""
+        inner = CountingEmbedding(fail_on="bad")
+        cached = CachedEmbeddingClient(inner, cache_path=cache_path)
+        cached.embed_texts(["ok"])
+
+        with pytest.raises(EmbeddingBatchError) as exc_info:
+            cached.embed_texts(["ok", "new", "bad"])
+        assert exc_info.value.failed_indices == [2]
+        assert exc_info.value.embeddings[1] == [3.0, 0.5, 0.5, 0.5]
+
+        inner.sent.clear()
+        inner.fail_on = None
+        cached.embed_texts(["ok", "new", "bad"])
+        assert inner.sent == ["bad"]
+
+
+    def test_embed_texts_array_uses_cache(self, cache_path):
+        """embed_texts_array: キャッシュヒット分は行列へ直接コピーし、ミス分のみ送信"""
+        import numpy as np
+        inner = CountingEmbedding()
+        cached = CachedEmbeddingClient(inner, cache_path=cache_path)
+        cached.embed_texts(["ab"])
+        inner.sent.clear()
+
+        matrix = cached.embed_texts_array(["ab", "xyz"], normalize=False)
+
+        assert inner.sent == ["xyz"]
+        assert matrix.dtype == np.float32
+        np.testing.assert_array_equal(matrix[:, 0], [2.0, 3.0])
+
+        normalized = cached.embed_texts_array(["ab", "xyz"])
+        np.testing.assert_allclose(np.linalg.norm(normalized, axis=1), 1.0, rtol=1e-6)
+        assert inner.sent == ["xyz"]
+
+
+# ====================================
+# EmbeddingCacheStore テスト
+# ====================================
+
+class TestEmbeddingCacheStore:
+    """EmbeddingCacheStore のテスト"""
+
+    def test_evicts_least_recently_used(self, cache_path, monkeypatch):
+        """容量超過時は最終アクセスが古いものから削除"""
+        import helper_embedding_cache
+        now = [1000.0]
+        monkeypatch.setattr(helper_embedding_cache.time, "time", lambda: now[0])
+
+        # 4次元float32 = 16バイト、上限40バイト → 2件まで
+        store = EmbeddingCacheStore(cache_path, max_bytes=40)
+        store.put_many({"a": [1.0] * 4})
+        now[0] += 1
+        store.put_many({"b": [2.0] * 4})
+        now[0] += 1
+        store.get_many(["a"])  # aを最近使用に
+        now[0] += 1
+        store.put_many({"c": [3.0] * 4})
+
+        assert set(store.get_many(["a", "b", "c"])) == {"a", "c"}
+        assert store.total_bytes == 32
+        assert len(store) == 2
+
+    def test_overwrite_does_not_double_count(self, cache_path):
+        """同じキーの上書きで容量を二重計上しない"""
+        store = EmbeddingCacheStore(cache_path, max_bytes=None)
+        store.put_many({"a": [1.0] * 4})
+        store.put_many({"a": [2.0] * 4})
+        assert store.total_bytes == 16
+        assert store.get_many(["a"])["a"] == [2.0] * 4
+
+    def test_bulk_lookup_over_sqlite_variable_limit(self):
+        """SQLiteの変数上限を超える件数でも一括照会できる"""
+        store = EmbeddingCacheStore(":memory:", max_bytes=None)
+        store.put_many({f"k{i}": [float(i)] for i in range(1500)})
+        found = store.get_many([f"k{i}" for i in range(1500)] + ["missing"])
+        assert len(found) == 1500
+        assert found["k1499"] == [1499.0]
@@ -14,18 +14,26 @@ import os
 from typing import List
 from unittest.mock import Mock, patch, MagicMock
 
-from pydantic import BaseModel
+from pydantic import BaseModel, ValidationError
 
 # テスト対象
 import sys
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from helper_llm import (
+    IncrementalJSONArrayParser,
     LLMClient,
     OpenAIClient,
     GeminiClient,
+    LocalTokenCounter,
+    _count_local_tokens,
+    clear_llm_clients,
     create_llm_client,
-    get_default_llm_client,
+    create_token_counter,
+    estimate_tokens,
+    get_generative_model,
+    get_llm_client,
+    get_token_counter,
 )
 
 
@@ -118,42 +126,44 @@ class TestOpenAIClient:
             with pytest.raises(ValueError, match="OPENAI_API_KEY"):
                 OpenAIClient()
 
+    @staticmethod
+    def chat_response(**message):
+        """Chat Completions の応答（usage なし）"""
+        return Mock(choices=[Mock(message=Mock(**message))], usage=None)
+
     def test_generate_content(self, mock_openai_client):
         """テキスト生成"""
         client, mock_instance = mock_openai_client
-        mock_response = Mock()
-        mock_response.output_text = "Hello, world!"
-        mock_instance.responses.create.return_value = mock_response
+        mock_instance.chat.completions.create.return_value = self.chat_response(content="Hello, world!")
 
         result = client.generate_content("Say hello")
 
         assert result == "Hello, world!"
-        mock_instance.responses.create.assert_called_once()
+        mock_instance.chat.completions.create.assert_called_once()
 
     def test_generate_content_with_system_instruction(self, mock_openai_client):
         """システム指示付きテキスト生成"""
         client, mock_instance = mock_openai_client
-        mock_response = Mock()
-        mock_response.output_text = "Response"
-        mock_instance.responses.create.return_value = mock_response
+        mock_instance.chat.completions.create.return_value = self.chat_response(content="Response")
 
         client.generate_content(
             "Question",
             system_instruction="You are a helpful assistant"
         )
 
-        call_args = mock_instance.responses.create.call_args
-        messages = call_args.kwargs["input"]
+        call_args = mock_instance.chat.completions.create.call_args
+        messages = call_args.kwargs["messages"]
         assert len(messages) == 2
         assert messages[0]["role"] == "developer"
         assert messages[1]["role"] == "user"
+        assert "system_instruction" not in call_args.kwargs
 
     def test_generate_structured(self, mock_openai_client):
         """構造化出力生成"""
         client, mock_instance = mock_openai_client
-        mock_response = Mock()
-        mock_response.output_parsed = TestResponse(message="test", score=100)
-        mock_instance.responses.parse.return_value = mock_response
+        mock_instance.beta.chat.completions.parse.return_value = self.chat_response(
+            content='{"message": "test", "score": 100}', parsed=TestResponse(message="test", score=100)
+        )
 
         result = client.generate_structured("Generate test", TestResponse)
 
@@ -183,13 +193,14 @@ class TestGeminiClient:
 
     @pytest.fixture
     def mock_gemini_client(self):
-        """モックGeminiクライアント"""
+        """モックGeminiクライアント（共有の GenerativeModel をモックに差し替える）"""
         with patch.dict(os.environ, {"GOOGLE_API_KEY": "test-key"}):
-            with patch("helper_llm.genai") as mock_genai:
-                mock_instance = Mock()
-                mock_genai.Client.return_value = mock_instance
-                client = GeminiClient()
-                return client, mock_instance
+            with patch("helper_llm.genai"), patch("helper_llm.get_generative_model") as mock_factory:
+                mock_model = Mock()
+                mock_factory.return_value = mock_model
+                client = GeminiClient(token_count_mode="api")
+                # テスト本体の実行中もモックを有効にする（実APIへ送信しない）
+                yield client, mock_model, mock_factory
 
     def test_init_with_env_key(self):
         """環境変数からAPIキーを取得"""
@@ -227,63 +238,327 @@ class TestGeminiClient:
 
     def test_generate_content(self, mock_gemini_client):
         """テキスト生成"""
-        client, mock_instance = mock_gemini_client
-        mock_response = Mock()
-        mock_response.text = "こんにちは"
-        mock_instance.models.generate_content.return_value = mock_response
+        client, mock_model, _ = mock_gemini_client
+        mock_model.generate_content.return_value = Mock(text="こんにちは", usage_metadata=None)
 
         result = client.generate_content("Hello")
 
         assert result == "こんにちは"
-        mock_instance.models.generate_content.assert_called_once()
+        mock_model.generate_content.assert_called_once_with("Hello")
 
     def test_generate_content_with_thinking_level(self, mock_gemini_client):
-        """思考レベル指定付きテキスト生成"""
-        client, mock_instance = mock_gemini_client
+        """思考レベル指定: google-generativeai に対応する設定がないため送信しない"""
+        client, mock_model, _ = mock_gemini_client
         client.default_model = "gemini-3-pro-preview"
-        mock_response = Mock()
-        mock_response.text = "Response"
-        mock_instance.models.generate_content.return_value = mock_response
+        mock_model.generate_content.return_value = Mock(text="Response", usage_metadata=None)
 
-        client.generate_content("Question", thinking_level="high")
+        assert client.generate_content("Question", thinking_level="high", temperature=0.2) == "Response"
 
-        call_args = mock_instance.models.generate_content.call_args
-        config = call_args.kwargs.get("config", {})
-        assert config.get("thinking_level") == "high"
+        mock_model.generate_content.assert_called_once_with("Question", generation_config={"temperature": 0.2})
 
     def test_generate_structured(self, mock_gemini_client):
-        """構造化出力生成"""
-        client, mock_instance = mock_gemini_client
-        mock_response = Mock()
-        mock_response.text = '{"message": "test", "score": 100}'
-        mock_instance.models.generate_content.return_value = mock_response
+        """構造化出力生成（JSONモードの生成設定でモデルを取得）"""
+        client, mock_model, mock_factory = mock_gemini_client
+        mock_model.generate_content.return_value = Mock(text='{"message": "test", "score": 100}',
+                                                        usage_metadata=None)
 
         result = client.generate_structured("Generate", TestResponse)
 
         assert isinstance(result, TestResponse)
         assert result.message == "test"
         assert result.score == 100
+        assert mock_factory.call_args.args[1] == {"response_mime_type": "application/json"}
 
     def test_generate_structured_invalid_json(self, mock_gemini_client):
         """構造化出力: 不正なJSONでエラー"""
-        client, mock_instance = mock_gemini_client
-        mock_response = Mock()
-        mock_response.text = "not valid json"
-        mock_instance.models.generate_content.return_value = mock_response
+        client, mock_model, _ = mock_gemini_client
+        mock_model.generate_content.return_value = Mock(text="not valid json", usage_metadata=None)
 
-        with pytest.raises(ValueError, match="構造化出力のパースに失敗"):
+        with pytest.raises(ValidationError):
             client.generate_structured("Generate", TestResponse)
 
     def test_count_tokens(self, mock_gemini_client):
-        """トークンカウント"""
-        client, mock_instance = mock_gemini_client
-        mock_response = Mock()
-        mock_response.total_tokens = 10
-        mock_instance.models.count_tokens.return_value = mock_response
+        """トークンカウント（token_count_mode="api" はAPIで数える）"""
+        client, mock_model, _ = mock_gemini_client
+        mock_model.count_tokens.return_value = Mock(total_tokens=10)
 
         count = client.count_tokens("Hello world")
 
         assert count == 10
+        mock_model.count_tokens.assert_called_once_with("Hello world")
+
+
+# ====================================
+# ローカルトークンカウントテスト
+# ====================================
+
+class TestLocalTokenCounter:
+    """LocalTokenCounter / create_token_counter のテスト"""
+
+    def test_estimate_tokens(self):
+        """ASCIIは4文字で1トークン、非ASCIIは1文字1トークン"""
+        assert estimate_tokens("") == 0
+        assert estimate_tokens("abcdefgh") == 2
+        assert estimate_tokens("東京abc") == 3
+
+    def test_calibration_factor(self):
+        """モデル別補正係数を掛ける"""
+        counter = LocalTokenCounter(mode="estimate", calibration={"gemini-2.0-flash": 0.5})
+        assert counter.count_tokens("東京都庁舎") == 2
+        assert counter.count_tokens("東京都庁舎", model="other-model") == 5
+        assert counter.count_tokens("") == 0
+
+    def test_calibrate_from_api(self):
+        """APIの実測値との比から補正係数を求める"""
+        api_client = Mock()
+        api_client.count_tokens.side_effect = lambda text, model=None: len(text) * 2
+        counter = LocalTokenCounter(mode="estimate", calibration={})
+
+        factor = counter.calibrate(api_client, ["日本語", "テキスト"])
+
+        assert factor == pytest.approx(2.0)
+        assert counter.count_tokens("日本語") == 6
+
+    def test_local_mode_allows_special_tokens(self):
+        """local: <|endoftext|> 等の特殊トークン表記を含む文書でもエラーにしない"""
+        def encode(text, disallowed_special="all"):
+            # tiktoken は既定で特殊トークン表記を ValueError にする
+            if disallowed_special != ():
+                raise ValueError(text)
+            return list(text)
+
+        encoding = Mock()
+        encoding.encode.side_effect = encode
+        _count_local_tokens.cache_clear()
+        try:
+            with patch("helper_llm._get_local_encoding", return_value=encoding):
+                counter = LocalTokenCounter(mode="local", calibration={})
+                assert counter.count_tokens("a<|endoftext|>b") == len("a<|endoftext|>b")
+        finally:
+            _count_local_tokens.cache_clear()
+
+    def test_create_token_counter_local_needs_no_api_key(self):
+        """api以外のモードはAPIキーなしで作成でき、SDKを呼ばない"""
+        with patch.dict(os.environ, {}, clear=True):
+            with patch("helper_llm.genai") as mock_genai:
+                counter = create_token_counter(mode="estimate")
+                assert counter.count_tokens("hello world!") == 3
+                mock_genai.GenerativeModel.assert_not_called()
+
+    def test_create_token_counter_invalid_mode(self):
+        """不明なモードはエラー"""
+        with pytest.raises(ValueError, match="token count mode"):
+            create_token_counter(mode="remote")
+
+    def test_gemini_client_local_mode_skips_api(self):
+        """GeminiClient: token_count_mode="estimate" では count_tokens がAPIを呼ばない"""
+        with patch("helper_llm.genai") as mock_genai:
+            client = GeminiClient(api_key="test-key", token_count_mode="estimate")
+            assert client.count_tokens("abcdefgh") == 2
+            mock_genai.GenerativeModel.assert_not_called()
+
+
+# ====================================
+# プロセス内キャッシュテスト
+# ====================================
+
+class TestLLMClientCache:
+    """get_generative_model / get_llm_client のテスト"""
+
+    @pytest.fixture(autouse=True)
+    def reset_cache(self):
+        clear_llm_clients()
+        yield
+        clear_llm_clients()
+
+    def test_generative_model_cached_per_config(self):
+        """同じ (モデル, 生成設定) ならインスタンスを共有し、設定のキー順に依存しない"""
+        with patch("helper_llm.genai") as mock_genai:
+            mock_genai.GenerativeModel.side_effect = lambda *args, **kwargs: Mock()
+            a = get_generative_model("gemini-2.0-flash", {"temperature": 0.1, "top_p": 0.9})
+            b = get_generative_model("gemini-2.0-flash", {"top_p": 0.9, "temperature": 0.1})
+            c = get_generative_model("gemini-2.0-flash")
+            assert a is b
+            assert a is not c
+            assert mock_genai.GenerativeModel.call_count == 2
+
+    def test_gemini_client_reuses_model(self):
+        """GeminiClient の呼び出しごとに GenerativeModel を作り直さない"""
+        with patch("helper_llm.genai") as mock_genai:
+            client = GeminiClient(api_key="test-key", token_count_mode="api")
+            mock_genai.GenerativeModel.return_value.generate_content.return_value = Mock(text="ok")
+            mock_genai.GenerativeModel.return_value.count_tokens.return_value = Mock(total_tokens=3)
+            client.generate_content("a")
+            client.generate_content("b")
+            client.count_tokens("c")
+            assert mock_genai.GenerativeModel.call_count == 1
+
+    def test_gemini_client_routes_generation_kwargs(self):
+        """max_output_tokens 等は generation_config、system_instruction はモデル作成時に渡す"""
+        with patch("helper_llm.genai") as mock_genai:
+            client = GeminiClient(api_key="test-key", token_count_mode="api")
+            mock_genai.GenerativeModel.return_value.generate_content.return_value = Mock(text="ok")
+            client.generate_content("a", system_instruction="be brief", temperature=0.7, max_output_tokens=100)
+
+            _, model_kwargs = mock_genai.GenerativeModel.call_args
+            assert model_kwargs["system_instruction"] == "be brief"
+            mock_genai.GenerativeModel.return_value.generate_content.assert_called_once_with(
+                "a", generation_config={"temperature": 0.7, "max_output_tokens": 100}
+            )
+
+    def test_gemini_client_spreads_requests_over_key_pool(self):
+        """キープール使用時はキーごとのモデル（キーを固定したクライアント）で送信する"""
+        from helper_rate_limit import APIKeyPool
+
+        with patch("helper_llm.genai") as mock_genai:
+            mock_genai.GenerativeModel.side_effect = lambda *args, **kwargs: Mock(
+                generate_content=Mock(return_value=Mock(text="ok"))
+            )
+            client = GeminiClient(key_pool=APIKeyPool(["key-1", "key-2"]), token_count_mode="estimate")
+            for _ in range(4):
+                assert client.generate_content("a") == "ok"
+
+            assert mock_genai.GenerativeModel.call_count == 2
+            mock_genai.configure.assert_not_called()
+
+    def test_gemini_client_binds_key_without_global_configure(self):
+        """実SDK: キーごとのクライアントで送信し、プロセス全体の既定設定を変更しない"""
+        import google.generativeai as genai
+        from google.generativeai import client as genai_client
+        from helper_rate_limit import APIKeyPool
+
+        response = genai.protos.GenerateContentResponse(candidates=[{"content": {"parts": [{"text": "ok"}]}}])
+        default_config = dict(genai_client._client_manager.client_config)
+        used_keys = []
+
+        def fake_generate_content(service_client, request, **kwargs):
+            used_keys.append(service_client._client_options.api_key)
+            return response
+
+        with patch.object(genai_client.glm.GenerativeServiceClient, "generate_content",
+                          autospec=True, side_effect=fake_generate_content):
+            client = GeminiClient(key_pool=APIKeyPool(["key-1", "key-2"]), token_count_mode="estimate")
+            for _ in range(4):
+                assert client.generate_content("a") == "ok"
+
+        assert set(used_keys) == {"key-1", "key-2"}
+        assert genai_client._client_manager.client_config == default_config
+
+    def test_get_token_counter_shared(self):
+        """チャンクごとに呼んでもカウンター（api はLLMクライアント）を作り直さない"""
+        assert get_token_counter(mode="estimate") is get_token_counter(mode="estimate")
+        with patch.dict(os.environ, {"GOOGLE_API_KEY": "test-key"}):
+            with patch("helper_llm.genai"), patch("helper_llm.GeminiClient", wraps=GeminiClient) as gemini_cls:
+                api_counter = get_token_counter(mode="api")
+                assert get_token_counter(mode="api") is api_counter
+                assert gemini_cls.call_count == 1
+                assert gemini_cls.call_args.kwargs["token_count_mode"] == "api"
+
+    def test_get_llm_client_cached_by_arguments(self):
+        """同じ引数なら同じクライアント、引数が違えば別インスタンス"""
+        with patch("helper_llm.genai") as mock_genai:
+            first = get_llm_client(provider="gemini", api_key="test-key")
+            assert get_llm_client(provider="gemini", api_key="test-key") is first
+            other = get_llm_client(provider="gemini", api_key="test-key", default_model="gemini-2.0-pro")
+            assert other is not first
+            mock_genai.configure.assert_not_called()
+
+
+# ====================================
+# ストリーミング構造化出力テスト
+# ====================================
+
+class TestIncrementalJSONArrayParser:
+    """IncrementalJSONArrayParser のテスト"""
+
+    RESPONSE = '```json\n{"qa_pairs": [{"question": "a{\\"}", "answer": "[x]"}, {"question": "b", "answer": "y"}]}\n```'
+
+    def test_items_emitted_as_they_complete(self):
+        """1文字ずつ与えても、要素の閉じ括弧が届いた時点で返す"""
+        parser = IncrementalJSONArrayParser("qa_pairs")
+        emitted = []
+        for i, ch in enumerate(self.RESPONSE):
+            for item in parser.feed(ch):
+                emitted.append((i, item))
+
+        assert [item for _, item in emitted] == [
+            {"question": 'a{"}', "answer": "[x]"},
+            {"question": "b", "answer": "y"},
+        ]
+        assert emitted[0][0] < self.RESPONSE.index('"b"')
+        assert parser.complete
+
+    def test_truncated_response_keeps_completed_items(self):
+        """途中で切れた応答でも完成した要素は取り出せる"""
+        parser = IncrementalJSONArrayParser("qa_pairs")
+        truncated = self.RESPONSE[:self.RESPONSE.index('"answer": "y"')]
+        assert parser.feed(truncated) == [{"question": 'a{"}', "answer": "[x]"}]
+        assert not parser.complete
+
+    def test_only_target_array(self):
+        """他のキーの配列・入れ子の配列の要素は返さない"""
+        parser = IncrementalJSONArrayParser("results")
+        text = '{"meta": [{"x": 1}], "results": [{"document_id": 0, "qa_pairs": [{"q": 1}]}]}'
+        assert parser.feed(text) == [{"document_id": 0, "qa_pairs": [{"q": 1}]}]
+
+
+class StreamingLLM(LLMClient):
+    """断片を順に返すテスト用クライアント"""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    def generate_content(self, prompt, model=None, **kwargs):
+        return "".join(self.chunks)
+
+    def generate_structured(self, prompt, response_schema, model=None, **kwargs):
+        return response_schema.model_validate_json(self.generate_content(prompt))
+
+    def count_tokens(self, text, model=None):
+        return len(text)
+
+    def generate_content_stream(self, prompt, model=None, **kwargs):
+        yield from self.chunks
+
+
+class TestGenerateStreamStructured:
+    """LLMClient.generate_stream_structured のテスト"""
+
+    def test_validates_items_and_skips_invalid(self):
+        """各要素を検証し、スキーマに合わない要素は読み飛ばす"""
+        client = StreamingLLM([
+            '{"qa_pairs": [{"question": "q1", "answer": "a1"},',
+            ' {"question": "q2"}, {"question": "q3", ',
+            '"answer": "a3"}]}',
+        ])
+        items = list(client.generate_stream_structured("p", QAPairsResponse))
+        assert items == [QAPair(question="q1", answer="a1"), QAPair(question="q3", answer="a3")]
+
+    def test_truncated_stream(self):
+        """途中で切れても完成した要素を返す"""
+        client = StreamingLLM(['{"qa_pairs": [{"question": "q1", "answer": "a1"}, {"question": "q2", "ans'])
+        assert list(client.generate_stream_structured("p", QAPairsResponse)) == [QAPair(question="q1", answer="a1")]
+
+    def test_default_stream_uses_generate_content(self):
+        """ストリーミング非対応のクライアントでも全文から要素を取り出す"""
+        client = StreamingLLM(['{"qa_pairs": [{"question": "q", "answer": "a"}]}'])
+        assert list(LLMClient.generate_content_stream(client, "p")) == [client.generate_content("p")]
+
+    def test_gemini_streams_json_mode(self):
+        """GeminiClient は JSONモードのモデルで stream=True の応答を中継する"""
+        clear_llm_clients()
+        with patch("helper_llm.genai") as mock_genai:
+            client = GeminiClient(api_key="test-key", token_count_mode="api")
+            chunks = [Mock(text='{"qa_pairs": [{"question": "q", '), Mock(text='"answer": "a"}]}')]
+            mock_genai.GenerativeModel.return_value.generate_content.return_value = iter(chunks)
+
+            items = list(client.generate_stream_structured("p", QAPairsResponse, max_output_tokens=50))
+
+            assert items == [QAPair(question="q", answer="a")]
+            args, kwargs = mock_genai.GenerativeModel.return_value.generate_content.call_args
+            assert kwargs["stream"] is True
+            assert kwargs["generation_config"] == {"max_output_tokens": 50}
+        clear_llm_clients()
 
 
 # ====================================
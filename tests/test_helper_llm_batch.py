@@ -0,0 +1,111 @@
+"""
+helper_llm_batch.py 単体テスト
+
+テスト実行:
+    pytest tests/test_helper_llm_batch.py -v
+"""
+
+import pytest
+import json
+import os
+
+# テスト対象
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from helper_llm_batch import (
+    LocalBatchBackend,
+    parse_batch_result_line,
+    write_batch_requests,
+)
+from tests.helpers import make_job_client
+
+
+# ====================================
+# JSONL 変換テスト
+# ====================================
+
+class TestBatchJsonl:
+    """リクエスト書き出し・結果行解析のテスト"""
+
+    def test_write_requests(self, tmp_path):
+        """1リクエスト1行、キーと生成設定を含む"""
+        path = str(tmp_path / "requests.jsonl")
+        count = write_batch_requests(path, [("a", "質問1"), ("b", "prompt 2")], {"max_output_tokens": 10})
+        assert count == 2
+
+        with open(path, encoding="utf-8") as f:
+            records = [json.loads(line) for line in f]
+        assert [r["key"] for r in records] == ["a", "b"]
+        assert records[0]["request"]["contents"][0]["parts"][0]["text"] == "質問1"
+        assert records[1]["request"]["generation_config"] == {"max_output_tokens": 10}
+
+    def test_parse_result_line(self):
+        """成功行はテキスト、エラー行はエラーメッセージを返す"""
+        ok = {"key": "a", "response": {"candidates": [{"content": {"parts": [{"text": "x"}, {"text": "y"}]}}]}}
+        assert parse_batch_result_line(json.dumps(ok)) == ("a", "xy", None)
+
+        key, text, error = parse_batch_result_line(json.dumps({"key": "b", "error": {"code": 3}}))
+        assert (key, text) == ("b", None)
+        assert "3" in error
+
+        key, text, error = parse_batch_result_line(json.dumps({"key": "c", "response": {}}))
+        assert (key, text) == ("c", None)
+        assert error
+
+
+# ====================================
+# BatchJobClient テスト
+# ====================================
+
+class TestBatchJobClient:
+    """BatchJobClient のテスト"""
+
+    def test_run_polls_until_done(self, tmp_path):
+        """完了までポーリングし、全リクエストの結果を返す"""
+        backend = LocalBatchBackend(lambda prompt, config: prompt.upper(), polls_until_done=3)
+        client, fake = make_job_client(backend, tmp_path, poll_interval=5)
+
+        results = list(client.run([("a", "x"), ("b", "y")], model="m", display_name="job"))
+
+        assert sorted(results) == [("a", "X", None), ("b", "Y", None)]
+        assert fake.sleeps == [5, 5]
+        assert backend.submitted == [str(tmp_path / "jobs" / "job.jsonl")]
+
+    def test_failed_requests_are_reported_per_key(self, tmp_path):
+        """一部リクエストの失敗はジョブ全体を失敗させない"""
+        def handler(prompt, config):
+            if prompt == "bad":
+                raise ValueError("blocked")
+            return "ok"
+
+        client, _ = make_job_client(LocalBatchBackend(handler), tmp_path)
+        results = dict((key, (text, error)) for key, text, error in client.run([("a", "good"), ("b", "bad")], "m"))
+
+        assert results["a"] == ("ok", None)
+        assert results["b"][0] is None
+        assert "blocked" in results["b"][1]
+
+    def test_timeout(self, tmp_path):
+        """timeout を超えても終了しなければ TimeoutError"""
+        backend = LocalBatchBackend(lambda prompt, config: "", polls_until_done=100)
+        client, _ = make_job_client(backend, tmp_path, poll_interval=10, timeout=25)
+
+        with pytest.raises(TimeoutError):
+            list(client.run([("a", "x")], "m"))
+
+    def test_failed_job_raises(self, tmp_path):
+        """成功以外の終了状態は RuntimeError"""
+        backend = LocalBatchBackend(lambda prompt, config: "")
+        backend.state = lambda job_name: "JOB_STATE_EXPIRED"
+        client, _ = make_job_client(backend, tmp_path)
+
+        with pytest.raises(RuntimeError):
+            list(client.run([("a", "x")], "m"))
+
+    def test_empty_requests_submit_nothing(self, tmp_path):
+        """リクエストがなければジョブを投入しない"""
+        backend = LocalBatchBackend(lambda prompt, config: "")
+        client, _ = make_job_client(backend, tmp_path)
+        assert list(client.run([], "m")) == []
+        assert backend.submitted == []
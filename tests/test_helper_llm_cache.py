@@ -0,0 +1,186 @@
+"""
+helper_llm_cache.py 単体テスト
+
+テスト実行:
+    pytest tests/test_helper_llm_cache.py -v
+"""
+
+import os
+from typing import List, Optional, Type
+
+from pydantic import BaseModel
+
+# テスト対象
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from helper_llm import LLMClient
+from helper_llm_cache import (
+    CachedLLMClient,
+    LLMCacheStore,
+    make_llm_cache_key,
+)
+
+
+class Answer(BaseModel):
+    text: str
+    score: int
+
+
+class CountingLLM(LLMClient):
+    """呼び出しを記録する決定的なテスト用クライアント"""
+
+    default_model = "fake-model"
+
+    def __init__(self):
+        self.calls: List[str] = []
+
+    def generate_content(self, prompt: str, model: Optional[str] = None, **kwargs) -> str:
+        self.calls.append(prompt)
+        return f"response:{prompt}:{kwargs.get('temperature')}"
+
+    def generate_structured(self, prompt: str, response_schema: Type[BaseModel], model: Optional[str] = None, **kwargs) -> BaseModel:
+        self.calls.append(prompt)
+        return response_schema(text=prompt, score=len(prompt))
+
+    def count_tokens(self, text: str, model: Optional[str] = None) -> int:
+        return len(text)
+
+
+class Answers(BaseModel):
+    answers: List[Answer]
+
+
+class StreamingLLM(CountingLLM):
+    """構造化出力を断片で返すテスト用クライアント"""
+
+    def __init__(self, chunks: List[str]):
+        super().__init__()
+        self.chunks = chunks
+
+    def generate_content_stream(self, prompt: str, model: Optional[str] = None, **kwargs):
+        self.calls.append(prompt)
+        yield from self.chunks
+
+
+# ====================================
+# キャッシュキーテスト
+# ====================================
+
+class TestMakeLLMCacheKey:
+    """make_llm_cache_key のテスト"""
+
+    def test_key_depends_on_all_inputs(self):
+        """provider/model/params/schema/promptのいずれかが違えば別キー"""
+        base = make_llm_cache_key("gemini", "m", "prompt", {"temperature": 0.7, "top_p": 1})
+        assert base == make_llm_cache_key("gemini", "m", "prompt", {"top_p": 1, "temperature": 0.7})
+        assert base != make_llm_cache_key("openai", "m", "prompt", {"temperature": 0.7, "top_p": 1})
+        assert base != make_llm_cache_key("gemini", "m2", "prompt", {"temperature": 0.7, "top_p": 1})
+        assert base != make_llm_cache_key("gemini", "m", "prompt", {"temperature": 0.2, "top_p": 1})
+        assert base != make_llm_cache_key("gemini", "m", "prompt!", {"temperature": 0.7, "top_p": 1})
+        assert base != make_llm_cache_key("gemini", "m", "prompt", {"temperature": 0.7, "top_p": 1},
+                                          Answer.model_json_schema())
+
+
+# ====================================
+# CachedLLMClient テスト
+# ====================================
+
+class TestCachedLLMClient:
+    """CachedLLMClient のテスト"""
+
+    def test_rerun_costs_zero_calls(self, cache_path):
+        """同一プロンプトの再実行ではAPIを呼ばない（別インスタンス・永続化）"""
+        first = CountingLLM()
+        cached = CachedLLMClient(first, store=LLMCacheStore(cache_path))
+        text = cached.generate_content("hello", temperature=0.7)
+        structured = cached.generate_structured("q", Answer)
+        assert first.calls == ["hello", "q"]
+        cached.store.close()
+
+        second = CountingLLM()
+        cached = CachedLLMClient(second, store=LLMCacheStore(cache_path))
+        assert cached.generate_content("hello", temperature=0.7) == text
+        assert cached.generate_structured("q", Answer) == structured
+        assert second.calls == []
+        assert cached.stats()["hit_rate"] == 1.0
+
+    def test_generation_params_are_part_of_key(self, cache_path):
+        """生成パラメータが違えば再生成する"""
+        inner = CountingLLM()
+        cached = CachedLLMClient(inner, store=LLMCacheStore(cache_path))
+        cached.generate_content("hello", temperature=0.7)
+        cached.generate_content("hello", temperature=0.1)
+        assert inner.calls == ["hello", "hello"]
+
+    def test_stream_structured_cached_when_complete(self, cache_path):
+        """最後まで揃ったストリーム応答は保存し、再実行では要素をキャッシュから返す"""
+        chunks = ['{"answers": [{"text": "a", "score": 1},', ' {"text": "b", "score": 2}]}']
+        cached = CachedLLMClient(StreamingLLM(chunks), store=LLMCacheStore(cache_path))
+        first = list(cached.generate_stream_structured("q", Answers, array_key="answers"))
+        assert [a.text for a in first] == ["a", "b"]
+
+        inner = StreamingLLM(chunks)
+        cached = CachedLLMClient(inner, store=LLMCacheStore(cache_path))
+        assert list(cached.generate_stream_structured("q", Answers, array_key="answers")) == first
+        assert inner.calls == []
+
+    def test_truncated_stream_not_cached(self, cache_path):
+        """途中で切れたストリーム応答は保存しない"""
+        chunks = ['{"answers": [{"text": "a", "score": 1}, {"text": "b"']
+        cached = CachedLLMClient(StreamingLLM(chunks), store=LLMCacheStore(cache_path))
+        assert [a.text for a in cached.generate_stream_structured("q", Answers, array_key="answers")] == ["a"]
+
+        inner = StreamingLLM(chunks)
+        cached = CachedLLMClient(inner, store=LLMCacheStore(cache_path))
+        list(cached.generate_stream_structured("q", Answers, array_key="answers"))
+        assert len(inner.calls) == 1
+
+    def test_delegates_attributes(self, cache_path):
+        """count_tokens・default_model はラップ先を使う"""
+        cached = CachedLLMClient(CountingLLM(), store=LLMCacheStore(cache_path))
+        assert cached.count_tokens("abc") == 3
+        assert cached.default_model == "fake-model"
+
+
+# ====================================
+# LLMCacheStore テスト
+# ====================================
+
+class TestLLMCacheStore:
+    """LLMCacheStore のテスト"""
+
+    def test_ttl_expires_entries(self, cache_path, monkeypatch):
+        """有効期限を過ぎた応答は返さない"""
+        import helper_llm_cache
+        now = [1000.0]
+        monkeypatch.setattr(helper_llm_cache.time, "time", lambda: now[0])
+
+        store = LLMCacheStore(cache_path, ttl=60)
+        store.put("a", "response")
+        now[0] += 59
+        assert store.get("a") == "response"
+        now[0] += 2
+        assert store.get("a") is None
+        assert store.total_bytes == 0
+
+    def test_evicts_least_recently_used(self, cache_path, monkeypatch):
+        """容量超過時は最終アクセスが古いものから削除"""
+        import helper_llm_cache
+        now = [1000.0]
+        monkeypatch.setattr(helper_llm_cache.time, "time", lambda: now[0])
+
+        # 10バイト × 2件まで
+        store = LLMCacheStore(cache_path, ttl=None, max_bytes=25)
+        store.put("a", "x" * 10)
+        now[0] += 1
+        store.put("b", "y" * 10)
+        now[0] += 1
+        store.get("a")  # aを最近使用に
+        now[0] += 1
+        store.put("c", "z" * 10)
+
+        assert store.get("a") is not None
+        assert store.get("b") is None
+        assert store.get("c") is not None
+        assert store.total_bytes == 20
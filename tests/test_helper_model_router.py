@@ -0,0 +1,113 @@
+"""
+helper_model_router.py 単体テスト
+
+テスト実行:
+    pytest tests/test_helper_model_router.py -v
+"""
+
+import pytest
+import os
+import threading
+import time
+
+# テスト対象
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from helper_model_router import ModelRouter, parse_route_concurrency
+from helper_usage import UsageMeter
+from tests.helpers import FakeClock
+
+
+# ====================================
+# ModelRouter テスト
+# ====================================
+
+class TestModelRouter:
+    """ModelRouter のテスト"""
+
+    def make_router(self, **kwargs):
+        kwargs.setdefault("fast_model", "gemini-2.0-flash-lite")
+        kwargs.setdefault("standard_model", "gemini-2.0-flash")
+        kwargs.setdefault("strong_model", "gemini-2.5-flash")
+        return ModelRouter(**kwargs)
+
+    def test_select_by_complexity_level(self):
+        router = self.make_router()
+        assert router.select({"complexity_level": "low", "token_count": 40}).model == "gemini-2.0-flash-lite"
+        assert router.select({"complexity_level": "medium"}).model == "gemini-2.0-flash"
+        assert router.select({"complexity_level": "high"}).model == "gemini-2.5-flash"
+        assert router.select({}).name == "standard"
+
+    def test_rule_route_only_for_short_low_chunks(self):
+        """rule_max_tokens 以下の low チャンクだけルールベースに回す"""
+        router = self.make_router(rule_max_tokens=50)
+        assert router.select({"complexity_level": "low", "token_count": 40}).is_rule
+        assert router.select({"complexity_level": "low", "token_count": 60}).name == "fast"
+        assert router.select({"complexity_level": "medium", "token_count": 40}).name == "standard"
+        assert not self.make_router().select({"complexity_level": "low", "token_count": 1}).is_rule
+
+    def test_assign_keeps_order_within_route(self):
+        router = self.make_router()
+        chunks = [{"id": i, "level": level} for i, level in enumerate(["low", "high", "low", "medium"])]
+        routed = router.assign(chunks, lambda chunk: {"complexity_level": chunk["level"]})
+        assert {name: [c["id"] for c in cs] for name, cs in routed.items()} == {
+            "fast": [0, 2], "strong": [1], "standard": [3]
+        }
+
+    def test_route_concurrency_limit(self):
+        """ルートの同時実行数を超えて実行しない"""
+        router = self.make_router(concurrency={"strong": 2})
+        route = router.routes["strong"]
+        active, peak, lock = [0], [0], threading.Lock()
+
+        def work():
+            with router.run(route, 1):
+                with lock:
+                    active[0] += 1
+                    peak[0] = max(peak[0], active[0])
+                time.sleep(0.02)
+                with lock:
+                    active[0] -= 1
+
+        threads = [threading.Thread(target=work) for _ in range(6)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert peak[0] == 2
+
+    def test_report_splits_latency_and_cost_by_route(self):
+        """ルートごとの1チャンクあたりレイテンシと費用（料金表）を集計する"""
+        clock = FakeClock()
+        router = self.make_router(clock=clock)
+        meter = UsageMeter()
+        router.assign([{"level": "low"}] * 2 + [{"level": "high"}],
+                      lambda chunk: {"complexity_level": chunk["level"]})
+
+        with router.run(router.routes["fast"], 2) as result:
+            with meter.measure("gemini", "gemini-2.0-flash-lite", "generate_structured") as usage:
+                usage.set_tokens(1000, 1000)
+            clock.now += 1.0
+            result.qa_pairs = 6
+        with router.run(router.routes["strong"], 1) as result:
+            with meter.measure("gemini", "gemini-2.5-flash", "generate_structured") as usage:
+                usage.set_tokens(1000, 1000)
+            clock.now += 4.0
+            result.qa_pairs = 5
+
+        report = router.report()
+        assert set(report) == {"fast", "strong"}
+        assert report["fast"]["latency_per_chunk_avg"] == pytest.approx(0.5)
+        assert report["strong"]["latency_per_chunk_avg"] == pytest.approx(4.0)
+        assert report["fast"]["cost"] == pytest.approx(0.000075 + 0.0003)
+        assert report["strong"]["cost_per_chunk"] == pytest.approx(0.0003 + 0.0025)
+        assert (report["fast"]["qa_pairs"], report["fast"]["calls"]) == (6, 1)
+        assert "1チャンクあたり平均 1.67s" in router.format_report()
+
+    def test_parse_route_concurrency(self):
+        assert parse_route_concurrency("fast=8, strong=2") == {"fast": 8, "strong": 2}
+        with pytest.raises(ValueError):
+            parse_route_concurrency("fast")
+        with pytest.raises(ValueError):
+            parse_route_concurrency("fast=0")
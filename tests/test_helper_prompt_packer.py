@@ -0,0 +1,68 @@
+"""
+helper_prompt_packer.py 単体テスト
+
+テスト実行:
+    pytest tests/test_helper_prompt_packer.py -v
+"""
+
+import pytest
+import os
+
+# テスト対象
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from helper_prompt_packer import TokenBudgetPacker
+
+
+# ====================================
+# TokenBudgetPacker テスト
+# ====================================
+
+class TestTokenBudgetPacker:
+    """TokenBudgetPacker のテスト"""
+
+    def test_fills_up_to_input_budget(self):
+        """入力予算（共通部分・アイテムごとのオーバーヘッド込み）まで詰める"""
+        packer = TokenBudgetPacker(input_budget=100, output_budget=1000,
+                                   prompt_overhead_tokens=20, item_overhead_tokens=5)
+        packed = packer.pack([30, 30, 30, 10], [0, 0, 0, 0])
+
+        assert [p.indices for p in packed] == [[0, 1], [2, 3]]
+        assert packed[0].input_tokens == 20 + 2 * 35
+        assert not any(p.oversized for p in packed)
+
+    def test_output_budget_splits_requests(self):
+        """期待出力が予算を超える場合も分割する"""
+        packer = TokenBudgetPacker(input_budget=10_000, output_budget=500)
+        packed = packer.pack([10] * 5, [200] * 5)
+        assert [p.indices for p in packed] == [[0, 1], [2, 3], [4]]
+        assert all(p.output_tokens <= 500 for p in packed)
+
+    def test_mixed_lengths_use_fewer_requests_than_fixed_size(self):
+        """短いチャンクが多い場合は固定件数より少ないリクエストになる"""
+        lengths = [50] * 12 + [900, 50, 50]
+        packer = TokenBudgetPacker(input_budget=1000, output_budget=4000, prompt_overhead_tokens=100)
+        packed = packer.pack(lengths, [100] * len(lengths))
+
+        assert [i for p in packed for i in p.indices] == list(range(len(lengths)))
+        assert len(packed) < (len(lengths) + 2) // 3
+
+    def test_oversized_item_is_sent_alone(self):
+        """単独で予算を超えるアイテムは切り詰めずに1件で送る"""
+        packer = TokenBudgetPacker(input_budget=100, output_budget=1000)
+        packed = packer.pack([10, 500, 10], [0, 0, 0])
+
+        assert [p.indices for p in packed] == [[0], [1], [2]]
+        assert [p.oversized for p in packed] == [False, True, False]
+        assert packed[1].input_tokens == 500
+
+    def test_max_items(self):
+        """max_items を超えて詰めない"""
+        packer = TokenBudgetPacker(input_budget=1000, output_budget=1000, max_items=2)
+        assert [p.indices for p in packer.pack([1] * 5, [1] * 5)] == [[0, 1], [2, 3], [4]]
+
+    def test_length_mismatch(self):
+        packer = TokenBudgetPacker()
+        with pytest.raises(ValueError):
+            packer.pack([1, 2], [1])
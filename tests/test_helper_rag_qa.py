@@ -0,0 +1,158 @@
+"""
+helper_rag_qa.py 単体テスト
+
+テスト実行:
+    pytest tests/test_helper_rag_qa.py -v
+"""
+
+import pytest
+import json
+import os
+
+# テスト対象
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+helper_rag_qa = pytest.importorskip("helper_rag_qa")
+from regex_mecab import KeywordExtractor
+
+NEWS = ("東京都は15日、新型ウイルス対策として飲食店への営業時間短縮要請を延長すると発表した。"
+        "期間は来月末までで、協力金の支給額も引き上げる。")
+NAVIGATION = "ホーム | ニュース | スポーツ | エンタメ | ログイン | 会員登録 | お問い合わせ | サイトマップ"
+FOOTER = "Copyright (C) 2024 livedoor All Rights Reserved.\n続きを読む\n関連記事\n関連記事"
+
+
+@pytest.fixture(scope="module")
+def prefilter():
+    # MeCab の有無でテスト結果が変わらないよう正規表現版のキーワード抽出を使う
+    extractor = KeywordExtractor(prefer_mecab=False)
+    return helper_rag_qa.ChunkInformationFilter(
+        threshold=0.3, keyword_extractors={"ja": extractor, "en": extractor}
+    )
+
+
+# ====================================
+# ChunkInformationFilter テスト
+# ====================================
+
+class TestChunkInformationFilter:
+    """ChunkInformationFilter のテスト"""
+
+    def test_prose_scores_high(self, prefilter):
+        assert prefilter.score(NEWS)["score"] > 0.6
+        english = ("The European Central Bank raised interest rates by a quarter point on Thursday, "
+                   "citing persistent inflation in the services sector.")
+        assert prefilter.score(english, "en")["score"] > 0.3
+
+    def test_boilerplate_scores_zero(self, prefilter):
+        """ナビゲーション（文がない）・著作権表示・定型文・短すぎるチャンクは0"""
+        assert prefilter.score(NAVIGATION)["score"] == 0.0
+        assert prefilter.score(FOOTER)["score"] == 0.0
+        assert prefilter.score("写真拡大")["score"] == 0.0
+
+    def test_repeated_lines_lower_score(self, prefilter):
+        sentence = "新型ウイルス対策として営業時間短縮要請を延長した。"
+        assert prefilter.score(sentence * 4)["unique_ratio"] == pytest.approx(0.25)
+
+    def test_split_keeps_order(self, prefilter):
+        chunks = [{"id": i, "text": text} for i, text in enumerate([NEWS, NAVIGATION, NEWS, FOOTER])]
+        kept, skipped = prefilter.split(chunks)
+        assert [c["id"] for c in kept] == [0, 2]
+        assert [c["id"] for c in skipped] == [1, 3]
+        assert skipped[0]["info_score"] == 0.0
+
+    def test_template_qa_uses_sentence_with_keyword(self, prefilter):
+        [qa] = prefilter.template_qa(NEWS)
+        assert qa["question"].endswith("について何と述べられていますか？")
+        assert qa["answer"] in NEWS and qa["answer"].endswith("。")
+        assert prefilter.template_qa(NAVIGATION) == []
+
+
+# ====================================
+# a02 プレフィルタ連携テスト
+# ====================================
+
+class TestGenerateQAForDatasetPrefilter:
+    """a02_make_qa_para.generate_qa_for_dataset(prefilter=...) のテスト"""
+
+    @pytest.fixture
+    def a02(self):
+        return pytest.importorskip("a02_make_qa_para")
+
+    class CountingClient:
+        def __init__(self):
+            self.prompts = []
+
+        def generate_structured(self, prompt, response_schema, model=None, **kwargs):
+            self.prompts.append(prompt)
+            return response_schema.model_validate_json(json.dumps({"qa_pairs": [
+                {"question": "q", "answer": "a", "question_type": "fact"}
+            ]}))
+
+    @staticmethod
+    def make_chunks(texts):
+        return [{"id": f"c{i}", "text": text, "doc_id": "d", "dataset_type": "wikipedia_ja", "chunk_idx": i}
+                for i, text in enumerate(texts)]
+
+    def test_low_information_chunks_skip_llm(self, a02, prefilter):
+        client = self.CountingClient()
+        qa_pairs = a02.generate_qa_for_dataset(
+            self.make_chunks([NEWS, NAVIGATION, FOOTER]), "wikipedia_ja",
+            chunk_batch_size=1, merge_chunks=False, client=client, prefilter=prefilter
+        )
+        assert len(client.prompts) == 1
+        assert {qa["source_chunk_id"] for qa in qa_pairs} == {"c0"}
+
+    def test_template_mode_keeps_chunk_order(self, a02, prefilter):
+        """template モードの低情報チャンクはテンプレートQ/Aをチャンク順に差し込む"""
+        repeated = "新型ウイルス対策として営業時間短縮要請を延長した。" * 4
+        client = self.CountingClient()
+        qa_pairs = a02.generate_qa_for_dataset(
+            self.make_chunks([repeated, NEWS, NAVIGATION]), "wikipedia_ja",
+            chunk_batch_size=1, merge_chunks=False, client=client,
+            prefilter=prefilter, prefilter_mode="template"
+        )
+        assert len(client.prompts) == 1
+        assert [qa["source_chunk_id"] for qa in qa_pairs] == ["c0", "c1"]
+        assert qa_pairs[0]["answer"] == "新型ウイルス対策として営業時間短縮要請を延長した。"
+
+
+# ====================================
+# SemanticChunker テスト
+# ====================================
+
+class TestSemanticChunker:
+    """SemanticChunker のテスト"""
+
+    DOCUMENT = NEWS + "\n\n" + "人工知能の研究が進んでいる。" * 30 + "\n\n" + "短い段落。"
+
+    @pytest.fixture
+    def offline(self, monkeypatch):
+        """埋め込み・LLMクライアントを作ろうとしたら失敗させる"""
+        def fail(*args, **kwargs):
+            raise AssertionError("network client created")
+        monkeypatch.setattr(helper_rag_qa, "create_embedding_client", fail)
+        monkeypatch.setattr(helper_rag_qa, "create_llm_client", fail)
+
+    def test_chunks_without_network_clients(self, offline):
+        chunker = helper_rag_qa.SemanticChunker(token_count_mode="estimate")
+        chunks = chunker.create_semantic_chunks(self.DOCUMENT, max_tokens=100, min_tokens=10, verbose=False)
+        assert chunks[0]["text"] == NEWS and chunks[0]["type"] == "paragraph"
+        assert any(c["type"] == "sentence_group" for c in chunks)
+        assert chunks[-1]["text"].endswith("短い段落。")
+
+    def test_reused_instance_matches_fresh_instance(self, offline):
+        """文書をまたいで使い回しても結果は毎回作り直した場合と同じ"""
+        chunker = helper_rag_qa.SemanticChunker(token_count_mode="estimate")
+        documents = [self.DOCUMENT, NEWS, FOOTER, self.DOCUMENT]
+        reused = [chunker.create_semantic_chunks(d, max_tokens=100, verbose=False) for d in documents]
+        fresh = [helper_rag_qa.SemanticChunker(token_count_mode="estimate").create_semantic_chunks(
+            d, max_tokens=100, verbose=False) for d in documents]
+        assert reused == fresh
+
+    def test_semantic_coverage_delegates(self):
+        from helper_embedding import LocalEmbedding
+        coverage = helper_rag_qa.SemanticCoverage(embedding_client=LocalEmbedding(), token_count_mode="estimate")
+        assert isinstance(coverage.chunker, helper_rag_qa.SemanticChunker)
+        assert coverage.create_semantic_chunks(self.DOCUMENT, max_tokens=100, verbose=False) == \
+            coverage.chunker.create_semantic_chunks(self.DOCUMENT, max_tokens=100, verbose=False)
@@ -0,0 +1,289 @@
+"""
+helper_rate_limit.py 単体テスト
+
+テスト実行:
+    pytest tests/test_helper_rate_limit.py -v
+"""
+
+import pytest
+import os
+
+# テスト対象
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from unittest.mock import patch
+
+from helper_rate_limit import (
+    AdaptiveConcurrencyController,
+    APIKeyPool,
+    APIKeySpec,
+    TokenBucketRateLimiter,
+    classify_rate_limit_error,
+    clear_api_key_pools,
+    get_api_key_pool,
+    parse_api_keys,
+    set_api_key_pool_processes,
+)
+from tests.helpers import FakeAPIError, FakeClock
+
+
+# ====================================
+# TokenBucketRateLimiter テスト
+# ====================================
+
+class TestTokenBucketRateLimiter:
+    """TokenBucketRateLimiter クラスのテスト"""
+
+    def test_disabled_never_waits(self):
+        """rpm/tpm未指定では待機しない"""
+        clock = FakeClock()
+        limiter = TokenBucketRateLimiter(clock=clock, sleep=clock.sleep)
+        assert not limiter.enabled
+        for _ in range(1000):
+            assert limiter.acquire(tokens=10_000) == 0.0
+        assert clock.sleeps == []
+
+    def test_invalid_rate_raises_error(self):
+        """0以下のレートはエラー"""
+        with pytest.raises(ValueError, match="rpm"):
+            TokenBucketRateLimiter(rpm=0)
+        with pytest.raises(ValueError, match="tpm"):
+            TokenBucketRateLimiter(tpm=-1)
+
+    def test_rpm_burst_then_throttle(self):
+        """rpm: 1分ぶんのバースト後は 60/rpm 秒間隔"""
+        clock = FakeClock()
+        limiter = TokenBucketRateLimiter(rpm=60, clock=clock, sleep=clock.sleep)
+
+        for _ in range(60):
+            assert limiter.acquire() == 0.0
+
+        waited = limiter.acquire()
+        assert waited == pytest.approx(1.0)
+        assert clock.now == pytest.approx(1.0)
+
+    def test_tpm_limits_tokens(self):
+        """tpm: トークン枠を超えると補充を待つ"""
+        clock = FakeClock()
+        limiter = TokenBucketRateLimiter(tpm=600, clock=clock, sleep=clock.sleep)
+
+        assert limiter.acquire(tokens=600) == 0.0
+        # 60トークン = 6秒分の補充が必要
+        assert limiter.acquire(tokens=60) == pytest.approx(6.0)
+
+    def test_oversized_request_is_clamped(self):
+        """容量を超えるトークン数でもデッドロックしない"""
+        clock = FakeClock()
+        limiter = TokenBucketRateLimiter(tpm=100, clock=clock, sleep=clock.sleep)
+        assert limiter.acquire(tokens=10_000) == 0.0
+        assert limiter.acquire(tokens=10_000) == pytest.approx(60.0)
+
+
+# ====================================
+# classify_rate_limit_error テスト
+# ====================================
+
+class TestClassifyRateLimitError:
+    """classify_rate_limit_error のテスト"""
+
+    def test_status_code(self):
+        """429/503 は再試行対象、400 は対象外"""
+        assert classify_rate_limit_error(FakeAPIError("busy", 503)) == (True, None)
+        assert classify_rate_limit_error(FakeAPIError("bad request", 400)) == (False, None)
+
+    def test_retry_delay_from_message(self):
+        """Gemini のメッセージから待機秒数を取り出す"""
+        assert classify_rate_limit_error(
+            FakeAPIError("Quota exceeded. Please retry in 12.5s.", 429)) == (True, 12.5)
+        assert classify_rate_limit_error(
+            Exception('429 RESOURCE_EXHAUSTED {"retryDelay": "7s"}')) == (True, 7.0)
+
+    def test_retry_after_header(self):
+        """レスポンスヘッダーの Retry-After を優先"""
+        error = FakeAPIError("rate limited", 429)
+        error.response = type("Response", (), {"headers": {"retry-after": "3"}})()
+        assert classify_rate_limit_error(error) == (True, 3.0)
+
+
+# ====================================
+# AdaptiveConcurrencyController テスト
+# ====================================
+
+class TestAdaptiveConcurrencyController:
+    """AdaptiveConcurrencyController のテスト"""
+
+    def _controller(self, clock: FakeClock, **kwargs) -> AdaptiveConcurrencyController:
+        return AdaptiveConcurrencyController(clock=clock, sleep=clock.sleep, **kwargs)
+
+    def test_additive_increase(self):
+        """1ウィンドウ（約上限件数）の成功で上限が1増え、max_limit で止まる"""
+        controller = self._controller(FakeClock(), initial_limit=4, max_limit=5)
+        for _ in range(5):
+            controller.release(controller.acquire())
+        assert controller.limit == 5
+        for _ in range(10):
+            controller.release(controller.acquire())
+        assert controller.limit == 5
+
+    def test_multiplicative_decrease_once_per_epoch(self):
+        """同時に返ってきた429の束では1回だけ半減する"""
+        clock = FakeClock()
+        controller = self._controller(clock, initial_limit=8)
+        epochs = [controller.acquire() for _ in range(4)]
+
+        for epoch in epochs:
+            controller.release(epoch, rate_limited=True, delay=2.0)
+
+        assert controller.limit == 4
+        assert controller.rate_limited == 4
+        assert controller.in_flight == 0
+
+    def test_retry_after_blocks_new_calls(self):
+        """Retry-After の間は新しい呼び出しを開始しない"""
+        clock = FakeClock()
+        controller = self._controller(clock)
+        controller.release(controller.acquire(), rate_limited=True, delay=2.5)
+
+        controller.acquire()
+        assert clock.sleeps == [2.5]
+
+    def test_call_retries_rate_limit_then_succeeds(self):
+        """429 は Retry-After 秒待って再試行する"""
+        clock = FakeClock()
+        controller = self._controller(clock, initial_limit=4)
+        responses = [FakeAPIError("retry in 1.5s", 429), FakeAPIError("overloaded", 503), "ok"]
+
+        def flaky():
+            response = responses.pop(0)
+            if isinstance(response, Exception):
+                raise response
+            return response
+
+        assert controller.call(flaky) == "ok"
+        # 2回目はRetry-Afterなし → 指数バックオフ（base_backoff * 2）
+        assert clock.sleeps == [1.5, 2.0]
+        assert controller.limit == 2
+
+    def test_call_gives_up_after_max_retries(self):
+        """max_retries を超えると例外を送出し、429以外は再試行しない"""
+        clock = FakeClock()
+        controller = self._controller(clock, max_retries=1)
+
+        def always_limited():
+            raise FakeAPIError("slow down", 429)
+
+        with pytest.raises(FakeAPIError):
+            controller.call(always_limited)
+        assert controller.rate_limited == 2
+
+        calls = []
+
+        def bad_request():
+            calls.append(1)
+            raise FakeAPIError("invalid", 400)
+
+        with pytest.raises(FakeAPIError):
+            controller.call(bad_request)
+        assert len(calls) == 1
+
+
+# ====================================
+# APIKeyPool テスト
+# ====================================
+
+class TestAPIKeyPool:
+    """APIKeyPool クラスのテスト"""
+
+    def _pool(self, clock: FakeClock, keys, **kwargs) -> APIKeyPool:
+        return APIKeyPool(keys, clock=clock, sleep=clock.sleep, **kwargs)
+
+    def test_parse_api_keys(self):
+        """"KEY" / "KEY:RPM:TPM" 形式、空欄は既定値"""
+        specs = parse_api_keys("a, b:100:5000 ,c::9000,", rpm=10, tpm=1000)
+        assert [(s.key, s.rpm, s.tpm) for s in specs] == [
+            ("a", 10, 1000), ("b", 100.0, 5000.0), ("c", 10, 9000.0)
+        ]
+
+    def test_spreads_by_remaining_capacity(self):
+        """残り枠の大きいキーを選び、予算に比例して振り分ける"""
+        clock = FakeClock()
+        pool = self._pool(clock, [APIKeySpec("small", rpm=10), APIKeySpec("large", rpm=30)])
+
+        used = [pool.call(lambda key: key) for _ in range(40)]
+
+        assert used.count("small") == 10
+        assert used.count("large") == 30
+        assert clock.sleeps == []
+        # 両方の枠を使い切ると最も早く空くキーまで待つ
+        assert pool.call(lambda key: key) == "large"
+        assert clock.sleeps == [pytest.approx(2.0)]
+
+    def test_unlimited_keys_round_robin(self):
+        """予算なしのキーは均等に使う"""
+        pool = self._pool(FakeClock(), ["a", "b", "c"])
+        used = [pool.call(lambda key: key) for _ in range(30)]
+        assert sorted(used.count(k) for k in "abc") == [10, 10, 10]
+
+    def test_rate_limited_key_is_paused_then_benched(self):
+        """429 のキーは Retry-After の間使わず、連続 bench_after 回で休止する"""
+        clock = FakeClock()
+        pool = self._pool(clock, ["a", "b"], bench_after=2, bench_seconds=60)
+
+        key = pool.acquire()
+        pool.release(key, FakeAPIError("retry in 5s", 429))
+        other = "b" if key == "a" else "a"
+        assert [pool.call(lambda k: k) for _ in range(3)] == [other] * 3
+
+        clock.now += 5
+        key_again = pool.acquire()
+        while key_again != key:
+            pool.release(key_again)
+            key_again = pool.acquire()
+        pool.release(key, FakeAPIError("slow down", 429))
+        assert pool.snapshot()[pool.keys.index(key)]["benched"] == 1
+        assert pool.snapshot()[pool.keys.index(key)]["unavailable_remaining"] == pytest.approx(60)
+
+        clock.now += 30
+        assert {pool.call(lambda k: k) for _ in range(5)} == {other}
+
+    def test_success_resets_consecutive_rate_limits(self):
+        """成功を挟めば休止しない"""
+        clock = FakeClock()
+        pool = self._pool(clock, ["a"], bench_after=2)
+        for _ in range(3):
+            pool.release(pool.acquire(), FakeAPIError("slow down", 429))
+            pool.release(pool.acquire())
+        assert pool.snapshot()[0]["benched"] == 0
+
+    def test_controller_retries_on_another_key(self):
+        """controller.call(pool.call, ...) の再試行は別のキーで行う"""
+        clock = FakeClock()
+        pool = self._pool(clock, ["a", "b"])
+        controller = AdaptiveConcurrencyController(clock=clock, sleep=clock.sleep, base_backoff=0.0)
+        keys = []
+
+        def send(key):
+            keys.append(key)
+            if len(keys) == 1:
+                raise FakeAPIError("retry in 10s", 429)
+            return key
+
+        assert controller.call(pool.call, send, 0) != keys[0]
+        assert clock.now < 10
+
+    def test_get_api_key_pool_from_env(self):
+        """環境変数からプールを作成し、プロセス数で予算を割る"""
+        clear_api_key_pools()
+        try:
+            with patch.dict(os.environ, {}, clear=True):
+                assert get_api_key_pool("gemini") is None
+            clear_api_key_pools()
+            set_api_key_pool_processes(4)
+            with patch.dict(os.environ, {"GOOGLE_API_KEYS": "k1,k2:400"}):
+                pool = get_api_key_pool("gemini", rpm=100)
+                assert get_api_key_pool("gemini") is pool
+            assert [s["rpm"] for s in pool.snapshot()] == [25, 100]
+        finally:
+            set_api_key_pool_processes(1)
+            clear_api_key_pools()
@@ -0,0 +1,248 @@
+"""
+helper_usage.py 単体テスト
+
+テスト実行:
+    pytest tests/test_helper_usage.py -v
+"""
+
+import pytest
+import json
+import os
+from types import SimpleNamespace
+from unittest.mock import Mock, patch
+
+# テスト対象
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from helper_rate_limit import AdaptiveConcurrencyController, TokenBucketRateLimiter
+from helper_usage import (
+    InMemoryUsageSink,
+    JSONLUsageSink,
+    UsageMeter,
+    UsageRecord,
+    collect_usage,
+    format_usage_report,
+    gemini_usage,
+    openai_usage,
+    percentile,
+    summarize_usage,
+)
+from tests.helpers import FakeAPIError, FakeClock
+
+
+# ====================================
+# UsageMeter テスト
+# ====================================
+
+class TestUsageMeter:
+    """UsageMeter のテスト"""
+
+    def test_measure_records_success(self):
+        """トークン数・ステータス200・レイテンシを記録してシンクへ送る"""
+        sink = InMemoryUsageSink()
+        meter = UsageMeter([sink])
+        with meter.measure("gemini", "gemini-2.0-flash", "generate_content") as usage:
+            usage.set_tokens(120, 30)
+
+        [record] = sink.records
+        assert (record.input_tokens, record.output_tokens, record.total_tokens) == (120, 30, 150)
+        assert record.status == 200 and record.success
+        assert 0 <= record.latency < 5
+
+    def test_measure_records_error_status(self):
+        """例外はステータスを記録して再送出する"""
+        sink = InMemoryUsageSink()
+        meter = UsageMeter([sink])
+        with pytest.raises(FakeAPIError):
+            with meter.measure("openai", "gpt-4o-mini", "generate_content"):
+                raise FakeAPIError("bad request", 400)
+
+        [record] = sink.records
+        assert not record.success
+        assert record.status == 400
+
+    def test_tracks_retries_and_queue_wait(self):
+        """controller.call の再試行回数と Retry-After・レート制限の待ち時間を加算する"""
+        clock = FakeClock()
+        controller = AdaptiveConcurrencyController(clock=clock, sleep=clock.sleep)
+        limiter = TokenBucketRateLimiter(rpm=60, clock=clock, sleep=clock.sleep)
+        responses = [FakeAPIError("retry in 1.5s", 429), "ok"]
+
+        def flaky():
+            response = responses.pop(0)
+            if isinstance(response, Exception):
+                raise response
+            return response
+
+        sink = InMemoryUsageSink()
+        meter = UsageMeter([sink])
+        for _ in range(60):  # バースト枠を使い切る
+            limiter.acquire()
+        with meter.measure("gemini", "m", "generate_content"):
+            limiter.acquire()
+            controller.call(flaky)
+
+        [record] = sink.records
+        assert record.retries == 1
+        assert record.queue_wait == pytest.approx(1.0 + 1.5)
+        assert record.status == 200
+
+    def test_collect_usage_is_scoped(self):
+        """collect_usage はブロック内の記録だけを集め、入れ子の外側にも記録される"""
+        meter = UsageMeter()
+        with collect_usage() as outer:
+            with meter.measure("gemini", "m", "a"):
+                pass
+            with collect_usage() as inner:
+                with meter.measure("gemini", "m", "b"):
+                    pass
+        with meter.measure("gemini", "m", "c"):
+            pass
+
+        assert [r.operation for r in outer] == ["a", "b"]
+        assert [r.operation for r in inner] == ["b"]
+
+    def test_failing_sink_does_not_break_call(self):
+        """シンクの例外は呼び出しに影響しない"""
+        broken = Mock()
+        broken.record.side_effect = OSError("disk full")
+        sink = InMemoryUsageSink()
+        meter = UsageMeter([broken, sink])
+        with meter.measure("gemini", "m", "a"):
+            pass
+        assert len(sink.records) == 1
+
+    def test_jsonl_sink(self, tmp_path):
+        """1呼び出し1行で追記する"""
+        path = str(tmp_path / "usage" / "calls.jsonl")
+        meter = UsageMeter([JSONLUsageSink(path)])
+        for _ in range(2):
+            with meter.measure("openai", "text-embedding-3-small", "embed_texts") as usage:
+                usage.set_tokens(10)
+
+        with open(path, encoding="utf-8") as f:
+            records = [json.loads(line) for line in f]
+        assert [r["input_tokens"] for r in records] == [10, 10]
+        assert records[0]["model"] == "text-embedding-3-small"
+
+
+# ====================================
+# 応答からのトークン数抽出テスト
+# ====================================
+
+class TestUsageExtraction:
+    """gemini_usage / openai_usage のテスト"""
+
+    def test_gemini_usage(self):
+        response = SimpleNamespace(usage_metadata=SimpleNamespace(prompt_token_count=11, candidates_token_count=7))
+        assert gemini_usage(response) == (11, 7)
+        assert gemini_usage(Mock()) is None  # 数値でなければ報告なし
+
+    def test_openai_usage(self):
+        assert openai_usage(SimpleNamespace(usage=SimpleNamespace(prompt_tokens=5, completion_tokens=2))) == (5, 2)
+        assert openai_usage(SimpleNamespace(usage=SimpleNamespace(prompt_tokens=9))) == (9, 0)
+        assert openai_usage(SimpleNamespace(usage=None)) is None
+
+
+# ====================================
+# 集計・レポート テスト
+# ====================================
+
+class TestSummarizeUsage:
+    """summarize_usage / format_usage_report のテスト"""
+
+    def test_summary_per_model(self):
+        records = [UsageRecord("gemini", "gemini-2.0-flash", "generate_content",
+                               input_tokens=1000, output_tokens=500, latency=float(i + 1))
+                   for i in range(20)]
+        records.append(UsageRecord("gemini", "gemini-2.0-flash", "generate_content",
+                                   latency=30.0, success=False, status=500, retries=2))
+        records.append(UsageRecord("openai", "text-embedding-3-small", "embed_texts", input_tokens=2000, latency=0.5))
+
+        summary = summarize_usage(records)
+
+        flash = summary["gemini-2.0-flash"]
+        assert (flash["calls"], flash["errors"], flash["retries"]) == (21, 1, 2)
+        assert flash["latency_p50"] == 11.0
+        assert flash["latency_p95"] == 20.0
+        # 成功した呼び出しのトークン / 成功した呼び出しの合計レイテンシ
+        assert flash["tokens_per_sec"] == pytest.approx(20 * 1500 / sum(range(1, 21)))
+        # helper_llm の料金表（1Kトークンあたり）
+        assert flash["cost"] == pytest.approx(20 * (1.0 * 0.0001 + 0.5 * 0.0002))
+        assert summary["text-embedding-3-small"]["cost"] == pytest.approx(2 * 0.00002)
+
+    def test_percentile_nearest_rank(self):
+        """最近傍法（昇順の値から q% の順位の値を取る）"""
+        values = [1.0, 2.0, 3.0, 4.0]
+        assert percentile(values, 50) == 2.0
+        assert percentile(values, 95) == 4.0
+        assert percentile(values, 0) == 1.0
+        assert percentile([], 95) == 0.0
+
+    def test_report_includes_cost_per_qa(self):
+        summary = summarize_usage([UsageRecord("gemini", "m", "generate_content", input_tokens=10, latency=1.0)],
+                                  cost_fn=lambda usage: 0.5)
+        report = format_usage_report(summary, qa_count=10)
+        assert "p50 1.00s" in report
+        assert "Q/Aあたり費用: $0.050000" in report
+        assert format_usage_report({}) == "API使用量: 記録なし"
+
+
+# ====================================
+# LLMクライアント連携テスト
+# ====================================
+
+class TestClientMetering:
+    """GeminiClient の呼び出しが使用量を記録するかのテスト"""
+
+    @pytest.fixture
+    def gemini_client(self):
+        from helper_llm import GeminiClient
+
+        with patch("helper_llm.genai"):
+            client = GeminiClient(api_key="test-key",
+                                  concurrency_controller=AdaptiveConcurrencyController(name="test"))
+        model = Mock()
+        with patch("helper_llm.get_generative_model", return_value=model):
+            yield client, model
+
+    def test_generate_content_records_reported_tokens(self, gemini_client):
+        client, model = gemini_client
+        model.generate_content.return_value = SimpleNamespace(
+            text="答え", usage_metadata=SimpleNamespace(prompt_token_count=40, candidates_token_count=12)
+        )
+
+        with collect_usage() as records:
+            assert client.generate_content("質問", model="gemini-2.0-flash") == "答え"
+
+        [record] = records
+        assert (record.model, record.input_tokens, record.output_tokens) == ("gemini-2.0-flash", 40, 12)
+        assert not record.estimated
+
+    def test_stream_uses_last_chunk_usage(self, gemini_client):
+        """ストリームは最後の断片の usage_metadata（累計）を記録する"""
+        client, model = gemini_client
+        chunks = [
+            SimpleNamespace(text="ab", usage_metadata=SimpleNamespace(prompt_token_count=40, candidates_token_count=1)),
+            SimpleNamespace(text="cd", usage_metadata=SimpleNamespace(prompt_token_count=40, candidates_token_count=9)),
+        ]
+        model.generate_content.return_value = iter(chunks)
+
+        with collect_usage() as records:
+            assert "".join(client.generate_content_stream("質問")) == "abcd"
+
+        [record] = records
+        assert (record.operation, record.input_tokens, record.output_tokens) == ("generate_content_stream", 40, 9)
+
+    def test_missing_usage_is_estimated(self, gemini_client):
+        """usage_metadata がなければローカル見積もりで記録する"""
+        client, model = gemini_client
+        model.generate_content.return_value = SimpleNamespace(text="abcd")
+
+        with collect_usage() as records:
+            client.generate_content("あいう")
+
+        [record] = records
+        assert record.estimated
+        assert (record.input_tokens, record.output_tokens) == (3, 1)
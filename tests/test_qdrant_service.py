@@ -19,6 +19,7 @@ from services.qdrant_service import (
     load_csv_for_qdrant,
     build_inputs_for_embedding,
     build_points_for_qdrant,
+    embed_texts_for_qdrant,
     QDRANT_CONFIG,
 )
 
@@ -247,6 +248,24 @@ class TestBuildInputsForEmbedding:
         assert "Pythonは汎用" in result[0]
 
 
+class TestEmbedTextsForQdrant:
+    """embed_texts_for_qdrant関数のテスト"""
+
+    def test_duplicates_embedded_once(self):
+        """同一テキストは1回だけEmbeddingし、空文字列はゼロベクトル"""
+        mock_client = MagicMock()
+        mock_client.embed_texts.side_effect = lambda texts, batch_size: [
+            [float(len(t))] * 3072 for t in texts
+        ]
+        with patch("services.qdrant_service.create_embedding_client", return_value=mock_client):
+            vecs = embed_texts_for_qdrant(["Q1", "", "Q22", "Q1", "Q22"])
+
+        mock_client.embed_texts.assert_called_once()
+        assert mock_client.embed_texts.call_args.args[0] == ["Q1", "Q22"]
+        assert [v[0] for v in vecs] == [2.0, 0.0, 3.0, 2.0, 3.0]
+        assert all(len(v) == 3072 for v in vecs)
+
+
 class TestBuildPointsForQdrant:
     """build_points_for_qdrant関数のテスト"""
 
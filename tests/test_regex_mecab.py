@@ -0,0 +1,78 @@
+"""
+regex_mecab.py 単体テスト
+
+テスト実行:
+    pytest tests/test_regex_mecab.py -v
+"""
+
+import pytest
+import os
+import threading
+
+# テスト対象
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import regex_mecab
+from regex_mecab import get_mecab_tagger, is_mecab_available, split_japanese_sentences
+
+requires_mecab = pytest.mark.skipif(not is_mecab_available(), reason="MeCab未インストール")
+
+TEXT = "今日は晴れ。明日は雨？ 「そうだ！」と言った\nGPT-4 は 3.5 より強い。最後"
+EXPECTED = ["今日は晴れ。", "明日は雨？", " 「そうだ！", "」と言った\n", "GPT-4 は 3.5 より強い。", "最後"]
+
+
+# ====================================
+# get_mecab_tagger テスト
+# ====================================
+
+@requires_mecab
+class TestGetMecabTagger:
+    """get_mecab_tagger のテスト"""
+
+    def test_same_tagger_within_thread(self):
+        assert get_mecab_tagger() is get_mecab_tagger()
+        assert get_mecab_tagger("-Owakati") is get_mecab_tagger("-Owakati")
+        assert get_mecab_tagger("-Owakati") is not get_mecab_tagger()
+
+    def test_separate_tagger_per_thread(self):
+        taggers = []
+        threads = [threading.Thread(target=lambda: taggers.append(get_mecab_tagger())) for _ in range(2)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert len({id(t) for t in taggers + [get_mecab_tagger()]}) == 3
+
+    def test_recreated_after_fork(self, monkeypatch):
+        """プロセスIDが変わったら親の Tagger を使わない"""
+        tagger = get_mecab_tagger()
+        monkeypatch.setattr(regex_mecab.os, "getpid", lambda: -1)
+        assert get_mecab_tagger() is not tagger
+
+    def test_keyword_extractor_reuses_tagger(self, monkeypatch):
+        """キーワード抽出ごとに MeCab.Tagger を生成しない"""
+        import MeCab
+        get_mecab_tagger()
+        extractor = regex_mecab.KeywordExtractor()
+        monkeypatch.setattr(MeCab, "Tagger", lambda *args: pytest.fail("Tagger created"))
+        assert "人工知能" in extractor.extract("人工知能の研究が進む。人工知能は便利だ。", top_n=3)
+
+
+# ====================================
+# split_japanese_sentences テスト
+# ====================================
+
+class TestSplitJapaneseSentences:
+    """split_japanese_sentences のテスト"""
+
+    @requires_mecab
+    def test_mecab_split_keeps_original_text(self):
+        assert split_japanese_sentences(TEXT) == EXPECTED
+
+    def test_regex_fallback_matches(self, monkeypatch):
+        monkeypatch.setattr(regex_mecab, "is_mecab_available", lambda: False)
+        assert split_japanese_sentences(TEXT) == EXPECTED
+
+    def test_empty_text(self):
+        assert split_japanese_sentences("") == []